@@ -46,6 +46,26 @@ class Annotator(object):
         self._annotations_cache = {}
         self._heads_provider = None
         self._ann_tuple_cache = {}
+        self._annotation_cache = None
+        # Keys added by add_special_text, which are never cached
+        self._special_keys = set()
+        # Annotations from the annotation cache, for texts not yet extracted
+        self._cached_annotations = {}
+        # Keys with cached annotations, whose ancestry was not looked up
+        self._unexpanded_keys = set()
+        # Parents of the ancestors of _unexpanded_keys, for resolving heads
+        self._ancestry_map = {}
+
+    def set_annotation_cache(self, cache):
+        """Use a persistent cache of annotations.
+
+        The ancestry of texts with cached annotations is not annotated again,
+        and the annotations of the texts passed to annotate() (or their
+        parents, for a text added by add_special_text) are added to the cache.
+
+        :param cache: An annotate.AnnotationCache, or None.
+        """
+        self._annotation_cache = cache
 
     def _update_needed_children(self, key, parent_keys):
         for parent_key in parent_keys:
@@ -93,6 +113,9 @@ class Annotator(object):
                 if parent_keys is None:  # No graph versionedfile
                     parent_keys = ()
                     next_parent_map[key] = ()
+                if key not in parent_map and self._get_cached_annotations(key):
+                    # We don't need the ancestry of this text
+                    continue
                 self._update_needed_children(key, parent_keys)
                 needed_keys.update([key for key in parent_keys
                                     if key not in parent_map])
@@ -102,6 +125,17 @@ class Annotator(object):
             self._heads_provider = None
         return vf_keys_needed, ann_keys_needed
 
+    def _get_cached_annotations(self, key):
+        """Look for the annotations of key in the annotation cache."""
+        if self._annotation_cache is None or key in self._special_keys:
+            return False
+        annotations = self._annotation_cache.get(key)
+        if annotations is None:
+            return False
+        self._cached_annotations[key] = annotations
+        self._unexpanded_keys.add(key)
+        return True
+
     def _get_needed_texts(self, key, pb=None):
         """Get the texts we need to properly annotate key.
 
@@ -246,6 +280,7 @@ class Annotator(object):
         """
         self._parent_map[key] = parent_keys
         self._text_cache[key] = osutils.split_lines(text)
+        self._special_keys.add(key)
         self._heads_provider = None
 
     def annotate(self, key):
@@ -257,10 +292,24 @@ class Annotator(object):
                         each key is a possible source for the given line.
             lines the text of "key" as a list of lines
         """
+        if self._annotation_cache is None:
+            keys_to_cache = ()
+        elif key in self._special_keys:
+            keys_to_cache = set(self._parent_map[key]).difference(
+                self._special_keys)
+        else:
+            keys_to_cache = (key,)
         with ui.ui_factory.nested_progress_bar() as pb:
             for text_key, text, num_lines in self._get_needed_texts(
                     key, pb=pb):
+                annotations = self._cached_annotations.pop(text_key, None)
+                if annotations is not None:
+                    self._annotations_cache[text_key] = annotations
+                    continue
                 self._annotate_one(text_key, text, num_lines)
+                if text_key in keys_to_cache:
+                    self._annotation_cache.add(
+                        text_key, self._annotations_cache[text_key])
         try:
             annotations = self._annotations_cache[key]
         except KeyError:
@@ -269,9 +318,37 @@ class Annotator(object):
 
     def _get_heads_provider(self):
         if self._heads_provider is None:
-            self._heads_provider = _mod_graph.KnownGraph(self._parent_map)
+            if self._unexpanded_keys:
+                self._expand_cached_ancestry()
+            if self._ancestry_map:
+                parent_map = dict(self._ancestry_map)
+                parent_map.update(self._parent_map)
+            else:
+                parent_map = self._parent_map
+            self._heads_provider = _mod_graph.KnownGraph(parent_map)
         return self._heads_provider
 
+    def _expand_cached_ancestry(self):
+        """Look up the ancestry of the texts with cached annotations.
+
+        Their annotations can refer to any of their ancestors, so resolving
+        heads needs the whole ancestry.
+        """
+        pending = set()
+        for key in self._unexpanded_keys:
+            pending.update(self._parent_map[key])
+        self._unexpanded_keys = set()
+        while pending:
+            pending.difference_update(self._parent_map)
+            pending.difference_update(self._ancestry_map)
+            parent_map = self._vf.get_parent_map(pending)
+            pending = set()
+            for key, parent_keys in parent_map.items():
+                if parent_keys is None:
+                    parent_keys = ()
+                self._ancestry_map[key] = parent_keys
+                pending.update(parent_keys)
+
     def _resolve_annotation_tie(self, the_heads, line, tiebreaker):
         if tiebreaker is None:
             head = sorted(the_heads)[0]
@@ -295,12 +372,14 @@ class Annotator(object):
         custom_tiebreaker = annotate._break_annotation_tie
         annotations, lines = self.annotate(key)
         out = []
-        heads = self._get_heads_provider().heads
+        heads = None
         append = out.append
         for annotation, line in zip(annotations, lines):
             if len(annotation) == 1:
                 head = annotation[0]
             else:
+                if heads is None:
+                    heads = self._get_heads_provider().heads
                 the_heads = heads(annotation)
                 if len(the_heads) == 1:
                     for head in the_heads:
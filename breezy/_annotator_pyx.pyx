@@ -290,13 +290,15 @@ class Annotator(_annotator_py.Annotator):
         annotations, lines = self.annotate(key)
         num_lines = len(lines)
         out = []
-        heads = self._get_heads_provider().heads
+        heads = None
         for pos from 0 <= pos < num_lines:
             annotation = annotations[pos]
             line = lines[pos]
             if len(annotation) == 1:
                 head = annotation[0]
             else:
+                if heads is None:
+                    heads = self._get_heads_provider().heads
                 the_heads = heads(annotation)
                 if len(the_heads) == 1:
                     for head in the_heads: break # get the item out of the set
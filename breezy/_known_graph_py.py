@@ -352,6 +352,22 @@ class KnownGraph(object):
                                     mainline_revisions=None,
                                     generate_revno=True)]
 
+    def iter_merge_sort_forward(self, tip_key):
+        """Iterate over the merge sorted graph output, oldest first.
+
+        Nodes are yielded as soon as they are sorted, without first sorting
+        the whole graph.
+
+        :return: An iterator over (key, merge_depth, revno) tuples.
+        """
+        from breezy import tsort
+        as_parent_map = dict((node.key, node.parent_keys)
+                             for node in self._nodes.values()
+                             if node.parent_keys is not None)
+        sorter = tsort.MergeSorter(as_parent_map, tip_key,
+                                   generate_revno=True)
+        return sorter.iter_forward_order()
+
     def get_parent_keys(self, key):
         """Get the parents for a key
 
@@ -646,6 +646,29 @@ cdef class KnownGraph:
         sorter = _MergeSorter(self, tip_key)
         return sorter.topo_order()
 
+    def iter_merge_sort_forward(self, tip_key):
+        """Iterate over the merge sorted graph output, oldest first.
+
+        Nodes are yielded as soon as they are sorted, without first sorting
+        the whole graph.
+
+        :return: An iterator over (key, merge_depth, revno) tuples.
+        """
+        cdef PyObject *temp_node
+        cdef Py_ssize_t pos
+        cdef _KnownGraphNode node
+
+        from breezy import tsort
+        as_parent_map = {}
+        pos = 0
+        while PyDict_Next(self._nodes, &pos, NULL, &temp_node):
+            node = <_KnownGraphNode>temp_node
+            if node.parents is not None:
+                as_parent_map[node.key] = node.parent_keys
+        sorter = tsort.MergeSorter(as_parent_map, tip_key,
+                                   generate_revno=True)
+        return sorter.iter_forward_order()
+
     def get_parent_keys(self, key):
         """Get the parents for a key
 
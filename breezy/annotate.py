@@ -25,8 +25,10 @@
 # TODO: perhaps abbreviate timescales depending on how recent they are
 # e.g. "3:12 Tue", "13 Oct", "Oct 2005", etc.
 
+import os
 import sys
 import time
+import zlib
 
 from .lazy_import import lazy_import
 lazy_import(globals(), """
@@ -34,6 +36,9 @@ lazy_import(globals(), """
 import patiencediff
 
 from breezy import (
+    bedding,
+    trace,
+    transport as _mod_transport,
     tsort,
     )
 """)
@@ -42,6 +47,10 @@ from . import (
     errors,
     osutils,
     )
+from .bencode import (
+    bdecode,
+    bencode,
+    )
 from .repository import _strip_NULL_ghosts
 from .revision import (
     CURRENT_REVISION,
@@ -436,6 +445,97 @@ def _reannotate_annotated(right_parent_lines, new_lines, new_revision_id,
     return lines
 
 
+class AnnotationCache(object):
+    """A persistent cache of the annotations of texts.
+
+    The annotations of a text only depend on the text and its ancestry, which
+    never change, so they are cached by text key. Each text has a file named
+    after the sha1 of its key, with the distinct origins of its lines and the
+    runs of lines that have the same origin.
+    """
+
+    def __init__(self, transport):
+        self._transport = transport
+
+    def _get_name(self, key):
+        digest = osutils.sha_string(b'\0'.join(key)).decode('ascii')
+        return '%s/%s' % (digest[:2], digest)
+
+    def get(self, key):
+        """Get the cached annotations of a text.
+
+        :param key: The key of the text.
+        :return: A list with the annotation of each line of the text, as
+            returned by Annotator.annotate(), or None if the text is not in
+            the cache.
+        """
+        try:
+            data = self._transport.get_bytes(self._get_name(key))
+        except errors.NoSuchFile:
+            return None
+        try:
+            stored_key, origins, runs = bdecode(zlib.decompress(data))
+        except (zlib.error, ValueError) as e:
+            trace.mutter('ignoring bad cached annotations of %r: %s', key, e)
+            return None
+        if tuple(stored_key) != key:
+            return None
+        origins = [tuple([tuple(origin_key) for origin_key in origin])
+                   for origin in origins]
+        annotations = []
+        for pos in range(0, len(runs), 2):
+            annotations.extend([origins[runs[pos + 1]]] * runs[pos])
+        return annotations
+
+    def add(self, key, annotations):
+        """Add the annotations of a text to the cache.
+
+        :param key: The key of the text.
+        :param annotations: The annotation of each line of the text.
+        """
+        origin_indexes = {}
+        origins = []
+        runs = []
+        last_annotation = None
+        for annotation in annotations:
+            if runs and annotation == last_annotation:
+                runs[-2] += 1
+                continue
+            index = origin_indexes.get(annotation)
+            if index is None:
+                index = origin_indexes[annotation] = len(origins)
+                origins.append([list(origin_key) for origin_key in annotation])
+            runs.extend([1, index])
+            last_annotation = annotation
+        data = zlib.compress(bencode([list(key), origins, runs]))
+        name = self._get_name(key)
+        try:
+            try:
+                self._transport.put_bytes(name, data)
+            except errors.NoSuchFile:
+                try:
+                    self._transport.mkdir(name[:2])
+                except errors.FileExists:
+                    pass
+                self._transport.put_bytes(name, data)
+        except (errors.TransportNotPossible, errors.PermissionDenied) as e:
+            trace.mutter('unable to cache annotations of %r: %s', key, e)
+
+
+def get_annotation_cache():
+    """Get the cache of annotations, if it is enabled.
+
+    :return: An AnnotationCache in the user's cache directory, or None if the
+        annotate.cache option is not set.
+    """
+    if not config.GlobalStack().get('annotate.cache'):
+        return None
+    path = os.path.join(bedding.cache_dir(), 'annotations')
+    if not os.path.isdir(path):
+        os.mkdir(path)
+    return AnnotationCache(_mod_transport.get_transport_from_path(path))
+
+
 try:
     from breezy._annotator_pyx import Annotator
 except ImportError as e:
@@ -97,5 +97,7 @@ format_registry.register_lazy('tlzma', 'breezy.archive.tar',
                               'tar_lzma_generator', ['.tar.lzma'])
 format_registry.register_lazy('txz', 'breezy.archive.tar',
                               'tar_xz_generator', ['.tar.xz'])
+format_registry.register_lazy('tzst', 'breezy.archive.tar',
+                              'tar_zstd_generator', ['.tar.zst', '.tzst'])
 format_registry.register_lazy('zip', 'breezy.archive.zip',
                               'zip_archive_generator', ['.zip'])
@@ -16,20 +16,26 @@
 
 """Export a tree to a tarball."""
 
+import collections
 from contextlib import closing
 from io import BytesIO
 import os
+import struct
 import sys
 import tarfile
+import time
+import zlib
 
 from .. import (
+    config,
     errors,
     osutils,
     )
-from ..export import _export_iter_entries
+from ..export import _export_iter_contents
 
 
-def prepare_tarball_item(tree, root, final_path, tree_path, entry, force_mtime=None):
+def prepare_tarball_item(tree, root, final_path, tree_path, entry,
+                         force_mtime=None, content=None):
     """Prepare a tarball item for exporting
 
     :param tree: Tree to export
@@ -38,6 +44,7 @@ def prepare_tarball_item(tree, root, final_path, tree_path, entry, force_mtime=N
     :param entry: Entry to export
     :param force_mtime: Option mtime to force, instead of using tree
         timestamps.
+    :param content: The text of the file, if already read from the tree.
 
     Returns a (tarinfo, fileobj) tuple
     """
@@ -58,7 +65,8 @@ def prepare_tarball_item(tree, root, final_path, tree_path, entry, force_mtime=N
         # the tarfile contract, which wants the size of the file up front.  We
         # want to make sure it doesn't change, and we need to read it in one
         # go for content filtering.
-        content = tree.get_file_text(tree_path)
+        if content is None:
+            content = tree.get_file_text(tree_path)
         item.size = len(content)
         fileobj = BytesIO(content)
     elif entry.kind in ("directory", "tree-reference"):
@@ -93,9 +101,11 @@ def tarball_generator(tree, root, subdir=None, force_mtime=None, format=''):
     """
     buf = BytesIO()
     with closing(tarfile.open(None, "w:%s" % format, buf)) as ball, tree.lock_read():
-        for final_path, tree_path, entry in _export_iter_entries(tree, subdir):
+        for final_path, tree_path, entry, content in _export_iter_contents(
+                tree, subdir):
             (item, fileobj) = prepare_tarball_item(
-                tree, root, final_path, tree_path, entry, force_mtime)
+                tree, root, final_path, tree_path, entry, force_mtime,
+                content)
             ball.addfile(item, fileobj)
             # Yield the data that was written so far, rinse, repeat.
             yield buf.getvalue()
@@ -104,6 +114,116 @@ def tarball_generator(tree, root, subdir=None, force_mtime=None, format=''):
     yield buf.getvalue()
 
 
+# Size of the blocks that are compressed independently by
+# parallel_gzip_generator, and the number of blocks compressed at once per
+# thread.
+_GZIP_BLOCK_SIZE = 1 << 20
+_GZIP_BLOCKS_PER_THREAD = 2
+# The size of the deflate window; each block is primed with this much of
+# the end of the previous block.
+_GZIP_DICT_SIZE = 32768
+
+
+def _gzip_header(basename, mtime, compresslevel):
+    # The same header as written by gzip.GzipFile.
+    try:
+        fname = os.path.basename(basename)
+        if not isinstance(fname, bytes):
+            fname = fname.encode('latin-1')
+        if fname.endswith(b'.gz'):
+            fname = fname[:-3]
+    except UnicodeEncodeError:
+        fname = b''
+    if mtime is None:
+        mtime = time.time()
+    if compresslevel == 9:
+        xfl = b'\002'
+    elif compresslevel == 1:
+        xfl = b'\004'
+    else:
+        xfl = b'\000'
+    header = b'\037\213\010'
+    if fname:
+        header += b'\010'
+    else:
+        header += b'\000'
+    header += struct.pack('<L', int(mtime)) + xfl + b'\377'
+    if fname:
+        header += fname + b'\000'
+    return header
+
+
+def _deflate_block(block, zdict, compresslevel):
+    if zdict:
+        compressor = zlib.compressobj(
+            compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS,
+            zlib.DEF_MEM_LEVEL, zlib.Z_DEFAULT_STRATEGY, zdict)
+    else:
+        compressor = zlib.compressobj(
+            compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS)
+    # A sync flush ends the output on a byte boundary without marking it as
+    # the last block, so the outputs for all blocks can be concatenated.
+    return compressor.compress(block) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+def _iter_blocks(chunks, block_size):
+    buf = bytearray()
+    for chunk in chunks:
+        buf += chunk
+        while len(buf) >= block_size:
+            yield bytes(buf[:block_size])
+            del buf[:block_size]
+    if buf:
+        yield bytes(buf)
+
+
+def parallel_gzip_generator(chunks, basename, mtime, num_threads,
+                            compresslevel=9):
+    """Compress chunks to a gzip stream, using several threads.
+
+    Like pigz, the data is split into blocks that are deflated independently
+    and concatenated into a single gzip member that any gzip reader can
+    decompress. Each block is primed with the end of the previous block, so
+    the result is only slightly larger than with gzip.GzipFile.
+
+    :param chunks: Iterator over the chunks of data to compress.
+    :param basename: File name to store in the gzip header.
+    :param mtime: Modification time to store in the gzip header, or None
+        for the current time.
+    :param num_threads: Number of threads to compress with.
+    :param compresslevel: zlib compression level.
+    :return: Iterator over chunks of the gzip stream.
+    """
+    # zlib releases the GIL while compressing, so these threads can use more
+    # than one core.
+    from concurrent.futures import ThreadPoolExecutor
+    yield _gzip_header(basename, mtime, compresslevel)
+    crc = 0
+    size = 0
+    zdict = None
+    pending = collections.deque()
+    executor = ThreadPoolExecutor(max_workers=num_threads)
+    try:
+        for block in _iter_blocks(chunks, _GZIP_BLOCK_SIZE):
+            crc = zlib.crc32(block, crc)
+            size += len(block)
+            pending.append(executor.submit(
+                _deflate_block, block, zdict, compresslevel))
+            zdict = block[-_GZIP_DICT_SIZE:]
+            while len(pending) > num_threads * _GZIP_BLOCKS_PER_THREAD:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+    # An empty last block ends the deflate stream.
+    yield zlib.compressobj(
+        compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS).flush()
+    yield struct.pack('<LL', crc, size & 0xffffffff)
+
+
 def tgz_generator(tree, dest, root, subdir, force_mtime=None):
     """Export this tree to a new tar file.
 
@@ -130,6 +250,13 @@ def tgz_generator(tree, dest, root, subdir, force_mtime=None):
         # the basename can be stored in the gzip file rather than
         # dest. (bug 102234)
         basename = os.path.basename(dest)
+        num_threads = config.GlobalStack().get('export.compression_threads')
+        if num_threads >= 1:
+            for chunk in parallel_gzip_generator(
+                    tarball_generator(tree, root, subdir, force_mtime),
+                    basename, root_mtime, num_threads):
+                yield chunk
+            return
         buf = BytesIO()
         zipstream = gzip.GzipFile(basename, 'w', fileobj=buf,
                                   mtime=root_mtime)
@@ -193,3 +320,25 @@ def tar_lzma_generator(tree, dest, root, subdir, force_mtime=None,
         yield compressor.compress(chunk)
 
     yield compressor.flush()
+
+
+def tar_zstd_generator(tree, dest, root, subdir, force_mtime=None):
+    """Export this tree to a new .tar.zst file.
+
+    `dest` will be created holding the contents of this tree; if it
+    already exists, it will be clobbered, like with "tar -c".
+    """
+    try:
+        import zstandard
+    except ImportError as e:
+        raise errors.DependencyNotPresent('zstandard', e)
+
+    num_threads = config.GlobalStack().get('export.compression_threads')
+    compressor = zstandard.ZstdCompressor(
+        threads=max(num_threads, 0)).compressobj()
+
+    for chunk in tarball_generator(
+            tree, root, subdir, force_mtime=force_mtime):
+        yield compressor.compress(chunk)
+
+    yield compressor.flush()
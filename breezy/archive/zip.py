@@ -21,14 +21,13 @@ from contextlib import closing
 import os
 import stat
 import sys
-import tempfile
 import time
 import zipfile
 
 from .. import (
     osutils,
     )
-from ..export import _export_iter_entries
+from ..export import _export_iter_contents
 from ..trace import mutter
 
 
@@ -42,6 +41,31 @@ _FILE_ATTR = stat.S_IFREG | FILE_PERMISSIONS
 _DIR_ATTR = stat.S_IFDIR | ZIP_DIRECTORY_BIT | DIR_PERMISSIONS
 
 
+class _ZipStream(object):
+    """Write-only file object that collects what ZipFile writes to it.
+
+    It can't tell or seek, so ZipFile writes the sizes and checksums of
+    members in data descriptors after them rather than going back to put
+    them in their headers, and the archive can be streamed.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop_chunks(self):
+        """Return and forget the data written so far."""
+        chunks = self._chunks
+        self._chunks = []
+        return chunks
+
+
 def zip_archive_generator(tree, dest, root, subdir=None,
                           force_mtime=None):
     """ Export this tree to a new zip file.
@@ -50,10 +74,10 @@ def zip_archive_generator(tree, dest, root, subdir=None,
     already exists, it will be overwritten".
     """
     compression = zipfile.ZIP_DEFLATED
-    with tempfile.SpooledTemporaryFile() as buf:
-        with closing(zipfile.ZipFile(buf, "w", compression)) as zipf, \
-                tree.lock_read():
-            for dp, tp, ie in _export_iter_entries(tree, subdir):
+    stream = _ZipStream()
+    with tree.lock_read():
+        with closing(zipfile.ZipFile(stream, "w", compression)) as zipf:
+            for dp, tp, ie, content in _export_iter_contents(tree, subdir):
                 mutter("  export {%s} kind %s to %s", tp, ie.kind, dest)
 
                 # zipfile.ZipFile switches all paths to forward
@@ -70,7 +94,6 @@ def zip_archive_generator(tree, dest, root, subdir=None,
                         date_time=date_time)
                     zinfo.compress_type = compression
                     zinfo.external_attr = _FILE_ATTR
-                    content = tree.get_file_text(tp)
                     zipf.writestr(zinfo, content)
                 elif ie.kind in ("directory", "tree-reference"):
                     # Directories must contain a trailing slash, to indicate
@@ -89,8 +112,8 @@ def zip_archive_generator(tree, dest, root, subdir=None,
                     zinfo.compress_type = compression
                     zinfo.external_attr = _FILE_ATTR
                     zipf.writestr(zinfo, tree.get_symlink_target(tp))
-        # Urgh, headers are written last since they include e.g. file size.
-        # So we have to buffer it all :(
-        buf.seek(0)
-        for chunk in osutils.file_iterator(buf):
+                for chunk in stream.pop_chunks():
+                    yield chunk
+        # Closing the zipfile writes the central directory.
+        for chunk in stream.pop_chunks():
             yield chunk
@@ -490,11 +490,8 @@ class Branch(controldir.ControlComponent):
             # we need the full graph to get stable numbers, regardless of the
             # start_revision_id.
             if self._merge_sorted_revisions_cache is None:
-                last_revision = self.last_revision()
-                known_graph = self.repository.get_known_graph_ancestry(
-                    [last_revision])
-                self._merge_sorted_revisions_cache = known_graph.merge_sort(
-                    last_revision)
+                self._merge_sorted_revisions_cache = (
+                    self._merge_sort_ancestry())
             filtered = self._filter_merge_sorted_revisions(
                 self._merge_sorted_revisions_cache, start_revision_id,
                 stop_revision_id, stop_rule)
@@ -508,6 +505,37 @@ class Branch(controldir.ControlComponent):
             else:
                 raise ValueError('invalid direction %r' % direction)
 
+    def _merge_sort_ancestry(self):
+        """Merge sort the ancestry of the branch tip.
+
+        :return: A list of nodes with key, merge_depth, revno and
+            end_of_merge attributes, newest first, as KnownGraph.merge_sort
+            returns.
+        """
+        last_revision = self.last_revision()
+        known_graph = self.repository.get_known_graph_ancestry(
+            [last_revision])
+        return known_graph.merge_sort(last_revision)
+
+    def _iter_merge_sorted_forward(self):
+        """Iterate over the merge sorted ancestry of the branch tip.
+
+        Unlike iter_merge_sorted_revisions(direction='forward'), this doesn't
+        wait for the whole ancestry to be sorted, so the oldest revisions are
+        available straight away.
+
+        :return: An iterator over (revision_id, depth, revno) tuples, oldest
+            first.
+        """
+        if self._merge_sorted_revisions_cache is not None:
+            return ((node.key, node.merge_depth, node.revno)
+                    for node in reversed(self._merge_sorted_revisions_cache))
+        with self.lock_read():
+            last_revision = self.last_revision()
+            known_graph = self.repository.get_known_graph_ancestry(
+                [last_revision])
+        return known_graph.iter_merge_sort_forward(last_revision)
+
     def _filter_merge_sorted_revisions(self, merge_sorted_revisions,
                                        start_revision_id, stop_revision_id,
                                        stop_rule):
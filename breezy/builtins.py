@@ -1476,7 +1476,8 @@ class cmd_branch(Command):
             recurse = 'none'
         else:
             recurse = 'down'
-        if not (hardlink or files_from):
+        if not (hardlink or files_from or
+                _mod_config.GlobalStack().get('bzr.transform.reflink')):
             # accelerator_tree is usually slower because you have to read N
             # files (no readahead, lots of seeks, etc), but allow the user to
             # explicitly request it
@@ -1670,7 +1671,8 @@ class cmd_checkout(Command):
             to_location = branch_location
         accelerator_tree, source = controldir.ControlDir.open_tree_or_branch(
             branch_location)
-        if not (hardlink or files_from):
+        if not (hardlink or files_from or
+                _mod_config.GlobalStack().get('bzr.transform.reflink')):
             # accelerator_tree is usually slower because you have to read N
             # files (no readahead, lots of seeks, etc), but allow the user to
             # explicitly request it
@@ -7122,6 +7124,7 @@ def _register_lazy_builtins():
             ('cmd_dump_btree', [], 'breezy.bzr.debug_commands'),
             ('cmd_file_id', [], 'breezy.bzr.debug_commands'),
             ('cmd_file_path', [], 'breezy.bzr.debug_commands'),
+            ('cmd_fsmonitor', [], 'breezy.fsmonitor'),
             ('cmd_version_info', [], 'breezy.cmd_version_info'),
             ('cmd_resolve', ['resolved'], 'breezy.conflicts'),
             ('cmd_conflicts', [], 'breezy.conflicts'),
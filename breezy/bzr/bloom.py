@@ -0,0 +1,151 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Bloom filters over index keys.
+
+A bloom filter answers "is this key possibly present?" with no false
+negatives, which lets a CombinedGraphIndex skip child indices that
+definitely don't contain a key without reading any of their pages.
+"""
+
+import hashlib
+import math
+
+from .. import errors
+
+
+_SIGNATURE = b"Bazaar Bloom Filter 1\n"
+_OPTION_HASHES = b"hashes="
+_OPTION_BITS = b"bits="
+
+# 10 bits per key with 7 hashes gives a false positive rate of about 1%
+DEFAULT_BITS_PER_KEY = 10
+
+
+class BadBloomFilter(errors.BzrError):
+
+    _fmt = "Bloom filter %(name)s is corrupt: %(reason)s"
+
+    def __init__(self, name, reason):
+        errors.BzrError.__init__(self)
+        self.name = name
+        self.reason = reason
+
+
+def key_digest(key):
+    """Hash a key for looking it up in bloom filters.
+
+    The digest doesn't depend on the size of the filter, so it can be
+    computed once and checked against the filters of several indices.
+
+    :return: A digest for BloomFilter.may_contain, or None if the key can't
+        be hashed (it has elements that aren't bytes).
+    """
+    try:
+        serialised = b'\x00'.join(key)
+    except TypeError:
+        return None
+    digest = hashlib.sha1(serialised).digest()
+    return (int.from_bytes(digest[:8], 'big'),
+            int.from_bytes(digest[8:16], 'big') | 1)
+
+
+def _digest_hashes(digest, num_hashes, num_bits):
+    """Generate the bit positions for a key digest.
+
+    This uses double hashing on a single sha1 of the serialised key, which
+    is as good as num_hashes independent hash functions for this purpose.
+    """
+    h1, h2 = digest
+    for i in range(num_hashes):
+        yield (h1 + i * h2) % num_bits
+
+
+class BloomFilter(object):
+    """A fixed size bloom filter of index keys."""
+
+    def __init__(self, num_bits, num_hashes, bits=None):
+        """Create a BloomFilter.
+
+        :param num_bits: The number of bits in the filter.
+        :param num_hashes: The number of bits set per key.
+        :param bits: Optional existing bit array, as a bytearray.
+        """
+        if num_bits < 8:
+            num_bits = 8
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        if bits is None:
+            bits = bytearray((num_bits + 7) // 8)
+        self._bits = bits
+
+    @classmethod
+    def for_key_count(cls, key_count, bits_per_key=DEFAULT_BITS_PER_KEY):
+        """Create an empty filter sized for key_count keys."""
+        num_hashes = max(1, int(round(bits_per_key * math.log(2))))
+        return cls(key_count * bits_per_key, num_hashes)
+
+    def add(self, key):
+        digest = key_digest(key)
+        if digest is None:
+            raise TypeError('bad key %r' % (key,))
+        bits = self._bits
+        for bit in _digest_hashes(digest, self.num_hashes, self.num_bits):
+            bits[bit >> 3] |= 1 << (bit & 7)
+
+    def may_contain(self, digest):
+        """Check whether the key with a digest from key_digest may be present.
+
+        Keys that couldn't be hashed may always be present.
+        """
+        if digest is None:
+            return True
+        bits = self._bits
+        for bit in _digest_hashes(digest, self.num_hashes, self.num_bits):
+            if not bits[bit >> 3] & (1 << (bit & 7)):
+                return False
+        return True
+
+    def __contains__(self, key):
+        return self.may_contain(key_digest(key))
+
+    def as_bytes(self):
+        """Serialise the filter."""
+        return b"".join([
+            _SIGNATURE,
+            _OPTION_HASHES, b"%d\n" % self.num_hashes,
+            _OPTION_BITS, b"%d\n" % self.num_bits,
+            bytes(self._bits)])
+
+    @classmethod
+    def from_bytes(cls, data, name=None):
+        """Parse a filter serialised by as_bytes."""
+        if not data.startswith(_SIGNATURE):
+            raise BadBloomFilter(name, "bad signature")
+        try:
+            hashes_line, bits_line, raw = data[len(_SIGNATURE):].split(
+                b"\n", 2)
+            if not (hashes_line.startswith(_OPTION_HASHES) and
+                    bits_line.startswith(_OPTION_BITS)):
+                raise ValueError
+            num_hashes = int(hashes_line[len(_OPTION_HASHES):])
+            num_bits = int(bits_line[len(_OPTION_BITS):])
+        except ValueError:
+            raise BadBloomFilter(name, "bad options")
+        if len(raw) != (num_bits + 7) // 8:
+            raise BadBloomFilter(name, "expected %d bytes, got %d" % (
+                (num_bits + 7) // 8, len(raw)))
+        return cls(num_bits, num_hashes, bytearray(raw))
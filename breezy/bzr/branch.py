@@ -29,6 +29,7 @@ from breezy import (
     shelf,
     )
 from breezy.bzr import (
+    merge_sort_cache as _mod_merge_sort_cache,
     tag as _mod_tag,
     )
 """)
@@ -439,6 +440,24 @@ class BzrBranch(Branch, _RelockDebugMixin):
         super(BzrBranch, self)._clear_cached_state()
         self._tags_bytes = None
 
+    def _merge_sort_ancestry(self):
+        """See Branch._merge_sort_ancestry."""
+        if not self.get_config_stack().get('branch.merge_sort_cache'):
+            return super(BzrBranch, self)._merge_sort_ancestry()
+        revno, last_revision = self.last_revision_info()
+        cache = _mod_merge_sort_cache.MergeSortCache(self._transport)
+        return cache.merge_sort(self.repository, last_revision, revno)
+
+    def _iter_merge_sorted_forward(self):
+        """See Branch._iter_merge_sorted_forward."""
+        if (self._merge_sorted_revisions_cache is None and
+                self.get_config_stack().get('branch.merge_sort_cache')):
+            # Reading the cache is quicker than sorting.
+            with self.lock_read():
+                self._merge_sorted_revisions_cache = (
+                    self._merge_sort_ancestry())
+        return super(BzrBranch, self)._iter_merge_sorted_forward()
+
     def reconcile(self, thorough=True):
         """Make sure the data stored in this branch is consistent."""
         from .reconcile import BranchReconciler
@@ -18,18 +18,23 @@
 """B+Tree indices"""
 
 from io import BytesIO
+import sys
 
 from ..lazy_import import lazy_import
 lazy_import(globals(), """
 import bisect
 import math
+import mmap
 import tempfile
 import zlib
+
+from breezy.transport import local
 """)
 
 from .. import (
     chunk_writer,
     debug,
+    errors,
     fifo_cache,
     lru_cache,
     osutils,
@@ -38,6 +43,7 @@ from .. import (
     transport,
     )
 from . import (
+    bloom,
     index,
     )
 from .index import _OPTION_NODE_REFS, _OPTION_KEY_ELEMENTS, _OPTION_LEN
@@ -55,6 +61,11 @@ _PAGE_SIZE = 4096
 # 4K per page: 4MB - 1000 entries
 _NODE_CACHE_SIZE = 1000
 
+# Whether indices on a LocalTransport are read through a shared read-only
+# mmap rather than via readv. Windows won't let a mapped file be renamed or
+# deleted, which pack repositories need to do to their indices.
+_use_mmap = (sys.platform != 'win32')
+
 
 class _BuilderRow(object):
     """The stored state accumulated while writing out a row in the index.
@@ -441,13 +452,24 @@ class BTreeBuilder(index.GraphIndexBuilder):
         result.seek(0)
         return result, size
 
-    def finish(self):
+    def finish(self, bloom_filter=None):
         """Finalise the index.
 
+        :param bloom_filter: If not None, a bloom.BloomFilter that every key
+            is added to as it is written out.
         :return: A file handle for a temporary file containing the nodes added
             to the index.
         """
-        return self._write_nodes(self.iter_all_entries())[0]
+        nodes = self.iter_all_entries()
+        if bloom_filter is not None:
+            nodes = self._add_to_bloom_filter(bloom_filter, nodes)
+        return self._write_nodes(nodes)[0]
+
+    @staticmethod
+    def _add_to_bloom_filter(bloom_filter, nodes):
+        for node in nodes:
+            bloom_filter.add(node[1])
+            yield node
 
     def iter_all_entries(self):
         """Iterate over all keys within the index
@@ -620,6 +642,109 @@ class _LeafNode(dict):
         return keys
 
 
+class _LazyLeafNode(object):
+    """A leaf node that only parses the rows that are asked for.
+
+    Leaf rows are stored sorted by key, and the serialised key is a prefix of
+    each row, so a single key can be found by bisecting the raw lines. This
+    avoids building a full dict for pages that only answer one or two
+    probes, which is the common case when reading through an mmap.
+    """
+
+    __slots__ = ('_lines', '_key_length', '_ref_list_length', '_parsed',
+                 '_items', 'min_key', 'max_key')
+
+    def __init__(self, bytes, key_length, ref_list_length):
+        """Split bytes into rows, without parsing them."""
+        lines = bytes.split(b'\n')
+        # Drop the 'type=leaf' header, and the trailing empty lines
+        end = len(lines)
+        while end > 1 and not lines[end - 1]:
+            end -= 1
+        self._lines = lines[1:end]
+        self._key_length = key_length
+        self._ref_list_length = ref_list_length
+        self._parsed = {}
+        self._items = None
+        if self._lines:
+            self.min_key = self._parse_key(self._lines[0])
+            self.max_key = self._parse_key(self._lines[-1])
+        else:
+            self.min_key = self.max_key = None
+
+    def _parse_key(self, line):
+        elements = line.split(b'\0', self._key_length)
+        return static_tuple.StaticTuple.from_sequence(
+            elements[:self._key_length]).intern()
+
+    def _lookup(self, key):
+        """Return the parsed (value, refs) for key, or None."""
+        try:
+            return self._parsed[key]
+        except KeyError:
+            pass
+        if self._items is not None:
+            return self._items.get(key)
+        if len(key) != self._key_length:
+            return None
+        try:
+            prefix = b'\0'.join(key) + b'\0'
+        except TypeError:
+            # Not a valid key, so it can't be present
+            return None
+        lines = self._lines
+        pos = bisect.bisect_left(lines, prefix)
+        if pos == len(lines) or not lines[pos].startswith(prefix):
+            return None
+        [(parsed_key, value)] = _btree_serializer._parse_leaf_lines(
+            _LEAF_FLAG + lines[pos], self._key_length, self._ref_list_length)
+        self._parsed[parsed_key] = value
+        return value
+
+    def _all(self):
+        if self._items is None:
+            self._items = dict(_btree_serializer._parse_leaf_lines(
+                _LEAF_FLAG + b'\n'.join(self._lines), self._key_length,
+                self._ref_list_length))
+            self._parsed = {}
+        return self._items
+
+    def __contains__(self, key):
+        return self._lookup(key) is not None
+
+    def __getitem__(self, key):
+        value = self._lookup(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        value = self._lookup(key)
+        if value is None:
+            return default
+        return value
+
+    def __len__(self):
+        return len(self._lines)
+
+    def __iter__(self):
+        return iter(self._all())
+
+    def keys(self):
+        return self._all().keys()
+
+    def items(self):
+        return self._all().items()
+
+    def all_items(self):
+        """Return a sorted list of (key, (value, refs)) items"""
+        return sorted(self._all().items())
+
+    def all_keys(self):
+        """Return a sorted list of all keys."""
+        return sorted(self._all())
+
+
 class _InternalNode(object):
     """An internal node for a serialised B+Tree index."""
 
@@ -648,6 +773,10 @@ class BTreeGraphIndex(object):
 
     Individual nodes are held in a LRU cache. This holds the root node in
     memory except when very large walks are done.
+
+    Indices on a LocalTransport are read through a read-only mmap of the
+    file, so that concurrent processes share the compressed pages via the OS
+    page cache, and default leaf pages are only parsed as far as needed.
     """
 
     def __init__(self, transport, name, size, unlimited_cache=False,
@@ -671,6 +800,11 @@ class BTreeGraphIndex(object):
         self._name = name
         self._size = size
         self._file = None
+        # The name of a bloom filter sidecar for this index, if one may exist
+        self._bloom_filter_name = None
+        self._bloom_filter = None
+        self._mmap = None
+        self._mmap_checked = False
         self._recommended_pages = self._compute_recommended_pages()
         self._root_node = None
         self._base_offset = offset
@@ -892,6 +1026,32 @@ class BTreeGraphIndex(object):
         # round-trips in the future. We may re-evaluate this if InternalNode
         # memory starts to be an issue.
         self._leaf_node_cache.clear()
+        self._close_mmap()
+
+    def __del__(self):
+        if getattr(self, '_mmap', None) is not None:
+            self._close_mmap()
+
+    def get_bloom_filter(self):
+        """Return the bloom filter for the keys in this index, or None.
+
+        The filter is read from the sidecar named by _bloom_filter_name the
+        first time it is asked for. A missing or corrupt sidecar just means
+        there is no filter.
+        """
+        if self._bloom_filter is None:
+            if self._bloom_filter_name is None:
+                return None
+            try:
+                self._bloom_filter = bloom.BloomFilter.from_bytes(
+                    self._transport.get_bytes(self._bloom_filter_name),
+                    self._bloom_filter_name)
+            except errors.NoSuchFile:
+                self._bloom_filter = False
+            except bloom.BadBloomFilter as e:
+                trace.mutter('ignoring bloom filter: %s', e)
+                self._bloom_filter = False
+        return self._bloom_filter or None
 
     def external_references(self, ref_list_num):
         if self._root_node is None:
@@ -1329,10 +1489,7 @@ class BTreeGraphIndex(object):
         'bar'), ('foobar', 'gam') and do a prefix search for ('foo', None) then
         only the former key is returned.
 
-        WARNING: Note that this method currently causes a full index parse
-        unconditionally (which is reasonably appropriate as it is a means for
-        thunking many small indices into one larger one and still supplies
-        iter_all_entries at the thunk layer).
+        Only the leaf nodes that can hold keys with the prefixes are read.
 
         :param keys: An iterable providing the key prefixes to be retrieved.
             Each key prefix takes the form of a tuple the length of a key, but
@@ -1349,52 +1506,54 @@ class BTreeGraphIndex(object):
         # Load if needed to check key lengths
         if self._key_count is None:
             self._get_root_node()
-        # TODO: only access nodes that can satisfy the prefixes we are looking
-        # for. For now, to meet API usage (as this function is not used by
-        # current breezy) just suck the entire index and iterate in memory.
-        nodes = {}
-        if self.node_ref_lists:
-            if self._key_length == 1:
-                for _1, key, value, refs in self.iter_all_entries():
-                    nodes[key] = value, refs
-            else:
-                nodes_by_key = {}
-                for _1, key, value, refs in self.iter_all_entries():
-                    key_value = key, value, refs
-                    # For a key of (foo, bar, baz) create
-                    # _nodes_by_key[foo][bar][baz] = key_value
-                    key_dict = nodes_by_key
-                    for subkey in key[:-1]:
-                        key_dict = key_dict.setdefault(subkey, {})
-                    key_dict[key[-1]] = key_value
-        else:
-            if self._key_length == 1:
-                for _1, key, value in self.iter_all_entries():
-                    nodes[key] = value
-            else:
-                nodes_by_key = {}
-                for _1, key, value in self.iter_all_entries():
-                    key_value = key, value
-                    # For a key of (foo, bar, baz) create
-                    # _nodes_by_key[foo][bar][baz] = key_value
-                    key_dict = nodes_by_key
-                    for subkey in key[:-1]:
-                        key_dict = key_dict.setdefault(subkey, {})
-                    key_dict[key[-1]] = key_value
         if self._key_length == 1:
             for key in keys:
                 index._sanity_check_key(self, key)
-                try:
-                    if self.node_ref_lists:
-                        value, node_refs = nodes[key]
-                        yield self, key, value, node_refs
-                    else:
-                        yield self, key, nodes[key]
-                except KeyError:
-                    pass
+            for entry in self.iter_entries(keys):
+                yield entry
             return
-        for entry in index._iter_entries_prefix(self, nodes_by_key, keys):
-            yield entry
+        for key in keys:
+            index._sanity_check_key(self, key)
+        if not self._key_count:
+            return
+        for key in keys:
+            for entry in self._iter_entries_with_prefix(key):
+                yield entry
+
+    def _iter_entries_with_prefix(self, key):
+        """Iterate over the entries whose keys start with a prefix.
+
+        Keys are sorted, so the matching keys are in a contiguous range of
+        leaf nodes, bounded by the leaves that the first key with the prefix
+        and the first key after them would be in. Only those are read.
+        """
+        prefix = []
+        for element in key:
+            if element is None:
+                break
+            prefix.append(element)
+        padding = (b'',) * (self._key_length - len(prefix))
+        # Key elements are not empty, so these sort before and after all the
+        # keys with the prefix.
+        lower = tuple(prefix) + padding
+        upper = tuple(prefix[:-1]) + (prefix[-1] + b'\x00',) + padding
+        nodes, nodes_and_keys = self._walk_through_internal_nodes(
+            [lower, upper])
+        node_indexes = [node_index for node_index, _ in nodes_and_keys]
+        first = min(node_indexes)
+        last = max(node_indexes)
+        nodes.update(self._get_leaf_nodes(
+            [idx for idx in range(first + 1, last) if idx not in nodes]))
+        prefix = tuple(prefix)
+        prefix_length = len(prefix)
+        for node_index in range(first, last + 1):
+            for node_key, (value, refs) in nodes[node_index].all_items():
+                if tuple(node_key[:prefix_length]) != prefix:
+                    continue
+                if self.node_ref_lists:
+                    yield (self, node_key, value, refs)
+                else:
+                    yield (self, node_key, value)
 
     def key_count(self):
         """Return an estimate of the number of keys in this index.
@@ -1508,17 +1667,31 @@ class BTreeGraphIndex(object):
             ranges.append((base_offset + offset, size))
         if not ranges:
             return
-        elif bytes is not None:
+        leaf_factory = self._leaf_factory
+        mapped = None
+        if bytes is None and self._file is None:
+            mapped = self._get_mmap()
+        if bytes is not None:
             # already have the whole file
             data_ranges = [(start, bytes[start:start + size])
                            for start, size in ranges]
-        elif self._file is None:
-            data_ranges = self._transport.readv(self._name, ranges)
-        else:
+        elif self._file is not None:
             data_ranges = []
             for offset, size in ranges:
                 self._file.seek(offset)
                 data_ranges.append((offset, self._file.read(size)))
+        elif mapped is not None:
+            if leaf_factory is _LeafNode:
+                leaf_factory = _LazyLeafNode
+            # Only the header page needs a copy, the rest are inflated
+            # straight out of the mapping.
+            view = memoryview(mapped)
+            data_ranges = [
+                (start, view[start:start + size]) if start != base_offset
+                else (start, mapped[start:start + size])
+                for start, size in ranges]
+        else:
+            data_ranges = self._transport.readv(self._name, ranges)
         for offset, data in data_ranges:
             offset -= base_offset
             if offset == 0:
@@ -1528,14 +1701,61 @@ class BTreeGraphIndex(object):
                     continue
             bytes = zlib.decompress(data)
             if bytes.startswith(_LEAF_FLAG):
-                node = self._leaf_factory(bytes, self._key_length,
-                                          self.node_ref_lists)
+                node = leaf_factory(bytes, self._key_length,
+                                    self.node_ref_lists)
             elif bytes.startswith(_INTERNAL_FLAG):
                 node = _InternalNode(bytes)
             else:
                 raise AssertionError("Unknown node type for %r" % bytes)
             yield offset // _PAGE_SIZE, node
 
+    def _get_mmap(self):
+        """Return a read-only mmap of the index file, or None.
+
+        The mapping is only attempted once, for indices with a known size on
+        a LocalTransport. Any failure just falls back to using readv.
+        """
+        if self._mmap_checked:
+            return self._mmap
+        if not self._size:
+            # Can't validate the mapping, and we'll read it all at once anyway
+            return None
+        self._mmap_checked = True
+        if not _use_mmap or not isinstance(self._transport,
+                                           local.LocalTransport):
+            return None
+        try:
+            path = self._transport.local_abspath(self._name)
+            with open(path, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (EnvironmentError, ValueError) as e:
+            trace.mutter('not mapping %s: %s', self._name, e)
+            return None
+        if len(mapped) < self._base_offset + self._size:
+            # The file isn't what we were told it would be, let readv raise
+            # the appropriate error.
+            mapped.close()
+            return None
+        self._mmap = mapped
+        return mapped
+
+    def _close_mmap(self):
+        """Close the mmap of the index file, if there is one.
+
+        It is mapped again the next time pages are read.
+        """
+        mapped = self._mmap
+        self._mmap = None
+        self._mmap_checked = False
+        if mapped is None:
+            return
+        try:
+            mapped.close()
+        except BufferError:
+            # Pages are still being read from it; the mapping goes away
+            # when they are done with it.
+            pass
+
     def _signature(self):
         """The file signature for this index type."""
         return _BTSIGNATURE
@@ -0,0 +1,214 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""A persistent cache of CHK pages, shared between processes.
+
+CHK pages are addressed by the sha1 of their content, so a page cached by
+one process (for any repository) is valid for every other process and never
+needs invalidating. Pages are stored one per file, in a directory fanned out
+on the first two hex digits of the sha1. The modification time of a file is
+used as its last access time, and the least recently used pages are removed
+once the cache grows beyond its size limit.
+"""
+
+import errno
+import os
+import time
+
+from .. import (
+    osutils,
+    trace,
+    )
+
+
+_KEY_PREFIX = b'sha1:'
+_STAMP_NAME = 'last-gc'
+# Check the size of the cache at least this often (in seconds), even when
+# no single process writes enough to trigger a check by itself.
+_GC_PERIOD = 3600
+# Once over the limit, prune the cache down to this fraction of it, so that
+# we don't have to prune again on the very next write.
+_GC_TARGET = 0.9
+
+
+class DiskPageCache(object):
+    """A size-bounded, content-addressed store of CHK pages on disk.
+
+    This has the same mapping interface as the in-memory page cache, but
+    only keys of the form (b'sha1:<hex>',) are stored.
+    """
+
+    def __init__(self, path, max_size):
+        """Create a DiskPageCache.
+
+        :param path: The directory to store the pages in. It is created if
+            it doesn't exist.
+        :param max_size: The approximate maximum number of bytes of pages to
+            keep.
+        """
+        self._path = path
+        self._max_size = max_size
+        # Bytes written by this process since the last size check
+        self._added_size = 0
+        self._gc_checked = False
+
+    def _sha1_for_key(self, key):
+        if len(key) != 1:
+            return None
+        key = key[0]
+        if not isinstance(key, bytes) or not key.startswith(_KEY_PREFIX):
+            return None
+        sha1 = key[len(_KEY_PREFIX):]
+        if len(sha1) != 40:
+            return None
+        return sha1
+
+    def _page_path(self, sha1):
+        sha1 = sha1.decode('ascii')
+        return osutils.pathjoin(self._path, sha1[:2], sha1[2:])
+
+    def __getitem__(self, key):
+        sha1 = self._sha1_for_key(key)
+        if sha1 is None:
+            raise KeyError(key)
+        path = self._page_path(sha1)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except (IOError, OSError):
+            raise KeyError(key)
+        if osutils.sha_string(data) != sha1:
+            # Truncated or otherwise damaged; drop it and go to the store.
+            trace.mutter('removing corrupt cached chk page %s', path)
+            self._remove(path)
+            raise KeyError(key)
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return data
+
+    def __contains__(self, key):
+        sha1 = self._sha1_for_key(key)
+        if sha1 is None:
+            return False
+        return os.path.exists(self._page_path(sha1))
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, data):
+        sha1 = self._sha1_for_key(key)
+        if sha1 is None or len(data) > self._max_size:
+            return
+        path = self._page_path(sha1)
+        if os.path.exists(path):
+            return
+        tmp_path = '%s.%s.tmp' % (path, osutils.rand_chars(10))
+        try:
+            try:
+                f = open(tmp_path, 'wb')
+            except (IOError, OSError) as e:
+                if e.errno != errno.ENOENT:
+                    raise
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                f = open(tmp_path, 'wb')
+            with f:
+                f.write(data)
+            os.rename(tmp_path, path)
+        except (IOError, OSError) as e:
+            # The cache is only an optimisation, so never fail because of it
+            trace.mutter('failed to cache chk page %s: %s', path, e)
+            self._remove(tmp_path)
+            return
+        self._added_size += len(data)
+        if (self._added_size > self._max_size // 16 or
+                (not self._gc_checked and self._gc_due())):
+            self.gc()
+
+    def _remove(self, path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def _gc_due(self):
+        self._gc_checked = True
+        try:
+            last_gc = os.stat(
+                osutils.pathjoin(self._path, _STAMP_NAME)).st_mtime
+        except OSError:
+            return True
+        return last_gc + _GC_PERIOD < time.time()
+
+    def _iter_pages(self):
+        """Yield (mtime, size, path) for each cached page."""
+        try:
+            subdirs = os.listdir(self._path)
+        except OSError:
+            return
+        for subdir in subdirs:
+            if len(subdir) != 2:
+                continue
+            subdir = osutils.pathjoin(self._path, subdir)
+            try:
+                names = os.listdir(subdir)
+            except OSError:
+                continue
+            for name in names:
+                if name.endswith('.tmp'):
+                    continue
+                path = osutils.pathjoin(subdir, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield st.st_mtime, st.st_size, path
+
+    def size(self):
+        """Return the total size of the cached pages."""
+        return sum(size for mtime, size, path in self._iter_pages())
+
+    def gc(self):
+        """Remove the least recently used pages if over the size limit."""
+        self._added_size = 0
+        self._gc_checked = True
+        pages = list(self._iter_pages())
+        total = sum(size for mtime, size, path in pages)
+        if total > self._max_size:
+            target = int(self._max_size * _GC_TARGET)
+            pages.sort()
+            for mtime, size, path in pages:
+                if total <= target:
+                    break
+                self._remove(path)
+                total -= size
+            trace.mutter('pruned chk page cache %s to %d bytes',
+                         self._path, total)
+        stamp = osutils.pathjoin(self._path, _STAMP_NAME)
+        try:
+            with open(stamp, 'wb'):
+                pass
+        except (IOError, OSError):
+            pass
+
+    def clear(self):
+        """Remove every cached page."""
+        for mtime, size, path in self._iter_pages():
+            self._remove(path)
@@ -81,6 +81,55 @@ def clear_cache():
     _get_cache().clear()
 
 
+# The persistent page cache, shared between processes. _NOT_LOADED until the
+# configuration has been consulted, then None if it is disabled.
+_NOT_LOADED = object()
+_disk_cache = _NOT_LOADED
+
+
+def _get_disk_cache():
+    """Get the persistent page cache, or None if it is disabled.
+
+    This is configured by the ``bzr.chk_map.disk_cache_size`` option.
+    """
+    global _disk_cache
+    if _disk_cache is _NOT_LOADED:
+        from .. import bedding, config
+        from . import chk_disk_cache
+        max_size = config.GlobalStack().get('bzr.chk_map.disk_cache_size')
+        if max_size:
+            _disk_cache = chk_disk_cache.DiskPageCache(
+                osutils.pathjoin(bedding.cache_dir(), 'chk-pages'), max_size)
+        else:
+            _disk_cache = None
+    return _disk_cache
+
+
+def _get_page(key):
+    """Get the bytes for a page from the in-memory or persistent caches.
+
+    :raises KeyError: If the page is in neither cache.
+    """
+    page_cache = _get_cache()
+    try:
+        return page_cache[key]
+    except KeyError:
+        disk_cache = _get_disk_cache()
+        if disk_cache is None:
+            raise
+    data = disk_cache[key]
+    page_cache[key] = data
+    return data
+
+
+def _cache_page(key, data):
+    """Add the bytes for a page read from the store to the page caches."""
+    _get_cache()[key] = data
+    disk_cache = _get_disk_cache()
+    if disk_cache is not None:
+        disk_cache[key] = data
+
+
 # If a ChildNode falls below this many bytes, we check for a remap
 _INTERESTING_NEW_SIZE = 50
 # If a ChildNode shrinks by more than this amount, we check for a remap
@@ -174,11 +223,11 @@ class CHKMap(object):
 
     def _read_bytes(self, key):
         try:
-            return _get_cache()[key]
+            return _get_page(key)
         except KeyError:
             stream = self._store.get_record_stream([key], 'unordered', True)
             bytes = next(stream).get_bytes_as('fulltext')
-            _get_cache()[key] = bytes
+            _cache_page(key, bytes)
             return bytes
 
     def _dump_tree(self, include_keys=False, encoding='utf-8'):
@@ -1163,7 +1212,7 @@ class InternalNode(Node):
             found_keys = set()
             for key in keys:
                 try:
-                    bytes = _get_cache()[key]
+                    bytes = _get_page(key)
                 except KeyError:
                     continue
                 else:
@@ -1194,7 +1243,7 @@ class InternalNode(Node):
                     prefix, node_key_filter = keys[record.key]
                     node_and_filters.append((node, node_key_filter))
                     self._items[prefix] = node
-                    _get_cache()[record.key] = bytes
+                    _cache_page(record.key, bytes)
                 for info in node_and_filters:
                     yield info
 
@@ -1719,6 +1768,183 @@ def iter_interesting_nodes(store, interesting_root_keys,
     return iterator.process()
 
 
+class _RootPairChanges(object):
+    """The state of walking one (new_root_key, old_root_key) pair."""
+
+    __slots__ = ('new_root_key', 'old_root_key', 'new_refs', 'old_refs',
+                 'new_items', 'old_items')
+
+    def __init__(self, new_root_key, old_root_key):
+        self.new_root_key = new_root_key
+        self.old_root_key = old_root_key
+        self.new_refs = set()
+        self.old_refs = set()
+        if new_root_key != old_root_key:
+            if new_root_key is not None:
+                self.new_refs.add(new_root_key)
+            if old_root_key is not None:
+                self.old_refs.add(old_root_key)
+        self.new_items = {}
+        self.old_items = {}
+
+    def changes(self):
+        """Return the (key, old_value, new_value) changes, sorted by key."""
+        new_items = self.new_items
+        old_items = self.old_items
+        changes = []
+        for key in sorted(set(new_items).union(old_items)):
+            old_value = old_items.get(key)
+            new_value = new_items.get(key)
+            if old_value != new_value:
+                changes.append((key, old_value, new_value))
+        return changes
+
+
+class CHKMapMultiDifference(object):
+    """Compute the changes between many pairs of maps in a single walk.
+
+    This is the batched equivalent of calling CHKMap.iter_changes for each
+    (new_root_key, old_root_key) pair. All the trees are walked together,
+    one level at a time, so each level costs a single get_record_stream
+    call no matter how many pairs there are, and a page shared by several
+    pairs is only read once per level. Within a pair, subtrees referenced
+    by both sides are skipped without being read.
+    """
+
+    def __init__(self, store, root_pairs, search_key_func, pb=None,
+                 known_nodes=None):
+        """Create a CHKMapMultiDifference.
+
+        :param store: The store the maps are stored in.
+        :param root_pairs: A sequence of (new_root_key, old_root_key) tuples.
+            Either key may be None for an empty map.
+        :param search_key_func: The search key function of the maps.
+        :param pb: An optional progress bar, ticked for each page read.
+        :param known_nodes: An optional dict of key => node for nodes that
+            are already in memory, such as the roots of loaded maps.
+        """
+        self._store = store
+        self._pairs = [_RootPairChanges(new_root_key, old_root_key)
+                       for new_root_key, old_root_key in root_pairs]
+        self._search_key_func = search_key_func
+        self._pb = pb
+        if known_nodes is None:
+            known_nodes = {}
+        self._known_nodes = known_nodes
+
+    def _read_nodes(self, keys):
+        """Read the nodes for keys, from the page caches or the store.
+
+        :return: A dict of key => node.
+        """
+        nodes = {}
+        missing = []
+        known_nodes = self._known_nodes
+        for key in keys:
+            node = known_nodes.get(key)
+            if node is not None:
+                nodes[key] = node
+                continue
+            try:
+                data = _get_page(key)
+            except KeyError:
+                missing.append(key)
+            else:
+                nodes[key] = _deserialise(data, key, self._search_key_func)
+        if missing:
+            stream = self._store.get_record_stream(missing, 'unordered', True)
+            for record in stream:
+                if self._pb is not None:
+                    self._pb.tick()
+                if record.storage_kind == 'absent':
+                    raise errors.NoSuchRevision(self._store, record.key)
+                data = record.get_bytes_as('fulltext')
+                # Pages may be needed again at a different depth by another
+                # pair, so keep them in the page cache.
+                _cache_page(record.key, data)
+                nodes[record.key] = _deserialise(data, record.key,
+                                                 self._search_key_func)
+        return nodes
+
+    def _expand(self, refs, nodes, items):
+        """Replace refs by the refs of their children.
+
+        The items of any leaf nodes are added to items.
+        """
+        child_refs = set()
+        for ref in refs:
+            node = nodes[ref]
+            if isinstance(node, InternalNode):
+                for child in node._items.values():
+                    if child.__class__ is not StaticTuple:
+                        # A child that was already paged in
+                        child = child.key()
+                    child_refs.add(child)
+            else:
+                items.update(node._items)
+        return child_refs
+
+    def process(self):
+        """Walk the maps, yielding the changes for each pair.
+
+        :return: An iterator of (new_root_key, old_root_key, changes) tuples,
+            in the order of root_pairs, where changes is a list of
+            (key, old_value, new_value) tuples as per CHKMap.iter_changes.
+        """
+        pairs = self._pairs
+        next_to_yield = 0
+        active = [pair for pair in pairs if pair.new_refs or pair.old_refs]
+        while True:
+            while (next_to_yield < len(pairs) and
+                   not pairs[next_to_yield].new_refs and
+                   not pairs[next_to_yield].old_refs):
+                pair = pairs[next_to_yield]
+                pairs[next_to_yield] = None
+                next_to_yield += 1
+                yield pair.new_root_key, pair.old_root_key, pair.changes()
+            if not active:
+                break
+            to_read = set()
+            for pair in active:
+                # Pages referenced by both sides hold the same items, so
+                # there is no need to read them at all.
+                common = pair.new_refs.intersection(pair.old_refs)
+                if common:
+                    pair.new_refs.difference_update(common)
+                    pair.old_refs.difference_update(common)
+                to_read.update(pair.new_refs)
+                to_read.update(pair.old_refs)
+            nodes = self._read_nodes(to_read)
+            for pair in active:
+                pair.new_refs = self._expand(pair.new_refs, nodes,
+                                             pair.new_items)
+                pair.old_refs = self._expand(pair.old_refs, nodes,
+                                             pair.old_items)
+            del nodes
+            active = [pair for pair in active
+                      if pair.new_refs or pair.old_refs]
+
+
+def iter_changes_for_roots(store, root_pairs, search_key_func=None,
+                           pb=None, known_nodes=None):
+    """Find the changes between many pairs of maps at once.
+
+    :param root_pairs: A sequence of (new_root_key, old_root_key) tuples.
+    :param search_key_func: The search key function of the maps, by default
+        the one of store.
+    :param known_nodes: An optional dict of key => node for nodes that are
+        already in memory.
+    :return: Yield (new_root_key, old_root_key, changes) for each pair, in
+        order, where changes is a list of (key, old_value, new_value).
+    """
+    if search_key_func is None:
+        search_key_func = store._search_key_func
+    iterator = CHKMapMultiDifference(store, root_pairs,
+                                     search_key_func=search_key_func, pb=pb,
+                                     known_nodes=known_nodes)
+    return iterator.process()
+
+
 try:
     from ._chk_map_pyx import (
         _bytes_to_text_key,
@@ -0,0 +1,311 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""A compact in-memory layout for the rows of a dirstate.
+
+DirState normally keeps its rows as nested lists and tuples of bytes (see the
+breezy.bzr.dirstate docstring), which takes several hundred bytes per row.
+CompactDirblocks keeps the same rows in one array per column instead, with
+every distinct string stored once in a single string table, and builds the
+entry tuples only when they are asked for.
+
+It can look up entries by path and by file id, iterate over all entries and
+record hash cache updates. Everything else needs the normal layout, which
+DirState builds from this one when it is first used.
+"""
+
+from array import array
+
+from .dirstate import DirstateCorrupt
+
+
+# Single byte bytes objects, indexed by their value.
+_BYTES = [bytes([value]) for value in range(256)]
+
+
+def read_dirblocks(state):
+    """Read the rows of a dirstate into a CompactDirblocks.
+
+    This is the counterpart of _dirstate_helpers._read_dirblocks.
+
+    :param state: A DirState object whose header has been read.
+    :return: A CompactDirblocks.
+    """
+    state._state_file.seek(state._end_of_header)
+    fields = state._state_file.read().split(b'\0')
+    trailing = fields.pop()
+    if trailing != b'':
+        raise DirstateCorrupt(state, 'trailing garbage: %r' % (trailing,))
+    # skip the first field which is the trailing null from the header.
+    cur = 1
+    entry_size = state._fields_per_entry()
+    expected_field_count = entry_size * state._num_entries
+    if len(fields) - cur != expected_field_count:
+        raise DirstateCorrupt(
+            state, 'field count incorrect %s != %s, entry_size=%s, '
+            'num_entries=%s' % (len(fields) - cur, expected_field_count,
+                                entry_size, state._num_entries))
+    return CompactDirblocks(
+        fields, cur, state._num_entries, 1 + state._num_present_parents())
+
+
+class CompactDirblocks(object):
+    """The rows of a dirstate, stored column by column."""
+
+    def __init__(self, fields, start, num_entries, tree_count):
+        """Create a CompactDirblocks.
+
+        :param fields: The fields of the dirstate rows, as in the file.
+        :param start: The index of the first field of the first row.
+        :param num_entries: The number of rows.
+        :param tree_count: The number of trees in each row.
+        """
+        self._tree_count = tree_count
+        strings = {}
+        self._block_dirnames = array('i')
+        # The index of the first row of each block, and of the end of the last
+        self._block_starts = array('i')
+        self._names = array('i')
+        self._file_ids = array('i')
+        self._minikinds = [bytearray(num_entries) for _ in range(tree_count)]
+        self._fingerprints = [array('i') for _ in range(tree_count)]
+        self._sizes = [array('q') for _ in range(tree_count)]
+        self._executables = [bytearray(num_entries)
+                             for _ in range(tree_count)]
+        self._infos = [array('i') for _ in range(tree_count)]
+        trees = list(zip(
+            self._minikinds, [fp.append for fp in self._fingerprints],
+            [sizes.append for sizes in self._sizes], self._executables,
+            [infos.append for infos in self._infos]))
+        intern = strings.setdefault
+        append_name = self._names.append
+        append_file_id = self._file_ids.append
+        current_dirname = None
+        pos = start
+        for index in range(num_entries):
+            dirname = fields[pos]
+            if dirname != current_dirname:
+                current_dirname = dirname
+                self._block_dirnames.append(intern(dirname, len(strings)))
+                self._block_starts.append(index)
+            append_name(intern(fields[pos + 1], len(strings)))
+            append_file_id(intern(fields[pos + 2], len(strings)))
+            pos += 3
+            for (minikinds, append_fingerprint, append_size, executables,
+                 append_info) in trees:
+                minikinds[index] = fields[pos][0]
+                append_fingerprint(intern(fields[pos + 1], len(strings)))
+                append_size(int(fields[pos + 2]))
+                executables[index] = fields[pos + 3] == b'y'
+                append_info(intern(fields[pos + 4], len(strings)))
+                pos += 5
+            if fields[pos] != b'\n':
+                raise ValueError(
+                    "trailing garbage in dirstate: %r" % fields[pos])
+            pos += 1
+        self._block_starts.append(num_entries)
+        self._string_data = b''.join(strings)
+        self._string_offsets = array('q', [0])
+        offset = 0
+        for string in strings:
+            offset += len(string)
+            self._string_offsets.append(offset)
+        self._string_count = len(strings)
+        # Strings added by later updates, and their indices.
+        self._extra_strings = []
+        self._extra_string_index = {}
+        # The rows ordered by file id, see _get_id_order.
+        self._id_order = None
+
+    def _string(self, index):
+        if index < self._string_count:
+            offsets = self._string_offsets
+            return self._string_data[offsets[index]:offsets[index + 1]]
+        return self._extra_strings[index - self._string_count]
+
+    def _add_string(self, string):
+        index = self._extra_string_index.get(string)
+        if index is None:
+            index = self._string_count + len(self._extra_strings)
+            self._extra_strings.append(string)
+            self._extra_string_index[string] = index
+        return index
+
+    def _entry(self, index, dirname):
+        string = self._string
+        return ((dirname, string(self._names[index]),
+                 string(self._file_ids[index])),
+                [(_BYTES[self._minikinds[tree][index]],
+                  string(self._fingerprints[tree][index]),
+                  self._sizes[tree][index],
+                  bool(self._executables[tree][index]),
+                  string(self._infos[tree][index]))
+                 for tree in range(self._tree_count)])
+
+    def iter_entries(self):
+        """Iterate over the entries, in dirstate order."""
+        starts = self._block_starts
+        for block_index, dirname in enumerate(self._block_dirnames):
+            dirname = self._string(dirname)
+            for index in range(starts[block_index], starts[block_index + 1]):
+                yield self._entry(index, dirname)
+
+    def to_dirblocks(self):
+        """Return the rows in the normal DirState._dirblocks layout."""
+        dirblocks = []
+        starts = self._block_starts
+        for block_index, dirname in enumerate(self._block_dirnames):
+            dirname = self._string(dirname)
+            dirblocks.append((dirname, [
+                self._entry(index, dirname) for index
+                in range(starts[block_index], starts[block_index + 1])]))
+        if not dirblocks:
+            return [(b'', []), (b'', [])]
+        # Split the root entries from the contents of the root.
+        root_block = []
+        contents_of_root_block = []
+        for entry in dirblocks[0][1]:
+            if not entry[0][1]:
+                root_block.append(entry)
+            else:
+                contents_of_root_block.append(entry)
+        dirblocks[0:1] = [(b'', root_block), (b'', contents_of_root_block)]
+        return dirblocks
+
+    def _find_block(self, dirname):
+        """Return the index of the block for dirname, or None."""
+        dirname_split = dirname.split(b'/')
+        lo = 0
+        hi = len(self._block_dirnames)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_split = self._string(self._block_dirnames[mid]).split(b'/')
+            if mid_split < dirname_split:
+                lo = mid + 1
+            else:
+                hi = mid
+        if (lo < len(self._block_dirnames) and
+                self._string(self._block_dirnames[lo]) == dirname):
+            return lo
+        return None
+
+    def _find_row(self, block_index, basename, file_id=b''):
+        """Return the index of the first row at or after basename, file_id."""
+        lo = self._block_starts[block_index]
+        hi = self._block_starts[block_index + 1]
+        target = (basename, file_id)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if (self._string(self._names[mid]),
+                    self._string(self._file_ids[mid])) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _find_key(self, key):
+        """Return the index of the row with key, or None."""
+        block_index = self._find_block(key[0])
+        if block_index is None:
+            return None
+        index = self._find_row(block_index, key[1], key[2])
+        if (index < self._block_starts[block_index + 1] and
+                self._string(self._names[index]) == key[1] and
+                self._string(self._file_ids[index]) == key[2]):
+            return index
+        return None
+
+    def get_key_entry(self, key):
+        """Return the entry with key, or None."""
+        index = self._find_key(key)
+        if index is None:
+            return None
+        return self._entry(index, key[0])
+
+    def get_path_entry(self, dirname, basename, tree_index):
+        """Return the entry at a path that is present in a tree, or None."""
+        block_index = self._find_block(dirname)
+        if block_index is None:
+            return None
+        minikinds = self._minikinds[tree_index]
+        end = self._block_starts[block_index + 1]
+        index = self._find_row(block_index, basename)
+        while (index < end and
+               self._string(self._names[index]) == basename):
+            if _BYTES[minikinds[index]] not in (b'a', b'r'):
+                return self._entry(index, dirname)
+            index += 1
+        return None
+
+    def _get_id_order(self):
+        if self._id_order is None:
+            # A stable sort, so rows with the same file id stay in dirstate
+            # order.
+            self._id_order = array('i', sorted(
+                range(len(self._names)),
+                key=lambda index: self._string(self._file_ids[index])))
+        return self._id_order
+
+    def _block_for_row(self, index):
+        lo = 0
+        hi = len(self._block_dirnames)
+        starts = self._block_starts
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if starts[mid + 1] <= index:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def get_id_entries(self, file_id):
+        """Return the entries for file_id in any tree, in dirstate order."""
+        if not isinstance(file_id, bytes):
+            return []
+        id_order = self._get_id_order()
+        lo = 0
+        hi = len(id_order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._string(self._file_ids[id_order[mid]]) < file_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        entries = []
+        while (lo < len(id_order) and
+               self._string(self._file_ids[id_order[lo]]) == file_id):
+            index = id_order[lo]
+            dirname = self._string(
+                self._block_dirnames[self._block_for_row(index)])
+            entries.append(self._entry(index, dirname))
+            lo += 1
+        return entries
+
+    def set_details(self, key, tree_index, details):
+        """Change the details of a tree in an entry, e.g. its hash cache.
+
+        :return: False if there is no entry with key.
+        """
+        index = self._find_key(key)
+        if index is None:
+            return False
+        minikind, fingerprint, size, executable, info = details
+        self._minikinds[tree_index][index] = minikind[0]
+        self._fingerprints[tree_index][index] = self._add_string(fingerprint)
+        self._sizes[tree_index][index] = size
+        self._executables[tree_index][index] = bool(executable)
+        self._infos[tree_index][index] = self._add_string(info)
+        return True
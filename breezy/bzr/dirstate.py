@@ -31,7 +31,7 @@ are not - this is done for clarity of reading. All string data is in utf8.
 
     dirstate format = header line, full checksum, row count, parent details,
      ghost_details, entries;
-    header line = "#bazaar dirstate flat format 3", NL;
+    header line = "#bazaar dirstate flat format 3", [" with journal"], NL;
     full checksum = "crc32: ", ["-"], WHOLE_NUMBER, NL;
     row count = "num_entries: ", WHOLE_NUMBER, NL;
     parent_details = WHOLE NUMBER, {REVISION_ID}* NL;
@@ -230,6 +230,7 @@ import time
 import zlib
 
 from . import (
+    dirstate_journal,
     inventory,
     )
 from .. import (
@@ -301,6 +302,26 @@ class DefaultSHA1Provider(SHA1Provider):
         return statvalue, sha1
 
 
+class _MaterialisedDirblocks(object):
+    """Build DirState._dirblocks from DirState._compact_dirblocks when used.
+
+    The result is stored on the instance, so this is only reached while the
+    rows are held in the compact layout.
+    """
+
+    def __get__(self, state, owner=None):
+        if state is None:
+            return self
+        compact = state._compact_dirblocks
+        if compact is None:
+            dirblocks = []
+        else:
+            state._compact_dirblocks = None
+            dirblocks = compact.to_dirblocks()
+        state.__dict__['_dirblocks'] = dirblocks
+        return dirblocks
+
+
 class DirState(object):
     """Record directory and metadata state for fast access.
 
@@ -359,6 +380,15 @@ class DirState(object):
 
     HEADER_FORMAT_2 = b'#bazaar dirstate flat format 2\n'
     HEADER_FORMAT_3 = b'#bazaar dirstate flat format 3\n'
+    # The same format, but changes may be in a journal next to the file.
+    # Clients that can't replay the journal don't accept this header, so
+    # they can't read stale rows and then rewrite the file without them.
+    HEADER_FORMAT_3_JOURNAL = b'#bazaar dirstate flat format 3 with journal\n'
+    # The journal is folded into the dirstate file once it is larger than this
+    # fraction of the dirstate file.
+    JOURNAL_MAX_FRACTION = 0.25
+
+    _dirblocks = _MaterialisedDirblocks()
 
     def __init__(self, path, sha1_provider, worth_saving_limit=0,
                  use_filesystem_for_exec=True):
@@ -390,9 +420,16 @@ class DirState(object):
         # for safety we're not going to commit to disk.
         self._changes_aborted = False
         self._dirblocks = []
+        # The rows in the layout of compact_dirstate, while they haven't been
+        # needed as _dirblocks. Only used under a read lock.
+        self._compact_dirblocks = None
         self._ghosts = []
         self._parents = []
         self._state_file = None
+        # The journal of the dirstate file, once its header has been read.
+        self._journal = None
+        # Whether the header of the dirstate file allows a journal.
+        self._header_has_journal = False
         self._filename = path
         self._lock_token = None
         self._lock_state = None
@@ -408,6 +445,8 @@ class DirState(object):
             self._sha1_file = self._sha1_file_and_mutter
         else:
             self._sha1_file = self._sha1_provider.sha1
+        # abspath -> future for stat_and_sha1, see _prefetch_sha1s.
+        self._prefetched_sha1s = None
         # These two attributes provide a simple cache for lookups into the
         # dirstate in-memory vectors. By probing respectively for the last
         # block, and for the next entry, we save nearly 2 bisections per path
@@ -438,6 +477,12 @@ class DirState(object):
         if hash_changed_entries:
             self._known_hash_changes.update(
                 [e[0] for e in hash_changed_entries])
+            if self._compact_dirblocks is not None:
+                # The entries were built from the compact rows, so the
+                # changes to them have to be copied back.
+                for entry in hash_changed_entries:
+                    self._compact_dirblocks.set_details(
+                        entry[0], 0, entry[1][0])
             if self._dirblock_state in (DirState.NOT_IN_MEMORY,
                                         DirState.IN_MEMORY_UNMODIFIED):
                 # If the dirstate is already marked a IN_MEMORY_MODIFIED, then
@@ -614,6 +659,8 @@ class DirState(object):
         if self._dirblock_state != DirState.NOT_IN_MEMORY:
             raise AssertionError("bad dirblock state %r" %
                                  self._dirblock_state)
+        if self._journal.records:
+            raise AssertionError("can't bisect a dirstate with a journal")
 
         # The disk representation is generally info + '\0\n\0' at the end. But
         # for bisecting, it is easier to treat this as '\0' + info + '\0\n'
@@ -808,6 +855,8 @@ class DirState(object):
         if self._dirblock_state != DirState.NOT_IN_MEMORY:
             raise AssertionError("bad dirblock state %r" %
                                  self._dirblock_state)
+        if self._journal.records:
+            raise AssertionError("can't bisect a dirstate with a journal")
         # The disk representation is generally info + '\0\n\0' at the end. But
         # for bisecting, it is easier to treat this as '\0' + info + '\0\n'
         # Because it means we can sync on the '\n'
@@ -1942,6 +1991,50 @@ class DirState(object):
         trace.mutter("dirstate sha1 " + abspath)
         return self._sha1_provider.sha1(abspath)
 
+    def _prefetch_sha1s(self, abspaths, executor):
+        """Start reading the stat and sha1 of files in an executor.
+
+        Until _clear_prefetched_sha1s is called, the results are used by
+        _sha1_file and _stat_and_sha1_file rather than reading the files
+        again.
+
+        :param abspaths: The paths of the files.
+        :param executor: A concurrent.futures executor.
+        """
+        if self._prefetched_sha1s is None:
+            self._prefetched_sha1s = {}
+            self._sha1_file_unprefetched = self._sha1_file
+            self._sha1_file = self._sha1_file_prefetched
+        stat_and_sha1 = self._sha1_provider.stat_and_sha1
+        for abspath in abspaths:
+            self._prefetched_sha1s[abspath] = executor.submit(
+                stat_and_sha1, abspath)
+
+    def _clear_prefetched_sha1s(self):
+        """Forget the prefetched sha1s that have not been used."""
+        if self._prefetched_sha1s:
+            for future in self._prefetched_sha1s.values():
+                future.cancel()
+            self._prefetched_sha1s.clear()
+
+    def _sha1_file_prefetched(self, abspath):
+        try:
+            future = self._prefetched_sha1s.pop(abspath)
+        except KeyError:
+            return self._sha1_file_unprefetched(abspath)
+        return future.result()[1]
+
+    def _stat_and_sha1_file(self, abspath):
+        """Return the stat and sha1 of a file, as SHA1Provider.stat_and_sha1.
+
+        A prefetched result is used if there is one.
+        """
+        if self._prefetched_sha1s:
+            future = self._prefetched_sha1s.pop(abspath, None)
+            if future is not None:
+                return future.result()
+        return self._sha1_provider.stat_and_sha1(abspath)
+
     def _is_executable(self, mode, old_executable):
         """Is this file executable?"""
         if self._use_filesystem_for_exec:
@@ -1976,7 +2069,8 @@ class DirState(object):
     def get_lines(self):
         """Serialise the entire dirstate to a sequence of lines."""
         if (self._header_state == DirState.IN_MEMORY_UNMODIFIED and
-                self._dirblock_state == DirState.IN_MEMORY_UNMODIFIED):
+                self._dirblock_state == DirState.IN_MEMORY_UNMODIFIED and
+                (self._journal is None or not self._journal.records)):
             # read what's on disk.
             self._state_file.seek(0)
             return self._state_file.readlines()
@@ -2142,6 +2236,9 @@ class DirState(object):
         :return: The dirstate entry tuple for path, or (None, None)
         """
         self._read_dirblocks_if_needed()
+        if self._compact_dirblocks is not None:
+            return self._get_entry_compact(
+                tree_index, fileid_utf8, path_utf8, include_deleted)
         if path_utf8 is not None:
             if not isinstance(path_utf8, bytes):
                 raise errors.BzrError('path_utf8 is not bytes: %s %r'
@@ -2202,6 +2299,42 @@ class DirState(object):
                                            path_utf8=real_path)
             return None, None
 
+    def _get_entry_compact(self, tree_index, fileid_utf8, path_utf8,
+                           include_deleted):
+        """Look up an entry in self._compact_dirblocks, see _get_entry."""
+        compact = self._compact_dirblocks
+        if path_utf8 is not None:
+            if not isinstance(path_utf8, bytes):
+                raise errors.BzrError('path_utf8 is not bytes: %s %r'
+                                      % (type(path_utf8), path_utf8))
+            dirname, basename = osutils.split(path_utf8)
+            entry = compact.get_path_entry(dirname, basename, tree_index)
+            if entry is None:
+                return None, None
+            if not entry[0][2]:
+                raise AssertionError('unversioned entry?')
+            if fileid_utf8:
+                if entry[0][2] != fileid_utf8:
+                    self._changes_aborted = True
+                    raise errors.BzrError('integrity error ? : mismatching'
+                                          ' tree_index, file_id and path')
+            return entry
+        for entry in compact.get_id_entries(fileid_utf8):
+            minikind = entry[1][tree_index][0]
+            if minikind in {b'f', b'd', b'l', b't'}:
+                return entry
+            if minikind == b'a':
+                if include_deleted:
+                    return entry
+                return None, None
+            if minikind != b'r':
+                raise AssertionError(
+                    "entry %r has invalid minikind %r for tree %r"
+                    % (entry, minikind, tree_index))
+            return self._get_entry_compact(
+                tree_index, fileid_utf8, entry[1][tree_index][1], False)
+        return None, None
+
     @classmethod
     def initialize(cls, path, sha1_provider=None):
         """Create a new dirstate on path.
@@ -2322,6 +2455,10 @@ class DirState(object):
         docstring of breezy.dirstate.
         """
         self._read_dirblocks_if_needed()
+        if self._compact_dirblocks is not None:
+            for entry in self._compact_dirblocks.iter_entries():
+                yield entry
+            return
         for directory in self._dirblocks:
             for entry in directory[1]:
                 yield entry
@@ -2374,7 +2511,10 @@ class DirState(object):
         :param lines: A sequence of lines containing the parents list and the
             path lines.
         """
-        output_lines = [DirState.HEADER_FORMAT_3]
+        if self._config_stack.get('dirstate.journal'):
+            output_lines = [DirState.HEADER_FORMAT_3_JOURNAL]
+        else:
+            output_lines = [DirState.HEADER_FORMAT_3]
         lines.append(b'')  # a final newline
         inventory_text = b'\0\n\0'.join(lines)
         output_lines.append(b'crc32: %d\n' % (zlib.crc32(inventory_text),))
@@ -2421,10 +2561,52 @@ class DirState(object):
         This populates self._dirblocks, and sets self._dirblock_state to
         IN_MEMORY_UNMODIFIED. It is not currently ready for incremental block
         loading.
+
+        If the dirstate.compact option is set and the dirstate is only read
+        locked, self._compact_dirblocks is populated instead, and
+        self._dirblocks is built from it if it is used.
         """
         self._read_header_if_needed()
         if self._dirblock_state == DirState.NOT_IN_MEMORY:
-            _read_dirblocks(self)
+            if (self._lock_state == 'r' and not self._journal.records and
+                    self._config_stack.get('dirstate.compact')):
+                from . import compact_dirstate
+                self._compact_dirblocks = compact_dirstate.read_dirblocks(
+                    self)
+                self.__dict__.pop('_dirblocks', None)
+                self._dirblock_state = DirState.IN_MEMORY_UNMODIFIED
+            else:
+                _read_dirblocks(self)
+                if self._journal.records:
+                    self._replay_journal()
+
+    def _replay_journal(self):
+        """Apply the records of the journal to the rows read from disk."""
+        fields_to_entry = self._get_fields_to_entry()
+        for record in self._journal.records:
+            for key in record.removed:
+                block_index, present = self._find_block_index_from_key(key)
+                if present:
+                    block = self._dirblocks[block_index][1]
+                    entry_index, present = self._find_entry_index(key, block)
+                if not present:
+                    raise DirstateCorrupt(
+                        self, 'journal removes missing row %r' % (key,))
+                del block[entry_index]
+            for fields in record.entries:
+                entry = fields_to_entry(fields)
+                block = self._find_block(entry[0], add_if_missing=True)[1]
+                entry_index, present = self._find_entry_index(entry[0], block)
+                if present:
+                    block[entry_index] = entry
+                else:
+                    block.insert(entry_index, entry)
+        # As when reading the dirstate file, only directories with rows in
+        # them have blocks.
+        self._dirblocks[2:] = [
+            block for block in self._dirblocks[2:] if block[1]]
+        self._last_block_index = None
+        self._last_entry_index = None
 
     def _read_header(self):
         """This reads in the metadata header, and the parent ids.
@@ -2445,6 +2627,26 @@ class DirState(object):
         self._ghosts = info[2:-1]
         self._header_state = DirState.IN_MEMORY_UNMODIFIED
         self._end_of_header = self._state_file.tell()
+        self._read_journal()
+
+    def _journal_path(self):
+        return self._filename + '.journal'
+
+    def _read_journal(self):
+        """Read the journal of changes to the dirstate file.
+
+        The parents and ghosts in the journal replace those in the header; the
+        rows are updated by _read_dirblocks_if_needed. A journal next to a
+        dirstate file whose header doesn't allow one is ignored.
+        """
+        self._journal = dirstate_journal.DirStateJournal(
+            self._journal_path(), self.crc_expected, self._num_entries,
+            1 + self._num_present_parents())
+        if self._header_has_journal:
+            self._journal.read()
+        if self._journal.records:
+            self._parents = self._journal.records[-1].parents
+            self._ghosts = self._journal.records[-1].ghosts
 
     def _read_header_if_needed(self):
         """Read the header of the dirstate file if needed."""
@@ -2464,9 +2666,12 @@ class DirState(object):
         and their ids. Followed by a newline.
         """
         header = self._state_file.readline()
-        if header != DirState.HEADER_FORMAT_3:
+        if header not in (DirState.HEADER_FORMAT_3,
+                          DirState.HEADER_FORMAT_3_JOURNAL):
             raise errors.BzrError(
                 'invalid header line: %r' % (header,))
+        self._header_has_journal = (
+            header == DirState.HEADER_FORMAT_3_JOURNAL)
         crc_line = self._state_file.readline()
         if not crc_line.startswith(b'crc32: '):
             raise errors.BzrError('missing crc32 checksum: %r' % crc_line)
@@ -2530,12 +2735,19 @@ class DirState(object):
                 # We couldn't grab a write lock, so we switch back to a read one
                 return
         try:
-            lines = self.get_lines()
-            self._state_file.seek(0)
-            self._state_file.writelines(lines)
-            self._state_file.truncate()
-            self._state_file.flush()
-            self._maybe_fdatasync()
+            if not self._save_to_journal():
+                lines = self.get_lines()
+                self._state_file.seek(0)
+                self._state_file.writelines(lines)
+                self._state_file.truncate()
+                self._state_file.flush()
+                self._maybe_fdatasync()
+                self._header_has_journal = (
+                    lines[0] == DirState.HEADER_FORMAT_3_JOURNAL)
+                dirstate_journal.remove(self._journal_path())
+                # The dirstate file is no longer the one that was read, so
+                # don't journal against it.
+                self._journal = None
             self._mark_unmodified()
         finally:
             if grabbed_write_lock:
@@ -2545,6 +2757,87 @@ class DirState(object):
                 #       not changed contents. Since restore_read_lock may
                 #       not be an atomic operation.
 
+    def _save_to_journal(self):
+        """Append the changes in memory to the journal, if that is enabled.
+
+        :return: True if the changes were saved, False if the dirstate file
+            needs to be rewritten instead. It is rewritten the first time, so
+            that its header says there may be a journal.
+        """
+        journal = self._journal
+        if (journal is None or not self._header_has_journal or
+                journal.tree_count != 1 + self._num_present_parents() or
+                not self._config_stack.get('dirstate.journal')):
+            return False
+        if (self._header_state != DirState.IN_MEMORY_MODIFIED and
+                self._dirblock_state == DirState.IN_MEMORY_HASH_MODIFIED):
+            # Only the hash cache of the known entries has changed.
+            removed = []
+            entry_lines = []
+            for key in sorted(self._known_hash_changes):
+                entry = self._get_entry_by_key(key)
+                if entry is None:
+                    return False
+                entry_lines.append(self._entry_to_line(entry))
+        else:
+            changes = self._changes_since_read()
+            if changes is None:
+                return False
+            removed, entry_lines = changes
+        limit = (os.fstat(self._state_file.fileno()).st_size *
+                 self.JOURNAL_MAX_FRACTION)
+        if journal.size + journal.record_size(removed, entry_lines) > limit:
+            return False
+        journal.append(self._parents, self._ghosts, removed, entry_lines,
+                       fdatasync=self._config_stack.get('dirstate.fdatasync'))
+        return True
+
+    def _get_entry_by_key(self, key):
+        """Return the entry with key, or None."""
+        if self._compact_dirblocks is not None:
+            return self._compact_dirblocks.get_key_entry(key)
+        block_index, present = self._find_block_index_from_key(key)
+        if not present:
+            return None
+        block = self._dirblocks[block_index][1]
+        entry_index, present = self._find_entry_index(key, block)
+        if not present:
+            return None
+        return block[entry_index]
+
+    def _changes_since_read(self):
+        """Compare the rows in memory with the dirstate file and journal.
+
+        :return: A list of the keys of rows that have been removed, and a list
+            of the rows that have been added or changed, as serialised by
+            _entry_to_line; or None if the dirstate file can't be read.
+        """
+        # The rows on disk, by their serialised key.
+        rows = {}
+        entry_size = self._fields_per_entry()
+        self._state_file.seek(self._end_of_header)
+        fields = self._state_file.read().split(b'\0')
+        if (fields[-1] != b'' or
+                len(fields) != 2 + entry_size * self._num_entries):
+            return None
+        # Skip the trailing null from the header; the last field is the
+        # trailing null of the last row.
+        for cur in range(1, len(fields) - 1, entry_size):
+            rows[b'\0'.join(fields[cur:cur + 3])] = b'\0'.join(
+                fields[cur:cur + entry_size - 1])
+        for record in self._journal.records:
+            for key in record.removed:
+                rows.pop(b'\0'.join(key), None)
+            for row in record.entries:
+                rows[b'\0'.join(row[:3])] = b'\0'.join(row[:-1])
+        entry_lines = []
+        for entry in self._iter_entries():
+            line = self._entry_to_line(entry)
+            if rows.pop(b'\0'.join(entry[0]), None) != line:
+                entry_lines.append(line)
+        removed = sorted(tuple(key.split(b'\0')) for key in rows)
+        return removed, entry_lines
+
     def _maybe_fdatasync(self):
         """Flush to disk if possible and if not configured off."""
         if self._config_stack.get('dirstate.fdatasync'):
@@ -2583,6 +2876,8 @@ class DirState(object):
         """
         # our memory copy is now authoritative.
         self._dirblocks = dirblocks
+        # and replaces the dirstate file, rather than changing it.
+        self._journal = None
         self._mark_modified(header_modified=True)
         self._parents = list(parent_ids)
         self._id_index = None
@@ -3373,6 +3668,8 @@ class DirState(object):
         self._parents = []
         self._ghosts = []
         self._dirblocks = []
+        self._compact_dirblocks = None
+        self._journal = None
         self._id_index = None
         self._packed_stat_index = None
         self._end_of_header = None
@@ -3530,11 +3827,22 @@ class ProcessEntryPython(object):
                  "partial", "use_filesystem_for_exec", "utf8_decode",
                  "searched_specific_files", "search_specific_files",
                  "searched_exact_paths", "search_specific_file_parents", "seen_ids",
-                 "state", "source_index", "target_index", "want_unversioned", "tree"]
+                 "state", "source_index", "target_index", "want_unversioned", "tree",
+                 "executor", "read_ahead", "filters_may_apply"]
 
     def __init__(self, include_unchanged, use_filesystem_for_exec,
                  search_specific_files, state, source_index, target_index,
-                 want_unversioned, tree):
+                 want_unversioned, tree, executor=None, read_ahead=0):
+        """Create a ProcessEntryPython.
+
+        :param executor: Optional concurrent.futures executor. If given,
+            the directories to be compared next are read, and the files
+            whose stat changed are sha1'ed, by it while the current
+            directory is compared.
+        :param read_ahead: How many directories to read ahead.
+            Files whose size differs from the source are then reported as
+            modified without being sha1'ed, unless content filters apply.
+        """
         self.old_dirname_to_file_id = {}
         self.new_dirname_to_file_id = {}
         # Are we doing a partial iter_changes?
@@ -3568,6 +3876,28 @@ class ProcessEntryPython(object):
             raise errors.BzrError('unsupported target index')
         self.want_unversioned = want_unversioned
         self.tree = tree
+        self.executor = executor
+        self.read_ahead = read_ahead
+        self.filters_may_apply = not isinstance(
+            state._sha1_provider, DefaultSHA1Provider)
+
+    def _size_changed(self, source_details, path_info):
+        """Check whether a file is modified just by looking at its size.
+
+        This is only done when sha1s are read in the executor, which is
+        for large trees.
+        """
+        if (self.executor is None
+                or source_details[0] != b'f'
+                or path_info[2] != 'file'
+                or source_details[2] == path_info[3].st_size):
+            return False
+        if self.filters_may_apply:
+            # Content filters may map files of different sizes to the same
+            # canonical content.
+            return not self.tree._content_filter_stack(
+                self.utf8_decode(path_info[0])[0])
+        return True
 
     def _process_entry(self, entry, path_info, pathjoin=osutils.pathjoin):
         """Compare an entry and real disk to generate delta information.
@@ -3596,7 +3926,12 @@ class ProcessEntryPython(object):
         _ra = (b'r', b'a')
         target_details = entry[1][self.target_index]
         target_minikind = target_details[0]
-        if path_info is not None and target_minikind in _fdlt:
+        size_changed = (path_info is not None and target_minikind == b'f'
+                        and self._size_changed(source_details, path_info))
+        if size_changed:
+            # Don't sha1 a file that is known to be modified.
+            link_or_sha1 = None
+        elif path_info is not None and target_minikind in _fdlt:
             if not (self.target_index == 0):
                 raise AssertionError()
             link_or_sha1 = update_entry(self.state, entry,
@@ -3665,14 +4000,18 @@ class ProcessEntryPython(object):
                         # Check the sha. We can't just rely on the size as
                         # content filtering may mean differ sizes actually
                         # map to the same content
-                        if link_or_sha1 is None:
-                            # Stat cache miss:
-                            statvalue, link_or_sha1 = \
-                                self.state._sha1_provider.stat_and_sha1(
-                                    path_info[4])
-                            self.state._observed_sha1(entry, link_or_sha1,
-                                                      statvalue)
-                        content_change = (link_or_sha1 != source_details[1])
+                        if size_changed:
+                            content_change = True
+                        else:
+                            if link_or_sha1 is None:
+                                # Stat cache miss:
+                                statvalue, link_or_sha1 = \
+                                    self.state._stat_and_sha1_file(
+                                        path_info[4])
+                                self.state._observed_sha1(
+                                    entry, link_or_sha1, statvalue)
+                            content_change = (
+                                link_or_sha1 != source_details[1])
                     # Target details is updated at update_entry time
                     if self.use_filesystem_for_exec:
                         # We don't need S_ISREG here, because we are sure
@@ -3869,8 +4208,54 @@ class ProcessEntryPython(object):
             # provide.
             self.search_specific_file_parents.add(b'')
 
+    def _prefetch_sha1s(self, entries, path_infos):
+        """Start sha1'ing the files of a directory whose stat changed.
+
+        :param entries: The dirblock entries for the directory.
+        :param path_infos: The directory listing from _walkdirs_utf8.
+        """
+        files = {}
+        for path_info in path_infos:
+            if path_info[2] == 'file':
+                files[path_info[1]] = path_info
+        abspaths = []
+        for entry in entries:
+            target_details = entry[1][self.target_index]
+            if target_details[0] != b'f':
+                continue
+            path_info = files.get(entry[0][1])
+            if path_info is None:
+                continue
+            # Only files in a parent tree are ever sha1'ed.
+            for details in entry[1][1:]:
+                if details[0] != b'a':
+                    break
+            else:
+                continue
+            stat_value = path_info[3]
+            if (target_details[2] == stat_value.st_size
+                    and target_details[4] == pack_stat(stat_value)):
+                # The saved sha1 will be used.
+                continue
+            if (self.source_index is not None and self._size_changed(
+                    entry[1][self.source_index], path_info)):
+                # Known to be modified, it won't be sha1'ed.
+                continue
+            abspaths.append(path_info[4])
+        if len(abspaths) > 1:
+            self.state._prefetch_sha1s(abspaths, self.executor)
+
     def iter_changes(self):
         """Iterate over the changes."""
+        try:
+            for result in self._iter_changes():
+                yield result
+        finally:
+            # Don't leave sha1s behind that may be out of date by the time
+            # the dirstate is next used.
+            self.state._clear_prefetched_sha1s()
+
+    def _iter_changes(self):
         utf8_decode = cache_utf8._utf8_decode
         _lt_by_dirs = lt_by_dirs
         _process_entry = self._process_entry
@@ -3981,7 +4366,8 @@ class ProcessEntryPython(object):
                 current_dir_info = None
             else:
                 dir_iterator = osutils._walkdirs_utf8(
-                    root_abspath, prefix=current_root)
+                    root_abspath, prefix=current_root,
+                    executor=self.executor, read_ahead=self.read_ahead)
                 try:
                     current_dir_info = next(dir_iterator)
                 except OSError as e:
@@ -4092,6 +4478,9 @@ class ProcessEntryPython(object):
                         else:
                             current_block = None
                     continue
+                if (self.executor is not None and current_block
+                        and current_dir_info):
+                    self._prefetch_sha1s(current_block[1], current_dir_info[1])
                 entry_index = 0
                 if current_block and entry_index < len(current_block[1]):
                     current_entry = current_block[1][entry_index]
@@ -4213,6 +4602,7 @@ class ProcessEntryPython(object):
                         path_handled = False
                     else:
                         advance_path = True  # reset the advance flagg.
+                self.state._clear_prefetched_sha1s()
                 if current_block is not None:
                     block_index += 1
                     if (block_index < len(self.state._dirblocks) and
@@ -0,0 +1,220 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""An append-only journal of changes to a dirstate file.
+
+Saving a DirState normally rewrites the whole dirstate file, even when only
+a few rows changed. With a journal, small changes are appended to a second
+file next to it instead, and the dirstate file is only rewritten once the
+journal has grown too large.
+
+The journal starts with a header line and a line naming the dirstate file it
+applies to, by the crc32 and entry count from the dirstate header, so a
+journal left behind by a rewrite of the dirstate file (by a crash, or by a
+client that doesn't know about journals) is ignored. Each record after that
+is a line with the length and crc32 of the record data, then the data and a
+newline. The data is NULL separated, like the dirstate file: the parents and
+ghosts, then rows to remove (b'r' and the key) and rows to add or replace
+(b'e' and the fields of the row as in the dirstate file). Every record
+holds the parents and ghosts, so the last record has the current ones.
+
+A record that is cut short or doesn't match its crc32 ends the journal; it
+is truncated away before anything else is appended.
+"""
+
+import errno
+import os
+import zlib
+
+from .. import (
+    osutils,
+    trace,
+    )
+
+
+JOURNAL_HEADER = b'#bazaar dirstate journal 1\n'
+
+
+class JournalRecord(object):
+    """A change to a dirstate, as stored in its journal.
+
+    :ivar parents: The parent ids after the change.
+    :ivar ghosts: The ghost ids after the change.
+    :ivar removed: The keys of rows that were removed.
+    :ivar entries: The fields of rows that were added or changed, in the
+        form read from the dirstate file: the key, the tree details and a
+        final b'\\n'.
+    """
+
+    __slots__ = ('parents', 'ghosts', 'removed', 'entries')
+
+    def __init__(self, parents, ghosts, removed, entries):
+        self.parents = parents
+        self.ghosts = ghosts
+        self.removed = removed
+        self.entries = entries
+
+
+def _parse_record(data, tree_count):
+    """Parse the data of a record, or return None if it is invalid."""
+    fields = data.split(b'\0')
+    try:
+        num_parents = int(fields[0])
+        parents = fields[1:1 + num_parents]
+        cur = 1 + num_parents
+        num_ghosts = int(fields[cur])
+        ghosts = fields[cur + 1:cur + 1 + num_ghosts]
+        cur += 1 + num_ghosts
+    except (IndexError, ValueError):
+        return None
+    if (len(parents) != num_parents or len(ghosts) != num_ghosts or
+            1 + num_parents - num_ghosts != tree_count):
+        return None
+    entry_size = 3 + 5 * tree_count + 1
+    removed = []
+    entries = []
+    while cur < len(fields):
+        kind = fields[cur]
+        if kind == b'r':
+            row = fields[cur + 1:cur + 5]
+            if len(row) != 4 or row[3] != b'\n':
+                return None
+            removed.append(tuple(row[:3]))
+            cur += 5
+        elif kind == b'e':
+            row = fields[cur + 1:cur + 1 + entry_size]
+            if len(row) != entry_size or row[-1] != b'\n':
+                return None
+            entries.append(row)
+            cur += 1 + entry_size
+        else:
+            return None
+    return JournalRecord(parents, ghosts, removed, entries)
+
+
+class DirStateJournal(object):
+    """The journal of a dirstate file.
+
+    :ivar records: The valid records in the journal, oldest first.
+    :ivar size: The size of the valid part of the journal file, or 0 if
+        there is no valid journal file.
+    """
+
+    def __init__(self, path, crc32, num_entries, tree_count):
+        """Create a DirStateJournal.
+
+        :param path: The path of the journal file.
+        :param crc32: The crc32 from the header of the dirstate file.
+        :param num_entries: The entry count from the header of the dirstate
+            file.
+        :param tree_count: The number of trees in each dirstate row.
+        """
+        self._path = path
+        self._base_line = b'base: %d %d\n' % (crc32, num_entries)
+        self.tree_count = tree_count
+        self.records = []
+        self.size = 0
+
+    def read(self):
+        """Read the records of the journal file, if it applies."""
+        try:
+            with open(self._path, 'rb') as f:
+                content = f.read()
+        except (IOError, OSError) as e:
+            if e.errno == errno.ENOENT:
+                return
+            raise
+        prefix = JOURNAL_HEADER + self._base_line
+        if not content.startswith(prefix):
+            trace.mutter('ignoring dirstate journal %s for another dirstate',
+                         self._path)
+            return
+        pos = len(prefix)
+        records = []
+        while pos < len(content):
+            end_of_line = content.find(b'\n', pos)
+            if end_of_line == -1:
+                break
+            try:
+                length, crc32 = map(int, content[pos:end_of_line].split(b' '))
+            except ValueError:
+                break
+            start = end_of_line + 1
+            data = content[start:start + length]
+            if (len(data) != length or
+                    content[start + length:start + length + 1] != b'\n' or
+                    zlib.crc32(data) != crc32):
+                break
+            record = _parse_record(data, self.tree_count)
+            if record is None:
+                break
+            records.append(record)
+            pos = start + length + 1
+        if pos < len(content):
+            trace.mutter('ignoring the end of dirstate journal %s from %d',
+                         self._path, pos)
+        self.records = records
+        self.size = pos
+
+    def append(self, parents, ghosts, removed, entry_lines, fdatasync=False):
+        """Append a record to the journal file.
+
+        :param parents: The current parent ids.
+        :param ghosts: The current ghost ids.
+        :param removed: The keys of rows that have been removed.
+        :param entry_lines: The rows that have been added or changed, as
+            serialised by DirState._entry_to_line.
+        :param fdatasync: If True, flush the journal to disk.
+        """
+        fields = [b'%d' % len(parents)] + parents
+        fields.append(b'%d' % len(ghosts))
+        fields.extend(ghosts)
+        for key in removed:
+            fields.append(b'r')
+            fields.extend(key)
+            fields.append(b'\n')
+        for line in entry_lines:
+            fields.append(b'e')
+            fields.append(line)
+            fields.append(b'\n')
+        data = b'\0'.join(fields)
+        record = b'%d %d\n%s\n' % (len(data), zlib.crc32(data), data)
+        with open(self._path, 'r+b' if self.size else 'wb') as f:
+            if self.size:
+                f.seek(self.size)
+                f.truncate()
+            else:
+                f.write(JOURNAL_HEADER + self._base_line)
+            f.write(record)
+            f.flush()
+            if fdatasync:
+                osutils.fdatasync(f.fileno())
+            self.size = f.tell()
+        self.records.append(_parse_record(data, self.tree_count))
+
+    def record_size(self, removed, entry_lines):
+        """Estimate how much appending a record would add to the journal."""
+        return (sum(len(b''.join(key)) + 7 for key in removed) +
+                sum(len(line) + 4 for line in entry_lines))
+
+
+def remove(path):
+    """Remove a journal file, e.g. after rewriting its dirstate file."""
+    try:
+        os.unlink(path)
+    except (IOError, OSError) as e:
+        if e.errno != errno.ENOENT:
+            raise
@@ -0,0 +1,84 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""The generation numbers of the revisions in a repository, kept on disk.
+
+Generation numbers (see graph.GenerationIndex) are computed the first time
+they are needed and appended to a file in the repository control directory,
+one revision per line. The generation number of a revision never changes,
+so the file never needs invalidating. Several processes appending the same
+revisions at once just leave duplicate lines behind, and lines that can't
+be parsed are skipped.
+"""
+
+from .. import (
+    errors,
+    trace,
+    )
+
+
+FORMAT_HEADER = b'Bazaar generation index 1\n'
+INDEX_NAME = 'generation-index'
+
+
+class GenerationIndexFile(object):
+    """The file of generation numbers of a repository."""
+
+    def __init__(self, transport):
+        """Create a GenerationIndexFile.
+
+        :param transport: The transport for the repository control directory.
+        """
+        self._transport = transport
+        self._valid = False
+
+    def load(self):
+        """Read the generation numbers.
+
+        :return: A dict mapping revision ids to generation numbers.
+        """
+        try:
+            content = self._transport.get_bytes(INDEX_NAME)
+        except (errors.PathError, errors.TransportNotPossible):
+            return {}
+        if not content.startswith(FORMAT_HEADER):
+            return {}
+        self._valid = True
+        generations = {}
+        for line in content[len(FORMAT_HEADER):].split(b'\n'):
+            try:
+                generation, revision_id = line.split(b' ', 1)
+                generations[revision_id] = int(generation)
+            except ValueError:
+                continue
+        return generations
+
+    def add(self, generations):
+        """Save newly computed generation numbers.
+
+        :param generations: A dict mapping revision ids to generation
+            numbers.
+        """
+        data = b''.join(b'%d %s\n' % (generation, revision_id)
+                        for revision_id, generation in generations.items())
+        try:
+            if self._valid:
+                self._transport.append_bytes(INDEX_NAME, data)
+            else:
+                self._transport.put_bytes(INDEX_NAME, FORMAT_HEADER + data)
+                self._valid = True
+        except (errors.PathError, errors.TransportNotPossible) as e:
+            trace.mutter('unable to write generation index: %s', e)
@@ -16,6 +16,7 @@
 
 """Core compression logic for compressing streams of related files."""
 
+import collections
 import time
 import zlib
 
@@ -1121,6 +1122,67 @@ def cleanup_pack_group(versioned_files):
     versioned_files.stream.close()
 
 
+class _DecompressionPool(object):
+    """Inflate GroupCompressBlocks ahead of use in a pool of threads.
+
+    zlib releases the GIL while decompressing, so this lets the next few
+    blocks of a record stream be inflated on other cores while texts are
+    extracted from the current one.
+    """
+
+    def __init__(self, num_threads):
+        from concurrent.futures import ThreadPoolExecutor
+        self.num_threads = num_threads
+        self._executor = ThreadPoolExecutor(max_workers=num_threads)
+
+    def prefetch(self, blocks, bytes_needed):
+        """Yield (read_memo, block) pairs with their content inflated.
+
+        Up to num_threads blocks are read and decompressed ahead of the one
+        being yielded. Blocks are only yielded once their worker is done with
+        them, so the caller never shares a block with a worker thread.
+
+        :param blocks: An iterator of (read_memo, block), as from
+            GroupCompressVersionedFiles._get_blocks.
+        :param bytes_needed: A dict mapping read_memo to the number of bytes
+            of content that will be used. Other blocks are fully inflated.
+        """
+        pending = collections.deque()
+        try:
+            for read_memo, block in blocks:
+                future = self._executor.submit(
+                    self._inflate, block, bytes_needed.get(read_memo))
+                pending.append((read_memo, block, future))
+                if len(pending) > self.num_threads:
+                    read_memo, block, future = pending.popleft()
+                    future.result()
+                    yield read_memo, block
+            while pending:
+                read_memo, block, future = pending.popleft()
+                future.result()
+                yield read_memo, block
+        finally:
+            # If we're abandoned part way through, make sure no worker is
+            # still touching blocks that are now in the group cache.
+            for _, _, future in pending:
+                if not future.cancel():
+                    try:
+                        future.result()
+                    except Exception:
+                        pass
+
+    def shutdown(self):
+        """Stop the worker threads, once they are done."""
+        self._executor.shutdown(wait=True)
+
+    @staticmethod
+    def _inflate(block, num_bytes):
+        if (num_bytes is not None and block._content_length is not None
+                and num_bytes > block._content_length):
+            num_bytes = None
+        block._ensure_content(num_bytes)
+
+
 class _BatchingBlockFetcher(object):
     """Fetch group compress blocks in batches.
 
@@ -1128,7 +1190,13 @@ class _BatchingBlockFetcher(object):
         currently pending batch.
     """
 
-    def __init__(self, gcvf, locations, get_compressor_settings=None):
+    def __init__(self, gcvf, locations, get_compressor_settings=None,
+                 decompression_pool=None):
+        """Create a _BatchingBlockFetcher.
+
+        :param decompression_pool: An optional _DecompressionPool used to
+            inflate upcoming blocks while the current one is being consumed.
+        """
         self.gcvf = gcvf
         self.locations = locations
         self.keys = []
@@ -1138,6 +1206,7 @@ class _BatchingBlockFetcher(object):
         self.last_read_memo = None
         self.manager = None
         self._get_compressor_settings = get_compressor_settings
+        self._decompression_pool = decompression_pool
 
     def add_key(self, key):
         """Add another to key to fetch.
@@ -1180,6 +1249,17 @@ class _BatchingBlockFetcher(object):
             self.manager = None
             self.last_read_memo = None
 
+    def _bytes_needed_per_block(self):
+        """Work out how much of each block the keys in this batch need."""
+        needed = {}
+        for key in self.keys:
+            index_memo = self.locations[key][0]
+            read_memo = index_memo[:3]
+            end = index_memo[4]
+            if needed.get(read_memo, 0) < end:
+                needed[read_memo] = end
+        return needed
+
     def yield_factories(self, full_flush=False):
         """Yield factories for keys added since the last yield.  They will be
         returned in the order they were added via add_key.
@@ -1192,6 +1272,10 @@ class _BatchingBlockFetcher(object):
             return
         # Fetch all memos in this batch.
         blocks = self.gcvf._get_blocks(self.memos_to_get)
+        if (self._decompression_pool is not None
+                and len(self.memos_to_get) > 1):
+            blocks = self._decompression_pool.prefetch(
+                blocks, self._bytes_needed_per_block())
         # Turn blocks into factories and yield them.
         memos_to_get_stack = list(self.memos_to_get)
         memos_to_get_stack.reverse()
@@ -1267,6 +1351,7 @@ class GroupCompressVersionedFiles(VersionedFilesWithFallbacks):
         self._group_cache = _group_cache
         self._immediate_fallback_vfs = []
         self._max_bytes_to_index = None
+        self._decompression_threads = None
 
     def without_fallbacks(self):
         """Return a clone of this object without any fallbacks configured."""
@@ -1646,32 +1731,53 @@ class GroupCompressVersionedFiles(VersionedFilesWithFallbacks):
         #  - we encounter an unadded ref, or
         #  - we run out of keys, or
         #  - the total bytes to retrieve for this batch > BATCH_SIZE
-        batcher = _BatchingBlockFetcher(self, locations,
-                                        get_compressor_settings=self._get_compressor_settings)
-        for source, keys in source_keys:
-            if source is self:
-                for key in keys:
-                    if key in self._unadded_refs:
-                        # Flush batch, then yield unadded ref from
-                        # self._compressor.
-                        for factory in batcher.yield_factories(full_flush=True):
-                            yield factory
-                        chunks, sha1 = self._compressor.extract(key)
-                        parents = self._unadded_refs[key]
-                        yield ChunkedContentFactory(key, parents, sha1, chunks)
-                        continue
-                    if batcher.add_key(key) > BATCH_SIZE:
-                        # Ok, this batch is big enough.  Yield some results.
-                        for factory in batcher.yield_factories():
-                            yield factory
-            else:
-                for factory in batcher.yield_factories(full_flush=True):
-                    yield factory
-                for record in source.get_record_stream(keys, ordering,
-                                                       include_delta_closure):
-                    yield record
-        for factory in batcher.yield_factories(full_flush=True):
-            yield factory
+        # Blocks beyond the first in a batch are inflated in the background,
+        # so make sure batches span enough blocks to keep the pool busy.
+        min_batch_blocks = 0
+        decompression_pool = None
+        if ordering == 'unordered':
+            # Callers asking for unordered streams generally want the texts,
+            # as opposed to fetch, which streams the compressed blocks on.
+            num_threads = self._get_decompression_threads()
+            if num_threads >= 1:
+                decompression_pool = _DecompressionPool(num_threads)
+                min_batch_blocks = num_threads
+        try:
+            batcher = _BatchingBlockFetcher(
+                self, locations,
+                get_compressor_settings=self._get_compressor_settings,
+                decompression_pool=decompression_pool)
+            for source, keys in source_keys:
+                if source is self:
+                    for key in keys:
+                        if key in self._unadded_refs:
+                            # Flush batch, then yield unadded ref from
+                            # self._compressor.
+                            for factory in batcher.yield_factories(
+                                    full_flush=True):
+                                yield factory
+                            chunks, sha1 = self._compressor.extract(key)
+                            parents = self._unadded_refs[key]
+                            yield ChunkedContentFactory(
+                                key, parents, sha1, chunks)
+                            continue
+                        if (batcher.add_key(key) > BATCH_SIZE and
+                                len(batcher.memos_to_get) > min_batch_blocks):
+                            # Ok, this batch is big enough.  Yield some
+                            # results.
+                            for factory in batcher.yield_factories():
+                                yield factory
+                else:
+                    for factory in batcher.yield_factories(full_flush=True):
+                        yield factory
+                    for record in source.get_record_stream(
+                            keys, ordering, include_delta_closure):
+                        yield record
+            for factory in batcher.yield_factories(full_flush=True):
+                yield factory
+        finally:
+            if decompression_pool is not None:
+                decompression_pool.shutdown()
 
     def get_sha1s(self, keys):
         """See VersionedFiles.get_sha1s()."""
@@ -1720,6 +1826,12 @@ class GroupCompressVersionedFiles(VersionedFilesWithFallbacks):
             self._max_bytes_to_index = val
         return {'max_bytes_to_index': self._max_bytes_to_index}
 
+    def _get_decompression_threads(self):
+        if self._decompression_threads is None:
+            self._decompression_threads = config.GlobalStack().get(
+                'bzr.groupcompress.decompression_threads')
+        return self._decompression_threads
+
     def _make_group_compressor(self):
         return GroupCompressor(self._get_compressor_settings())
 
@@ -1057,6 +1057,43 @@ class CHKInventoryRepository(PackRepository):
                         file_id_revisions[file_id] = {revision_id}
         return file_id_revisions
 
+    def _get_revision_delta_trees(self, revisions):
+        trees = super(CHKInventoryRepository, self)._get_revision_delta_trees(
+            revisions)
+        # Compute the inventory changes of the whole batch in a single walk
+        # of the CHK pages, rather than one walk per revision.
+        inventories = []
+        root_pairs = []
+        for revision in revisions:
+            if not revision.parent_ids:
+                continue
+            new_tree = trees.get(revision.revision_id)
+            old_tree = trees.get(revision.parent_ids[0])
+            if new_tree is None or old_tree is None:
+                continue
+            new_inv = new_tree.root_inventory
+            old_inv = old_tree.root_inventory
+            inventories.append(new_inv)
+            root_pairs.append((new_inv.id_to_entry.key(),
+                               old_inv.id_to_entry.key()))
+        if len(root_pairs) < 2:
+            return trees
+        # The root nodes are needed anyway to look up paths afterwards, so
+        # load them into the maps and share them with the walk.
+        root_nodes = {}
+        for tree in trees.values():
+            id_to_entry = tree.root_inventory.id_to_entry
+            id_to_entry._ensure_root()
+            root_nodes[id_to_entry.key()] = id_to_entry._root_node
+        search_key_func = inventories[0].id_to_entry._search_key_func
+        for new_inv, (new_root_key, old_root_key, changes) in zip(
+                inventories,
+                chk_map.iter_changes_for_roots(self.chk_bytes, root_pairs,
+                                               search_key_func,
+                                               known_nodes=root_nodes)):
+            new_inv._set_id_to_entry_changes(old_root_key, changes)
+        return trees
+
     def find_text_key_references(self):
         """Find the text key references within the repository.
 
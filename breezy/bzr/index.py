@@ -35,6 +35,7 @@ from breezy import (
     revision as _mod_revision,
     trace,
     )
+from breezy.bzr import bloom
 """)
 from .. import (
     debug,
@@ -1390,13 +1391,17 @@ class CombinedGraphIndex(object):
         """
         keys = set(keys)
         hit_indices = []
+        digests = {}
         while True:
             try:
                 for index in self._indices:
                     if not keys:
                         break
+                    index_keys = self._filter_by_bloom(index, keys, digests)
+                    if not index_keys:
+                        continue
                     index_hit = False
-                    for node in index.iter_entries(keys):
+                    for node in index.iter_entries(index_keys):
                         keys.remove(node[1])
                         yield node
                         index_hit = True
@@ -1408,6 +1413,32 @@ class CombinedGraphIndex(object):
                     raise
         self._move_to_front(hit_indices)
 
+    def _filter_by_bloom(self, index, keys, digests):
+        """Return the subset of keys that may be present in index.
+
+        Child indices that offer a bloom filter (via get_bloom_filter) can
+        rule out absent keys without reading any index pages. Other indices
+        are assumed to possibly contain every key.
+
+        :param digests: Dict of the bloom.key_digest of keys, filled in as
+            needed so that each key is only hashed once per lookup.
+        """
+        get_bloom_filter = getattr(index, 'get_bloom_filter', None)
+        if get_bloom_filter is None:
+            return keys
+        bloom_filter = get_bloom_filter()
+        if bloom_filter is None:
+            return keys
+        maybe_keys = set()
+        for key in keys:
+            try:
+                digest = digests[key]
+            except KeyError:
+                digest = digests[key] = bloom.key_digest(key)
+            if bloom_filter.may_contain(digest):
+                maybe_keys.add(key)
+        return maybe_keys
+
     def iter_entries_prefix(self, keys):
         """Iterate over keys within the index using prefix matching.
 
@@ -1532,6 +1563,7 @@ class CombinedGraphIndex(object):
         # XXX: make this call _move_to_front?
         missing_keys = set()
         parent_map = {}
+        digests = {}
         keys_to_lookup = set(keys)
         generation = 0
         while keys_to_lookup:
@@ -1550,7 +1582,11 @@ class CombinedGraphIndex(object):
                 # Find all of the ancestry we can from this index
                 # keep looking until the search_keys set is empty, which means
                 # things we didn't find should be in index_missing_keys
-                search_keys = keys_to_lookup
+                search_keys = self._filter_by_bloom(
+                    index, keys_to_lookup, digests)
+                if search_keys is not keys_to_lookup:
+                    index_missing_keys.update(
+                        keys_to_lookup.difference(search_keys))
                 sub_generation = 0
                 # print '    \t%2d\t\t%4d\t%5d\t%5d' % (
                 #     index_idx, len(search_keys),
@@ -1562,6 +1598,12 @@ class CombinedGraphIndex(object):
                     #       mean.
                     search_keys = index._find_ancestors(search_keys,
                                                         ref_list_num, parent_map, index_missing_keys)
+                    maybe_keys = self._filter_by_bloom(
+                        index, search_keys, digests)
+                    if maybe_keys is not search_keys:
+                        index_missing_keys.update(
+                            search_keys.difference(maybe_keys))
+                        search_keys = maybe_keys
                     # print '    \t  \t%2d\t%4d\t%5d\t%5d' % (
                     #     sub_generation, len(search_keys),
                     #     len(parent_map), len(index_missing_keys))
@@ -1456,6 +1456,8 @@ class CHKInventory(CommonInventory):
         self._fully_cached = False
         self._path_to_fileid_cache = {}
         self._search_key_name = search_key_name
+        # basis id_to_entry root key => changes computed ahead of time
+        self._id_to_entry_changes = {}
         self.root_id = None
 
     def __eq__(self, other):
@@ -2080,6 +2082,25 @@ class CHKInventory(CommonInventory):
             parent_ie._children[basename] = ie
         self._fully_cached = True
 
+    def _set_id_to_entry_changes(self, basis_key, changes):
+        """Record the id_to_entry changes against a basis inventory.
+
+        This lets callers comparing many inventories compute their changes
+        together, e.g. with chk_map.iter_changes_for_roots.
+
+        :param basis_key: The root key of the basis id_to_entry map.
+        :param changes: A list of (key, old_value, new_value) tuples, as
+            returned by CHKMap.iter_changes.
+        """
+        self._id_to_entry_changes[basis_key] = changes
+
+    def _iter_id_to_entry_changes(self, basis):
+        if self._id_to_entry_changes:
+            changes = self._id_to_entry_changes.get(basis.id_to_entry.key())
+            if changes is not None:
+                return iter(changes)
+        return self.id_to_entry.iter_changes(basis.id_to_entry)
+
     def iter_changes(self, basis):
         """Generate a Tree.iter_changes change list between this and basis.
 
@@ -2091,7 +2112,7 @@ class CHKInventory(CommonInventory):
         # changed_content, versioned, parent, name, kind,
         # executable)
         for key, basis_value, self_value in \
-                self.id_to_entry.iter_changes(basis.id_to_entry):
+                self._iter_id_to_entry_changes(basis):
             file_id = key[0]
             if basis_value is not None:
                 basis_entry = basis._bytes_to_entry(basis_value)
@@ -2164,7 +2185,7 @@ class CHKInventory(CommonInventory):
             return CommonInventory._make_delta(self, old)
         delta = []
         for key, old_value, self_value in \
-                self.id_to_entry.iter_changes(old.id_to_entry):
+                self._iter_id_to_entry_changes(old):
             file_id = key[0]
             if old_value is not None:
                 old_path = old.id2path(file_id)
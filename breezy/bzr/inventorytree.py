@@ -49,6 +49,7 @@ from ..revisiontree import (
 lazy_import.lazy_import(globals(), """
 from breezy import (
     add,
+    annotate as _mod_annotate,
     controldir,
     trace,
     transport as _mod_transport,
@@ -1042,6 +1043,7 @@ class InventoryRevisionTree(RevisionTree, InventoryTree):
         file_id = self.path2id(path)
         text_key = (file_id, self.get_file_revision(path))
         annotator = self._repository.texts.get_annotator()
+        annotator.set_annotation_cache(_mod_annotate.get_annotation_cache())
         annotations = annotator.annotate_flat(text_key)
         return [(key[-1], line) for key, line in annotations]
 
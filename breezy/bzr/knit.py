@@ -3446,8 +3446,10 @@ class _KnitAnnotator(annotate.Annotator):
 
     def _get_needed_texts(self, key, pb=None):
         # if True or len(self._vf._immediate_fallback_vfs) > 0:
-        if len(self._vf._immediate_fallback_vfs) > 0:
-            # If we have fallbacks, go to the generic path
+        if (len(self._vf._immediate_fallback_vfs) > 0 or
+                self._annotation_cache is not None):
+            # If we have fallbacks or an annotation cache, go to the generic
+            # path
             for v in annotate.Annotator._get_needed_texts(self, key, pb=pb):
                 yield v
             return
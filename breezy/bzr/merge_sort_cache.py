@@ -0,0 +1,184 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""A persistent cache of the merge sorted ancestry of a branch.
+
+Merge sorting the whole ancestry of a branch (to get dotted revnos for log,
+or a revision id to revno map) needs the full revision graph, which is slow
+to read for large branches. The result only ever grows at its newest end
+while the branch tip moves forward along its mainline, so it is kept in the
+branch control directory, oldest revision first, and new revisions are
+merge sorted against the known revnos and appended when the tip moves.
+
+Each line holds the merge depth, dotted revno, end of merge flag and
+revision id of one revision. If the tip moves anywhere other than forward
+along the mainline, or the file is not valid, the cache is rewritten from
+a full merge sort.
+"""
+
+from .. import (
+    errors,
+    revision as _mod_revision,
+    trace,
+    tsort,
+    )
+
+
+FORMAT_HEADER = b'Bazaar merge sort cache 1\n'
+CACHE_NAME = 'merge-sort-cache'
+
+
+class _MergeSortNode(object):
+    """A merge sorted revision, as returned by KnownGraph.merge_sort."""
+
+    __slots__ = ('key', 'merge_depth', 'revno', 'end_of_merge')
+
+    def __init__(self, key, merge_depth, revno, end_of_merge):
+        self.key = key
+        self.merge_depth = merge_depth
+        self.revno = revno
+        self.end_of_merge = end_of_merge
+
+
+def _serialise_nodes(nodes):
+    return b''.join(
+        b'%d %s %d %s\n' % (
+            node.merge_depth, b'.'.join(b'%d' % n for n in node.revno),
+            node.end_of_merge, node.key)
+        for node in nodes)
+
+
+class MergeSortCache(object):
+    """The merge sort cache of a branch."""
+
+    def __init__(self, transport):
+        """Create a MergeSortCache.
+
+        :param transport: The transport for the branch control directory.
+        """
+        self._transport = transport
+
+    def _load(self):
+        """Read the cached nodes.
+
+        :return: A list of nodes, oldest first, or None if there is no
+            valid cache.
+        """
+        try:
+            content = self._transport.get_bytes(CACHE_NAME)
+        except (errors.PathError, errors.TransportNotPossible):
+            return None
+        if not content.startswith(FORMAT_HEADER) or not content.endswith(
+                b'\n'):
+            return None
+        nodes = []
+        try:
+            for line in content[len(FORMAT_HEADER):].splitlines():
+                depth, revno, end_of_merge, revision_id = line.split(b' ', 3)
+                nodes.append(_MergeSortNode(
+                    revision_id, int(depth),
+                    tuple(int(n) for n in revno.split(b'.')),
+                    end_of_merge == b'1'))
+        except ValueError:
+            return None
+        if not nodes:
+            return None
+        tip = nodes[-1]
+        if tip.merge_depth != 0 or len(tip.revno) != 1:
+            return None
+        # Two processes appending the same revisions at once leave
+        # duplicates behind.
+        if len(set(node.key for node in nodes)) != len(nodes):
+            return None
+        return nodes
+
+    def _write(self, nodes, append):
+        data = _serialise_nodes(nodes)
+        try:
+            if append:
+                self._transport.append_bytes(CACHE_NAME, data)
+            else:
+                self._transport.put_bytes(CACHE_NAME, FORMAT_HEADER + data)
+        except (errors.PathError, errors.TransportNotPossible) as e:
+            trace.mutter('unable to write merge sort cache: %s', e)
+
+    def _merge_sort_new(self, repository, nodes, tip, tip_revno):
+        """Merge sort the revisions added since the cache was written.
+
+        :return: The new nodes, oldest first, or None if tip doesn't descend
+            from the cached tip along the mainline.
+        """
+        old_tip = nodes[-1]
+        steps = tip_revno - old_tip.revno[0]
+        if steps <= 0:
+            return None
+        graph = repository.get_graph()
+        try:
+            for i, revision_id in enumerate(
+                    graph.iter_lefthand_ancestry(tip)):
+                if i == steps:
+                    break
+            else:
+                return None
+        except errors.RevisionNotPresent:
+            return None
+        if revision_id != old_tip.key:
+            return None
+        new_keys = graph.find_unique_ancestors(tip, [old_tip.key])
+        parent_map = graph.get_parent_map(new_keys)
+        known_revnos = dict((node.key, node.revno) for node in nodes)
+        sorter = tsort.MergeSorter(
+            parent_map, tip, generate_revno=True, known_revnos=known_revnos)
+        new_nodes = [
+            _MergeSortNode(key, depth, revno, end_of_merge)
+            for _, key, depth, revno, end_of_merge
+            in sorter.iter_topo_order()]
+        # The oldest new revision is followed by the old tip, which the
+        # sorter didn't see.
+        oldest = new_nodes[-1]
+        oldest.end_of_merge = (
+            oldest.merge_depth > 0 or old_tip.key not in parent_map[oldest.key])
+        new_nodes.reverse()
+        return new_nodes
+
+    def merge_sort(self, repository, tip, tip_revno):
+        """Merge sort the ancestry of tip, using and updating the cache.
+
+        :param repository: The repository to read the revision graph from.
+        :param tip: The branch tip revision id.
+        :param tip_revno: The revno of tip.
+        :return: A list of nodes with key, merge_depth, revno and
+            end_of_merge attributes, newest first, as KnownGraph.merge_sort
+            returns.
+        """
+        if _mod_revision.is_null(tip):
+            return []
+        nodes = self._load()
+        if nodes is not None:
+            if nodes[-1].key == tip:
+                nodes.reverse()
+                return nodes
+            new_nodes = self._merge_sort_new(
+                repository, nodes, tip, tip_revno)
+            if new_nodes is not None:
+                self._write(new_nodes, append=True)
+                nodes.extend(new_nodes)
+                nodes.reverse()
+                return nodes
+        known_graph = repository.get_known_graph_ancestry([tip])
+        merge_sorted = known_graph.merge_sort(tip)
+        self._write(reversed(merge_sorted), append=False)
+        return merge_sorted
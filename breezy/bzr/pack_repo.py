@@ -31,6 +31,8 @@ from breezy import (
     ui,
     )
 from breezy.bzr import (
+    bloom,
+    generation_index,
     pack,
     )
 from breezy.bzr.index import (
@@ -91,6 +93,10 @@ class PackCommitBuilder(VersionedFileCommitBuilder):
         return {key[1] for key in self._file_graph.heads(keys)}
 
 
+# Bloom filter sidecars are stored next to their index, as INDEX_NAME + this
+BLOOM_FILTER_SUFFIX = '.bloom'
+
+
 class Pack(object):
     """An in memory proxy for a pack and its indices.
 
@@ -179,6 +185,10 @@ class Pack(object):
         """Get the position in a index_size array for a given index type."""
         return Pack.index_definitions[index_type][1]
 
+    def bloom_filter_name(self, index_type, name):
+        """Get the disk name of the bloom filter for an index of pack 'name'."""
+        return self.index_name(index_type, name) + BLOOM_FILTER_SUFFIX
+
     def inventory_index_name(self, name):
         """The inv index is the name + .iix."""
         return self.index_name('inventory', name)
@@ -206,6 +216,9 @@ class Pack(object):
                                  unlimited_cache=unlimited_cache)
         if index_type == 'chk':
             index._leaf_factory = btree_index._gcchk_factory
+        if self._pack_collection._use_bloom_filters(index):
+            index._bloom_filter_name = self.bloom_filter_name(
+                index_type, self.name)
         setattr(self, index_type + '_index', index)
 
     def __lt__(self, other):
@@ -531,13 +544,30 @@ class NewPack(Pack):
             transport = self.upload_transport
         else:
             transport = self.index_transport
-        index_tempfile = index.finish()
+        want_fdatasync = self._pack_collection.config_stack.get(
+            'repository.fdatasync')
+        if not suspend and isinstance(index, btree_index.BTreeBuilder):
+            bloom_filter = self._pack_collection._new_bloom_filter(
+                index.key_count())
+        else:
+            bloom_filter = None
+        if bloom_filter is not None:
+            index_tempfile = index.finish(bloom_filter=bloom_filter)
+        else:
+            index_tempfile = index.finish()
         index_bytes = index_tempfile.read()
         write_stream = transport.open_write_stream(index_name,
                                                    mode=self._file_mode)
         write_stream.write(index_bytes)
-        write_stream.close(
-            want_fdatasync=self._pack_collection.config_stack.get('repository.fdatasync'))
+        write_stream.close(want_fdatasync=want_fdatasync)
+        if bloom_filter is not None:
+            # Written after the index, but before the pack is added to
+            # pack-names, so readers never see an index without its filter.
+            write_stream = transport.open_write_stream(
+                self.bloom_filter_name(index_type, self.name),
+                mode=self._file_mode)
+            write_stream.write(bloom_filter.as_bytes())
+            write_stream.close(want_fdatasync=want_fdatasync)
         self.index_sizes[self.index_offset(index_type)] = len(index_bytes)
         if 'pack' in debug.debug_flags:
             # XXX: size might be interesting?
@@ -792,6 +822,7 @@ class RepositoryPackCollection(object):
         self._index_class = index_class
         self._suffix_offsets = {'.rix': 0, '.iix': 1, '.tix': 2, '.six': 3,
                                 '.cix': 4}
+        self._bloom_filters = None
         self.packs = []
         # name:Pack mapping
         self._names = None
@@ -1178,8 +1209,30 @@ class RepositoryPackCollection(object):
                                   unlimited_cache=is_chk)
         if is_chk and self._index_class is btree_index.BTreeGraphIndex:
             index._leaf_factory = btree_index._gcchk_factory
+        if not resume and self._use_bloom_filters(index):
+            index._bloom_filter_name = index_name + BLOOM_FILTER_SUFFIX
         return index
 
+    def _use_bloom_filters(self, index=None):
+        """Should bloom filter sidecars be written and read for indices?
+
+        :param index: If supplied, also check that this index supports
+            bloom filters.
+        """
+        if index is not None and not isinstance(
+                index, btree_index.BTreeGraphIndex):
+            return False
+        if self._bloom_filters is None:
+            self._bloom_filters = self.config_stack.get(
+                'repository.bloom_filters')
+        return self._bloom_filters
+
+    def _new_bloom_filter(self, key_count):
+        """Create a bloom filter for a new index, if they are enabled."""
+        if not self._use_bloom_filters():
+            return None
+        return bloom.BloomFilter.for_key_count(key_count)
+
     def _max_pack_count(self, total_revisions):
         """Return the maximum number of packs to use for total revisions.
 
@@ -1235,6 +1288,9 @@ class RepositoryPackCollection(object):
             suffixes = ['.iix', '.six', '.tix', '.rix']
             if self.chk_index is not None:
                 suffixes.append('.cix')
+            if self._use_bloom_filters():
+                suffixes.extend([suffix + BLOOM_FILTER_SUFFIX
+                                 for suffix in suffixes])
             for suffix in suffixes:
                 try:
                     self._index_transport.move(pack.name + suffix,
@@ -1503,7 +1559,8 @@ class RepositoryPackCollection(object):
             name, ext = osutils.splitext(filename)
             if ext == '.pack':
                 found.append(name)
-            if name in preserve:
+            # Bloom filters are named after their index, e.g. NAME.rix.bloom
+            if name.split('.', 1)[0] in preserve:
                 continue
             try:
                 obsolete_pack_transport.delete(filename)
@@ -1681,6 +1738,7 @@ class PackRepository(MetaDirVersionedFileRepository):
         self._commit_builder_class = _commit_builder_class
         self._serializer = _serializer
         self._reconcile_fixes_text_parents = True
+        self._generation_index = None
         if self._format.supports_external_lookups:
             self._unstacked_provider = graph.CachingParentsProvider(
                 self._make_parents_provider_unstacked())
@@ -1697,6 +1755,24 @@ class PackRepository(MetaDirVersionedFileRepository):
         self.revisions._index._key_dependencies.clear()
         self._pack_collection._abort_write_group()
 
+    def _get_generation_index(self):
+        """See Repository._get_generation_index."""
+        if self._generation_index is None:
+            if config.GlobalStack().get('bzr.generation_index'):
+                self._generation_index_file = (
+                    generation_index.GenerationIndexFile(self._transport))
+                self._generation_index = graph.GenerationIndex(
+                    self._generation_index_file.load(),
+                    self._save_generations)
+            else:
+                self._generation_index = False
+        return self._generation_index or None
+
+    def _save_generations(self, generations):
+        # Revisions in an uncommitted write group may never exist.
+        if not self.is_in_write_group():
+            self._generation_index_file.add(generations)
+
     def _make_parents_provider(self):
         if not self._format.supports_external_lookups:
             return self._unstacked_provider
@@ -810,9 +810,17 @@ class RemoteBzrDir(_mod_bzrdir.BzrDir, _RpcHelper):
         if not branch_format_name:
             branch_format_name = None
         format = RemoteBranchFormat(network_name=branch_format_name)
-        return RemoteBranch(self, self.find_repository(), format=format,
-                            setup_stacking=not ignore_fallbacks, name=name,
-                            possible_transports=possible_transports)
+        # Finding the repository and the stacked on url don't depend on each
+        # other, so ask for both at once.
+        path = self._path_for_remote_call(self._client)
+        calls = [(b'BzrDir.find_repositoryV3', (path,))]
+        if not ignore_fallbacks:
+            calls.append((b'Branch.get_stacked_on_url', (path,)))
+        with self._client.prefetching(calls):
+            return RemoteBranch(self, self.find_repository(), format=format,
+                                setup_stacking=not ignore_fallbacks,
+                                name=name,
+                                possible_transports=possible_transports)
 
     def open_branch(self, name=None, unsupported=False,
                     ignore_fallbacks=False, possible_transports=None):
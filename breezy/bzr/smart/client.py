@@ -14,6 +14,8 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
 
+import contextlib
+
 from ... import lazy_import
 lazy_import.lazy_import(globals(), """
 from breezy.bzr.smart import request as _mod_request
@@ -48,6 +50,7 @@ class _SmartClient(object):
 
     def _call_and_read_response(self, method, args, body=None, readv_body=None,
                                 body_stream=None, expect_response_body=True):
+        self._discard_stale_prefetched_responses([method])
         request = _SmartClientRequest(self, method, args, body=body,
                                       readv_body=readv_body, body_stream=body_stream,
                                       expect_response_body=expect_response_body)
@@ -55,6 +58,17 @@ class _SmartClient(object):
 
     def call(self, method, *args):
         """Call a method on the remote server."""
+        prefetched = self._medium._prefetched_responses
+        if prefetched:
+            try:
+                result = prefetched.pop((method, args))
+            except (KeyError, TypeError):
+                # Not prefetched, or args that can't have been (lists)
+                pass
+            else:
+                if isinstance(result, Exception):
+                    raise result
+                return result
         result, protocol = self.call_expecting_body(method, *args)
         protocol.cancel_read_body()
         return result
@@ -107,6 +121,129 @@ class _SmartClient(object):
             expect_response_body=False)
         return (response, response_handler)
 
+    def call_many(self, calls, expect_body=False):
+        """Call several methods without waiting for each response in turn.
+
+        When the medium supports it, all the requests are sent before any
+        response is read, so the calls cost a single round trip rather than
+        one each. The calls must be independent of each other, and must not
+        have request bodies.
+
+        :param calls: A sequence of (method, args) tuples.
+        :param expect_body: If True, return the response body of each call
+            as well.
+        :return: A list with an entry for each call, in order: the response
+            tuple (or a (response_tuple, body_bytes) tuple if expect_body is
+            True), or the ErrorFromSmartServer or UnknownSmartMethod
+            exception that the call raised.
+        """
+        calls = list(calls)
+        results = []
+        medium = self._medium
+        self._discard_stale_prefetched_responses(
+            [method for method, args in calls])
+        if calls and medium._protocol_version is None:
+            # Let the first call find out which protocol the server speaks
+            results.append(self._call_for_many(calls[0], expect_body))
+        if (len(calls) - len(results) < 2 or
+                medium._protocol_version != 3 or
+                not medium.supports_pipelining()):
+            for call in calls[len(results):]:
+                results.append(self._call_for_many(call, expect_body))
+            return results
+        try:
+            self._call_pipelined(calls[len(results):], expect_body, results)
+        except errors.ConnectionReset:
+            medium.reset()
+            remaining = calls[len(results):]
+            for method, args in remaining:
+                if not _SmartClientRequest(
+                        self, method, args)._is_safe_to_send_twice():
+                    raise
+            trace.warning('ConnectionReset during pipelined calls, retrying'
+                          ' %d calls one at a time' % (len(remaining),))
+            trace.log_exception_quietly()
+            for call in remaining:
+                results.append(self._call_for_many(call, expect_body))
+        return results
+
+    @contextlib.contextmanager
+    def prefetching(self, calls):
+        """Make read-only calls that are about to be needed in one round trip.
+
+        If the medium supports pipelining, the calls are made on entry, and
+        until the context exits the response to each is returned by the first
+        call() with the same method and arguments, unless a request that is
+        not read-only is made in between. Otherwise the calls are just made
+        when call() is.
+
+        :param calls: A sequence of (method, args) tuples.
+        """
+        calls = [(method, tuple(args)) for method, args in calls]
+        medium = self._medium
+        if (len(calls) > 1 and medium._protocol_version == 3 and
+                medium.supports_pipelining()):
+            results = self.call_many(calls)
+            medium._prefetched_responses.update(zip(calls, results))
+        try:
+            yield
+        finally:
+            medium._prefetched_responses.clear()
+
+    def _discard_stale_prefetched_responses(self, methods):
+        """Forget the prefetched responses if methods may change anything."""
+        prefetched = self._medium._prefetched_responses
+        if not prefetched:
+            return
+        for method in methods:
+            # Verbs that are not registered here, e.g. ones only known to
+            # plugins, may change anything.
+            if (method not in _mod_request.request_handlers or
+                    _mod_request.request_handlers.get_info(method) != 'read'):
+                prefetched.clear()
+                return
+
+    def _call_for_many(self, call, expect_body):
+        """Make one of the calls for call_many, on its own."""
+        method, args = call
+        try:
+            if not expect_body:
+                return self.call(method, *args)
+            response, response_handler = self.call_expecting_body(
+                method, *args)
+            return response, response_handler.read_body_bytes()
+        except (errors.ErrorFromSmartServer, errors.UnknownSmartMethod) as e:
+            return e
+
+    def _call_pipelined(self, calls, expect_body, results):
+        """Send all of calls, then read their responses into results."""
+        medium_request = self._medium.get_request()
+        response_handlers = []
+        for method, args in calls:
+            _SmartClientRequest(self, method, args)._run_call_hooks()
+            request = _PipelinedMediumRequest(medium_request)
+            encoder = protocol.ProtocolThreeRequester(request)
+            response_handler = message.ConventionalResponseHandler()
+            response_proto = protocol.ProtocolThreeDecoder(
+                response_handler, expect_version_marker=True)
+            response_handler.setProtoAndMediumRequest(response_proto, request)
+            request.protocol_decoder = response_proto
+            encoder.set_headers(self._headers)
+            encoder.call(method, *args)
+            response_handlers.append(response_handler)
+        medium_request.finished_writing()
+        for response_handler in response_handlers:
+            try:
+                response = response_handler.read_response_tuple(
+                    expect_body=expect_body)
+                if expect_body:
+                    response = (response, response_handler.read_body_bytes())
+            except (errors.ErrorFromSmartServer,
+                    errors.UnknownSmartMethod) as e:
+                response = e
+            results.append(response)
+        medium_request.finished_reading()
+
     def remote_path_from_transport(self, transport):
         """Convert transport into a path suitable for using in a request.
 
@@ -317,6 +454,43 @@ class _SmartClientRequest(object):
             encoder.call(self.method, *self.args)
 
 
+class _PipelinedMediumRequest(object):
+    """One of several requests sent together on a single medium request.
+
+    The requests are all written before finished_writing is called on the
+    medium request, and their responses read back in the same order before
+    finished_reading is called on it, so the writing and reading state of
+    each individual request is left to the protocol objects.
+
+    :ivar protocol_decoder: The decoder for this request's response.
+    """
+
+    def __init__(self, medium_request):
+        self._medium_request = medium_request
+        self._medium = medium_request._medium
+        self.protocol_decoder = None
+
+    def accept_bytes(self, bytes):
+        self._medium_request.accept_bytes(bytes)
+
+    def finished_writing(self):
+        pass
+
+    def read_bytes(self, count):
+        return self._medium_request.read_bytes(count)
+
+    def read_line(self):
+        return self._medium_request.read_line()
+
+    def finished_reading(self):
+        # Any bytes read past the end of this response belong to the next
+        # one, so give them back to the medium for it to read.
+        unused_data = self.protocol_decoder.unused_data
+        if unused_data:
+            self.protocol_decoder.unused_data = b''
+            self._medium._push_back(unused_data)
+
+
 class SmartClientHooks(hooks.Hooks):
 
     def __init__(self):
@@ -27,6 +27,7 @@ breezy/transport/smart/__init__.py.
 import errno
 import io
 import os
+import re
 import sys
 import time
 
@@ -294,7 +295,10 @@ class SmartServerStreamMedium(SmartMedium):
 
         :returns: a SmartServerRequestProtocol.
         """
-        self._wait_for_bytes_with_timeout(self._client_timeout)
+        if self._push_back_buffer is None:
+            # Otherwise the client has already sent (the start of) the next
+            # request along with the previous one.
+            self._wait_for_bytes_with_timeout(self._client_timeout)
         if self.finished:
             # We're stopping, so don't try to do any more work
             return None
@@ -515,6 +519,11 @@ class SmartServerPipeStreamMedium(SmartServerStreamMedium):
             return
 
     def _read_bytes(self, desired_count):
+        # A buffered file would read ahead into the next request, where
+        # _wait_for_bytes_with_timeout can't see it. read1 doesn't.
+        read1 = getattr(self._in, 'read1', None)
+        if read1 is not None:
+            return read1(desired_count)
         return self._in.read(desired_count)
 
     def terminate_due_to_error(self):
@@ -760,6 +769,12 @@ class SmartClientMedium(SmartMedium):
         # _remote_version_is_before tracks the bzr version the remote side
         # can be based on what we've seen so far.
         self._remote_version_is_before = None
+        # The 'Software version' header the remote side sent with its first
+        # protocol three response, if any.
+        self._remote_software_version = None
+        # Maps (method, args) to the response for calls made ahead of time
+        # by _SmartClient.prefetching.
+        self._prefetched_responses = {}
         # Install debug hook function if debug flag is set.
         if 'hpss' in debug.debug_flags:
             global _debug_counter
@@ -815,6 +830,23 @@ class SmartClientMedium(SmartMedium):
             return
         self._remote_version_is_before = version_tuple
 
+    def _remote_is_at_least(self, version_tuple):
+        """Is the remote side known to be at least the given version?
+
+        This is only known once the remote side has reported its software
+        version, which it does in the headers of protocol three responses.
+        """
+        version = self._remote_software_version
+        if version is None:
+            return False
+        remote_version = []
+        for part in version.split(b'.'):
+            digits = re.match(b'[0-9]*', part).group()
+            if not digits:
+                break
+            remote_version.append(int(digits))
+        return tuple(remote_version) >= version_tuple
+
     def protocol_version(self):
         """Find out if 'hello' smart request works."""
         if self._protocol_version_error is not None:
@@ -851,6 +883,14 @@ class SmartClientMedium(SmartMedium):
         """
         return False
 
+    def supports_pipelining(self):
+        """Can several requests be sent before reading their responses?
+
+        If so, the responses are read back in the order the requests were
+        sent. See _SmartClient.call_many.
+        """
+        return False
+
     def disconnect(self):
         """If this medium maintains a persistent connection, close it.
 
@@ -907,6 +947,17 @@ class SmartClientStreamMedium(SmartClientMedium):
         """
         return SmartClientStreamMediumRequest(self)
 
+    def supports_pipelining(self):
+        """See SmartClientMedium.supports_pipelining().
+
+        Responses arrive on the stream in the order the requests were sent,
+        so several requests can be written before any response is read.
+        Servers older than 3.2 do read a following request along with the
+        current one, but then wait for more bytes on the stream before
+        serving it, so this is only true for newer servers.
+        """
+        return self._remote_is_at_least((3, 2))
+
     def reset(self):
         """We have been disconnected, reset current state.
 
@@ -231,6 +231,12 @@ class ConventionalResponseHandler(MessageHandler, ResponseHandler):
         self._protocol_decoder = protocol_decoder
         self._medium_request = medium_request
 
+    def headers_received(self, headers):
+        MessageHandler.headers_received(self, headers)
+        medium = getattr(self._medium_request, '_medium', None)
+        if medium is not None and medium._remote_software_version is None:
+            medium._remote_software_version = headers.get(b'Software version')
+
     def byte_part_received(self, byte):
         if not isinstance(byte, bytes):
             raise TypeError(byte)
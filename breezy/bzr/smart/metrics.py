@@ -0,0 +1,118 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Counters describing the load on the smart server.
+
+The connection counts are kept up to date by SmartTCPServer, and the request
+latencies by SmartServerRequestHandler. They are per process, as the request
+handlers don't know which server they're serving.
+"""
+
+import threading
+
+
+# The upper bounds (in seconds) of the request latency histogram buckets. The
+# last bucket counts the requests slower than all of these.
+LATENCY_BUCKETS = (0.001, 0.01, 0.1, 1.0, 10.0)
+
+
+class SmartServerMetrics(object):
+    """Connection and request counters for the smart server.
+
+    :ivar active_connections: The number of connections being served.
+    :ivar queued_connections: The number of accepted connections waiting for
+        a connection slot.
+    :ivar total_connections: The number of connections served in total.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.active_connections = 0
+        self.queued_connections = 0
+        self.total_connections = 0
+        # verb -> [count per bucket, with one more for slower requests]
+        self._latencies = {}
+        # verb -> total seconds spent
+        self._latency_totals = {}
+
+    def connection_queued(self):
+        with self._lock:
+            self.queued_connections += 1
+
+    def connection_dequeued(self):
+        with self._lock:
+            self.queued_connections -= 1
+
+    def connection_started(self):
+        with self._lock:
+            self.active_connections += 1
+            self.total_connections += 1
+
+    def connection_finished(self):
+        with self._lock:
+            self.active_connections -= 1
+
+    def request_finished(self, verb, seconds):
+        """Record that a request has been served.
+
+        :param verb: The request name, e.g. b'Branch.last_revision_info'.
+        :param seconds: How long the request handler took.
+        """
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                break
+        else:
+            i = len(LATENCY_BUCKETS)
+        with self._lock:
+            try:
+                counts = self._latencies[verb]
+            except KeyError:
+                counts = self._latencies[verb] = [0] * (
+                    len(LATENCY_BUCKETS) + 1)
+                self._latency_totals[verb] = 0.0
+            counts[i] += 1
+            self._latency_totals[verb] += seconds
+
+    def latency_histogram(self, verb):
+        """Return the request latency histogram for verb.
+
+        :return: A list with the number of requests in each bucket of
+            LATENCY_BUCKETS, followed by the number of slower requests.
+        """
+        with self._lock:
+            return list(self._latencies.get(
+                verb, [0] * (len(LATENCY_BUCKETS) + 1)))
+
+    def report(self):
+        """Return a summary of the metrics, as a list of lines of text."""
+        with self._lock:
+            lines = ['connections: %d active, %d queued, %d total'
+                     % (self.active_connections, self.queued_connections,
+                        self.total_connections)]
+            for verb in sorted(self._latencies):
+                counts = self._latencies[verb]
+                total = sum(counts)
+                buckets = ' '.join(
+                    '<=%gs:%d' % (bound, count)
+                    for bound, count in zip(LATENCY_BUCKETS, counts))
+                lines.append('%s: %d requests, mean %.4fs, %s >%gs:%d'
+                             % (verb.decode('ascii', 'replace'), total,
+                                self._latency_totals[verb] / total, buckets,
+                                LATENCY_BUCKETS[-1], counts[-1]))
+        return lines
+
+
+server_metrics = SmartServerMetrics()
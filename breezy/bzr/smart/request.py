@@ -44,6 +44,7 @@ from ... import (
     trace,
     urlutils,
     )
+from . import metrics
 from ...lazy_import import lazy_import
 lazy_import(globals(), """
 from breezy.bzr import bzrdir
@@ -302,6 +303,7 @@ class SmartServerRequestHandler(object):
         self.response = None
         self.finished_reading = False
         self._command = None
+        self._verb = None
         if 'hpss' in debug.debug_flags:
             self._request_start_time = osutils.perf_counter()
             self._thread_id = get_ident()
@@ -356,6 +358,10 @@ class SmartServerRequestHandler(object):
         if result is not None:
             self.response = result
             self.finished_reading = True
+            if self._verb is not None:
+                metrics.server_metrics.request_finished(
+                    self._verb,
+                    osutils.perf_counter() - self._command_start_time)
 
     def _call_converting_errors(self, callable, args, kwargs):
         """Call callable converting errors to Response objects."""
@@ -395,6 +401,8 @@ class SmartServerRequestHandler(object):
             else:
                 action = 'hpss request'
             self._trace(action, '%s %s' % (cmd, repr(args)[1:-1]))
+        self._verb = cmd
+        self._command_start_time = osutils.perf_counter()
         self._command = command(
             self._backing_transport, self._root_client_path, self._jail_root)
         self._run_handler_code(self._command.execute, args, {})
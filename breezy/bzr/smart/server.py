@@ -16,6 +16,7 @@
 
 """Server for smart-server protocol."""
 
+import collections
 import errno
 import os.path
 import socket
@@ -34,6 +35,7 @@ from ...lazy_import import lazy_import
 lazy_import(globals(), """
 from breezy.bzr.smart import (
     medium,
+    metrics,
     signals,
     )
 from breezy.transport import (
@@ -51,7 +53,9 @@ class SmartTCPServer(object):
     """Listens on a TCP socket and accepts connections from smart clients.
 
     Each connection will be served by a SmartServerSocketStreamMedium running in
-    a thread.
+    a thread. If the number of connections is limited, connections accepted
+    beyond the limit wait for one of the threads to finish its connection,
+    and that thread then serves them.
 
     hooks: An instance of SmartServerHooks.
     """
@@ -66,7 +70,9 @@ class SmartTCPServer(object):
     _timer = time.time
 
     def __init__(self, backing_transport, root_client_path='/',
-                 client_timeout=None):
+                 client_timeout=None, max_connections=0,
+                 max_connection_time=0, accept_backlog=1,
+                 metrics_log_interval=0):
         """Construct a new server.
 
         To actually start it running, call either start_background_thread or
@@ -77,11 +83,32 @@ class SmartTCPServer(object):
             of backing_transport.
         :param client_timeout: See SmartServerSocketStreamMedium's timeout
             parameter.
+        :param max_connections: The maximum number of connections to serve at
+            once, or 0 for no limit. At most as many connections again are
+            accepted and queued, further ones wait in the listen backlog.
+        :param max_connection_time: The number of seconds after which a
+            connection is closed once its current request is served, or 0 for
+            no limit.
+        :param accept_backlog: The size of the listen backlog.
+        :param metrics_log_interval: How often (in seconds) to log the server
+            metrics, or 0 to not log them.
         """
         self.backing_transport = backing_transport
         self.root_client_path = root_client_path
         self._client_timeout = client_timeout
+        self._max_connections = max_connections
+        self._max_connection_time = max_connection_time
+        self._accept_backlog = accept_backlog
+        self._metrics_log_interval = metrics_log_interval
+        # Protects _active_connections and _queued_connections, which are
+        # updated by the connection threads as well as the serving thread.
+        # It is notified when a connection thread finishes.
+        self._connections_changed = threading.Condition()
         self._active_connections = []
+        self._queued_connections = collections.deque()
+        # handler -> the time we started serving it
+        self._connection_start_times = {}
+        self._next_metrics_log = self._timer() + metrics_log_interval
         # This is set to indicate we want to wait for clients to finish before
         # we disconnect.
         self._gracefully_stopping = False
@@ -115,7 +142,7 @@ class SmartTCPServer(object):
             raise errors.CannotBindAddress(host, port, message)
         self._sockname = self._server_socket.getsockname()
         self.port = self._sockname[1]
-        self._server_socket.listen(1)
+        self._server_socket.listen(self._accept_backlog)
         self._server_socket.settimeout(self._ACCEPT_TIMEOUT)
         # Once we start accept()ing connections, we set started.
         self._started = threading.Event()
@@ -167,8 +194,14 @@ class SmartTCPServer(object):
         trace.note(gettext('Requested to stop gracefully'))
         self._should_terminate = True
         self._gracefully_stopping = True
-        for handler, _ in self._active_connections:
-            handler._stop_gracefully()
+        with self._connections_changed:
+            for handler, _ in self._active_connections:
+                handler._stop_gracefully()
+            # Don't start serving connections that are still waiting
+            while self._queued_connections:
+                handler = self._queued_connections.popleft()
+                metrics.server_metrics.connection_dequeued()
+                handler._disconnect_client()
 
     def _wait_for_clients_to_disconnect(self):
         self._poll_active_connections()
@@ -203,6 +236,14 @@ class SmartTCPServer(object):
         try:
             try:
                 while not self._should_terminate:
+                    if self._queue_is_full():
+                        # Leave any more connections in the listen backlog
+                        # until a connection slot is free.
+                        with self._connections_changed:
+                            self._connections_changed.wait(
+                                self._ACCEPT_TIMEOUT)
+                        self._poll_active_connections()
+                        continue
                     try:
                         conn, client_addr = self._server_socket.accept()
                     except self._socket_timeout:
@@ -258,31 +299,109 @@ class SmartTCPServer(object):
         This will iterate through self._active_connections, and update any
         connections that are finished.
 
+        This also stops connections that have been open for longer than
+        max_connection_time, and logs the metrics when they are due.
+
         :param timeout: The timeout to pass to thread.join(). By default, we
             set it to 0, so that we don't hang if threads are not done yet.
         :return: None
         """
-        still_active = []
-        for handler, thread in self._active_connections:
+        with self._connections_changed:
+            active_connections = list(self._active_connections)
+        for handler, thread in active_connections:
             thread.join(timeout)
-            if thread.is_alive():
-                still_active.append((handler, thread))
-        self._active_connections = still_active
+        with self._connections_changed:
+            self._active_connections = [
+                (handler, thread)
+                for handler, thread in self._active_connections
+                if thread.is_alive()]
+            if self._max_connection_time:
+                now = self._timer()
+                for handler, thread in self._active_connections:
+                    started = self._connection_start_times.get(handler)
+                    if (started is not None and
+                            now - started > self._max_connection_time):
+                        trace.mutter('%s has been open for too long' %
+                                     (handler,))
+                        del self._connection_start_times[handler]
+                        handler._stop_gracefully()
+        if self._metrics_log_interval:
+            now = self._timer()
+            if now >= self._next_metrics_log:
+                for line in metrics.server_metrics.report():
+                    trace.mutter('smart server %s', line)
+                self._next_metrics_log = now + self._metrics_log_interval
+
+    def _queue_is_full(self):
+        """Should we stop accepting connections for now?"""
+        if not self._max_connections:
+            return False
+        with self._connections_changed:
+            return len(self._queued_connections) >= self._max_connections
 
     def serve_conn(self, conn, thread_name_suffix):
+        """Serve a newly accepted connection.
+
+        :return: The thread serving the connection, or None if it has been
+            queued until a connection slot is free.
+        """
         # For WIN32, where the timeout value from the listening socket
         # propagates to the newly accepted socket.
         conn.setblocking(True)
         conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         thread_name = 'smart-server-child' + thread_name_suffix
         handler = self._make_handler(conn)
-        connection_thread = threading.Thread(
-            None, handler.serve, name=thread_name)
-        self._active_connections.append((handler, connection_thread))
+        with self._connections_changed:
+            if (self._max_connections and
+                    len(self._active_connections) >= self._max_connections):
+                self._queued_connections.append(handler)
+                metrics.server_metrics.connection_queued()
+                return None
+            connection_thread = threading.Thread(
+                None, self._serve_connections, args=(handler,),
+                name=thread_name)
+            self._active_connections.append((handler, connection_thread))
         connection_thread.setDaemon(True)
         connection_thread.start()
         return connection_thread
 
+    def _serve_connections(self, handler):
+        """Serve handler, then any connections queued meanwhile."""
+        thread = threading.current_thread()
+        while handler is not None:
+            with self._connections_changed:
+                self._connection_start_times[handler] = self._timer()
+            metrics.server_metrics.connection_started()
+            try:
+                handler.serve()
+            finally:
+                metrics.server_metrics.connection_finished()
+                with self._connections_changed:
+                    self._connection_start_times.pop(handler, None)
+                    handler = self._take_queued_connection(thread)
+                    self._connections_changed.notify_all()
+
+    def _take_queued_connection(self, thread):
+        """Hand the next queued connection, if any, to thread.
+
+        Must be called with _connections_changed held.
+        """
+        for i, (handler, active_thread) in enumerate(
+                self._active_connections):
+            if active_thread is thread:
+                break
+        else:
+            return None
+        if not self._queued_connections or self._gracefully_stopping:
+            # Free the connection slot straight away, rather than when
+            # _poll_active_connections notices the thread has finished.
+            del self._active_connections[i]
+            return None
+        handler = self._queued_connections.popleft()
+        metrics.server_metrics.connection_dequeued()
+        self._active_connections[i] = (handler, thread)
+        return handler
+
     def start_background_thread(self, thread_name_suffix=''):
         self._started.clear()
         self._server_thread = threading.Thread(None,
@@ -436,8 +555,8 @@ class BzrServerFactory(object):
         return sys.stdin.buffer, sys.stdout.buffer
 
     def _make_smart_server(self, host, port, inet, timeout):
+        c = config.GlobalStack()
         if timeout is None:
-            c = config.GlobalStack()
             timeout = c.get('serve.client_timeout')
         if inet:
             stdin, stdout = self._get_stdin_stdout()
@@ -448,8 +567,12 @@ class BzrServerFactory(object):
                 host = medium.BZR_DEFAULT_INTERFACE
             if port is None:
                 port = medium.BZR_DEFAULT_PORT
-            smart_server = SmartTCPServer(self.transport,
-                                          client_timeout=timeout)
+            smart_server = SmartTCPServer(
+                self.transport, client_timeout=timeout,
+                max_connections=c.get('serve.max_connections'),
+                max_connection_time=c.get('serve.max_connection_time'),
+                accept_backlog=c.get('serve.accept_backlog'),
+                metrics_log_interval=c.get('serve.metrics_log_interval'))
             smart_server.start_server(host, port)
             trace.note(gettext('listening on port: %s'),
                        str(smart_server.port))
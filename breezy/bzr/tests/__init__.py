@@ -48,6 +48,7 @@ def load_tests(loader, basic_tests, pattern):
     testmod_names = [
         'blackbox',
         'test_dirstate',
+        'test_dirstate_journal',
         'per_bzrdir',
         'per_inventory',
         'per_pack_repository',
@@ -58,19 +59,24 @@ def load_tests(loader, basic_tests, pattern):
         'test__chk_map',
         'test__dirstate_helpers',
         'test__groupcompress',
+        'test_bloom',
         'test_btree_index',
         'test_bundle',
         'test_bzrdir',
+        'test_chk_disk_cache',
         'test_chk_map',
         'test_chk_serializer',
+        'test_compact_dirstate',
         'test_conflicts',
         'test_generate_ids',
+        'test_generation_index',
         'test_groupcompress',
         'test_index',
         'test_inv',
         'test_inventory_delta',
         'test_knit',
         'test_matchers',
+        'test_merge_sort_cache',
         'test_pack',
         'test_read_bundle',
         'test_remote',
@@ -0,0 +1,88 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Tests for bloom filters over index keys."""
+
+from ... import tests
+from .. import bloom
+
+
+class TestBloomFilter(tests.TestCase):
+
+    def make_keys(self, count, prefix=b'key'):
+        return [(prefix, b'%d' % i) for i in range(count)]
+
+    def test_empty(self):
+        bf = bloom.BloomFilter.for_key_count(0)
+        self.assertFalse((b'foo',) in bf)
+
+    def test_no_false_negatives(self):
+        keys = self.make_keys(1000)
+        bf = bloom.BloomFilter.for_key_count(len(keys))
+        for key in keys:
+            bf.add(key)
+        for key in keys:
+            self.assertTrue(key in bf)
+
+    def test_false_positive_rate(self):
+        bf = bloom.BloomFilter.for_key_count(1000)
+        for key in self.make_keys(1000):
+            bf.add(key)
+        false_positives = [key for key in self.make_keys(10000, b'other')
+                           if key in bf]
+        # About 1% is expected with the default sizing
+        self.assertTrue(len(false_positives) < 300, len(false_positives))
+
+    def test_unhashable_key_may_be_present(self):
+        bf = bloom.BloomFilter.for_key_count(10)
+        bf.add((b'foo',))
+        self.assertIs(None, bloom.key_digest((b'foo', None)))
+        self.assertTrue((b'foo', None) in bf)
+        self.assertTrue(('foo',) in bf)
+        self.assertRaises(TypeError, bf.add, ('foo',))
+
+    def test_may_contain(self):
+        keys = self.make_keys(100)
+        bf = bloom.BloomFilter.for_key_count(len(keys))
+        for key in keys:
+            bf.add(key)
+        for key in keys:
+            self.assertTrue(bf.may_contain(bloom.key_digest(key)))
+        self.assertEqual(
+            [key in bf for key in self.make_keys(100, b'other')],
+            [bf.may_contain(bloom.key_digest(key))
+             for key in self.make_keys(100, b'other')])
+
+    def test_round_trip(self):
+        keys = self.make_keys(50)
+        bf = bloom.BloomFilter.for_key_count(len(keys))
+        for key in keys:
+            bf.add(key)
+        bf2 = bloom.BloomFilter.from_bytes(bf.as_bytes())
+        self.assertEqual(bf.num_bits, bf2.num_bits)
+        self.assertEqual(bf.num_hashes, bf2.num_hashes)
+        self.assertEqual(bf.as_bytes(), bf2.as_bytes())
+        for key in keys:
+            self.assertTrue(key in bf2)
+
+    def test_bad_signature(self):
+        self.assertRaises(bloom.BadBloomFilter,
+                          bloom.BloomFilter.from_bytes, b'not a filter\n')
+
+    def test_truncated(self):
+        bf = bloom.BloomFilter.for_key_count(100)
+        self.assertRaises(bloom.BadBloomFilter,
+                          bloom.BloomFilter.from_bytes, bf.as_bytes()[:-1])
@@ -29,6 +29,7 @@ from ... import (
     transport,
     )
 from .. import (
+    bloom,
     btree_index,
     index as _mod_index,
     )
@@ -1002,6 +1003,34 @@ class TestBTreeIndex(BTreeTestCase):
                 (index, (b'name', b'fin2'), b'beta', ((), ))},
             set(index.iter_entries_prefix([(b'name', None)])))
 
+    def test_iter_key_prefix_reads_matching_leaves(self):
+        nodes = []
+        for prefix_pos in range(100):
+            for pos in range(20):
+                key = (b'prefix%03d' % prefix_pos, b'%d' % pos)
+                nodes.append((key, b'value:%s' % (b'%d' % pos) * 20, ()))
+        index = self.make_index(key_elements=2, nodes=nodes)
+        del index._transport._activity[:]
+        found = set(index.iter_entries_prefix([(b'prefix050', None)]))
+        self.assertEqual(
+            {(index, key, value) for key, value, _ in nodes
+             if key[0] == b'prefix050'},
+            found)
+        # There is at least one row of internal nodes
+        self.assertTrue(len(index._row_lengths) > 1)
+        leaf_count = index._row_lengths[-1]
+        read_pages = sum(len(action[2]) for action in
+                         index._transport._activity if action[0] == 'readv')
+        self.assertTrue(read_pages < leaf_count,
+                        '%d pages read of %d leaves' % (read_pages,
+                                                        leaf_count))
+        # Prefixes at the edges of the index
+        for prefix in [b'prefix000', b'prefix099', b'prefix', b'prefix1000']:
+            self.assertEqual(
+                {(index, key, value) for key, value, _ in nodes
+                 if key[0] == prefix},
+                set(index.iter_entries_prefix([(prefix, None)])))
+
     # XXX: external_references tests are duplicated in test_index.  We
     # probably should have per_graph_index tests...
     def test_external_references_no_refs(self):
@@ -1206,6 +1235,113 @@ class TestBTreeIndex(BTreeTestCase):
         self.assertEqual(500, len(entries))
 
 
+class TestBTreeIndexBloomFilter(BTreeTestCase):
+
+    def test_finish_fills_bloom_filter(self):
+        nodes = self.make_nodes(200, 1, 1)
+        builder = btree_index.BTreeBuilder(reference_lists=1)
+        for node in nodes:
+            builder.add_node(*node)
+        bf = bloom.BloomFilter.for_key_count(builder.key_count())
+        builder.finish(bloom_filter=bf)
+        for key, _, _ in nodes:
+            self.assertTrue(key in bf)
+
+    def test_get_bloom_filter(self):
+        trans = self.get_transport()
+        bf = bloom.BloomFilter.for_key_count(1)
+        bf.add((b'key',))
+        trans.put_bytes('index.bloom', bf.as_bytes())
+        index = btree_index.BTreeGraphIndex(trans, 'index', None)
+        # No sidecar name, no filter
+        self.assertIs(None, index.get_bloom_filter())
+        index._bloom_filter_name = 'index.bloom'
+        self.assertTrue((b'key',) in index.get_bloom_filter())
+
+    def test_get_bloom_filter_missing(self):
+        index = btree_index.BTreeGraphIndex(self.get_transport(), 'index',
+                                            None)
+        index._bloom_filter_name = 'index.bloom'
+        self.assertIs(None, index.get_bloom_filter())
+
+    def test_get_bloom_filter_corrupt(self):
+        trans = self.get_transport()
+        trans.put_bytes('index.bloom', b'garbage')
+        index = btree_index.BTreeGraphIndex(trans, 'index', None)
+        index._bloom_filter_name = 'index.bloom'
+        self.assertIs(None, index.get_bloom_filter())
+
+
+class TestBTreeIndexMmap(BTreeTestCase):
+
+    def make_local_index(self, nodes, ref_lists=0, key_elements=1):
+        builder = btree_index.BTreeBuilder(reference_lists=ref_lists,
+                                           key_elements=key_elements)
+        for node in nodes:
+            builder.add_node(*node)
+        trans = transport.get_transport_from_path('.')
+        size = trans.put_file('index', builder.finish())
+        return btree_index.BTreeGraphIndex(trans, 'index', size)
+
+    def test_local_index_is_mapped(self):
+        self.overrideAttr(btree_index, '_use_mmap', True)
+        nodes = self.make_nodes(500, 1, 1)
+        index = self.make_local_index(nodes, ref_lists=1)
+        self.assertEqual(500, index.key_count())
+        self.assertIsNot(None, index._mmap)
+        self.assertEqual(
+            sorted((index, key, value, refs) for key, value, refs in nodes),
+            sorted(index.iter_entries([n[0] for n in nodes])))
+        self.assertEqual(500, len(list(index.iter_all_entries())))
+        leaves = [index._leaf_node_cache[offset]
+                  for offset in index._leaf_node_cache.keys()]
+        self.assertTrue(leaves)
+        self.assertIsInstance(leaves[0], btree_index._LazyLeafNode)
+
+    def test_missing_keys(self):
+        self.overrideAttr(btree_index, '_use_mmap', True)
+        nodes = self.make_nodes(500, 2, 0)
+        index = self.make_local_index(nodes, key_elements=2)
+        self.assertEqual([], list(index.iter_entries(
+            [(b'missing', b'key'), nodes[0][0][:1] + (b'x',)])))
+        self.assertEqual(1, len(list(index.iter_entries([nodes[10][0]]))))
+
+    def test_clear_cache_closes_mmap(self):
+        self.overrideAttr(btree_index, '_use_mmap', True)
+        nodes = self.make_nodes(500, 1, 0)
+        index = self.make_local_index(nodes)
+        self.assertEqual(1, len(list(index.iter_entries([nodes[10][0]]))))
+        mapped = index._mmap
+        self.assertIsNot(None, mapped)
+        index.clear_cache()
+        self.assertIs(None, index._mmap)
+        self.assertTrue(mapped.closed)
+        # It is mapped again when needed.
+        self.assertEqual(1, len(list(index.iter_entries([nodes[400][0]]))))
+        self.assertIsNot(None, index._mmap)
+
+    def test_mmap_disabled(self):
+        self.overrideAttr(btree_index, '_use_mmap', False)
+        nodes = self.make_nodes(500, 1, 0)
+        index = self.make_local_index(nodes)
+        self.assertEqual(1, len(list(index.iter_entries([nodes[10][0]]))))
+        self.assertIs(None, index._mmap)
+
+    def test_non_local_transport_not_mapped(self):
+        self.overrideAttr(btree_index, '_use_mmap', True)
+        builder = btree_index.BTreeBuilder(reference_lists=0, key_elements=1)
+        for node in self.make_nodes(10, 1, 0):
+            builder.add_node(*node)
+        trans = self.get_transport()
+        size = trans.put_file('index', builder.finish())
+        trans = transport.get_transport_from_url('trace+' + trans.base)
+        index = btree_index.BTreeGraphIndex(trans, 'index', size)
+        self.assertEqual(10, index.key_count())
+        self.assertIs(None, index._mmap)
+        self.assertEqual([('readv', 'index', [(0, size)], False, None)],
+                         trans._activity)
+
+
 class TestBTreeNodes(BTreeTestCase):
 
     scenarios = btreeparser_scenarios()
@@ -1252,6 +1388,31 @@ class TestBTreeNodes(BTreeTestCase):
             (b'11', b'44'): (b'value:4', ((), ((b'11', b'ref00'),)))
             }, dict(node.all_items()))
 
+    def test_LazyLeafNode_2_2(self):
+        node_bytes = (b"type=leaf\n"
+                      b"00\x0000\x00\t00\x00ref00\x00value:0\n"
+                      b"00\x0011\x0000\x00ref00\t00\x00ref00\r01\x00ref01\x00value:1\n"
+                      b"11\x0033\x0011\x00ref22\t11\x00ref22\r11\x00ref22\x00value:3\n"
+                      b"11\x0044\x00\t11\x00ref00\x00value:4\n"
+                      b""
+                      )
+        node = btree_index._LazyLeafNode(node_bytes, 2, 2)
+        self.assertEqual((b'00', b'00'), node.min_key)
+        self.assertEqual((b'11', b'44'), node.max_key)
+        self.assertEqual(4, len(node))
+        self.assertEqual((b'value:3', (((b'11', b'ref22'),),
+                                       ((b'11', b'ref22'), (b'11', b'ref22')))),
+                         node[(b'11', b'33')])
+        self.assertFalse((b'11', b'3') in node)
+        self.assertFalse((b'0', b'00') in node)
+        self.assertFalse((b'22', b'00') in node)
+        self.assertEqual(None, node.get((b'00', b'12')))
+        self.assertEqual([(b'00', b'00'), (b'00', b'11'), (b'11', b'33'),
+                          (b'11', b'44')], node.all_keys())
+        self.assertEqual(
+            dict(btree_index._LeafNode(node_bytes, 2, 2).all_items()),
+            dict(node.all_items()))
+
     def test_InternalNode_1(self):
         node_bytes = (b"type=internal\n"
                       b"offset=1\n"
@@ -0,0 +1,110 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Tests for the persistent CHK page cache."""
+
+import os
+
+from ... import (
+    osutils,
+    tests,
+    )
+from .. import chk_disk_cache
+from ...static_tuple import StaticTuple
+
+
+def page_key(data):
+    return StaticTuple(b'sha1:' + osutils.sha_string(data),)
+
+
+class TestDiskPageCache(tests.TestCaseInTempDir):
+
+    def make_cache(self, max_size=1000000):
+        return chk_disk_cache.DiskPageCache('cache', max_size)
+
+    def test_missing(self):
+        cache = self.make_cache()
+        key = page_key(b'content')
+        self.assertRaises(KeyError, cache.__getitem__, key)
+        self.assertFalse(key in cache)
+        self.assertIs(None, cache.get(key))
+
+    def test_add_and_get(self):
+        cache = self.make_cache()
+        key = page_key(b'content')
+        cache[key] = b'content'
+        self.assertTrue(key in cache)
+        self.assertEqual(b'content', cache[key])
+
+    def test_shared_between_instances(self):
+        key = page_key(b'content')
+        self.make_cache()[key] = b'content'
+        self.assertEqual(b'content', self.make_cache()[key])
+
+    def test_fanned_out_by_sha1(self):
+        cache = self.make_cache()
+        sha1 = osutils.sha_string(b'content').decode('ascii')
+        cache[page_key(b'content')] = b'content'
+        self.assertPathExists(osutils.pathjoin('cache', sha1[:2], sha1[2:]))
+
+    def test_ignores_non_sha1_keys(self):
+        cache = self.make_cache()
+        cache[(b'not-a-sha1',)] = b'content'
+        cache[(b'sha1:short',)] = b'content'
+        self.assertFalse(os.path.exists('cache'))
+        self.assertRaises(KeyError, cache.__getitem__, (b'not-a-sha1',))
+
+    def test_corrupt_page_removed(self):
+        cache = self.make_cache()
+        key = page_key(b'content')
+        cache[key] = b'content'
+        sha1 = osutils.sha_string(b'content').decode('ascii')
+        path = osutils.pathjoin('cache', sha1[:2], sha1[2:])
+        with open(path, 'wb') as f:
+            f.write(b'conte')
+        self.assertRaises(KeyError, cache.__getitem__, key)
+        self.assertPathDoesNotExist(path)
+
+    def test_gc_removes_least_recently_used(self):
+        cache = self.make_cache(max_size=100)
+        pages = [b'%d' % i * 20 for i in range(4)]
+        for i, data in enumerate(pages):
+            cache[page_key(data)] = data
+            sha1 = osutils.sha_string(data).decode('ascii')
+            os.utime(osutils.pathjoin('cache', sha1[:2], sha1[2:]),
+                     (1000 + i, 1000 + i))
+        # Reading a page marks it as recently used
+        cache[page_key(pages[0])]
+        self.assertEqual(80, cache.size())
+        data = b'x' * 40
+        cache[page_key(data)] = data
+        self.assertTrue(cache.size() <= 90)
+        self.assertTrue(page_key(pages[0]) in cache)
+        self.assertFalse(page_key(pages[1]) in cache)
+        self.assertTrue(page_key(data) in cache)
+
+    def test_oversized_page_not_cached(self):
+        cache = self.make_cache(max_size=10)
+        key = page_key(b'x' * 20)
+        cache[key] = b'x' * 20
+        self.assertFalse(key in cache)
+
+    def test_clear(self):
+        cache = self.make_cache()
+        key = page_key(b'content')
+        cache[key] = b'content'
+        cache.clear()
+        self.assertFalse(key in cache)
@@ -17,11 +17,13 @@
 """Tests for maps built on a CHK versionedfiles facility."""
 
 from ... import (
+    config,
     errors,
     osutils,
     tests,
     )
 from .. import (
+    chk_disk_cache,
     chk_map,
     groupcompress,
     )
@@ -1347,6 +1349,64 @@ def _test_search_key(key):
     return b'test:' + b'\x00'.join(key)
 
 
+class TestDiskPageCache(TestCaseWithStore):
+
+    def setUp(self):
+        super(TestDiskPageCache, self).setUp()
+        path = osutils.mkdtemp()
+        self.addCleanup(osutils.rmtree, path)
+        self.disk_cache = chk_disk_cache.DiskPageCache(path, 1000000)
+        self.overrideAttr(chk_map, '_disk_cache', self.disk_cache)
+
+    def make_saved_map(self):
+        chk_bytes = self.get_chk_bytes()
+        chkmap = CHKMap(chk_bytes, None)
+        chkmap._root_node.set_maximum_size(30)
+        for name in (b'aaa', b'aab', b'aac'):
+            chkmap.map((name,), b'val')
+        return chkmap._save()
+
+    def test_disabled_by_default(self):
+        self.overrideAttr(chk_map, '_disk_cache', chk_map._NOT_LOADED)
+        self.assertIs(None, chk_map._get_disk_cache())
+
+    def test_enabled_by_config(self):
+        self.overrideAttr(chk_map, '_disk_cache', chk_map._NOT_LOADED)
+        self.overrideEnv('XDG_CACHE_HOME', osutils.mkdtemp())
+        config.GlobalStack().set('bzr.chk_map.disk_cache_size', '10MB')
+        disk_cache = chk_map._get_disk_cache()
+        self.assertIsInstance(disk_cache, chk_disk_cache.DiskPageCache)
+        self.assertEqual(10000000, disk_cache._max_size)
+        self.assertIs(disk_cache, chk_map._get_disk_cache())
+
+    def test_pages_read_from_store_are_cached(self):
+        root_key = self.make_saved_map()
+        # Saving only fills the in-memory cache
+        self.assertFalse(root_key in self.disk_cache)
+        chk_map.clear_cache()
+        chkmap = CHKMap(self.chk_bytes, root_key)
+        self.assertEqual(3, len(list(chkmap.iteritems())))
+        self.assertTrue(root_key in self.disk_cache)
+        for node in chkmap._root_node._items.values():
+            self.assertTrue(node.key() in self.disk_cache)
+
+    def test_pages_read_from_disk_cache(self):
+        root_key = self.make_saved_map()
+        chk_map.clear_cache()
+        list(CHKMap(self.chk_bytes, root_key).iteritems())
+        chk_map.clear_cache()
+        # A store with nothing in it can still serve the map from the cache
+        factory = groupcompress.make_pack_factory(False, False, 1)
+        t = self.get_transport()
+        t.mkdir('empty')
+        chkmap = CHKMap(factory(t.clone('empty')), root_key)
+        self.assertEqual({(b'aaa',): b'val', (b'aab',): b'val',
+                          (b'aac',): b'val'}, self.to_dict(chkmap))
+        # And the pages were promoted to the in-memory cache
+        self.assertEqual(
+            self.disk_cache[root_key], chk_map._get_cache()[root_key])
+
+
 class TestMapSearchKeys(TestCaseWithStore):
 
     def test_default_chk_map_uses_flat_search_key(self):
@@ -2834,3 +2894,103 @@ class TestIterInterestingNodes(TestCaseWithExampleMaps):
             [right, left, l_a_key, r_c_key],
             [((b'abb',), b'changed left'), ((b'cbb',), b'changed right')],
             [left, right], [basis])
+
+
+class TestIterChangesForRoots(TestCaseWithExampleMaps):
+
+    def get_changes(self, root_pairs):
+        return list(chk_map.iter_changes_for_roots(
+            self.get_chk_bytes(), root_pairs, chk_map._search_key_plain))
+
+    def make_map_history(self):
+        """Make a sequence of maps, each a small change from the last."""
+        c_map = CHKMap(self.get_chk_bytes(), None)
+        c_map._root_node.set_maximum_size(40)
+        for i in range(20):
+            c_map.map((b'k%02d' % i,), b'initial %d' % i)
+        keys = [c_map._save()]
+        for i in range(0, 20, 3):
+            c_map.map((b'k%02d' % i,), b'changed %d' % i)
+            if i % 2:
+                c_map.unmap((b'k%02d' % (i - 1),))
+            else:
+                c_map.map((b'new%02d' % i,), b'added %d' % i)
+            keys.append(c_map._save())
+        return keys
+
+    def map_depth(self, key):
+        dump = CHKMap(self.get_chk_bytes(), key)._dump_tree()
+        return max((len(line) - len(line.lstrip())) // 2 + 1
+                   for line in dump.splitlines() if line.endswith('Node'))
+
+    def test_matches_iter_changes(self):
+        keys = self.make_map_history()
+        root_pairs = list(zip(keys[1:], keys[:-1]))
+        root_pairs.append((keys[-1], keys[0]))
+        root_pairs.append((keys[0], keys[-1]))
+        results = self.get_changes(root_pairs)
+        self.assertEqual(len(root_pairs), len(results))
+        for (new_key, old_key), result in zip(root_pairs, results):
+            new_items = self.to_dict(CHKMap(self.get_chk_bytes(), new_key))
+            old_items = self.to_dict(CHKMap(self.get_chk_bytes(), old_key))
+            expected = [(key, old_items.get(key), new_items.get(key))
+                        for key in sorted(set(new_items).union(old_items))
+                        if old_items.get(key) != new_items.get(key)]
+            self.assertEqual((new_key, old_key, expected), result)
+
+    def test_empty_maps(self):
+        c_map = self.make_root_only_map()
+        key = c_map.key()
+        self.assertEqual([
+            (key, None, [((b'aaa',), None, b'initial aaa content'),
+                         ((b'abb',), None, b'initial abb content')]),
+            (None, key, [((b'aaa',), b'initial aaa content', None),
+                         ((b'abb',), b'initial abb content', None)]),
+            (key, key, []),
+            (None, None, []),
+            ], self.get_changes([(key, None), (None, key), (key, key),
+                                 (None, None)]))
+
+    def test_one_stream_per_level(self):
+        keys = self.make_map_history()
+        depth = max(self.map_depth(key) for key in keys)
+        store = self.get_chk_bytes()
+        calls = []
+        orig_get = store.get_record_stream
+
+        def get_record_stream(keys, order, fulltext):
+            calls.append(list(keys))
+            return orig_get(keys, order, fulltext)
+        store.get_record_stream = get_record_stream
+        chk_map.clear_cache()
+        root_pairs = list(zip(keys[1:], keys[:-1]))
+        list(chk_map.iter_changes_for_roots(store, root_pairs,
+                                            chk_map._search_key_plain))
+        # At most one request for each level of the deepest tree
+        self.assertTrue(len(calls) <= depth, '%d > %d' % (len(calls), depth))
+        # No page was requested twice
+        all_keys = [key for keys in calls for key in keys]
+        self.assertEqual(len(all_keys), len(set(all_keys)))
+
+    def test_common_pages_not_loaded(self):
+        basis_dict = {(b'aaa',): b'foo bar',
+                      (b'aab',): b'common altered a', (b'b',): b'foo bar b'}
+        target_dict = {(b'aaa',): b'foo bar',
+                       (b'aab',): b'common altered b', (b'at',): b'foo bar t'}
+        basis = self._get_map(basis_dict, maximum_size=10)
+        target = self._get_map(target_dict, maximum_size=10,
+                               chk_bytes=basis._store)
+        # The same 'aaa' pointer as in test_iter_changes_common_pages_not_loaded
+        aaa_key = (b'sha1:1adf7c0d1b9140ab5f33bb64c6275fa78b1580b7',)
+        chk_map.clear_cache()
+        basis_get = basis._store.get_record_stream
+
+        def get_record_stream(keys, order, fulltext):
+            if aaa_key in keys:
+                raise AssertionError("'aaa' pointer was followed %r" % keys)
+            return basis_get(keys, order, fulltext)
+        basis._store.get_record_stream = get_record_stream
+        [(_, _, changes)] = chk_map.iter_changes_for_roots(
+            basis._store, [(target.key(), basis.key())],
+            chk_map._search_key_plain)
+        self.assertEqual(sorted(target.iter_changes(basis)), changes)
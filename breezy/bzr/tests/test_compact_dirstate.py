@@ -0,0 +1,147 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Tests for the compact in-memory layout of dirstates."""
+
+import os
+
+from ... import (
+    config,
+    tests,
+    )
+from .. import dirstate
+
+
+class TestCompactDirState(tests.TestCaseWithTransport):
+
+    def setUp(self):
+        super(TestCompactDirState, self).setUp()
+        self.tree = self.make_branch_and_tree('tree', format='dirstate')
+        self.build_tree(['tree/a', 'tree/b', 'tree/d/', 'tree/d/c',
+                         'tree/d/e/', 'tree/d/e/f', 'tree/d-g', 'tree/d/h'])
+        self.tree.add(['a', 'b', 'd', 'd/c', 'd/e', 'd/e/f', 'd-g', 'd/h'],
+                      ids=[b'a-id', b'b-id', b'd-id', b'c-id', b'e-id',
+                           b'f-id', b'g-id', b'h-id'])
+        self.tree.commit('one')
+        other = self.tree.controldir.sprout('other').open_workingtree()
+        self.build_tree_contents([('other/a', b'new a\n')])
+        other.rename_one('d/h', 'h')
+        other.commit('other')
+        self.tree.merge_from_branch(other.branch)
+        self.tree.rename_one('b', 'd/e/b')
+        self.tree.remove(['d/c'], keep_files=False)
+        self.tree.rename_one('d-g', 'd/g')
+        self.build_tree(['tree/i'])
+        self.tree.add(['i'], ids=[b'i-id'])
+        self.paths = [b'', b'a', b'b', b'd', b'd/c', b'd/e', b'd/e/b',
+                      b'd/e/f', b'd-g', b'd/g', b'd/h', b'h', b'i', b'x',
+                      b'x/y', b'd/x']
+        self.file_ids = [b'a-id', b'b-id', b'c-id', b'd-id', b'e-id',
+                         b'f-id', b'g-id', b'h-id', b'i-id', b'x-id',
+                         self.tree.path2id('')]
+        self.filename = self.tree.controldir.get_workingtree_transport(
+            None).local_abspath('dirstate')
+
+    def get_state(self, compact):
+        config.GlobalStack().set('dirstate.compact', compact)
+        state = dirstate.DirState.on_file(self.filename)
+        state.lock_read()
+        self.addCleanup(state.unlock)
+        state._read_dirblocks_if_needed()
+        self.assertEqual(compact, state._compact_dirblocks is not None)
+        return state
+
+    def test_iter_entries(self):
+        expected = list(self.get_state(False)._iter_entries())
+        state = self.get_state(True)
+        self.assertEqual(expected, list(state._iter_entries()))
+        self.assertIsNot(None, state._compact_dirblocks)
+
+    def test_get_entry(self):
+        normal = self.get_state(False)
+        state = self.get_state(True)
+        for tree_index in range(3):
+            for path in self.paths:
+                self.assertEqual(
+                    normal._get_entry(tree_index, path_utf8=path),
+                    state._get_entry(tree_index, path_utf8=path))
+            for file_id in self.file_ids:
+                for include_deleted in (False, True):
+                    self.assertEqual(
+                        normal._get_entry(
+                            tree_index, fileid_utf8=file_id,
+                            include_deleted=include_deleted),
+                        state._get_entry(
+                            tree_index, fileid_utf8=file_id,
+                            include_deleted=include_deleted))
+        self.assertIsNot(None, state._compact_dirblocks)
+
+    def test_get_entry_mismatched_file_id(self):
+        state = self.get_state(True)
+        self.assertRaises(
+            dirstate.errors.BzrError, state._get_entry, 0,
+            fileid_utf8=b'b-id', path_utf8=b'a')
+
+    def test_dirblocks_built_when_used(self):
+        expected = self.get_state(False)._dirblocks
+        state = self.get_state(True)
+        self.assertNotIn('_dirblocks', state.__dict__)
+        self.assertEqual(expected, state._dirblocks)
+        self.assertIs(None, state._compact_dirblocks)
+        state._validate()
+        self.assertEqual(
+            list(self.get_state(False)._iter_entries()),
+            list(state._iter_entries()))
+
+    def test_hash_cache_update(self):
+        self.build_tree_contents([('tree/a', b'newer a\n')])
+        # Make the file old enough for its sha1 to be cached.
+        os.utime('tree/a', (1000000000, 1000000000))
+        state = self.get_state(True)
+        entry = state._get_entry(0, path_utf8=b'a')
+        self.assertEqual(b'', entry[1][0][1])
+        state._sha_cutoff_time()
+        state._cutoff_time += 10
+        link_or_sha1 = dirstate.update_entry(
+            state, entry, os.path.abspath('tree/a'), os.lstat('tree/a'))
+        self.assertEqual(dirstate.DirState.IN_MEMORY_HASH_MODIFIED,
+                         state._dirblock_state)
+        self.assertEqual(link_or_sha1,
+                         state._get_entry(0, path_utf8=b'a')[1][0][1])
+        state.save()
+        self.assertIsNot(None, state._compact_dirblocks)
+        state.unlock()
+        state.lock_read()
+        self.assertEqual(link_or_sha1,
+                         state._get_entry(0, path_utf8=b'a')[1][0][1])
+        state._validate()
+
+    def test_not_used_when_write_locked(self):
+        config.GlobalStack().set('dirstate.compact', True)
+        with self.tree.lock_write():
+            state = self.tree.current_dirstate()
+            state._read_dirblocks_if_needed()
+            self.assertIs(None, state._compact_dirblocks)
+
+    def test_corrupt(self):
+        with open(self.filename, 'ab') as f:
+            f.write(b'garbage')
+        config.GlobalStack().set('dirstate.compact', True)
+        state = dirstate.DirState.on_file(self.filename)
+        state.lock_read()
+        self.addCleanup(state.unlock)
+        self.assertRaises(dirstate.DirstateCorrupt,
+                          state._read_dirblocks_if_needed)
@@ -0,0 +1,258 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Tests for the journal of dirstate changes."""
+
+import os
+
+from ... import (
+    config,
+    tests,
+    )
+from .. import (
+    dirstate,
+    dirstate_journal,
+    )
+
+
+class TestDirStateJournal(tests.TestCaseWithTransport):
+
+    def setUp(self):
+        super(TestDirStateJournal, self).setUp()
+        config.GlobalStack().set('dirstate.journal', True)
+        self.overrideAttr(dirstate.DirState, 'JOURNAL_MAX_FRACTION', 10)
+        self.tree = self.make_branch_and_tree('tree', format='dirstate')
+        self.build_tree(['tree/a', 'tree/b', 'tree/d/', 'tree/d/c'])
+        self.tree.add(['a', 'b', 'd', 'd/c'])
+        self.tree.commit('one')
+        self.filename = self.tree.controldir.get_workingtree_transport(
+            None).local_abspath('dirstate')
+        self.journal_filename = self.filename + '.journal'
+
+    def get_dirstate_file(self):
+        with open(self.filename, 'rb') as f:
+            return f.read()
+
+    def get_state(self):
+        """Return the rows and parents of the dirstate, read from disk."""
+        state = dirstate.DirState.on_file(self.filename)
+        with state.lock_read():
+            state._read_dirblocks_if_needed()
+            state._validate()
+            return list(state._iter_entries()), state.get_parent_ids()
+
+    def get_state_in_memory(self):
+        with self.tree.lock_read():
+            state = self.tree.current_dirstate()
+            return list(state._iter_entries()), state.get_parent_ids()
+
+    def test_commit_appends_to_journal(self):
+        self.assertPathDoesNotExist(self.journal_filename)
+        content = self.get_dirstate_file()
+        self.build_tree_contents([('tree/a', b'new a\n')])
+        self.tree.remove(['b'], keep_files=False)
+        self.build_tree(['tree/e/', 'tree/e/f'])
+        self.tree.add(['e', 'e/f'])
+        self.tree.rename_one('d/c', 'c')
+        with self.tree.lock_write():
+            self.tree.commit('two')
+            self.tree.current_dirstate()._read_dirblocks_if_needed()
+            expected = (list(self.tree.current_dirstate()._iter_entries()),
+                        self.tree.get_parent_ids())
+        self.assertEqual(content, self.get_dirstate_file())
+        self.assertPathExists(self.journal_filename)
+        self.assertEqual(expected, self.get_state())
+        self.assertEqual(expected, self.get_state_in_memory())
+        with self.tree.lock_read():
+            basis = self.tree.basis_tree()
+            with basis.lock_read():
+                self.assertEqual([], list(self.tree.iter_changes(basis)))
+
+    def check_hash_cache_appends_to_journal(self):
+        self.build_tree_contents([('tree/a', b'newer a\n')])
+        content = self.get_dirstate_file()
+        state = dirstate.DirState.on_file(self.filename)
+        with state.lock_read():
+            entry = state._get_entry(0, path_utf8=b'a')
+            # Set the cutoff-time into the future, so things look cacheable
+            state._sha_cutoff_time()
+            state._cutoff_time += 10.0
+            sha1 = dirstate.update_entry(
+                state, entry, os.path.abspath('tree/a'), os.lstat('tree/a'))
+            self.assertEqual(dirstate.DirState.IN_MEMORY_HASH_MODIFIED,
+                             state._dirblock_state)
+            state.save()
+        self.assertEqual(content, self.get_dirstate_file())
+        self.assertPathExists(self.journal_filename)
+        entries, parents = self.get_state()
+        entry = [e for e in entries if e[0][1] == b'a'][0]
+        self.assertEqual(sha1, entry[1][0][1])
+
+    def test_hash_cache_appends_to_journal(self):
+        self.check_hash_cache_appends_to_journal()
+
+    def test_hash_cache_appends_to_journal_compact(self):
+        config.GlobalStack().set('dirstate.compact', True)
+        self.check_hash_cache_appends_to_journal()
+
+    def test_journal_folded_when_large(self):
+        self.overrideAttr(dirstate.DirState, 'JOURNAL_MAX_FRACTION', 0.01)
+        content = self.get_dirstate_file()
+        self.build_tree_contents([('tree/a', b'new a\n')])
+        self.tree.commit('two')
+        self.assertNotEqual(content, self.get_dirstate_file())
+        self.assertPathDoesNotExist(self.journal_filename)
+        self.assertEqual(self.get_state_in_memory(), self.get_state())
+
+    def test_new_parent_rewrites_dirstate(self):
+        self.build_tree_contents([('tree/a', b'new a\n')])
+        self.tree.commit('two')
+        self.assertPathExists(self.journal_filename)
+        other = self.tree.controldir.sprout('other').open_workingtree()
+        self.build_tree_contents([('other/b', b'new b\n')])
+        other.commit('other')
+        self.tree.merge_from_branch(other.branch)
+        self.assertPathDoesNotExist(self.journal_filename)
+        self.assertEqual(2, len(self.get_state()[1]))
+
+    def test_journal_disabled(self):
+        self.build_tree_contents([('tree/a', b'new a\n')])
+        self.tree.commit('two')
+        self.assertPathExists(self.journal_filename)
+        config.GlobalStack().set('dirstate.journal', False)
+        expected = self.get_state()
+        self.build_tree_contents([('tree/b', b'new b\n')])
+        self.tree.commit('three')
+        self.assertPathDoesNotExist(self.journal_filename)
+        self.assertNotEqual(expected, self.get_state())
+        self.assertEqual(self.get_state_in_memory(), self.get_state())
+
+    def test_journal_for_other_dirstate_ignored(self):
+        self.build_tree_contents([('tree/a', b'new a\n')])
+        self.tree.commit('two')
+        with open(self.journal_filename, 'rb') as f:
+            journal = f.read()
+        expected = self.get_state()
+        config.GlobalStack().set('dirstate.journal', False)
+        self.build_tree_contents([('tree/b', b'new b\n')])
+        self.tree.commit('three')
+        # As left behind by a client that doesn't know about journals.
+        with open(self.journal_filename, 'wb') as f:
+            f.write(journal)
+        self.assertNotEqual(expected, self.get_state())
+        self.assertEqual(self.get_state_in_memory(), self.get_state())
+
+    def test_header_marks_journal(self):
+        self.assertTrue(self.get_dirstate_file().startswith(
+            dirstate.DirState.HEADER_FORMAT_3_JOURNAL))
+        config.GlobalStack().set('dirstate.journal', False)
+        self.build_tree_contents([('tree/a', b'new a\n')])
+        self.tree.commit('two')
+        self.assertTrue(self.get_dirstate_file().startswith(
+            dirstate.DirState.HEADER_FORMAT_3))
+
+    def test_first_save_rewrites_plain_header(self):
+        config.GlobalStack().set('dirstate.journal', False)
+        self.build_tree_contents([('tree/a', b'new a\n')])
+        self.tree.commit('two')
+        config.GlobalStack().set('dirstate.journal', True)
+        self.build_tree_contents([('tree/b', b'new b\n')])
+        self.tree.commit('three')
+        # Clients that can't replay a journal must not be able to read the
+        # dirstate file once a journal may be used.
+        self.assertPathDoesNotExist(self.journal_filename)
+        content = self.get_dirstate_file()
+        self.assertTrue(content.startswith(
+            dirstate.DirState.HEADER_FORMAT_3_JOURNAL))
+        self.build_tree_contents([('tree/a', b'newer a\n')])
+        self.tree.commit('four')
+        self.assertPathExists(self.journal_filename)
+        self.assertEqual(content, self.get_dirstate_file())
+        self.assertEqual(self.get_state_in_memory(), self.get_state())
+
+    def test_journal_ignored_with_plain_header(self):
+        self.build_tree_contents([('tree/a', b'new a\n')])
+        self.tree.commit('two')
+        content = self.get_dirstate_file()
+        expected = self.get_state()
+        with open(self.filename, 'wb') as f:
+            f.write(content.replace(dirstate.DirState.HEADER_FORMAT_3_JOURNAL,
+                                    dirstate.DirState.HEADER_FORMAT_3, 1))
+        self.assertNotEqual(expected, self.get_state())
+
+    def test_torn_record_ignored(self):
+        self.build_tree_contents([('tree/a', b'new a\n')])
+        self.tree.commit('two')
+        expected = self.get_state()
+        with open(self.journal_filename, 'ab') as f:
+            f.write(b'1000 12345\npartial')
+        self.assertEqual(expected, self.get_state())
+        self.build_tree_contents([('tree/b', b'new b\n')])
+        self.tree.commit('three')
+        with open(self.journal_filename, 'rb') as f:
+            self.assertNotIn(b'partial', f.read())
+        self.assertEqual(self.get_state_in_memory(), self.get_state())
+
+
+class TestJournalFile(tests.TestCaseInTempDir):
+
+    def make_journal(self, crc32=1234, num_entries=3):
+        journal = dirstate_journal.DirStateJournal(
+            'journal', crc32, num_entries, 2)
+        journal.read()
+        return journal
+
+    def test_round_trip(self):
+        journal = self.make_journal()
+        self.assertEqual(([], 0), (journal.records, journal.size))
+        entry = [b'd', b'f', b'f-id', b'f', b'sha', b'3', b'n', b'stat',
+                 b'f', b'sha', b'3', b'n', b'rev-1']
+        journal.append([b'rev-1'], [], [(b'd', b'g', b'g-id')],
+                       [b'\0'.join(entry)])
+        journal.append([b'rev-2', b'rev-3'], [b'rev-3'], [], [])
+        journal = self.make_journal()
+        self.assertEqual(2, len(journal.records))
+        self.assertEqual(os.path.getsize('journal'), journal.size)
+        first, second = journal.records
+        self.assertEqual([b'rev-1'], first.parents)
+        self.assertEqual([], first.ghosts)
+        self.assertEqual([(b'd', b'g', b'g-id')], first.removed)
+        self.assertEqual([entry + [b'\n']], first.entries)
+        self.assertEqual([b'rev-2', b'rev-3'], second.parents)
+        self.assertEqual([b'rev-3'], second.ghosts)
+
+    def test_other_base(self):
+        self.make_journal().append([b'rev-1'], [], [], [])
+        self.assertEqual([], self.make_journal(crc32=4321).records)
+        self.assertEqual([], self.make_journal(num_entries=4).records)
+
+    def test_bad_crc(self):
+        self.make_journal().append([b'rev-1'], [], [], [])
+        with open('journal', 'rb') as f:
+            content = f.read()
+        with open('journal', 'wb') as f:
+            f.write(content.replace(b'rev-1', b'rev-2'))
+        journal = self.make_journal()
+        self.assertEqual([], journal.records)
+        self.assertEqual(
+            len(dirstate_journal.JOURNAL_HEADER + b'base: 1234 3\n'),
+            journal.size)
+
+    def test_remove(self):
+        self.make_journal().append([b'rev-1'], [], [], [])
+        dirstate_journal.remove('journal')
+        self.assertPathDoesNotExist('journal')
+        dirstate_journal.remove('journal')
@@ -0,0 +1,101 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Tests for the persistent generation number index."""
+
+from ... import (
+    config,
+    tests,
+    )
+from .. import generation_index
+
+
+class TestGenerationIndexFile(tests.TestCaseWithTransport):
+
+    def make_index_file(self):
+        return generation_index.GenerationIndexFile(self.get_transport())
+
+    def test_missing(self):
+        self.assertEqual({}, self.make_index_file().load())
+
+    def test_add_and_load(self):
+        index_file = self.make_index_file()
+        index_file.load()
+        index_file.add({b'rev-1': 1})
+        index_file.add({b'rev-2': 2, b'rev 3': 3})
+        self.assertEqual({b'rev-1': 1, b'rev-2': 2, b'rev 3': 3},
+                         self.make_index_file().load())
+
+    def test_invalid_lines_skipped(self):
+        self.get_transport().put_bytes(
+            generation_index.INDEX_NAME,
+            generation_index.FORMAT_HEADER
+            + b'1 rev-1\ngarbage\n2 rev-2\n1 rev-1\nx rev-3\n4')
+        self.assertEqual({b'rev-1': 1, b'rev-2': 2},
+                         self.make_index_file().load())
+
+    def test_invalid_header_replaced(self):
+        self.get_transport().put_bytes(
+            generation_index.INDEX_NAME, b'Something else\n1 rev-1\n')
+        index_file = self.make_index_file()
+        self.assertEqual({}, index_file.load())
+        index_file.add({b'rev-2': 2})
+        self.assertEqual({b'rev-2': 2}, self.make_index_file().load())
+
+
+class TestPackRepositoryGenerationIndex(tests.TestCaseWithTransport):
+
+    def setUp(self):
+        super(TestPackRepositoryGenerationIndex, self).setUp()
+        builder = self.make_branch_builder('branch')
+        builder.start_series()
+        builder.build_snapshot(None, [
+            ('add', ('', b'root-id', 'directory', None))],
+            revision_id=b'A')
+        builder.build_snapshot([b'A'], [], revision_id=b'B')
+        builder.build_snapshot([b'A'], [], revision_id=b'C')
+        builder.build_snapshot([b'B', b'C'], [], revision_id=b'D')
+        builder.finish_series()
+        self.repository = builder.get_branch().repository
+
+    def open_repository(self):
+        repository = self.repository.controldir.open_repository()
+        repository.lock_read()
+        self.addCleanup(repository.unlock)
+        return repository
+
+    def test_disabled(self):
+        repository = self.open_repository()
+        self.assertEqual({b'D'},
+                         repository.get_graph().heads([b'B', b'C', b'D']))
+        self.assertIs(None, repository.get_graph()._generation_index)
+        self.assertFalse(repository._transport.has(
+            generation_index.INDEX_NAME))
+
+    def test_saved(self):
+        config.GlobalStack().set('bzr.generation_index', True)
+        repository = self.open_repository()
+        self.assertEqual({b'D'},
+                         repository.get_graph().heads([b'B', b'C', b'D']))
+        self.assertEqual(
+            {b'A': 1, b'B': 2, b'C': 2, b'D': 3},
+            generation_index.GenerationIndexFile(
+                repository._transport).load())
+        repository = self.open_repository()
+        self.assertEqual(
+            {b'B': 2, b'D': 3},
+            repository.get_graph()._generation_index.get_generations(
+                None, [b'B', b'D']))
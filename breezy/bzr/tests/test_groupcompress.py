@@ -938,6 +938,91 @@ class Test_BatchingBlockFetcher(TestCaseWithGroupCompressVersionedFiles):
         self.assertEqual('groupcompress-block', factories[0].storage_kind)
 
 
+class Test_DecompressionPool(tests.TestCase):
+
+    def make_block(self, texts):
+        compressor = groupcompress.GroupCompressor()
+        for i, text in enumerate(texts):
+            compressor.compress((b'key%d' % i,), [text], len(text), None)
+        block = compressor.flush()
+        return groupcompress.GroupCompressBlock.from_bytes(block.to_bytes())
+
+    def make_pool(self, num_threads):
+        pool = groupcompress._DecompressionPool(num_threads)
+        self.addCleanup(pool.shutdown)
+        return pool
+
+    def test_prefetch_inflates_in_order(self):
+        pool = self.make_pool(2)
+        blocks = [((b'memo', i), self.make_block([b'text %d\n' % i] * 10))
+                  for i in range(5)]
+        result = list(pool.prefetch(iter(blocks), {}))
+        self.assertEqual([memo for memo, _ in blocks],
+                         [memo for memo, _ in result])
+        for memo, block in result:
+            self.assertEqual(block._content_length, len(block._content))
+
+    def test_prefetch_partial(self):
+        pool = self.make_pool(1)
+        block = self.make_block([b'%d\n' % i for i in range(20000)])
+        [(memo, result)] = pool.prefetch(iter([(b'memo', block)]),
+                                         {b'memo': 10})
+        self.assertIs(block, result)
+        self.assertTrue(len(block._content) >= 10)
+
+    def test_prefetch_abandoned(self):
+        pool = self.make_pool(2)
+        blocks = [((b'memo', i), self.make_block([b'text %d\n' % i] * 10))
+                  for i in range(5)]
+        prefetched = pool.prefetch(iter(blocks), {})
+        next(prefetched)
+        prefetched.close()
+        # Nothing is left running against the remaining blocks
+        pool.shutdown()
+
+    def test_prefetch_error(self):
+        pool = self.make_pool(1)
+        block = groupcompress.GroupCompressBlock()
+        self.assertRaises(AssertionError, list,
+                          pool.prefetch(iter([(b'memo', block)]), {}))
+
+
+
+class TestDecompressionThreadsConfig(TestCaseWithGroupCompressVersionedFiles):
+
+    def test_default_disabled(self):
+        vf = self.make_test_vf(False)
+        self.assertEqual(0, vf._get_decompression_threads())
+
+    def test_get_record_stream_with_threads(self):
+        pools = []
+
+        class RecordingPool(groupcompress._DecompressionPool):
+
+            def __init__(self, num_threads):
+                super(RecordingPool, self).__init__(num_threads)
+                pools.append(self)
+        self.overrideAttr(groupcompress, '_DecompressionPool', RecordingPool)
+        config.GlobalStack().set(
+            'bzr.groupcompress.decompression_threads', '2')
+        self.addCleanup(config.GlobalStack().remove,
+                        'bzr.groupcompress.decompression_threads')
+        vf = self.make_test_vf(False, dir='source')
+        texts = {}
+        for i in range(20):
+            key = (b'key%d' % i,)
+            texts[key] = b'content of %d\n' % i
+            vf.add_lines(key, (), [texts[key]])
+        vf.writer.end()
+        self.assertEqual(2, vf._get_decompression_threads())
+        self.assertEqual(texts, {
+            record.key: record.get_bytes_as('fulltext')
+            for record in vf.get_record_stream(texts, 'unordered', True)})
+        # The stream had its own pool, which it shut down when done.
+        self.assertEqual(1, len(pools))
+        self.assertTrue(pools[0]._executor._shutdown)
+
+
 class TestLazyGroupCompress(tests.TestCaseWithTransport):
 
     _texts = {
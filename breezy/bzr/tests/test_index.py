@@ -22,6 +22,7 @@ from ... import (
     transport,
     )
 from .. import (
+    bloom,
     index as _mod_index,
     )
 
@@ -1520,6 +1521,82 @@ class TestCombinedGraphIndex(tests.TestCaseWithMemoryTransport):
         self.assertEqual({key1: (), key2: (key1,), key3: (key2,)}, parent_map)
         self.assertEqual(set(), missing_keys)
 
+    def test_iter_entries_skips_indices_by_bloom_filter(self):
+        index1 = self.make_index_with_simple_nodes('1')
+        index2 = self.make_index_with_simple_nodes('2')
+        # An empty filter rules out every key
+        index1.get_bloom_filter = lambda: bloom.BloomFilter.for_key_count(0)
+
+        def iter_entries(keys):
+            self.fail('index1 was read for %r' % (keys,))
+        index1.iter_entries = iter_entries
+        c_index = _mod_index.CombinedGraphIndex([index1, index2])
+        self.assertEqual([(index2, (b'index-2-key-1',), b'')],
+                         list(c_index.iter_entries([(b'index-2-key-1',),
+                                                    (b'missing',)])))
+
+    def test_iter_entries_bloom_filter_unhashable_key(self):
+        index1 = self.make_index_with_simple_nodes('1')
+        index1.get_bloom_filter = lambda: bloom.BloomFilter.for_key_count(0)
+        looked_up = []
+
+        def iter_entries(keys):
+            looked_up.extend(keys)
+            return []
+        index1.iter_entries = iter_entries
+        c_index = _mod_index.CombinedGraphIndex([index1])
+        # A key the filter can't hash may be present, so the index itself
+        # has to answer.
+        self.assertEqual([], list(c_index.iter_entries([(b'a', None)])))
+        self.assertEqual([(b'a', None)], looked_up)
+
+    def test_iter_entries_hashes_keys_once(self):
+        indices = [self.make_index_with_simple_nodes(str(i))
+                   for i in range(3)]
+        for index in indices:
+            index.get_bloom_filter = lambda: bloom.BloomFilter.for_key_count(0)
+        digested = []
+        key_digest = bloom.key_digest
+
+        def counting_key_digest(key):
+            digested.append(key)
+            return key_digest(key)
+        self.overrideAttr(bloom, 'key_digest', counting_key_digest)
+        c_index = _mod_index.CombinedGraphIndex(indices)
+        self.assertEqual(
+            [], list(c_index.iter_entries([(b'missing',), (b'other',)])))
+        self.assertEqual([(b'missing',), (b'other',)], sorted(digested))
+
+    def test_iter_entries_uses_index_without_bloom_filter(self):
+        index1 = self.make_index_with_simple_nodes('1')
+        index1.get_bloom_filter = lambda: None
+        c_index = _mod_index.CombinedGraphIndex([index1])
+        self.assertEqual([(index1, (b'index-1-key-1',), b'')],
+                         list(c_index.iter_entries([(b'index-1-key-1',)])))
+
+    def test_find_ancestors_skips_indices_by_bloom_filter(self):
+        key1 = (b'key-1',)
+        key2 = (b'key-2',)
+        index1 = self.make_index('1', ref_lists=1, nodes=[
+            (key1, b'value', ([],)),
+            ])
+        index2 = self.make_index('2', ref_lists=1, nodes=[
+            (key2, b'value', ([key1],)),
+            ])
+        bf = bloom.BloomFilter.for_key_count(1)
+        bf.add(key1)
+        index1.get_bloom_filter = lambda: bf
+        index2.get_bloom_filter = lambda: bloom.BloomFilter.for_key_count(0)
+        c_index = _mod_index.CombinedGraphIndex([index1, index2])
+        parent_map, missing_keys = c_index.find_ancestry([key2], 0)
+        # index2 can't be consulted, so key2 is reported missing
+        self.assertEqual({}, parent_map)
+        self.assertEqual({key2}, missing_keys)
+        index2.get_bloom_filter = lambda: None
+        parent_map, missing_keys = c_index.find_ancestry([key2], 0)
+        self.assertEqual({key1: (), key2: (key1,)}, parent_map)
+        self.assertEqual(set(), missing_keys)
+
     def test_find_ancestors_missing_keys(self):
         key1 = (b'key-1',)
         key2 = (b'key-2',)
@@ -0,0 +1,122 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Tests for the persistent merge sort cache of branches."""
+
+from ... import tests
+from .. import merge_sort_cache
+
+
+class TestMergeSortCache(tests.TestCaseWithTransport):
+
+    def setUp(self):
+        super(TestMergeSortCache, self).setUp()
+        self.builder = self.make_branch_builder('branch')
+        self.builder.start_series()
+        self.addCleanup(self.builder.finish_series)
+        self.builder.build_snapshot(None, [
+            ('add', ('', b'root-id', 'directory', None))],
+            revision_id=b'A')
+        self.builder.build_snapshot([b'A'], [], revision_id=b'B')
+        self.builder.build_snapshot([b'A'], [], revision_id=b'C')
+        self.builder.build_snapshot([b'B', b'C'], [], revision_id=b'D')
+        self.branch = self.builder.get_branch()
+        self.branch.get_config_stack().set('branch.merge_sort_cache', True)
+
+    def merge_sorted(self):
+        with self.branch.lock_read():
+            return [(node.key, node.merge_depth, node.revno,
+                     node.end_of_merge)
+                    for node in self.branch._merge_sort_ancestry()]
+
+    def full_merge_sorted(self):
+        with self.branch.lock_read():
+            last_revision = self.branch.last_revision()
+            known_graph = self.branch.repository.get_known_graph_ancestry(
+                [last_revision])
+            return [(node.key, node.merge_depth, node.revno,
+                     node.end_of_merge)
+                    for node in known_graph.merge_sort(last_revision)]
+
+    def get_cache_bytes(self):
+        return self.branch._transport.get_bytes(merge_sort_cache.CACHE_NAME)
+
+    def test_written(self):
+        self.assertEqual(self.full_merge_sorted(), self.merge_sorted())
+        self.assertEqualDiff(
+            merge_sort_cache.FORMAT_HEADER
+            + b'0 1 1 A\n'
+            + b'0 2 0 B\n'
+            + b'1 1.1.1 1 C\n'
+            + b'0 3 0 D\n',
+            self.get_cache_bytes())
+        self.assertEqual(self.full_merge_sorted(), self.merge_sorted())
+
+    def test_disabled(self):
+        self.branch.get_config_stack().set('branch.merge_sort_cache', False)
+        self.assertEqual(self.full_merge_sorted(), self.merge_sorted())
+        self.assertFalse(self.branch._transport.has(
+            merge_sort_cache.CACHE_NAME))
+
+    def test_appended_when_tip_advances(self):
+        self.merge_sorted()
+        old_bytes = self.get_cache_bytes()
+        self.builder.build_snapshot([b'C'], [], revision_id=b'E')
+        self.builder.build_snapshot([b'A'], [], revision_id=b'F')
+        self.builder.build_snapshot([b'D', b'E', b'F'], [], revision_id=b'G')
+        self.builder.build_snapshot([b'G'], [], revision_id=b'H')
+        expected = self.full_merge_sorted()
+        # Only the new revisions are sorted.
+        self.overrideAttr(self.branch.repository, 'get_known_graph_ancestry',
+                          None)
+        self.assertEqual(expected, self.merge_sorted())
+        self.assertStartsWith(self.get_cache_bytes(), old_bytes)
+        self.assertEqual(expected, self.merge_sorted())
+
+    def test_rewritten_when_tip_moves_back(self):
+        self.merge_sorted()
+        self.branch.set_last_revision_info(2, b'B')
+        self.assertEqual(self.full_merge_sorted(), self.merge_sorted())
+        self.assertEqualDiff(
+            merge_sort_cache.FORMAT_HEADER + b'0 1 1 A\n0 2 0 B\n',
+            self.get_cache_bytes())
+
+    def test_rewritten_when_tip_diverges(self):
+        self.merge_sorted()
+        self.builder.build_snapshot([b'C'], [], revision_id=b'E')
+        self.builder.build_snapshot([b'E', b'D'], [], revision_id=b'F')
+        self.branch.set_last_revision_info(4, b'F')
+        self.assertEqual(self.full_merge_sorted(), self.merge_sorted())
+        self.assertEqual(self.full_merge_sorted(), self.merge_sorted())
+
+    def test_invalid_cache_ignored(self):
+        self.merge_sorted()
+        # As left by two processes appending the same revision.
+        self.branch._transport.append_bytes(
+            merge_sort_cache.CACHE_NAME, b'0 3 0 D\n')
+        self.assertEqual(self.full_merge_sorted(), self.merge_sorted())
+        self.branch._transport.put_bytes(
+            merge_sort_cache.CACHE_NAME, b'garbage\n')
+        self.assertEqual(self.full_merge_sorted(), self.merge_sorted())
+        self.assertStartsWith(
+            self.get_cache_bytes(), merge_sort_cache.FORMAT_HEADER)
+
+    def test_revno_map(self):
+        self.builder.build_snapshot([b'D', b'C'], [], revision_id=b'E')
+        self.assertEqual(
+            {b'A': (1,), b'B': (2,), b'C': (1, 1, 1), b'D': (3,),
+             b'E': (4,)},
+            self.branch.get_revision_id_to_revno_map())
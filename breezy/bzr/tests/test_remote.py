@@ -432,6 +432,19 @@ class Test_ClientMedium_remote_is_at_least(tests.TestCase):
         self.assertContainsRe(self.get_log(), '_remember_remote_is_before')
         self.assertTrue(client_medium._is_remote_before((1, 5)))
 
+    def test__remote_is_at_least_unknown(self):
+        client_medium = medium.SmartClientMedium('dummy base')
+        self.assertFalse(client_medium._remote_is_at_least((1, 0)))
+
+    def test__remote_is_at_least(self):
+        client_medium = medium.SmartClientMedium('dummy base')
+        client_medium._remote_software_version = b'3.2.0dev'
+        self.assertTrue(client_medium._remote_is_at_least((3, 2)))
+        self.assertTrue(client_medium._remote_is_at_least((3, 1, 9)))
+        self.assertFalse(client_medium._remote_is_at_least((3, 3)))
+        client_medium._remote_software_version = b'2.7.0'
+        self.assertFalse(client_medium._remote_is_at_least((3, 2)))
+
 
 class TestBzrDirCloningMetaDir(TestRemote):
 
@@ -718,6 +731,20 @@ class TestBzrDirOpenBranch(TestRemote):
                           call.call.method == verb])
         self.assertEqual(1, call_count)
 
+    def test_repository_and_stacking_prefetched(self):
+        self.setup_smart_server_with_call_log()
+        self.make_branch('.')
+        a_dir = BzrDir.open(self.get_url('.'))
+        self.reset_smart_call_log()
+        branch = a_dir.open_branch()
+        methods = [call.call.method for call in self.hpss_calls]
+        self.assertEqual(1, methods.count(b'BzrDir.find_repositoryV3'))
+        self.assertEqual(1, methods.count(b'Branch.get_stacked_on_url'))
+        self.assertLess(methods.index(b'BzrDir.find_repositoryV3'),
+                        methods.index(b'Branch.get_stacked_on_url'))
+        self.assertEqual(
+            {}, branch.controldir._client._medium._prefetched_responses)
+
     def test_branch_present(self):
         reference_format = self.get_repo_format()
         network_name = reference_format.network_name()
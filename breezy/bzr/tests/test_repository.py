@@ -49,6 +49,7 @@ from breezy.tests import (
     TestCaseWithTransport,
     )
 from breezy import (
+    config,
     controldir,
     errors,
     osutils,
@@ -761,6 +762,40 @@ class Test2a(tests.TestCaseWithMemoryTransport):
         self.assertEqual(257, len(full_chk_records))
         self.assertSubset(simple_chk_records, full_chk_records)
 
+    def test_get_revision_deltas_batched(self):
+        builder = self.make_branch_builder('source', format='2a')
+        builder.start_series()
+        builder.build_snapshot(None, [
+            ('add', ('', b'root-id', 'directory', '')),
+            ('add', ('a', b'a-id', 'file', b'content\n')),
+            ('add', ('b', b'b-id', 'file', b'content\n'))],
+            revision_id=b'1')
+        builder.build_snapshot([b'1'], [
+            ('modify', ('a', b'content-2\n'))],
+            revision_id=b'2')
+        builder.build_snapshot([b'2'], [
+            ('unversion', 'b'),
+            ('add', ('c', b'c-id', 'file', b'content\n'))],
+            revision_id=b'3')
+        builder.finish_series()
+        repo = builder.get_branch().repository
+        repo.lock_read()
+        self.addCleanup(repo.unlock)
+        revisions = [repo.get_revision(r) for r in (b'1', b'2', b'3')]
+        trees = repo._get_revision_delta_trees(revisions)
+        inv3 = trees[b'3'].root_inventory
+        inv2 = trees[b'2'].root_inventory
+        self.assertEqual(
+            [inv2.id_to_entry.key()], list(inv3._id_to_entry_changes))
+        deltas = list(repo.get_revision_deltas(revisions))
+        self.assertEqual(['a', 'b'], [c.path[1] for c in deltas[0].added])
+        self.assertEqual(['a'], [c.path[1] for c in deltas[1].modified])
+        self.assertEqual(['c'], [c.path[1] for c in deltas[2].added])
+        self.assertEqual(['b'], [c.path[0] for c in deltas[2].removed])
+        for revision, delta in zip(revisions, deltas):
+            self.assertEqual(
+                repo.get_revision_delta(revision.revision_id), delta)
+
     def test_inconsistency_fatal(self):
         repo = self.make_repository('repo', format='2a')
         self.assertTrue(repo.revisions._index._inconsistency_fatal)
@@ -1053,6 +1088,46 @@ class TestRepositoryPackCollection(TestCaseWithTransport):
         self.assertEqual(['a-pack.iix', 'a-pack.pack', 'a-pack.rix'],
                          sorted(obsolete_pack_trans.list_dir('.')))
 
+    def test__clear_obsolete_packs_preserve_bloom_filters(self):
+        packs = self.get_packs()
+        obsolete_pack_trans = packs.transport.clone('obsolete_packs')
+        obsolete_pack_trans.put_bytes('a-pack.pack', b'content\n')
+        obsolete_pack_trans.put_bytes('a-pack.rix', b'content\n')
+        obsolete_pack_trans.put_bytes('a-pack.rix.bloom', b'content\n')
+        obsolete_pack_trans.put_bytes('another-pack.rix.bloom', b'foo\n')
+        res = packs._clear_obsolete_packs(preserve={'a-pack'})
+        self.assertEqual(['a-pack'], res)
+        self.assertEqual(['a-pack.pack', 'a-pack.rix', 'a-pack.rix.bloom'],
+                         sorted(obsolete_pack_trans.list_dir('.')))
+
+    def test_bloom_filters(self):
+        config.GlobalStack().set('repository.bloom_filters', True)
+        tree = self.make_branch_and_tree('.', format='2a')
+        revid = tree.commit('first')
+        repo = repository.Repository.open('.')
+        repo.lock_read()
+        self.addCleanup(repo.unlock)
+        [pack] = repo._pack_collection.all_packs()
+        index_t = repo._pack_collection._index_transport
+        for suffix in ['.rix', '.iix', '.tix', '.six', '.cix']:
+            self.assertTrue(index_t.has(pack.name + suffix + '.bloom'))
+        index = repo.revisions._index._graph_index._indices[0]
+        self.assertTrue((revid,) in index.get_bloom_filter())
+        self.assertEqual({revid: (_mod_revision.NULL_REVISION,)},
+                         repo.get_parent_map([revid, b'missing']))
+
+    def test_no_bloom_filters_by_default(self):
+        tree = self.make_branch_and_tree('.', format='2a')
+        tree.commit('first')
+        repo = repository.Repository.open('.')
+        repo.lock_read()
+        self.addCleanup(repo.unlock)
+        [pack] = repo._pack_collection.all_packs()
+        index_t = repo._pack_collection._index_transport
+        self.assertFalse(index_t.has(pack.name + '.rix.bloom'))
+        index = repo.revisions._index._graph_index._indices[0]
+        self.assertIs(None, index.get_bloom_filter())
+
     def test__max_pack_count(self):
         """The maximum pack count is a function of the number of revisions."""
         # no revisions - one pack, so that we can have a revision free repo
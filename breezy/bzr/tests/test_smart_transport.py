@@ -46,6 +46,7 @@ from ..smart import (
     client,
     medium,
     message,
+    metrics,
     protocol,
     request as _mod_request,
     server as _mod_server,
@@ -1041,6 +1042,40 @@ class TestSmartServerStreamMedium(tests.TestCase):
         server._disconnect_client()
         self.assertEqual(b'', client_sock.recv(1))
 
+    def test_socket_stream_build_protocol_for_pushed_back_request(self):
+        # When the next request has already been read along with the previous
+        # one, _build_protocol doesn't wait for more bytes on the socket.
+        sample_request_bytes = protocol.REQUEST_VERSION_TWO + b'hello\n'
+        server, client_sock = self.create_socket_context(None, timeout=0.1)
+        client_sock.sendall(sample_request_bytes * 2)
+        server._serve_one_request(server._build_protocol())
+        # Both requests were read by now
+        server_protocol = server._build_protocol()
+        server._serve_one_request(server_protocol)
+        server._disconnect_client()
+        expected_response = (
+            protocol.RESPONSE_VERSION_TWO + b'success\nok\x012\n')
+        self.assertEqual(expected_response * 2,
+                         osutils.recv_all(client_sock, 100))
+
+    def test_pipe_stream_build_protocol_for_request_sent_together(self):
+        # When the client sends the next request along with the previous
+        # one, the server doesn't read it into the buffer of the pipe where
+        # _build_protocol can't see it.
+        sample_request_bytes = protocol.REQUEST_VERSION_TWO + b'hello\n'
+        (r_server, w_client) = os.pipe()
+        self.addCleanup(os.close, w_client)
+        from_server = BytesIO()
+        with os.fdopen(r_server, 'rb') as rf_server:
+            server = self.create_pipe_medium(
+                rf_server, from_server, None, timeout=0.1)
+            os.write(w_client, sample_request_bytes * 2)
+            server._serve_one_request(server._build_protocol())
+            server._serve_one_request(server._build_protocol())
+        expected_response = (
+            protocol.RESPONSE_VERSION_TWO + b'success\nok\x012\n')
+        self.assertEqual(expected_response * 2, from_server.getvalue())
+
     def test_pipe_like_stream_error_handling(self):
         # Use plain python BytesIO so we can monkey-patch the close method to
         # not discard the contents.
@@ -1489,6 +1524,82 @@ class TestSmartTCPServer(tests.TestCase):
         self.connect_to_server_and_hangup(server)
         server_thread.join()
 
+    def test_serve_conn_queues_beyond_max_connections(self):
+        server_metrics = metrics.SmartServerMetrics()
+        self.overrideAttr(metrics, 'server_metrics', server_metrics)
+        t = _mod_transport.get_transport_from_url('memory:///')
+        server = _mod_server.SmartTCPServer(
+            t, client_timeout=4.0, max_connections=1)
+        server_sock1, client_sock1 = portable_socket_pair()
+        server_sock2, client_sock2 = portable_socket_pair()
+        thread = server.serve_conn(server_sock1, '-%s' % (self.id(),))
+        self.assertIsNot(None, thread)
+        self.assertIs(None, server.serve_conn(server_sock2, self.id()))
+        self.assertEqual(1, len(server._active_connections))
+        self.assertEqual(1, server_metrics.queued_connections)
+        # Once the first connection finishes, its thread serves the second
+        client_sock1.close()
+        self.say_hello(client_sock2)
+        [(handler, active_thread)] = server._active_connections
+        self.assertIs(thread, active_thread)
+        self.assertEqual(0, server_metrics.queued_connections)
+        self.assertEqual(1, server_metrics.active_connections)
+        self.assertEqual(2, server_metrics.total_connections)
+        client_sock2.close()
+        thread.join()
+        self.assertEqual(0, server_metrics.active_connections)
+
+    def test_stop_gracefully_disconnects_queued_connections(self):
+        self.overrideAttr(metrics, 'server_metrics',
+                          metrics.SmartServerMetrics())
+        t = _mod_transport.get_transport_from_url('memory:///')
+        server = _mod_server.SmartTCPServer(
+            t, client_timeout=4.0, max_connections=1)
+        server_sock1, client_sock1 = portable_socket_pair()
+        server_sock2, client_sock2 = portable_socket_pair()
+        thread = server.serve_conn(server_sock1, '-%s' % (self.id(),))
+        server.serve_conn(server_sock2, self.id())
+        server._stop_gracefully()
+        # The queued connection is hung up on without being served
+        self.assertEqual(b'', client_sock2.recv(1))
+        self.assertEqual(0, len(server._queued_connections))
+        client_sock1.close()
+        thread.join()
+
+    def test_max_connection_time(self):
+        self.overrideAttr(metrics, 'server_metrics',
+                          metrics.SmartServerMetrics())
+        now = [1000.0]
+        self.overrideAttr(_mod_server.SmartTCPServer, '_timer',
+                          lambda self: now[0])
+        t = _mod_transport.get_transport_from_url('memory:///')
+        server = _mod_server.SmartTCPServer(
+            t, client_timeout=4.0, max_connection_time=10)
+        server_sock, client_sock = portable_socket_pair()
+        server.serve_conn(server_sock, '-%s' % (self.id(),))
+        self.say_hello(client_sock)
+        [(handler, thread)] = server._active_connections
+        server._poll_active_connections()
+        self.assertFalse(handler.finished)
+        now[0] += 11
+        server._poll_active_connections()
+        self.assertTrue(handler.finished)
+        # The connection is idle, so it is closed straight away
+        thread.join()
+        self.assertEqual(b'', client_sock.recv(1))
+
+    def test_serve_logs_metrics(self):
+        server_metrics = metrics.SmartServerMetrics()
+        self.overrideAttr(metrics, 'server_metrics', server_metrics)
+        t = _mod_transport.get_transport_from_url('memory:///')
+        server = _mod_server.SmartTCPServer(
+            t, client_timeout=4.0, metrics_log_interval=0.01)
+        server._next_metrics_log = 0
+        server._poll_active_connections()
+        self.assertContainsRe(
+            self.get_log(),
+            'smart server connections: 0 active, 0 queued, 0 total')
+
 
 class SmartTCPTests(tests.TestCase):
     """Tests for connection/end to end behaviour using the TCP server.
@@ -1642,6 +1753,81 @@ class WritableEndToEndTests(SmartTCPTests):
             transport)
 
 
+class PipelinedCallsTests(SmartTCPTests):
+    """Tests for _SmartClient.call_many over a real connection."""
+
+    def setUp(self):
+        super(PipelinedCallsTests, self).setUp()
+        self.overrideEnv('BRZ_NO_SMART_VFS', None)
+        self.start_server()
+        self.backing_transport.put_bytes('foo', b'contents of foo\n')
+        self.backing_transport.put_bytes('bar', b'contents of bar\n')
+        self.smart_client = client._SmartClient(
+            self.transport.get_smart_medium())
+        # Find out the protocol version before counting anything
+        self.smart_client.call(b'hello')
+        self.addCleanup(self.disconnect_and_wait)
+
+    def disconnect_and_wait(self):
+        """Disconnect, and wait for the server to finish the connection."""
+        self.transport.disconnect()
+        for handler, thread in self.server._active_connections:
+            thread.join()
+
+    def count_writes_finished(self):
+        calls = []
+        orig = medium.SmartClientStreamMediumRequest._finished_writing
+
+        def _finished_writing(request):
+            calls.append(request)
+            return orig(request)
+        self.overrideAttr(medium.SmartClientStreamMediumRequest,
+                          '_finished_writing', _finished_writing)
+        return calls
+
+    def test_call_many(self):
+        self.assertTrue(self.transport.get_smart_medium().supports_pipelining())
+        flushes = self.count_writes_finished()
+        results = self.smart_client.call_many(
+            [(b'get', (b'foo',)), (b'hello', ()), (b'get', (b'bar',))],
+            expect_body=True)
+        self.assertEqual([
+            ((b'ok',), b'contents of foo\n'),
+            ((b'ok', b'2'), b''),
+            ((b'ok',), b'contents of bar\n')], results)
+        self.assertLength(1, flushes)
+
+    def test_call_many_older_server(self):
+        # Older servers don't serve a request that arrives with the previous
+        # one until more bytes arrive, so the calls are made one at a time.
+        client_medium = self.transport.get_smart_medium()
+        client_medium._remote_software_version = b'3.1.7'
+        self.assertFalse(client_medium.supports_pipelining())
+        flushes = self.count_writes_finished()
+        results = self.smart_client.call_many(
+            [(b'has', (b'foo',)), (b'has', (b'bar',))])
+        self.assertEqual([(b'yes',), (b'yes',)], results)
+        self.assertLength(2, flushes)
+
+    def test_call_many_errors_inline(self):
+        results = self.smart_client.call_many(
+            [(b'has', (b'foo',)), (b'get', (b'missing',)),
+             (b'has', (b'missing',))])
+        self.assertEqual((b'yes',), results[0])
+        self.assertIsInstance(results[1], errors.ErrorFromSmartServer)
+        self.assertEqual(b'NoSuchFile', results[1].error_verb)
+        self.assertEqual((b'no',), results[2])
+
+    def test_call_many_unknown_method(self):
+        results = self.smart_client.call_many(
+            [(b'no-such-method', ()), (b'has', (b'foo',))])
+        self.assertIsInstance(results[0], errors.UnknownSmartMethod)
+        self.assertEqual((b'yes',), results[1])
+
+    def test_call_many_empty(self):
+        self.assertEqual([], self.smart_client.call_many([]))
+
+
 class ReadOnlyEndToEndTests(SmartTCPTests):
     """Tests from the client to the server using a readonly backing transport."""
 
@@ -1772,6 +1958,33 @@ class SmartServerCommandTests(tests.TestCaseWithTransport):
         self.assertEqual((), response.args)
 
 
+class TestSmartServerMetrics(tests.TestCase):
+
+    def test_latency_histogram(self):
+        server_metrics = metrics.SmartServerMetrics()
+        server_metrics.request_finished(b'hello', 0.0005)
+        server_metrics.request_finished(b'hello', 0.05)
+        server_metrics.request_finished(b'hello', 0.07)
+        server_metrics.request_finished(b'hello', 100)
+        self.assertEqual([1, 0, 2, 0, 0, 1],
+                         server_metrics.latency_histogram(b'hello'))
+        self.assertEqual([0, 0, 0, 0, 0, 0],
+                         server_metrics.latency_histogram(b'get'))
+
+    def test_report(self):
+        server_metrics = metrics.SmartServerMetrics()
+        server_metrics.connection_queued()
+        server_metrics.connection_dequeued()
+        server_metrics.connection_started()
+        server_metrics.request_finished(b'hello', 0.5)
+        server_metrics.request_finished(b'hello', 1.5)
+        self.assertEqual(
+            ['connections: 1 active, 0 queued, 1 total',
+             'hello: 2 requests, mean 1.0000s, <=0.001s:0 <=0.01s:0'
+             ' <=0.1s:0 <=1s:1 <=10s:1 >10s:0'],
+            server_metrics.report())
+
+
 class SmartServerRequestHandlerTests(tests.TestCaseWithTransport):
     """Test that call directly into the handler logic, bypassing the network."""
 
@@ -1796,6 +2009,13 @@ class SmartServerRequestHandlerTests(tests.TestCaseWithTransport):
         self.assertEqual((b'ok', b'2'), handler.response.args)
         self.assertEqual(None, handler.response.body)
 
+    def test_request_latency_recorded(self):
+        server_metrics = metrics.SmartServerMetrics()
+        self.overrideAttr(metrics, 'server_metrics', server_metrics)
+        handler = self.build_handler(None)
+        handler.args_received((b'hello',))
+        self.assertEqual(1, sum(server_metrics.latency_histogram(b'hello')))
+
     def test_disable_vfs_handler_classes_via_environment(self):
         # VFS handler classes will raise an error from "execute" if
         # BRZ_NO_SMART_VFS is set.
@@ -3779,6 +3999,23 @@ class Test_SmartClient(tests.TestCase):
         # XXX: need a test that smart_client._headers is passed to the request
         # encoder.
 
+    def test_unknown_verb_discards_prefetched(self):
+        """A verb missing from the request registry is treated as mutating."""
+        medium = MockMedium()
+        medium._protocol_version = 3
+        medium._prefetched_responses[
+            (b'Branch.get_stacked_on_url', (b'quack/',))] = (b'NotStacked',)
+        smart_client = client._SmartClient(medium, headers={})
+        message_start = protocol.MESSAGE_VERSION_THREE + b'\x00\x00\x00\x02de'
+        medium.expect_request(
+            message_start
+            + b's\x00\x00\x00\x10l11:method-nameee',
+            message_start + b's\0\0\0\x13l14:response valueee')
+        result = smart_client.call(b'method-name')
+        self.assertEqual((b'response value',), result)
+        self.assertEqual([], medium._expected_events)
+        self.assertEqual({}, medium._prefetched_responses)
+
 
 class Test_SmartClientRequest(tests.TestCase):
 
@@ -3800,6 +4037,27 @@ class Test_SmartClientRequest(tests.TestCase):
         responder.send_response(response)
         return response_io.getvalue()
 
+    def test_call_many_responses_read_together(self):
+        # The responses to pipelined calls may all arrive in one read.
+        server_sock, client_sock = portable_socket_pair()
+        self.addCleanup(server_sock.close)
+        client_medium = medium.SmartClientAlreadyConnectedSocketMedium(
+            'base', client_sock)
+        self.addCleanup(client_medium.disconnect)
+        client_medium._protocol_version = 3
+        client_medium._remote_software_version = b'3.2.0'
+        smart_client = client._SmartClient(client_medium, headers={})
+        server_sock.sendall(
+            self.make_response((b'ok', b'1')) +
+            self.make_response((b'ok', b'2'), b'body') +
+            self.make_response((b'ok', b'3')))
+        self.assertEqual(
+            [((b'ok', b'1'), b''), ((b'ok', b'2'), b'body'),
+             ((b'ok', b'3'), b'')],
+            smart_client.call_many(
+                [(b'one', ()), (b'two', ()), (b'three', ())],
+                expect_body=True))
+
     def test__call_doesnt_retry_append(self):
         response = self.make_response(('appended', b'8'))
         output, vendor, smart_client = self.make_client_with_failing_medium(
@@ -19,7 +19,7 @@ import os
 import time
 
 from ...tests import features
-from ... import errors, filters, osutils, rules
+from ... import config, errors, filters, osutils, rules
 from ...controldir import ControlDir
 from ..conflicts import DuplicateEntry
 from ..transform import build_tree
@@ -324,6 +324,31 @@ class TestBuildTree(TestCaseWithTransport):
         target2_stat = os.stat('target2/file1')
         self.assertNotEqual(source_stat, target2_stat)
 
+    def test_build_tree_reflink(self):
+        source = self.create_ab_tree()
+        self.build_tree_contents([('source/file2', b'C')])
+        config.GlobalStack().set('bzr.transform.reflink', True)
+        cloned = []
+        reflink_or_copy = osutils.reflink_or_copy
+
+        def reflink(src, dest):
+            cloned.append(osutils.basename(src))
+            return reflink_or_copy(src, dest)
+        self.overrideAttr(osutils, 'reflink_or_copy', reflink)
+        target = self.make_branch_and_tree('target')
+        revision_tree = source.basis_tree()
+        revision_tree.lock_read()
+        self.addCleanup(revision_tree.unlock)
+        build_tree(revision_tree, target, source)
+        # file2 is changed in the accelerator tree, so it comes from the
+        # repository.
+        self.assertEqual(['file1'], cloned)
+        target.lock_read()
+        self.addCleanup(target.unlock)
+        self.assertEqual([], list(target.iter_changes(revision_tree)))
+        self.assertNotEqual(os.stat('source/file1').st_ino,
+                            os.stat('target/file1').st_ino)
+
     def test_build_tree_accelerator_tree_moved(self):
         source = self.make_branch_and_tree('source')
         self.build_tree_contents([('source/file1', b'A')])
@@ -462,5 +487,38 @@ class TestBuildTree(TestCaseWithTransport):
         self.assertEqual(entry1_state, entry1[1][0])
         self.assertEqual(entry2_state, entry2[1][0])
 
+    def test_build_tree_write_threads(self):
+        source = self.make_branch_and_tree('source')
+        paths = ['dir/', 'dir/subdir/', 'exe']
+        paths.extend('file%d' % i for i in range(20))
+        paths.extend('dir/file%d' % i for i in range(20))
+        paths.extend('dir/subdir/file%d' % i for i in range(20))
+        self.build_tree(['source/' + path for path in paths])
+        os.chmod('source/exe', 0o755)
+        source.add([path.rstrip('/') for path in paths])
+        source.commit('new files')
+        config.GlobalStack().set('bzr.transform.write_threads', 3)
+        target = self.make_branch_and_tree('target')
+        target.lock_write()
+        self.addCleanup(target.unlock)
+        state = target.current_dirstate()
+        state._cutoff_time = time.time() + 60
+        build_tree(source.basis_tree(), target)
+        for path in paths:
+            if path.endswith('/'):
+                self.assertPathExists('target/' + path)
+                continue
+            self.assertFileEqual(
+                'contents of source/%s\n' % path, 'target/' + path)
+            # The sha1s observed by the writer threads were recorded.
+            entry = state._get_entry(0, path_utf8=path.encode('utf-8'))
+            self.assertEqual(
+                osutils.sha_file_by_name('source/' + path), entry[1][0][1])
+        self.assertTrue(target.is_executable('exe'))
+        self.assertFalse(target.is_executable('file0'))
+        basis = source.basis_tree()
+        with basis.lock_read():
+            self.assertEqual([], list(target.iter_changes(basis)))
+
 
 
@@ -21,6 +21,7 @@ import os
 import time
 
 from ... import (
+    config,
     errors,
     osutils,
     )
@@ -702,6 +703,60 @@ class TestWorkingTreeFormat4(TestCaseWithTransport):
                               tree_iter_changes, tree, [u'\xa7', u'\u03c0'])
         self.assertEqual(set(e.paths), set([u'\xa7', u'\u03c0']))
 
+    def test_iter_changes_threads(self):
+        tree = self.make_branch_and_tree('.')
+        self.build_tree(['a/', 'a/b', 'a/c/', 'a/c/d', 'e', 'f/', 'f/g'])
+        tree.add(['a', 'a/b', 'a/c', 'a/c/d', 'e', 'f', 'f/g'])
+        tree.commit('one')
+        self.build_tree_contents([('a/b', b'new b\n'), ('a/c/d', b'new d\n'),
+                                  ('f/g', b'new g\n'), ('h', b'unknown\n')])
+        tree.lock_read()
+        self.addCleanup(tree.unlock)
+        basis = tree.basis_tree()
+        basis.lock_read()
+        self.addCleanup(basis.unlock)
+
+        def changes():
+            return [(c.path, c.changed_content, c.versioned)
+                    for c in tree.iter_changes(
+                        basis, include_unchanged=True, want_unversioned=True)]
+        expected = changes()
+        self.assertEqual(
+            [((None, 'h'), True), (('a/b', 'a/b'), True),
+             (('a/c/d', 'a/c/d'), True), (('f/g', 'f/g'), True)],
+            [(path, changed) for path, changed, versioned in expected
+             if changed or versioned == (False, False)])
+        config.GlobalStack().set('bzr.workingtree.iter_changes_threads', 2)
+        self.assertEqual(expected, changes())
+
+    def test_iter_changes_threads_size_changed(self):
+        tree = self.make_branch_and_tree('.')
+        self.build_tree_contents([('a', b'a text\n'), ('b', b'b text\n')])
+        tree.add(['a', 'b'])
+        tree.commit('one')
+        # a changes size, b keeps it.
+        self.build_tree_contents([('a', b'longer a text\n'),
+                                  ('b', b'B TEXT\n')])
+        hashed = []
+
+        def recording(sha):
+            def sha_and_record(f):
+                hashed.append(os.path.basename(getattr(f, 'name', f)))
+                return sha(f)
+            return sha_and_record
+        for name in ['sha_file', 'sha_file_by_name', 'size_sha_file']:
+            self.overrideAttr(osutils, name, recording(getattr(osutils, name)))
+        config.GlobalStack().set('bzr.workingtree.iter_changes_threads', 2)
+        tree.lock_read()
+        self.addCleanup(tree.unlock)
+        basis = tree.basis_tree()
+        basis.lock_read()
+        self.addCleanup(basis.unlock)
+        self.assertEqual(
+            ['a', 'b'],
+            [c.path[1] for c in tree.iter_changes(basis) if c.changed_content])
+        self.assertEqual(['b'], hashed)
+
     def get_tree_with_cachable_file_foo(self):
         tree = self.make_branch_and_tree('.')
         tree.lock_write()
@@ -17,6 +17,7 @@
 
 from __future__ import absolute_import
 
+import collections
 import contextlib
 import errno
 import os
@@ -1000,6 +1001,15 @@ class TreeTransformBase(TreeTransform):
         """Schedule creation of a hard link"""
         raise NotImplementedError(self.create_hardlink)
 
+    def create_reflink(self, path, trans_id, sha1=None):
+        """Schedule creation of a copy-on-write clone of a file.
+
+        The file is copied if it can't be cloned.
+
+        :param sha1: If the sha1 of the file is already known, pass it in.
+        """
+        raise NotImplementedError(self.create_reflink)
+
     def cancel_creation(self, trans_id):
         """Cancel the creation of new file contents."""
         raise NotImplementedError(self.cancel_creation)
@@ -1272,6 +1282,69 @@ class DiskTreeTransform(TreeTransformBase):
         if sha1 is not None:
             self._observed_sha1s[trans_id] = (sha1, osutils.lstat(name))
 
+    def create_files(self, files, executor):
+        """Schedule creation of several new files, writing them in threads.
+
+        The transform is only updated by the calling thread; writing the
+        limbo files, setting their mtime and mode and stat'ing them happens
+        in the executor, so the contents of the next files can be produced
+        while the previous ones are written out.
+
+        :seealso: create_file.
+
+        :param files: An iterable of (contents, trans_id, sha1) tuples, with
+            the arguments as for create_file. contents is read completely
+            before the next tuple is requested.
+        :param executor: A concurrent.futures.Executor to write the files in.
+        """
+        if self._creation_mtime is None:
+            self._creation_mtime = time.time()
+        pending = collections.deque()
+        try:
+            batch = []
+            for contents, trans_id, sha1 in files:
+                name = self._limbo_name(trans_id)
+                chunks = list(contents)
+                unique_add(self._new_contents, trans_id, 'file')
+                batch.append((name, chunks, trans_id, sha1))
+                if len(batch) < _WRITE_BATCH_SIZE:
+                    continue
+                pending.append(
+                    executor.submit(self._write_limbo_files, batch))
+                batch = []
+                if len(pending) > _MAX_PENDING_WRITES:
+                    self._observed_sha1s.update(pending.popleft().result())
+            if batch:
+                pending.append(
+                    executor.submit(self._write_limbo_files, batch))
+            while pending:
+                self._observed_sha1s.update(pending.popleft().result())
+        finally:
+            # If we're abandoned part way through, make sure no worker is
+            # still writing into limbo when it gets cleaned up.
+            for future in pending:
+                if not future.cancel():
+                    try:
+                        future.result()
+                    except Exception:
+                        pass
+
+    def _write_limbo_files(self, batch):
+        """Write a batch of limbo files for create_files.
+
+        :return: The observed sha1s of the files, as (trans_id, (sha1,
+            stat_value)) pairs.
+        """
+        observed_sha1s = []
+        for name, chunks, trans_id, sha1 in batch:
+            with open(name, 'wb') as f:
+                f.writelines(chunks)
+            self._set_mtime(name)
+            self._set_mode(trans_id, None, S_ISREG)
+            if sha1 is not None:
+                observed_sha1s.append((trans_id, (sha1, osutils.lstat(name))))
+        return observed_sha1s
+
     def _read_symlink_target(self, trans_id):
         return os.readlink(self._limbo_name(trans_id))
 
@@ -1301,6 +1374,26 @@ class DiskTreeTransform(TreeTransformBase):
             os.unlink(name)
             raise
 
+    def create_reflink(self, path, trans_id, sha1=None):
+        """Schedule creation of a copy-on-write clone of a file.
+
+        The file is copied if it can't be cloned.
+        """
+        name = self._limbo_name(trans_id)
+        try:
+            osutils.reflink_or_copy(path, name)
+            unique_add(self._new_contents, trans_id, 'file')
+        except BaseException:
+            # Clean up the file, it never got registered so
+            # TreeTransform.finalize() won't clean it up.
+            if os.path.exists(name):
+                os.unlink(name)
+            raise
+        self._set_mtime(name)
+        self._set_mode(trans_id, None, S_ISREG)
+        if sha1 is not None:
+            self._observed_sha1s[trans_id] = (sha1, osutils.lstat(name))
+
     def create_directory(self, trans_id):
         """Schedule creation of a new directory.
 
@@ -2439,10 +2532,17 @@ def _build_tree(tree, wt, accelerator_tree, hardlink, delta_from_tree):
     return result
 
 
+# create_files hands files to the writer threads in batches of this many, and
+# lets this many batches wait for a writer before producing more contents.
+_WRITE_BATCH_SIZE = 32
+_MAX_PENDING_WRITES = 4
+
+
 def _create_files(tt, tree, desired_files, pb, offset, accelerator_tree,
                   hardlink):
     total = len(desired_files) + offset
     wt = tt._tree
+    config_stack = wt.get_config_stack()
     if accelerator_tree is None:
         new_desired_files = desired_files
     else:
@@ -2456,6 +2556,7 @@ def _create_files(tt, tree, desired_files, pb, offset, accelerator_tree,
         unchanged = dict(unchanged)
         new_desired_files = []
         count = 0
+        reflink = config_stack.get('bzr.transform.reflink')
         for unused_tree_path, (trans_id, tree_path, text_sha1) in desired_files:
             accelerator_path = unchanged.get(tree_path)
             if accelerator_path is None:
@@ -2463,27 +2564,46 @@ def _create_files(tt, tree, desired_files, pb, offset, accelerator_tree,
                                           (trans_id, tree_path, text_sha1)))
                 continue
             pb.update(gettext('Adding file contents'), count + offset, total)
+            if wt.supports_content_filtering():
+                filters = wt._content_filter_stack(tree_path)
+            else:
+                filters = []
             if hardlink:
                 tt.create_hardlink(accelerator_tree.abspath(accelerator_path),
                                    trans_id)
+            elif reflink and not filters:
+                tt.create_reflink(accelerator_tree.abspath(accelerator_path),
+                                  trans_id, sha1=text_sha1)
             else:
                 with accelerator_tree.get_file(accelerator_path) as f:
                     chunks = osutils.file_iterator(f)
-                    if wt.supports_content_filtering():
-                        filters = wt._content_filter_stack(tree_path)
+                    if filters:
                         chunks = filtered_output_bytes(chunks, filters,
                                                        ContentFilterContext(tree_path, tree))
                     tt.create_file(chunks, trans_id, sha1=text_sha1)
             count += 1
         offset += count
-    for count, ((trans_id, tree_path, text_sha1), contents) in enumerate(
-            tree.iter_files_bytes(new_desired_files)):
-        if wt.supports_content_filtering():
-            filters = wt._content_filter_stack(tree_path)
-            contents = filtered_output_bytes(contents, filters,
-                                             ContentFilterContext(tree_path, tree))
-        tt.create_file(contents, trans_id, sha1=text_sha1)
-        pb.update(gettext('Adding file contents'), count + offset, total)
+
+    def iter_files():
+        for count, ((trans_id, tree_path, text_sha1), contents) in enumerate(
+                tree.iter_files_bytes(new_desired_files)):
+            if wt.supports_content_filtering():
+                filters = wt._content_filter_stack(tree_path)
+                contents = filtered_output_bytes(
+                    contents, filters, ContentFilterContext(tree_path, tree))
+            yield contents, trans_id, text_sha1
+            pb.update(gettext('Adding file contents'), count + offset, total)
+    # File writes, utime, chmod and lstat release the GIL, so writer threads
+    # let the files of a new tree be written out while the next texts are
+    # extracted from the repository.
+    num_threads = config_stack.get('bzr.transform.write_threads')
+    if num_threads < 1:
+        for contents, trans_id, text_sha1 in iter_files():
+            tt.create_file(contents, trans_id, sha1=text_sha1)
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=num_threads) as executor:
+            tt.create_files(iter_files(), executor)
 
 
 
@@ -52,6 +52,7 @@ from .. import lazy_import
 lazy_import.lazy_import(globals(), """
 import contextlib
 from breezy import (
+    annotate as _mod_annotate,
     cache_utf8,
     conflicts as _mod_conflicts,
     globbing,
@@ -874,6 +875,8 @@ class InventoryWorkingTree(WorkingTree, MutableInventoryTree):
 
             # Now we have the parents of this content
             annotator = self.branch.repository.texts.get_annotator()
+            annotator.set_annotation_cache(
+                _mod_annotate.get_annotation_cache())
             text = self.get_file_text(path)
             this_key = (file_id, default_revision)
             annotator.add_special_text(this_key, file_parent_keys, text)
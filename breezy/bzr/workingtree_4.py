@@ -37,6 +37,7 @@ from breezy import (
     controldir,
     debug,
     filters as _mod_filters,
+    fsmonitor,
     osutils,
     revision as _mod_revision,
     revisiontree,
@@ -61,6 +62,7 @@ from .inventorytree import (
     InventoryTree,
     InterInventoryTree,
     InventoryRevisionTree,
+    InventoryTreeChange,
     )
 from ..mutabletree import (
     BadReferenceTarget,
@@ -89,6 +91,25 @@ from .workingtree import (
     )
 
 
+# How many directories iter_changes reads ahead for each of its threads.
+_ITER_CHANGES_READ_AHEAD = 4
+
+
+def _entries_modified(state):
+    """Check whether records in state were changed, not just hashes."""
+    return (state._header_state == dirstate.DirState.IN_MEMORY_MODIFIED or
+            state._dirblock_state == dirstate.DirState.IN_MEMORY_MODIFIED)
+
+
+def _dirblock_order_key(change):
+    """Sort key for changes, in the order of the dirstate dirblocks."""
+    path = change.path[1]
+    if path is None:
+        path = change.path[0]
+    dirname, basename = osutils.split(path)
+    return (dirname.split('/'), basename)
+
+
 class DirStateWorkingTree(InventoryWorkingTree):
 
     def __init__(self, basedir,
@@ -312,10 +333,20 @@ class DirStateWorkingTree(InventoryWorkingTree):
         """Write all cached data to disk."""
         if self._control_files._lock_mode != 'w':
             raise errors.NotWriteLocked(self)
-        self.current_dirstate().save()
+        self._save_dirstate(self.current_dirstate())
         self._inventory = None
         self._dirty = False
 
+    def _save_dirstate(self, state):
+        """Save the dirstate, if it was modified.
+
+        If records were changed rather than just hashes, the fsmonitor state
+        is flagged so that the next comparison looks at the records again.
+        """
+        if _entries_modified(state):
+            fsmonitor.TreeStateFile(self._transport).mark_entries_changed()
+        state.save()
+
     def _gather_kinds(self, files, kinds):
         """See MutableTree._gather_kinds."""
         with self.lock_tree_write():
@@ -1213,7 +1244,7 @@ class DirStateWorkingTree(InventoryWorkingTree):
                     self.flush()
             if self._dirstate is not None:
                 # This is a no-op if there are no modifications.
-                self._dirstate.save()
+                self._save_dirstate(self._dirstate)
                 self._dirstate.unlock()
             # TODO: jam 20070301 We shouldn't have to wipe the dirstate at this
             #       point. Instead, it could check if the header has been
@@ -2311,11 +2342,162 @@ class InterDirStateTree(InterInventoryTree):
             # would be good here.
             search_specific_files_utf8.add(path.encode('utf8'))
 
-        iter_changes = self.target._iter_changes(
-            include_unchanged, self.target._supports_executable(),
-            search_specific_files_utf8, state, source_index, target_index,
-            want_unversioned, self.target)
-        return iter_changes.iter_changes()
+        config_stack = self.target.get_config_stack()
+        num_threads = config_stack.get('bzr.workingtree.iter_changes_threads')
+
+        def iter_changes_threaded(search_specific_files_utf8,
+                                  want_unversioned):
+            # os.lstat, directory reads and hashlib release the GIL, so these
+            # threads read directories and sha1 files on several cores.
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=num_threads) as executor:
+                # Only the python implementation can use the threads.
+                process_entry = dirstate.ProcessEntryPython(
+                    include_unchanged, self.target._supports_executable(),
+                    search_specific_files_utf8, state, source_index,
+                    target_index, want_unversioned, self.target,
+                    executor=executor,
+                    read_ahead=num_threads * _ITER_CHANGES_READ_AHEAD)
+                for result in process_entry.iter_changes():
+                    yield result
+
+        def iter_changes(search_specific_files_utf8, want_unversioned):
+            if num_threads >= 1:
+                return iter_changes_threaded(
+                    search_specific_files_utf8, want_unversioned)
+            process_entry = self.target._iter_changes(
+                include_unchanged, self.target._supports_executable(),
+                search_specific_files_utf8, state, source_index,
+                target_index, want_unversioned, self.target)
+            return process_entry.iter_changes()
+        if (not include_unchanged and source_index == 1
+                and search_specific_files_utf8 == {b''}
+                and config_stack.get('bzr.workingtree.fsmonitor')):
+            return self._iter_changes_fsmonitor(
+                state, iter_changes, want_unversioned,
+                fsmonitor.socket_path_from_config(config_stack))
+        return iter_changes(search_specific_files_utf8, want_unversioned)
+
+    def _iter_changes_fsmonitor(self, state, iter_changes, want_unversioned,
+                                socket_path):
+        """Compare the whole trees, only looking at what may have changed.
+
+        See fsmonitor.TreeStateFile for how the paths to look at are found.
+        """
+        state_file = fsmonitor.TreeStateFile(self.target._transport)
+        token, paths, entries_changed = state_file.load()
+        try:
+            token, dirty = fsmonitor.FSMonitorClient(socket_path).query(
+                self.target.basedir, token)
+        except fsmonitor.FSMonitorError as e:
+            trace.mutter('not using fsmonitor: %s', e)
+            return iter_changes({b''}, want_unversioned)
+        # Unknown files are looked for even if they aren't wanted, as the
+        # next comparison may want them.
+        if dirty is None or paths is None:
+            changes = iter_changes({b''}, True)
+        else:
+            paths = dirty.union(paths)
+            if entries_changed or _entries_modified(state):
+                paths.update(self._changed_entry_paths(state))
+            search_paths, unversioned_paths = self._fsmonitor_search_paths(
+                state, paths)
+            changes = self._iter_changes_paths(
+                iter_changes, search_paths, unversioned_paths)
+        return self._record_fsmonitor_changes(
+            changes, want_unversioned, state_file, token)
+
+    def _changed_entry_paths(self, state):
+        """Find the working tree records that don't match the basis.
+
+        These are left by e.g. add, remove, rename or uncommit. As finding
+        them means looking at every record, this is only done after the
+        records were changed.
+        """
+        paths = set()
+        for entry in state._iter_entries():
+            target, source = entry[1][0], entry[1][1]
+            if target[0] in b'ar' and source[0] in b'ar':
+                continue
+            if target[:2] != source[:2] or target[3] != source[3]:
+                if entry[0][0]:
+                    paths.add(osutils.pathjoin(
+                        entry[0][0], entry[0][1]).decode('utf-8'))
+                else:
+                    paths.add(entry[0][1].decode('utf-8'))
+        return paths
+
+    def _fsmonitor_search_paths(self, state, paths):
+        """Find what to compare, given the paths that may differ.
+
+        :return: A tuple with the utf8 paths to compare, and the paths that
+            are unversioned in the working tree, which are not descended into
+            when comparing the whole tree.
+        """
+        search_paths = set()
+        unversioned_paths = set()
+        for path in paths:
+            path_utf8 = path.encode('utf-8')
+            parts = path_utf8.split(b'/')
+            for i in range(1, len(parts) + 1):
+                prefix = b'/'.join(parts[:i])
+                if state._get_entry(0, path_utf8=prefix) == (None, None):
+                    unversioned_paths.add(prefix.decode('utf-8'))
+                    # Removed or renamed entries may still be there.
+                    if (state._entries_for_path(prefix) or
+                            state._find_block_index_from_key(
+                                (prefix, b'', b''))[1]):
+                        search_paths.add(prefix)
+                    break
+            else:
+                search_paths.add(path_utf8)
+        return osutils.minimum_path_selection(search_paths), unversioned_paths
+
+    def _iter_changes_paths(self, iter_changes, search_paths,
+                            unversioned_paths):
+        """Compare search_paths, and report unversioned_paths if present.
+
+        The changes are reported in the same order as when comparing the
+        whole trees.
+        """
+        changes = []
+        for change in iter_changes(search_paths, True):
+            if change.versioned == (False, False):
+                path = change.path[1]
+                while path and path not in unversioned_paths:
+                    path = osutils.dirname(path)
+                if path:
+                    continue
+            changes.append(change)
+        for path in unversioned_paths:
+            try:
+                st = os.lstat(self.target.abspath(path))
+            except OSError as e:
+                if e.errno in (errno.ENOENT, errno.ENOTDIR):
+                    continue
+                raise
+            kind = osutils.file_kind_from_stat_mode(st.st_mode)
+            if (kind == 'directory' and
+                    self.target._directory_is_tree_reference(path)):
+                kind = 'tree-reference'
+            executable = bool(
+                stat.S_ISREG(st.st_mode) and stat.S_IEXEC & st.st_mode)
+            changes.append(InventoryTreeChange(
+                None, (None, path), True, (False, False), (None, None),
+                (None, osutils.basename(path)), (None, kind),
+                (None, executable)))
+        changes.sort(key=_dirblock_order_key)
+        return iter(changes)
+
+    @staticmethod
+    def _record_fsmonitor_changes(changes, want_unversioned, state_file,
+                                  token):
+        paths = set()
+        for change in changes:
+            paths.update(path for path in change.path if path is not None)
+            if want_unversioned or change.versioned != (False, False):
+                yield change
+        state_file.save(token, paths)
 
     @staticmethod
     def is_compatible(source, target):
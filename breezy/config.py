@@ -2406,6 +2406,16 @@ arguments.
 
 A negative value means disable the size check.
 """))
+option_registry.register(
+    Option('annotate.cache',
+           default=False, from_unicode=bool_from_store, invalid='warning',
+           help="""\
+Cache the annotations of file texts.
+
+With this set, 'brz annotate' stores the annotations it computes in the
+user's cache directory, and later annotations of descendants of those texts
+only process the revisions since then.
+"""))
 option_registry.register(
     Option('bound',
            default=None, from_unicode=bool_from_store,
@@ -2432,8 +2442,97 @@ option_registry.register(
            help="""\
 Whether revisions associated with tags should be fetched.
 """))
+option_registry.register(
+    Option('branch.merge_sort_cache', default=False,
+           from_unicode=bool_from_store, invalid='warning',
+           help="""\
+Whether to keep the merge sorted ancestry of the branch on disk.
+
+Dotted revnos (e.g. for log) are computed by merge sorting the whole
+ancestry of the branch, which is slow for large branches. With this set, the
+result is kept in the branch and only the revisions added since are merge
+sorted when the tip moves forward.
+"""))
 option_registry.register_lazy(
     'transform.orphan_policy', 'breezy.transform', 'opt_transform_orphan')
+option_registry.register(
+    Option('bzr.chk_map.disk_cache_size', default=0,
+           from_unicode=int_SI_from_store, invalid='warning',
+           help='''\
+Maximum size of the persistent cache of CHK pages, e.g. 100MB.
+
+Inventory pages read from 2a repositories are kept in the breezy cache
+directory, so that later commands don't have to read and decompress them
+again. Pages are addressed by their content, so the cache is shared by all
+repositories and never needs invalidating. 0 disables the cache.
+'''))
+option_registry.register(
+    Option('bzr.generation_index', default=False,
+           from_unicode=bool_from_store, invalid='warning',
+           help='''\
+Whether to keep an index of revision generation numbers in repositories.
+
+The generation number of a revision is one more than the highest
+generation number of its parents. With this set, pack repositories keep them
+on disk and graph searches such as finding the merge base of two revisions
+stop as soon as they reach revisions too old to matter. The first search in
+a repository computes the generation numbers of the whole ancestry it
+touches.
+'''))
+option_registry.register(
+    Option('bzr.groupcompress.decompression_threads', default=0,
+           from_unicode=int_from_store, invalid='warning',
+           help='''\
+How many threads to use for inflating groupcompress blocks.
+
+When reading many texts (e.g. for branch, checkout or export), the next
+blocks in the stream are decompressed by this many background threads while
+texts are extracted from the current one. 0 disables this.
+'''))
+option_registry.register(
+    Option('bzr.transform.reflink', default=False,
+           from_unicode=bool_from_store, invalid='warning',
+           help='''\
+Clone unchanged files from the source working tree when building a tree.
+
+With this set, 'brz branch' and 'brz checkout' from a branch with a working
+tree (or with --files-from) make copy-on-write clones of the files that are
+unchanged in that tree, rather than writing them out again. Clones take next
+to no time or disk space on filesystems that support them, like btrfs and
+XFS; elsewhere the files are copied.
+'''))
+option_registry.register(
+    Option('bzr.transform.write_threads', default=0,
+           from_unicode=int_from_store, invalid='warning',
+           help='''\
+How many threads to use for writing out files when building a tree.
+
+With this set, the files of a new working tree (e.g. for checkout and
+branch) are written in this many threads while the next file texts are
+extracted from the repository. 0 writes them in a single thread.
+'''))
+option_registry.register(
+    Option('bzr.workingtree.fsmonitor', default=False,
+           from_unicode=bool_from_store, invalid='warning',
+           help='''\
+Ask the fsmonitor daemon which files changed.
+
+With this set, comparing a working tree with its basis (e.g. for status,
+diff and commit) only looks at the files the daemon reports as changed since
+the last comparison, rather than at every file in the tree. The daemon is
+started with 'brz fsmonitor start'; while it isn't running the whole tree is
+looked at.
+'''))
+option_registry.register(
+    Option('bzr.workingtree.iter_changes_threads', default=0,
+           from_unicode=int_from_store, invalid='warning',
+           help='''\
+How many threads to use for comparing a working tree with its basis.
+
+With this set, directories are read and the files whose stat changed are
+sha1'ed in this many threads while the previous ones are compared, e.g. for
+status, diff and commit. 0 does it all in a single thread.
+'''))
 option_registry.register(
     Option('bzr.workingtree.worth_saving_limit', default=10,
            from_unicode=int_from_store, invalid='warning',
@@ -2494,6 +2593,17 @@ Possible values: always, never, when-required (default)
 This option controls whether bzr will always create
 gpg signatures or not on commits.
 '''))
+option_registry.register(
+    Option('dirstate.compact', default=False,
+           from_unicode=bool_from_store, invalid='warning',
+           help='''\
+Keep read locked dirstates in a compact layout in memory?
+
+If true, the rows of the dirstate of a working tree that is only being read
+are kept in flat arrays rather than as tuples, which takes much less memory
+for large trees. Rows are converted back to tuples when something needs
+them in that form.
+'''))
 option_registry.register(
     Option('dirstate.fdatasync', default=True,
            from_unicode=bool_from_store,
@@ -2504,6 +2614,21 @@ If true (default), working tree metadata changes are flushed through the
 OS buffers to physical disk.  This is somewhat slower, but means data
 should not be lost if the machine crashes.  See also repository.fdatasync.
 '''))
+option_registry.register(
+    Option('dirstate.journal', default=False,
+           from_unicode=bool_from_store, invalid='warning',
+           help='''\
+Append small dirstate changes to a journal?
+
+If true, small changes to the working tree metadata, such as updates to the
+hash cache or a commit of a few files, are appended to a journal next to
+the dirstate file rather than rewriting the whole dirstate file. The journal
+is folded back into the dirstate file when it grows large.
+
+While this is set, the dirstate file is written with a header that clients
+without journal support refuse to read. Unsetting it writes the plain header
+again the next time the dirstate file is saved.
+'''))
 option_registry.register(
     ListOption('debug_flags', default=[],
                help='Debug flags to activate.'))
@@ -2516,6 +2641,23 @@ option_registry.register(
 option_registry.register(
     Option('email', override_from_env=['BRZ_EMAIL', 'BZR_EMAIL'],
            default=bedding.default_email, help='The users identity'))
+option_registry.register(
+    Option('export.compression_threads', default=0,
+           from_unicode=int_from_store, invalid='warning',
+           help='''\
+How many threads to use for compressing exported tarballs.
+
+With this set, 'brz export' compresses .tar.gz files in blocks on this many
+threads, like pigz does, and .tar.zst files with this many zstd worker
+threads. 0 compresses in a single thread.
+'''))
+option_registry.register(
+    Option('fsmonitor.socket', default=None,
+           help='''\
+The path of the socket the fsmonitor daemon listens on.
+
+Defaults to fsmonitor.sock in the breezy cache directory.
+'''))
 option_registry.register(
     Option('gpg_signing_key',
            default=None,
@@ -2524,6 +2666,16 @@ GPG key to use for signing.
 
 This defaults to the first key associated with the users email.
 """))
+option_registry.register(
+    Option('http.concurrent_requests', default=1,
+           from_unicode=int_from_store, invalid='warning',
+           help="""\
+How many requests to issue at once when reading parts of a file over HTTP.
+
+Big reads of many parts of a file (such as a pack) are split into several
+range requests, which are issued concurrently on separate connections to the
+server if this is more than 1. The connections are kept open for later reads.
+"""))
 option_registry.register(
     Option('language',
            help='Language to translate messages into.'))
@@ -2539,6 +2691,17 @@ will automatically break the stale lock, and create a new lock for
 this process.
 Otherwise, bzr will prompt as normal to break the lock.
 '''))
+option_registry.register(
+    Option('log.delta_processes', default=0,
+           from_unicode=int_from_store, invalid='warning',
+           help='''\
+How many processes to use for computing the changes shown by 'brz log -v'.
+
+With this set, the changes made by each revision are computed by this many
+worker processes, each with its own copy of the repository, while log output
+continues in the order of the revisions. Only used for local repositories
+and on platforms that support fork. 0 does it all in a single process.
+'''))
 option_registry.register(
     Option('log_format', default='long',
            help='''\
@@ -2549,6 +2712,17 @@ may be provided by plugins.
 '''))
 option_registry.register_lazy('mail_client', 'breezy.mail_client',
                               'opt_mail_client')
+option_registry.register(
+    Option('merge.text_merge_processes', default=0,
+           from_unicode=int_from_store, invalid='warning',
+           help='''\
+How many processes to use for merging file texts.
+
+With this set, the three-way merges of the texts of changed files are done
+by this many worker processes while the rest of the merge carries on. Merge
+hooks still run in order in the main process. Only used on platforms that
+support fork. 0 does it all in a single process.
+'''))
 option_registry.register(
     Option('output_encoding',
            help='Unicode encoding for output'
@@ -2599,6 +2773,16 @@ The default value for ``push --strict``.
 If present, defines the ``--strict`` option default value for checking
 uncommitted changes before sending a merge directive.
 '''))
+option_registry.register(
+    Option('repository.bloom_filters', default=False,
+           from_unicode=bool_from_store,
+           help='''\
+Write and use bloom filters for pack indices?
+
+If true, a bloom filter of the keys in each new pack index is stored next
+to it, and lookups skip packs whose filter shows they can't contain a key.
+This avoids reading index pages for keys that are absent from most packs.
+'''))
 option_registry.register(
     Option('repository.fdatasync', default=True,
            from_unicode=bool_from_store,
@@ -2632,11 +2816,50 @@ If present, defines the ``--strict`` option default value for checking
 uncommitted changes before sending a bundle.
 '''))
 
+option_registry.register(
+    Option('serve.accept_backlog',
+           default=1, from_unicode=int_from_store, invalid='warning',
+           help="""\
+How many connections the smart server leaves pending before refusing more.
+
+This is the backlog of connections the operating system keeps for the
+listening socket of ``brz serve`` until they are accepted.
+"""))
 option_registry.register(
     Option('serve.client_timeout',
            default=300.0, from_unicode=float_from_store,
            help="If we wait for a new request from a client for more than"
                 " X seconds, consider the client idle, and hangup."))
+option_registry.register(
+    Option('serve.max_connection_time',
+           default=0.0, from_unicode=float_from_store, invalid='warning',
+           help="""\
+How long (in seconds) a smart server connection may stay open.
+
+Once a connection has been open for longer than this, it is closed after
+its current request has been served. 0 means no limit.
+"""))
+option_registry.register(
+    Option('serve.max_connections',
+           default=0, from_unicode=int_from_store, invalid='warning',
+           help="""\
+How many connections the smart server serves at once.
+
+Each connection is served by its own thread, so this bounds the threads and
+memory used by ``brz serve``. Up to as many connections again are accepted
+and wait for a connection to finish, further ones are left pending (see
+``serve.accept_backlog``). 0 means no limit.
+"""))
+option_registry.register(
+    Option('serve.metrics_log_interval',
+           default=0.0, from_unicode=float_from_store, invalid='warning',
+           help="""\
+How often (in seconds) the smart server logs its metrics.
+
+The metrics are the number of active and queued connections and a histogram
+of the time taken by each kind of request. They are written to the log file.
+0 means never.
+"""))
 option_registry.register(
     Option('ssh',
            default=None, override_from_env=['BRZ_SSH'],
@@ -165,6 +165,56 @@ def _export_iter_entries(tree, subdir, skip_special=True):
         yield final_path, path, entry
 
 
+# Maximum number of files, and their total size, to read from the tree at
+# once in _export_iter_contents.
+_PREFETCH_FILES = 100
+_PREFETCH_BYTES = 32 << 20
+
+
+def _export_iter_contents(tree, subdir, skip_special=True):
+    """Iter the entries for tree suitable for exporting, with file texts.
+
+    File texts are read in batches with tree.iter_files_bytes, so that the
+    repository can read them in the order it stores them in rather than one
+    by one.
+
+    :param tree: A tree object.
+    :param subdir: None or the path of an entry to start exporting from.
+    :param skip_special: Whether to skip .bzr files.
+    :return: iterator over tuples with final path, tree path, inventory
+        entry and, for files, the text of the file (None for other kinds)
+    """
+    batch = []
+    num_files = 0
+    num_bytes = 0
+    for final_path, tree_path, entry in _export_iter_entries(
+            tree, subdir, skip_special):
+        batch.append((final_path, tree_path, entry))
+        if entry.kind != 'file':
+            continue
+        num_files += 1
+        num_bytes += getattr(entry, 'text_size', None) or 0
+        if num_files >= _PREFETCH_FILES or num_bytes >= _PREFETCH_BYTES:
+            for item in _fetch_contents(tree, batch):
+                yield item
+            batch = []
+            num_files = 0
+            num_bytes = 0
+    for item in _fetch_contents(tree, batch):
+        yield item
+
+
+def _fetch_contents(tree, batch):
+    texts = {}
+    to_fetch = [(tree_path, tree_path)
+                for (final_path, tree_path, entry) in batch
+                if entry.kind == 'file']
+    for tree_path, chunks in tree.iter_files_bytes(to_fetch):
+        texts[tree_path] = b''.join(chunks)
+    for final_path, tree_path, entry in batch:
+        yield final_path, tree_path, entry, texts.pop(tree_path, None)
+
+
 def dir_exporter_generator(tree, dest, root, subdir=None,
                            force_mtime=None, fileobj=None):
     """Return a generator that exports this tree to a new directory.
@@ -0,0 +1,555 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""A daemon that keeps track of the files changed in working trees.
+
+Comparing a large working tree with its basis means calling stat on every
+file in it. The fsmonitor daemon watches the trees it is asked about with
+inotify and remembers which paths changed, so that commands only need to
+look at those.
+
+Clients talk to the daemon over a unix socket. Each request and response is
+a bencoded list, and each connection carries a single request. A client
+asks for the paths that changed in a tree since a token the daemon handed
+out earlier, and gets back a new token along with the paths. If the daemon
+can't tell (because it wasn't watching the tree yet, was restarted, or lost
+events) it says so, and the client has to look at the whole tree.
+"""
+
+import errno
+import os
+import selectors
+import socket
+
+from . import (
+    bedding,
+    errors,
+    osutils,
+    trace,
+    )
+from .bencode import bdecode, bencode
+from .commands import Command
+from .i18n import gettext
+from .option import Option
+
+
+# Directories whose contents never count as changes to the tree.
+CONTROL_DIRS = ('.bzr',)
+
+# How long clients wait for the daemon, in seconds.
+_CLIENT_TIMEOUT = 5.0
+
+# How often the daemon checks whether it has been asked to stop, in seconds.
+_POLL_INTERVAL = 0.5
+
+
+class FSMonitorError(errors.BzrError):
+
+    _fmt = ('Unable to talk to the fsmonitor daemon at %(socket_path)s: '
+            '%(error)s')
+
+    def __init__(self, socket_path, error):
+        errors.BzrError.__init__(self, socket_path=socket_path, error=error)
+
+
+def default_socket_path():
+    """Return the path of the socket the daemon listens on by default."""
+    return osutils.pathjoin(bedding.cache_dir(), 'fsmonitor.sock')
+
+
+def socket_path_from_config(config_stack):
+    """Return the path of the daemon socket configured in config_stack."""
+    path = config_stack.get('fsmonitor.socket')
+    if path is None:
+        path = default_socket_path()
+    return path
+
+
+class DirtyPathLog(object):
+    """The paths that changed in a tree, numbered in the order they changed.
+
+    :ivar sequence: The number of the latest change.
+    """
+
+    def __init__(self):
+        self.sequence = 0
+        # Changes numbered before this are not known.
+        self._complete_from = 0
+        self._changed = {}
+        # Whether changes to every directory in the tree are reported.
+        self._watched = True
+
+    def mark_dirty(self, relpath):
+        """Record that relpath changed."""
+        self.sequence += 1
+        self._changed[relpath] = self.sequence
+
+    def mark_all_dirty(self):
+        """Record that anything may have changed, e.g. if events were lost."""
+        self.sequence += 1
+        self._complete_from = self.sequence
+        self._changed.clear()
+
+    def mark_unwatched(self):
+        """Record that some changes won't be reported from now on.
+
+        This is the case if a directory in the tree couldn't be watched.
+        """
+        self.mark_all_dirty()
+        self._watched = False
+
+    def changes_since(self, sequence):
+        """Return the paths that changed after change number sequence.
+
+        :return: A set of paths, or None if what changed is not known.
+        """
+        if not self._watched:
+            return None
+        if sequence < self._complete_from or sequence > self.sequence:
+            return None
+        return set(path for path, changed in self._changed.items()
+                   if changed > sequence)
+
+
+class InotifyWatcher(object):
+    """Watch trees with inotify, recording changes in their DirtyPathLogs."""
+
+    def __init__(self):
+        try:
+            import pyinotify
+        except ImportError as e:
+            raise errors.DependencyNotPresent('pyinotify', e)
+        self._pyinotify = pyinotify
+        self._mask = (
+            pyinotify.IN_CREATE | pyinotify.IN_MODIFY |
+            pyinotify.IN_CLOSE_WRITE | pyinotify.IN_ATTRIB |
+            pyinotify.IN_DELETE | pyinotify.IN_MOVED_FROM |
+            pyinotify.IN_MOVED_TO | pyinotify.IN_DELETE_SELF |
+            pyinotify.IN_MOVE_SELF | pyinotify.IN_Q_OVERFLOW)
+        self._logs = {}
+        self._wm = pyinotify.WatchManager()
+        self._notifier = pyinotify.Notifier(self._wm, self._process_event)
+
+    def fileno(self):
+        return self._wm.get_fd()
+
+    def add_tree(self, root, log):
+        """Start watching the tree at root.
+
+        If some directories can't be watched, e.g. because
+        fs.inotify.max_user_watches was reached, the tree is not watched
+        and log is marked as unwatched.
+        """
+        excluded = set(osutils.pathjoin(root, name) for name in CONTROL_DIRS)
+        excluded_prefixes = tuple(path + '/' for path in excluded)
+        wds = self._wm.add_watch(
+            root, self._mask, rec=True, auto_add=True,
+            exclude_filter=lambda path: (
+                path in excluded or path.startswith(excluded_prefixes)))
+        # pyinotify uses -2 for the excluded directories.
+        failed = [path for path, wd in wds.items() if wd < 0 and wd != -2]
+        if failed:
+            trace.mutter('fsmonitor could not watch %s, e.g. %s',
+                         root, failed[0])
+            self._wm.rm_watch(
+                [wd for wd in wds.values() if wd >= 0], quiet=True)
+            log.mark_unwatched()
+            return
+        self._logs[root] = log
+
+    def process_events(self):
+        """Record the changes the kernel has queued up."""
+        if self._notifier.check_events(timeout=0):
+            self._notifier.read_events()
+        self._notifier.process_events()
+
+    def _process_event(self, event):
+        if event.mask & self._pyinotify.IN_Q_OVERFLOW:
+            for log in self._logs.values():
+                log.mark_all_dirty()
+            return
+        path = event.pathname
+        root = path
+        while root not in self._logs:
+            parent = os.path.dirname(root)
+            if parent == root:
+                return
+            root = parent
+        log = self._logs[root]
+        if root == path:
+            if event.mask & (self._pyinotify.IN_DELETE_SELF |
+                             self._pyinotify.IN_MOVE_SELF):
+                log.mark_all_dirty()
+            return
+        relpath = path[len(root):].lstrip('/')
+        if relpath.split('/', 1)[0] in CONTROL_DIRS:
+            return
+        if (event.dir and event.mask & self._pyinotify.IN_CREATE and
+                self._wm.get_wd(path) is None and os.path.isdir(path)):
+            # The new directory couldn't be watched, and wasn't just removed
+            # again.
+            trace.mutter('fsmonitor could not watch %s', path)
+            log.mark_unwatched()
+        log.mark_dirty(relpath)
+
+
+class FSMonitorServer(object):
+    """The fsmonitor daemon.
+
+    The daemon is single threaded: it handles one request at a time, and
+    catches up with the pending filesystem events before answering each one.
+    """
+
+    def __init__(self, socket_path, watcher=None):
+        """Create a FSMonitorServer.
+
+        :param socket_path: The path of the unix socket to listen on.
+        :param watcher: The object watching the trees for changes, an
+            InotifyWatcher by default.
+        """
+        if watcher is None:
+            watcher = InotifyWatcher()
+        self.socket_path = socket_path
+        self._watcher = watcher
+        self._logs = {}
+        self._server_id = osutils.rand_chars(16).encode('ascii')
+        self._socket = None
+        self._stopping = False
+
+    def start(self):
+        """Start listening on the socket.
+
+        :raises errors.CommandError: If another daemon is listening on it.
+        """
+        if os.path.exists(self.socket_path):
+            try:
+                FSMonitorClient(self.socket_path).status()
+            except FSMonitorError:
+                # Left behind by a daemon that didn't shut down cleanly.
+                os.unlink(self.socket_path)
+            else:
+                raise errors.CommandError(gettext(
+                    'An fsmonitor daemon is already running at %s.')
+                    % self.socket_path)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.bind(self.socket_path)
+        self._socket.listen(5)
+
+    def stop(self):
+        """Ask serve() to return."""
+        self._stopping = True
+
+    def serve(self):
+        """Handle requests until stopped."""
+        selector = selectors.DefaultSelector()
+        selector.register(self._socket, selectors.EVENT_READ)
+        watcher_fd = self._watcher.fileno()
+        if watcher_fd is not None:
+            selector.register(watcher_fd, selectors.EVENT_READ)
+        try:
+            while not self._stopping:
+                for key, _ in selector.select(_POLL_INTERVAL):
+                    if key.fileobj is self._socket:
+                        conn, _ = self._socket.accept()
+                        try:
+                            self._handle_connection(conn)
+                        finally:
+                            conn.close()
+                    else:
+                        self._watcher.process_events()
+        finally:
+            selector.close()
+            self._socket.close()
+            try:
+                os.unlink(self.socket_path)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+
+    def _handle_connection(self, conn):
+        conn.settimeout(_CLIENT_TIMEOUT)
+        try:
+            chunks = []
+            while True:
+                chunk = conn.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            try:
+                request = bdecode(b''.join(chunks))
+                handler = getattr(self, '_do_' + request[0].decode('ascii'))
+                response = handler(*request[1:])
+            except Exception as e:
+                trace.mutter('fsmonitor request failed: %s', e)
+                response = [b'error', str(e).encode('utf-8')]
+            conn.sendall(bencode(response))
+        except (OSError, socket.error) as e:
+            trace.mutter('fsmonitor connection failed: %s', e)
+
+    def _make_token(self, log):
+        return b'%s:%d' % (self._server_id, log.sequence)
+
+    def _parse_token(self, token):
+        """Return the change number in token, or None if not ours."""
+        server_id, _, sequence = token.partition(b':')
+        if server_id != self._server_id:
+            return None
+        try:
+            return int(sequence)
+        except ValueError:
+            return None
+
+    def _do_query(self, root, token):
+        root = root.decode('utf-8')
+        self._watcher.process_events()
+        log = self._logs.get(root)
+        if log is None:
+            log = DirtyPathLog()
+            self._watcher.add_tree(root, log)
+            self._logs[root] = log
+            changes = None
+        else:
+            sequence = self._parse_token(token)
+            if sequence is None:
+                changes = None
+            else:
+                changes = log.changes_since(sequence)
+        if changes is None:
+            return [b'fresh', self._make_token(log)]
+        return [b'changes', self._make_token(log),
+                sorted(path.encode('utf-8') for path in changes)]
+
+    def _do_status(self):
+        return [b'trees', [[root.encode('utf-8'), log.sequence]
+                           for root, log in sorted(self._logs.items())]]
+
+    def _do_stop(self):
+        self.stop()
+        return [b'stopping']
+
+
+class FSMonitorClient(object):
+    """A connection to the fsmonitor daemon."""
+
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+
+    def _call(self, *args):
+        try:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        except (AttributeError, OSError, socket.error) as e:
+            raise FSMonitorError(self.socket_path, e)
+        try:
+            sock.settimeout(_CLIENT_TIMEOUT)
+            sock.connect(self.socket_path)
+            sock.sendall(bencode(list(args)))
+            sock.shutdown(socket.SHUT_WR)
+            chunks = []
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        except (OSError, socket.error) as e:
+            raise FSMonitorError(self.socket_path, e)
+        finally:
+            sock.close()
+        try:
+            response = bdecode(b''.join(chunks))
+        except ValueError as e:
+            raise FSMonitorError(self.socket_path, e)
+        if response[0] == b'error':
+            raise FSMonitorError(
+                self.socket_path, response[1].decode('utf-8', 'replace'))
+        return response
+
+    def query(self, root, token):
+        """Ask which paths in a tree changed since token.
+
+        The daemon starts watching the tree if it isn't already.
+
+        :param root: The absolute path of the tree.
+        :param token: A token returned by an earlier query, or None.
+        :return: A tuple with a new token and a set of the paths relative to
+            root that changed, or None instead of the set if anything may
+            have changed.
+        """
+        response = self._call(b'query', root.encode('utf-8'), token or b'')
+        if response[0] == b'fresh':
+            return response[1], None
+        return response[1], set(path.decode('utf-8')
+                                for path in response[2])
+
+    def status(self):
+        """Return a list of the roots of the trees the daemon watches."""
+        response = self._call(b'status')
+        return [root.decode('utf-8') for root, _ in response[1]]
+
+    def stop(self):
+        """Ask the daemon to shut down."""
+        self._call(b'stop')
+
+
+class TreeStateFile(object):
+    """What a tree looked like the last time it was compared to its basis.
+
+    This is kept in the tree control directory. It holds the token the
+    daemon handed out just before the comparison, and the paths that were
+    changed or unknown at the time. Any later difference between the tree
+    and its basis is either in those paths, or in paths the daemon reports
+    as changed since the token, or in working tree records that have been
+    changed since. The latter is flagged by the tree when it writes them.
+    """
+
+    FORMAT_HEADER = b'Breezy fsmonitor state 2\n'
+    STATE_NAME = 'fsmonitor-state'
+
+    def __init__(self, transport):
+        """Create a TreeStateFile.
+
+        :param transport: The transport for the tree control directory.
+        """
+        self._transport = transport
+
+    def load(self):
+        """Read the state.
+
+        :return: A tuple with the token, a set of paths and whether the
+            working tree records have changed since, or (None, None, None)
+            if there is no valid state.
+        """
+        try:
+            content = self._transport.get_bytes(self.STATE_NAME)
+        except (errors.PathError, errors.TransportNotPossible):
+            return None, None, None
+        if not content.startswith(self.FORMAT_HEADER):
+            return None, None, None
+        lines = content[len(self.FORMAT_HEADER):].split(b'\n', 2)
+        if len(lines) != 3 or lines[1] not in (b'', b'entries-changed'):
+            return None, None, None
+        token, flag, paths = lines
+        try:
+            paths = set(path.decode('utf-8')
+                        for path in paths.split(b'\0') if path)
+        except UnicodeDecodeError:
+            return None, None, None
+        return token, paths, bool(flag)
+
+    def save(self, token, paths):
+        """Save the state.
+
+        :param token: The token the daemon handed out before the comparison.
+        :param paths: The paths that were changed or unknown.
+        """
+        self._put(token, paths, False)
+
+    def mark_entries_changed(self):
+        """Note that the working tree records are being changed.
+
+        This does nothing if there is no state, as the next comparison will
+        look at the whole tree anyway.
+        """
+        token, paths, entries_changed = self.load()
+        if paths is not None and not entries_changed:
+            self._put(token, paths, True)
+
+    def _put(self, token, paths, entries_changed):
+        if entries_changed:
+            flag = b'entries-changed'
+        else:
+            flag = b''
+        data = b''.join([self.FORMAT_HEADER, token, b'\n', flag, b'\n',
+                         b'\0'.join(sorted(path.encode('utf-8')
+                                           for path in paths))])
+        try:
+            self._transport.put_bytes(self.STATE_NAME, data)
+        except (errors.PathError, errors.TransportNotPossible) as e:
+            trace.mutter('unable to write fsmonitor state: %s', e)
+
+
+def _detach():
+    """Fork a daemon process.
+
+    :return: The pid of the daemon in the parent, and 0 in the daemon.
+    """
+    pid = os.fork()
+    if pid:
+        return pid
+    os.setsid()
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    os.close(devnull)
+    return 0
+
+
+class cmd_fsmonitor(Command):
+    __doc__ = """Control the filesystem monitor daemon.
+
+    The daemon watches working trees for changes, so that commands like
+    status and commit only need to look at the files that changed rather
+    than at every file in the tree. It is used by working trees that have
+    the bzr.workingtree.fsmonitor option set, and starts watching a tree the
+    first time it is used there. It needs the pyinotify library.
+
+    The actions are:
+
+      start   Start the daemon.
+      stop    Stop the daemon.
+      status  List the trees the daemon is watching.
+    """
+
+    takes_args = ['action']
+    takes_options = [
+        Option('foreground',
+               help="Don't detach from the terminal when starting."),
+        ]
+
+    def run(self, action, foreground=False):
+        from .config import GlobalStack
+        socket_path = socket_path_from_config(GlobalStack())
+        if action == 'start':
+            if getattr(socket, 'AF_UNIX', None) is None:
+                raise errors.CommandError(gettext(
+                    'fsmonitor is not supported on this platform.'))
+            server = FSMonitorServer(socket_path)
+            server.start()
+            if foreground:
+                server.serve()
+                return
+            pid = _detach()
+            if pid:
+                self.outf.write(gettext('fsmonitor started, pid %d\n') % pid)
+                return
+            try:
+                server.serve()
+            finally:
+                os._exit(0)
+        elif action == 'stop':
+            FSMonitorClient(socket_path).stop()
+        elif action == 'status':
+            try:
+                roots = FSMonitorClient(socket_path).status()
+            except FSMonitorError:
+                self.outf.write(gettext('fsmonitor is not running\n'))
+                return 1
+            self.outf.write(gettext('fsmonitor is watching %d trees\n')
+                            % len(roots))
+            for root in roots:
+                self.outf.write('  %s\n' % root)
+        else:
+            raise errors.CommandError(
+                gettext('Unknown action: %s') % action)
@@ -249,6 +249,8 @@ plugin_cmds.register_lazy("cmd_git_object", ["git-objects", "git-cat"],
                           __name__ + ".commands")
 plugin_cmds.register_lazy("cmd_git_refs", [], __name__ + ".commands")
 plugin_cmds.register_lazy("cmd_git_apply", [], __name__ + ".commands")
+plugin_cmds.register_lazy("cmd_git_cache_compact", [],
+                          __name__ + ".commands")
 plugin_cmds.register_lazy("cmd_git_push_pristine_tar_deltas",
                           ['git-push-pristine-tar', 'git-push-pristine'],
                           __name__ + ".commands")
@@ -439,8 +441,20 @@ from ..config import (
     option_registry,
     Option,
     bool_from_store,
+    int_from_store,
     )
 
+option_registry.register(
+    Option('git.file_history_index',
+           default=False, from_unicode=bool_from_store, invalid='warning',
+           help='''\
+Keep an index of the commits that changed each file in Git repositories.
+
+The index is built the first time it is needed and then updated with new
+commits. It speeds up 'brz log FILE' and 'brz annotate', which otherwise
+have to compare the trees of many commits. The index is kept in the
+'bzr-file-history' directory of the .git directory.
+'''))
 option_registry.register(
     Option('git.http',
            default=None, from_unicode=bool_from_store, invalid='warning',
@@ -449,6 +463,27 @@ Allow fetching of Git packs over HTTP.
 
 This enables support for fetching Git packs over HTTP in Loggerhead.
 '''))
+option_registry.register(
+    Option('git.export_threads',
+           default=0, from_unicode=int_from_store, invalid='warning',
+           help='''\
+How many threads to use for hashing Git blobs when exporting revisions.
+
+With this set, the SHA1s of Git blobs are computed in this many threads while
+the next file texts are read from the repository, e.g. when pushing to a Git
+repository. 0 does it all in a single thread.
+'''))
+option_registry.register(
+    Option('git.mmap_cache',
+           default=False, from_unicode=bool_from_store, invalid='warning',
+           help='''\
+Create new Git SHA map caches in the mmap format.
+
+This format keeps the cache in sorted tables that are mapped into memory,
+which makes lookups faster than in the default format. New entries are
+appended to a log; use 'brz git-cache-compact' to merge the log and tables.
+Existing caches keep their format.
+'''))
 
 
 def test_suite():
@@ -20,8 +20,14 @@ from dulwich.objects import (
     sha_to_hex,
     hex_to_sha,
     )
+from collections import OrderedDict
+import errno
+import mmap
 import os
+import struct
 import threading
+import time
+import zlib
 
 from dulwich.objects import (
     ShaFile,
@@ -30,6 +36,7 @@ from dulwich.objects import (
 from .. import (
     bedding,
     errors as bzr_errors,
+    lock,
     osutils,
     registry,
     trace,
@@ -200,7 +207,11 @@ class BzrGitCacheFormat(object):
             format_name = transport.get_bytes('format')
             format = formats.get(format_name)
         except bzr_errors.NoSuchFile:
-            format = formats.get('default')
+            from ..config import GlobalStack
+            if GlobalStack().get('git.mmap_cache'):
+                format = MmapGitCacheFormat()
+            else:
+                format = formats.get('default')
             format.initialize(transport)
         return format.open(transport)
 
@@ -968,6 +979,569 @@ class IndexGitShaMap(GitShaMap):
             yield key[1]
 
 
+class MmapCacheUpdater(CacheUpdater):
+    """Cache updater for mmap-based caches."""
+
+    def __init__(self, cache, rev):
+        self.cache = cache
+        self.revid = rev.revision_id
+        self.parent_revids = rev.parent_ids
+        self._commit = None
+        self._entries = []
+
+    def add_object(self, obj, bzr_key_data, path):
+        if isinstance(obj, tuple):
+            (type_name, hexsha) = obj
+            sha = hex_to_sha(hexsha)
+        else:
+            type_name = obj.type_name.decode('ascii')
+            sha = obj.sha().digest()
+        if type_name == "commit":
+            if type(bzr_key_data) is not dict:
+                raise TypeError(bzr_key_data)
+            type_data = (self.revid, obj.tree)
+            try:
+                type_data += (bzr_key_data["testament3-sha1"],)
+            except KeyError:
+                pass
+            self._commit = obj
+        elif type_name in ("blob", "tree"):
+            if bzr_key_data is None:
+                return
+            type_data = bzr_key_data
+        else:
+            raise AssertionError
+        self._entries.append(
+            (sha, b"\0".join((type_name.encode('ascii'),) + type_data)))
+
+    def finish(self):
+        if self._commit is None:
+            raise AssertionError("No commit object added")
+        self.cache.idmap._add_entries(self._entries)
+        return self._commit
+
+
+def MmapBzrGitCache(p):
+    return BzrGitCache(MmapGitShaMap(p), MmapCacheUpdater)
+
+
+class MmapGitCacheFormat(BzrGitCacheFormat):
+    """Cache format for mmap-based caches."""
+
+    def get_format_string(self):
+        return b'bzr-git sha map version 1 using mmap\n'
+
+    def open(self, transport):
+        try:
+            basepath = transport.local_abspath(".")
+        except bzr_errors.NotLocalUrl:
+            basepath = get_cache_dir()
+        return MmapBzrGitCache(os.path.join(basepath, "idmap.mmap"))
+
+
+def _entry_key(data):
+    """Return the key for looking up the sha of an entry by its bzr ids.
+
+    :param data: The type and type data of an entry, NULL separated.
+    :return: A 20 byte key, or None if the entry can not be looked up.
+    """
+    fields = data.split(b"\0")
+    if fields[0] == b"commit":
+        fields = fields[:2]
+    elif fields[0] not in (b"blob", b"tree"):
+        return None
+    return osutils.sha(b"\0".join(fields)).digest()
+
+
+def _parse_entry(data):
+    """Parse the type and type data of an entry."""
+    fields = data.split(b"\0")
+    type_name = fields[0].decode('ascii')
+    if type_name == "commit":
+        if len(fields) == 3:
+            return (type_name, (fields[1], fields[2], {}))
+        else:
+            return (type_name, (fields[1], fields[2],
+                                {"testament3-sha1": fields[3]}))
+    elif type_name in ("tree", "blob"):
+        return (type_name, tuple(fields[1:]))
+    else:
+        raise AssertionError("unknown type %r" % type_name)
+
+
+class MmapGitShaTable(object):
+    """A read-only table of git shas, mapped into memory.
+
+    Like a git pack index, the table starts with fanouts that give the
+    number of rows whose first byte is at most each byte value, followed by
+    fixed width rows sorted by sha, so a sha can be found by a binary search
+    in a small part of the table.
+
+    The file holds:
+
+    * TABLE_SIGNATURE
+    * the number of objects and of keys, as 32 bit integers
+    * the fanout of the objects and the fanout of the keys, 256 32 bit
+      integers each
+    * the objects: a 20 byte git sha and the 64 bit offset of its entry in
+      the data. A sha can have several entries.
+    * the keys: a 20 byte key (see _entry_key) and the 20 byte git sha of
+      the object with those bzr ids.
+    * the data: the type and type data of each entry, NULL separated and
+      preceded by their length as a 32 bit integer.
+
+    All integers are big endian.
+    """
+
+    TABLE_SIGNATURE = b'bzr-git sha map table 1\n'
+
+    _HEADER = struct.Struct('>II')
+    _FANOUT = struct.Struct('>256I')
+    _OBJECT = struct.Struct('>20sQ')
+    _KEY = struct.Struct('>20s20s')
+    _LENGTH = struct.Struct('>I')
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        mm = self._mmap
+        pos = len(self.TABLE_SIGNATURE)
+        if mm[:pos] != self.TABLE_SIGNATURE:
+            raise ValueError("not a git sha map table")
+        self._num_objects, self._num_keys = self._HEADER.unpack_from(mm, pos)
+        pos += self._HEADER.size
+        self._object_fanout = self._FANOUT.unpack_from(mm, pos)
+        pos += self._FANOUT.size
+        self._key_fanout = self._FANOUT.unpack_from(mm, pos)
+        pos += self._FANOUT.size
+        self._objects_start = pos
+        self._keys_start = pos + self._num_objects * self._OBJECT.size
+        self._data_start = self._keys_start + self._num_keys * self._KEY.size
+        if (self._object_fanout[-1] != self._num_objects or
+                self._key_fanout[-1] != self._num_keys or
+                len(mm) < self._data_start):
+            raise ValueError("truncated git sha map table")
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self.path)
+
+    def _bisect(self, fanout, start, width, sha):
+        """Find the first row in a fanout table that is at or after sha.
+
+        :return: The index of the row, and the index after the last row
+            whose sha has the same first byte.
+        """
+        mm = self._mmap
+        first = sha[0]
+        lo = fanout[first - 1] if first else 0
+        end = hi = fanout[first]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            pos = start + mid * width
+            if mm[pos:pos + 20] < sha:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo, end
+
+    def _data(self, offset):
+        pos = self._data_start + offset
+        (length,) = self._LENGTH.unpack_from(self._mmap, pos)
+        pos += self._LENGTH.size
+        return self._mmap[pos:pos + length]
+
+    def lookup_object(self, sha):
+        """Return the entries for a binary git sha."""
+        index, end = self._bisect(
+            self._object_fanout, self._objects_start, self._OBJECT.size, sha)
+        ret = []
+        while index < end:
+            row_sha, offset = self._OBJECT.unpack_from(
+                self._mmap, self._objects_start + index * self._OBJECT.size)
+            if row_sha != sha:
+                break
+            ret.append(self._data(offset))
+            index += 1
+        return ret
+
+    def lookup_key(self, key):
+        """Return the binary git sha for a key, or None."""
+        index, end = self._bisect(
+            self._key_fanout, self._keys_start, self._KEY.size, key)
+        if index < end:
+            row_key, sha = self._KEY.unpack_from(
+                self._mmap, self._keys_start + index * self._KEY.size)
+            if row_key == key:
+                return sha
+        return None
+
+    def iter_objects(self):
+        """Iterate over the binary shas and entries, in sha order."""
+        for (sha, offset) in self._OBJECT.iter_unpack(
+                self._mmap[self._objects_start:self._keys_start]):
+            yield sha, self._data(offset)
+
+
+def write_mmap_table(path, entries):
+    """Write a table for MmapGitShaTable.
+
+    :param path: Directory to write the table to. Its name is derived from
+        its contents.
+    :param entries: Set of binary sha and entry data tuples.
+    :return: Name of the new table.
+    """
+    entries = sorted(entries)
+    keys = {}
+    data = []
+    objects = []
+    offset = 0
+    table = MmapGitShaTable
+    for sha, entry in entries:
+        key = _entry_key(entry)
+        if key is not None:
+            keys[key] = sha
+        objects.append(table._OBJECT.pack(sha, offset))
+        data.append(table._LENGTH.pack(len(entry)))
+        data.append(entry)
+        offset += table._LENGTH.size + len(entry)
+    keys = sorted(keys.items())
+
+    def fanout(shas):
+        counts = [0] * 256
+        for sha in shas:
+            counts[sha[0]] += 1
+        total = 0
+        for i, count in enumerate(counts):
+            total += count
+            counts[i] = total
+        return table._FANOUT.pack(*counts)
+    chunks = [table.TABLE_SIGNATURE,
+              table._HEADER.pack(len(objects), len(keys)),
+              fanout(sha for (sha, entry) in entries),
+              fanout(key for (key, sha) in keys)]
+    chunks.extend(objects)
+    chunks.extend(table._KEY.pack(key, sha) for (key, sha) in keys)
+    chunks.extend(data)
+    content = b"".join(chunks)
+    name = osutils.sha(content).hexdigest() + ".tab"
+    tmp_path = os.path.join(path, name + ".tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    osutils.rename(tmp_path, os.path.join(path, name))
+    return name
+
+
+class MmapGitShaMap(GitShaMap):
+    """SHA Map that stores its entries in tables mapped into memory.
+
+    Entries are first appended to a log, which is read into memory when the
+    map is opened. Once the log gets larger than LOG_MAX_SIZE it is written
+    out as a MmapGitShaTable. 'brz git-cache-compact' merges the log and all
+    tables into a single table.
+
+    The log starts with LOG_HEADER. Each write group is appended as a line
+    with the length and crc32 of its data, followed by the data and a
+    newline; the data has a line with the hex sha and the entry for every
+    object. A record that is cut short ends the log.
+
+    Appending to the log and writing tables is done with the 'lock' file in
+    the directory locked, so that processes don't lose each other's entries.
+    Reading doesn't need the lock.
+    """
+
+    LOG_HEADER = b'bzr-git sha map log 1\n'
+    LOG_MAX_SIZE = 4 * 1024 * 1024
+    # How long to wait for another process to finish writing, in seconds.
+    LOCK_TIMEOUT = 300
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            os.mkdir(path)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        self._tables = {}
+        self._log_size = 0
+        self._log_objects = {}
+        self._log_keys = {}
+        self._pending = None
+        self._pending_objects = {}
+        self._pending_keys = {}
+        self._refresh()
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self.path)
+
+    def _refresh(self):
+        """Pick up tables and log records written since we last looked."""
+        names = set(name for name in os.listdir(self.path)
+                    if name.endswith(".tab"))
+        for name in set(self._tables) - names:
+            # Other users may still be iterating over the table, so leave
+            # closing it to the garbage collector.
+            del self._tables[name]
+        for name in names - set(self._tables):
+            try:
+                self._tables[name] = MmapGitShaTable(
+                    os.path.join(self.path, name))
+            except (IOError, OSError) as e:
+                # Removed by a concurrent compaction?
+                if e.errno != errno.ENOENT:
+                    raise
+            except ValueError as e:
+                trace.warning("Ignoring invalid git sha map table %s: %s",
+                              name, e)
+        self._read_log()
+
+    def _read_log(self):
+        self._log_size = 0
+        self._log_objects = {}
+        self._log_keys = {}
+        try:
+            with open(os.path.join(self.path, "log"), 'rb') as f:
+                content = f.read()
+        except (IOError, OSError) as e:
+            if e.errno == errno.ENOENT:
+                return
+            raise
+        if not content.startswith(self.LOG_HEADER):
+            return
+        pos = len(self.LOG_HEADER)
+        while pos < len(content):
+            end_of_line = content.find(b'\n', pos)
+            if end_of_line == -1:
+                break
+            try:
+                length, crc32 = map(int, content[pos:end_of_line].split(b' '))
+            except ValueError:
+                break
+            start = end_of_line + 1
+            data = content[start:start + length]
+            if (len(data) != length or
+                    content[start + length:start + length + 1] != b'\n' or
+                    zlib.crc32(data) != crc32):
+                break
+            for line in data.splitlines():
+                hexsha, entry = line.split(b'\0', 1)
+                self._add_to(self._log_objects, self._log_keys,
+                             hex_to_sha(hexsha), entry)
+            pos = start + length + 1
+        self._log_size = pos
+
+    def _add_to(self, objects, keys, sha, entry):
+        objects.setdefault(sha, []).append(entry)
+        key = _entry_key(entry)
+        if key is not None:
+            keys[key] = sha
+
+    def _lookup_entries(self, sha):
+        ret = []
+        for entries in (self._pending_objects.get(sha, ()),
+                        self._log_objects.get(sha, ())):
+            ret.extend(entries)
+        for table in self._tables.values():
+            ret.extend(table.lookup_object(sha))
+        # The same entry can be in several tables until they are compacted.
+        return list(OrderedDict.fromkeys(ret))
+
+    def _lookup_key(self, key):
+        for keys in (self._pending_keys, self._log_keys):
+            try:
+                return keys[key]
+            except KeyError:
+                pass
+        for table in self._tables.values():
+            sha = table.lookup_key(key)
+            if sha is not None:
+                return sha
+        raise KeyError(key)
+
+    def _add_entries(self, entries):
+        """Add entries, as binary sha and entry data tuples."""
+        entries = [(sha, entry) for (sha, entry) in entries
+                   if entry not in self._lookup_entries(sha)]
+        if self._pending is not None:
+            for sha, entry in entries:
+                self._add_to(self._pending_objects, self._pending_keys,
+                             sha, entry)
+            self._pending.extend(entries)
+        else:
+            self._append_to_log(entries)
+
+    def _lock(self):
+        """Lock the log and tables for writing.
+
+        :return: A lock.WriteLock, to be unlocked once done.
+        :raises LockContention: If another process still holds the lock
+            after LOCK_TIMEOUT.
+        """
+        path = os.path.join(self.path, "lock")
+        deadline = time.time() + self.LOCK_TIMEOUT
+        while True:
+            try:
+                return lock.WriteLock(path)
+            except bzr_errors.LockContention:
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.1)
+
+    def _append_to_log(self, entries):
+        if not entries:
+            return
+        data = b"".join(b"%s\0%s\n" % (sha_to_hex(sha), entry)
+                        for (sha, entry) in entries)
+        path = os.path.join(self.path, "log")
+        write_lock = self._lock()
+        try:
+            # Pick up what other processes wrote before we had the lock.
+            self._refresh()
+            with open(path, 'r+b' if self._log_size else 'wb') as f:
+                if self._log_size:
+                    # Drop any record that was cut short.
+                    f.seek(self._log_size)
+                    f.truncate()
+                else:
+                    f.write(self.LOG_HEADER)
+                f.write(b"%d %d\n%s\n" % (len(data), zlib.crc32(data), data))
+                self._log_size = f.tell()
+            for sha, entry in entries:
+                self._add_to(self._log_objects, self._log_keys, sha, entry)
+            if self._log_size > self.LOG_MAX_SIZE:
+                self._write_table(self._iter_log_entries(), [])
+        finally:
+            write_lock.unlock()
+
+    def _iter_log_entries(self):
+        for sha, entries in self._log_objects.items():
+            for entry in entries:
+                yield sha, entry
+
+    def _write_table(self, entries, old_tables):
+        """Write entries to a new table, replacing the log and old_tables.
+
+        The caller must hold the lock from _lock.
+        """
+        name = write_mmap_table(self.path, set(entries))
+        for old_name in [n for n in old_tables if n != name] + ["log"]:
+            try:
+                os.unlink(os.path.join(self.path, old_name))
+            except (IOError, OSError) as e:
+                if e.errno != errno.ENOENT:
+                    raise
+        self._refresh()
+
+    def compact(self):
+        """Merge the log and all tables into a single table."""
+        if self._pending is not None:
+            raise bzr_errors.BzrError('write group open')
+        write_lock = self._lock()
+        try:
+            self._refresh()
+            if not self._log_objects and len(self._tables) <= 1:
+                return
+            tables = list(self._tables.values())
+
+            def iter_entries():
+                for table in tables:
+                    for entry in table.iter_objects():
+                        yield entry
+                for entry in self._iter_log_entries():
+                    yield entry
+            self._write_table(iter_entries(), list(self._tables))
+        finally:
+            write_lock.unlock()
+
+    def start_write_group(self):
+        """Start writing changes."""
+        if self._pending is not None:
+            raise bzr_errors.BzrError('write group already open')
+        self._pending = []
+
+    def commit_write_group(self):
+        """Commit any pending changes."""
+        if self._pending is None:
+            raise bzr_errors.BzrError('write group not open')
+        entries = self._pending
+        self.abort_write_group()
+        self._append_to_log(entries)
+
+    def abort_write_group(self):
+        """Abort any pending changes."""
+        self._pending = None
+        self._pending_objects = {}
+        self._pending_keys = {}
+
+    def lookup_commit(self, revid):
+        try:
+            return sha_to_hex(self._lookup_key(
+                osutils.sha(b"commit\0" + revid).digest()))
+        except KeyError:
+            raise KeyError("No cache entry for %r" % revid)
+
+    def lookup_blob_id(self, fileid, revision):
+        return sha_to_hex(self._lookup_key(
+            osutils.sha(b"\0".join((b"blob", fileid, revision))).digest()))
+
+    def lookup_tree_id(self, fileid, revision):
+        return sha_to_hex(self._lookup_key(
+            osutils.sha(b"\0".join((b"tree", fileid, revision))).digest()))
+
+    def lookup_git_sha(self, sha):
+        """Lookup a Git sha in the database.
+
+        :param sha: Git object sha
+        :return: (type, type_data) with type_data:
+            commit: revid, tree sha, verifiers
+            blob: fileid, revid
+            tree: fileid, revid
+        """
+        if len(sha) == 40:
+            sha = hex_to_sha(sha)
+        entries = self._lookup_entries(sha)
+        if not entries:
+            raise KeyError(sha)
+        for entry in entries:
+            yield _parse_entry(entry)
+
+    def missing_revisions(self, revids):
+        ret = set()
+        for revid in revids:
+            try:
+                self.lookup_commit(revid)
+            except KeyError:
+                ret.add(revid)
+        return ret
+
+    def _iter_all_entries(self):
+        for objects in (self._pending_objects, self._log_objects):
+            for sha, entries in objects.items():
+                for entry in entries:
+                    yield sha, entry
+        for table in list(self._tables.values()):
+            for entry in table.iter_objects():
+                yield entry
+
+    def revids(self):
+        """List the revision ids known."""
+        seen = set()
+        for sha, entry in self._iter_all_entries():
+            if entry.startswith(b"commit\0"):
+                revid = entry.split(b"\0", 2)[1]
+                if revid not in seen:
+                    seen.add(revid)
+                    yield revid
+
+    def sha1s(self):
+        """List the SHA1s."""
+        seen = set()
+        for sha, entry in self._iter_all_entries():
+            if sha not in seen:
+                seen.add(sha)
+                yield sha_to_hex(sha)
+
+
 formats = registry.Registry()
 formats.register(TdbGitCacheFormat().get_format_string(),
                  TdbGitCacheFormat())
@@ -975,6 +1549,8 @@ formats.register(SqliteGitCacheFormat().get_format_string(),
                  SqliteGitCacheFormat())
 formats.register(IndexGitCacheFormat().get_format_string(),
                  IndexGitCacheFormat())
+formats.register(MmapGitCacheFormat().get_format_string(),
+                 MmapGitCacheFormat())
 # In the future, this will become the default:
 formats.register('default', IndexGitCacheFormat())
 
@@ -293,6 +293,48 @@ class cmd_git_apply(Command):
                     self._apply_patch(tree, f, signoff=signoff)
 
 
+class cmd_git_cache_compact(Command):
+    """Compact the Git SHA map cache of a repository.
+
+    Caches in the mmap format append new entries to a log, which is
+    regularly written out as a new table. This merges the log and all tables
+    into a single table, which makes lookups faster.
+    """
+
+    hidden = True
+
+    takes_options = [Option('directory',
+                            short_name='d',
+                            help='Location of repository.', type=str)]
+
+    def run(self, directory="."):
+        from ..controldir import (
+            ControlDir,
+            )
+        from ..errors import (
+            CommandError,
+            )
+        from ..i18n import gettext
+        from .cache import (
+            from_repository,
+            )
+        from .repository import (
+            GitRepository,
+            )
+        controldir, _ = ControlDir.open_containing(directory)
+        repo = controldir.find_repository()
+        if isinstance(repo, GitRepository):
+            raise CommandError(
+                gettext("Git repositories do not have a SHA map cache."))
+        with repo.lock_read():
+            idmap = from_repository(repo).idmap
+            if getattr(idmap, "compact", None) is None:
+                raise CommandError(
+                    gettext("The SHA map cache %r can not be compacted.") %
+                    idmap)
+            idmap.compact()
+
+
 class cmd_git_push_pristine_tar_deltas(Command):
     """Push pristine tar deltas to a git repository."""
 
@@ -0,0 +1,266 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""An index of the commits that changed each path in a Git repository.
+
+Git doesn't record which commits changed a file; finding them means comparing
+the trees of every commit with those of its parents. This index records the
+result of that comparison, so that 'brz log FILE' and annotate only have to
+look at the commits that changed the file.
+
+The index is kept in BTree index files in the 'bzr-file-history' directory
+of the repository's control directory, with these keys:
+
+("commit", <commit sha>) -> "" for every commit that has been indexed
+(<sha1 of path>, <commit sha>) -> "" for every commit that changed path
+
+A commit is only indexed together with all of its ancestors, so an indexed
+commit has a complete history. Each update writes a new index file; the files
+are combined once there are more than MAX_INDEX_FILES of them. Other processes
+may then find the files they were reading gone, in which case they reload the
+list of index files.
+
+Only files, symlinks and submodules are indexed, not directories.
+"""
+
+from dulwich.diff_tree import (
+    CHANGE_MODIFY,
+    tree_changes,
+    )
+from dulwich.errors import (
+    NotTreeError,
+    )
+from dulwich.object_store import (
+    tree_lookup_path,
+    )
+
+from .. import (
+    errors,
+    osutils,
+    trace,
+    )
+from ..bzr import (
+    btree_index as _mod_btree_index,
+    index as _mod_index,
+    )
+
+
+MAX_INDEX_FILES = 10
+
+
+def _path_key(path):
+    # Index keys can't contain whitespace, which paths can.
+    return osutils.sha_string(path)
+
+
+def changed_paths(store, commit):
+    """Return the paths of the files changed in a commit.
+
+    A file is changed in a commit if it is different in one of the parents
+    that have it, or if none of the parents have it. This matches the
+    commit GitFileLastChangeScanner picks as the last change of a file.
+
+    :param store: Object store to read the trees from.
+    :param commit: The commit.
+    :return: A set of paths.
+    """
+    parents = []
+    for parent_id in commit.parents:
+        try:
+            parents.append(store[parent_id])
+        except KeyError:
+            # Outside of a shallow clone.
+            pass
+    if not parents:
+        return set(
+            change.new.path
+            for change in tree_changes(store, None, commit.tree))
+    changed = set()
+    # Paths that are new compared to some of the parents, and the parents
+    # they are new in.
+    added = {}
+    for parent in parents:
+        for change in tree_changes(store, parent.tree, commit.tree):
+            if change.new.path is None:
+                continue
+            if change.type == CHANGE_MODIFY:
+                changed.add(change.new.path)
+            else:
+                added.setdefault(change.new.path, []).append(parent)
+    for path, added_in in added.items():
+        if path in changed:
+            continue
+        if len(added_in) == len(parents):
+            changed.add(path)
+            continue
+        # A file that replaces something else in a parent is changed.
+        for parent in added_in:
+            try:
+                tree_lookup_path(store.__getitem__, parent.tree, path)
+            except (NotTreeError, KeyError):
+                continue
+            changed.add(path)
+            break
+    return changed
+
+
+class GitFileHistoryIndex(object):
+    """Index of the commits that changed each path in a Git repository."""
+
+    def __init__(self, store, transport):
+        """Create a GitFileHistoryIndex.
+
+        :param store: The object store of the repository.
+        :param transport: Transport for the directory with the index files.
+        """
+        self.store = store
+        self._transport = transport
+        self._index = _mod_index.CombinedGraphIndex(
+            [], reload_func=self._reload)
+        # The names of the index files in self._index.
+        self._names = []
+        for name in self._list_names():
+            self._add_index_file(name)
+
+    def _list_names(self):
+        return set(name for name in self._transport.list_dir(".")
+                   if name.endswith(".fhx"))
+
+    def _add_index_file(self, name, size=None):
+        if size is None:
+            size = self._transport.stat(name).st_size
+        self._index.insert_index(0, _mod_btree_index.BTreeGraphIndex(
+            self._transport, name, size), name)
+        self._names.append(name)
+
+    def _reload(self):
+        """Pick up the index files added and removed by other processes.
+
+        :return: True if the index files changed.
+        """
+        names = self._list_names()
+        if names == set(self._names):
+            return False
+        removed = set(self._names) - names
+        for pos in reversed(range(len(self._index._indices))):
+            if self._index._index_names[pos] in removed:
+                del self._index._indices[pos]
+                del self._index._index_names[pos]
+        self._names = [name for name in self._names if name not in removed]
+        for name in names.difference(self._names):
+            try:
+                self._add_index_file(name)
+            except errors.NoSuchFile:
+                # Already removed again by another pack.
+                pass
+        return True
+
+    @classmethod
+    def from_repository(cls, repository):
+        transport = repository.controldir.control_transport
+        try:
+            transport.mkdir('bzr-file-history')
+        except errors.FileExists:
+            pass
+        return cls(repository._git.object_store,
+                   transport.clone('bzr-file-history'))
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self._transport.base)
+
+    def _indexed(self, commit_ids):
+        return set(
+            entry[1][1] for entry in
+            self._index.iter_entries([(b"commit", c) for c in commit_ids]))
+
+    def update(self, heads):
+        """Index the commits in the ancestry of heads that aren't yet.
+
+        :param heads: Commit ids.
+        """
+        todo = set(heads) - self._indexed(heads)
+        seen = set(todo)
+        commits = []
+        while todo:
+            next_todo = set()
+            for commit_id in todo:
+                try:
+                    commit = self.store[commit_id]
+                except KeyError:
+                    continue
+                commits.append(commit)
+                next_todo.update(commit.parents)
+            next_todo.difference_update(seen)
+            seen.update(next_todo)
+            todo = next_todo - self._indexed(next_todo)
+        if not commits:
+            return
+        trace.mutter('indexing file history of %d commits', len(commits))
+        builder = _mod_btree_index.BTreeBuilder(0, key_elements=2)
+        name = osutils.sha()
+        for commit in commits:
+            name.update(commit.id)
+            builder.add_node((b"commit", commit.id), b"")
+            for path in changed_paths(self.store, commit):
+                builder.add_node((_path_key(path), commit.id), b"")
+        self._write(name.hexdigest() + ".fhx", builder)
+        if len(self._names) > MAX_INDEX_FILES:
+            self.pack()
+
+    def _write(self, name, builder):
+        try:
+            size = self._transport.put_file(name, builder.finish())
+        except (errors.TransportNotPossible, errors.PermissionDenied) as e:
+            # Keep what we found for as long as we're around.
+            trace.mutter('unable to write file history index: %s', e)
+            self._index.insert_index(0, builder)
+            return
+        if name not in self._names:
+            self._add_index_file(name, size)
+
+    def pack(self):
+        """Combine the index files into one.
+
+        Another process may be packing at the same time, and remove the same
+        files.
+        """
+        builder = _mod_btree_index.BTreeBuilder(0, key_elements=2)
+        name = osutils.sha()
+        for _, key, value in self._index.iter_all_entries():
+            if key[0] == b"commit":
+                name.update(key[1])
+            builder.add_node(key, value)
+        # Reloading while reading the entries may have changed these.
+        old_names = self._names
+        self._index = _mod_index.CombinedGraphIndex(
+            [], reload_func=self._reload)
+        self._names = []
+        self._write(name.hexdigest() + ".fhx", builder)
+        for old_name in old_names:
+            if old_name not in self._names:
+                try:
+                    self._transport.delete(old_name)
+                except errors.NoSuchFile:
+                    pass
+
+    def iter_changing_commits(self, path):
+        """Iterate over the indexed commits that changed a path.
+
+        :param path: Path of a file, as bytes.
+        :return: Iterator over commit ids, in no particular order.
+        """
+        for entry in self._index.iter_entries_prefix([(_path_key(path), None)]):
+            yield entry[1][1]
@@ -52,6 +52,11 @@ class GitFileLastChangeScanner(object):
         if target_mode is None:
             raise AssertionError("sha %r for %r in %r" %
                                  (target_sha, path, commit_id))
+        if not stat.S_ISDIR(target_mode):
+            file_history = self.repository._get_file_history_index()
+            if file_history is not None:
+                return (path, self._find_last_change_in_index(
+                    file_history, path, commit))
         while True:
             parent_commits = []
             for parent_commit in [self.store[c] for c in commit.parents]:
@@ -74,6 +79,28 @@ class GitFileLastChangeScanner(object):
             commit = parent_commits[0]
         return (path, commit.id)
 
+    def _find_last_change_in_index(self, file_history, path, commit):
+        file_history.update([commit.id])
+        changing_commits = set(file_history.iter_changing_commits(path))
+        while commit.id not in changing_commits:
+            if len(commit.parents) == 1:
+                commit = self.store[commit.parents[0]]
+                continue
+            # The file is the same in all parents that have it, so follow
+            # the first of them.
+            for parent_id in commit.parents:
+                parent_commit = self.store[parent_id]
+                try:
+                    tree_lookup_path(self.store.__getitem__,
+                                     parent_commit.tree, path)
+                except (NotTreeError, KeyError):
+                    continue
+                commit = parent_commit
+                break
+            else:
+                break
+        return commit.id
+
 
 class GitFileParentProvider(object):
 
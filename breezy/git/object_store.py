@@ -34,6 +34,7 @@ from dulwich.pack import (
     )
 
 from .. import (
+    config,
     errors,
     lru_cache,
     trace,
@@ -64,6 +65,7 @@ from .unpeel_map import (
     UnpeelMap,
     )
 
+import collections
 import posixpath
 import stat
 
@@ -82,6 +84,9 @@ def get_object_store(repo, mapping=None):
 
 
 MAX_TREE_CACHE_SIZE = 50 * 1024 * 1024
+# How much of the trees and commits generated for a pack to keep, rather than
+# generating them again when the pack is written.
+MAX_GENERATED_CACHE_SIZE = 50 * 1024 * 1024
 
 
 class LRUTreeCache(object):
@@ -178,6 +183,67 @@ def _check_expected_sha(expected_sha, object):
                                                            expected_sha))
 
 
+def _chunks_to_blob(chunks):
+    """Create a Blob from its chunks, and compute its SHA1."""
+    blob = Blob()
+    blob.chunked = chunks
+    # The SHA1 is cached on the blob.
+    blob.sha()
+    return blob
+
+
+class _BlobHashingPool(object):
+    """Compute the SHA1s of blobs ahead of use in a pool of threads.
+
+    hashlib releases the GIL while hashing all but tiny texts, so this lets
+    the next few blobs be hashed on other cores while the texts after them
+    are read from the repository.
+    """
+
+    def __init__(self, num_threads):
+        from concurrent.futures import ThreadPoolExecutor
+        self.num_threads = num_threads
+        self._executor = ThreadPoolExecutor(max_workers=num_threads)
+
+    def iter_blobs(self, texts):
+        """Yield (key, blob) pairs, in the order of texts.
+
+        Up to twice num_threads blobs are hashed ahead of the one being
+        yielded.
+
+        :param texts: An iterator of (key, chunks), as from
+            Tree.iter_files_bytes.
+        """
+        pending = collections.deque()
+        try:
+            for key, chunks in texts:
+                pending.append((key, self._executor.submit(
+                    _chunks_to_blob, list(chunks))))
+                if len(pending) > 2 * self.num_threads:
+                    key, future = pending.popleft()
+                    yield key, future.result()
+            while pending:
+                key, future = pending.popleft()
+                yield key, future.result()
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+    def shutdown(self):
+        """Stop the hashing threads, once the blobs being hashed are done."""
+        self._executor.shutdown(wait=True)
+
+
+def _iter_blobs(texts, hashing_pool=None):
+    """Turn (key, chunks) pairs into (key, blob) pairs.
+
+    :param hashing_pool: Optional _BlobHashingPool to hash the blobs in.
+    """
+    if hashing_pool is not None:
+        return hashing_pool.iter_blobs(texts)
+    return ((key, _chunks_to_blob(list(chunks))) for (key, chunks) in texts)
+
+
 def directory_to_tree(path, children, lookup_ie_sha1, unusual_modes,
                       empty_file_name, allow_empty=False):
     """Create a Git Tree object from a Bazaar directory.
@@ -211,7 +277,8 @@ def directory_to_tree(path, children, lookup_ie_sha1, unusual_modes,
 
 
 def _tree_to_objects(tree, parent_trees, idmap, unusual_modes,
-                     dummy_file_name=None, add_cache_entry=None):
+                     dummy_file_name=None, add_cache_entry=None,
+                     hashing_pool=None):
     """Iterate over the objects that were introduced in a revision.
 
     :param idmap: id map
@@ -219,6 +286,7 @@ def _tree_to_objects(tree, parent_trees, idmap, unusual_modes,
     :param unusual_modes: Unusual file modes dictionary
     :param dummy_file_name: File name to use for dummy files
         in empty directories. None to skip empty directories
+    :param hashing_pool: Optional _BlobHashingPool to hash new blobs in
     :return: Yields (path, object, ie) entries
     """
     dirty_dirs = set()
@@ -306,10 +374,9 @@ def _tree_to_objects(tree, parent_trees, idmap, unusual_modes,
             dirty_dirs.add(osutils.dirname(p))
 
     # Fetch contents of the blobs that were changed
-    for (path, file_id), chunks in tree.iter_files_bytes(
-            [(path, (path, file_id)) for (path, file_id) in new_blobs]):
-        obj = Blob()
-        obj.chunked = list(chunks)
+    for (path, file_id), obj in _iter_blobs(tree.iter_files_bytes(
+            [(path, (path, file_id)) for (path, file_id) in new_blobs]),
+            hashing_pool):
         if add_cache_entry is not None:
             add_cache_entry(obj, (file_id, tree.get_file_revision(path)), path)
         yield path, obj, (file_id, tree.get_file_revision(path))
@@ -390,6 +457,12 @@ class PackTupleIterable(object):
         self.store = store
         self.store.lock_read()
         self.objects = {}
+        # The most recent trees and commits that were added, by SHA1
+        self._generated = lru_cache.LRUSizeCache(
+            max_size=MAX_GENERATED_CACHE_SIZE, after_cleanup_size=None,
+            compute_size=lambda obj: obj.raw_length())
+        # (file_id, revision) of blobs that were added, by SHA1
+        self._blob_keys = {}
 
     def __del__(self):
         self.store.unlock()
@@ -397,12 +470,37 @@ class PackTupleIterable(object):
     def add(self, sha, path):
         self.objects[sha] = path
 
+    def add_object(self, obj, path, bzr_key_data=None):
+        """Add an object that has just been generated.
+
+        Recent trees and commits are kept, rather than generated again when
+        the pack is written; the others are looked up in the store again.
+        Blob texts are read again, all in one go.
+
+        :param bzr_key_data: The file id and revision of a blob
+        """
+        self.objects[obj.id] = path
+        if obj.type_name != Blob.type_name:
+            self._generated[obj.id] = obj
+        elif bzr_key_data is not None:
+            self._blob_keys[obj.id] = bzr_key_data
+
     def __len__(self):
         return len(self.objects)
 
     def __iter__(self):
-        return ((self.store[object_id], path) for (object_id, path) in
-                self.objects.items())
+        blob_shas = []
+        for object_id, path in self.objects.items():
+            if object_id in self._blob_keys:
+                blob_shas.append(object_id)
+                continue
+            obj = self._generated.get(object_id)
+            if obj is None:
+                obj = self.store[object_id]
+            yield obj, path
+        for blob in self.store._reconstruct_blobs(
+                [self._blob_keys[sha] + (sha,) for sha in blob_shas]):
+            yield blob, self.objects[blob.id]
 
 
 class BazaarObjectStore(BaseObjectStore):
@@ -421,12 +519,27 @@ class BazaarObjectStore(BaseObjectStore):
         self.start_write_group = self._cache.idmap.start_write_group
         self.abort_write_group = self._cache.idmap.abort_write_group
         self.commit_write_group = self._cache.idmap.commit_write_group
+        self._export_threads = None
         self.tree_cache = LRUTreeCache(self.repository)
         self.unpeel_map = UnpeelMap.from_repository(self.repository)
 
     def _missing_revisions(self, revisions):
         return self._cache.idmap.missing_revisions(revisions)
 
+    def _make_hashing_pool(self):
+        """Create a _BlobHashingPool for exporting blobs.
+
+        The caller is responsible for shutting the pool down.
+
+        :return: A _BlobHashingPool, or None if git.export_threads is < 1.
+        """
+        if self._export_threads is None:
+            self._export_threads = config.GlobalStack().get(
+                'git.export_threads')
+        if self._export_threads < 1:
+            return None
+        return _BlobHashingPool(self._export_threads)
+
     def _update_sha_map(self, stop_revision=None):
         if not self.is_locked():
             raise errors.LockNotHeld(self)
@@ -457,13 +570,14 @@ class BazaarObjectStore(BaseObjectStore):
                 self._map_updated = True
             return
         self.start_write_group()
+        hashing_pool = self._make_hashing_pool()
         try:
             with ui.ui_factory.nested_progress_bar() as pb:
                 for i, revid in enumerate(graph.iter_topo_order(
                         missing_revids)):
                     trace.mutter('processing %r', revid)
                     pb.update("updating git map", i, len(missing_revids))
-                    self._update_sha_map_revision(revid)
+                    self._update_sha_map_revision(revid, hashing_pool)
             if stop_revision is None:
                 self._map_updated = True
         except BaseException:
@@ -471,6 +585,9 @@ class BazaarObjectStore(BaseObjectStore):
             raise
         else:
             self.commit_write_group()
+        finally:
+            if hashing_pool is not None:
+                hashing_pool.shutdown()
 
     def __iter__(self):
         self._update_sha_map()
@@ -493,12 +610,14 @@ class BazaarObjectStore(BaseObjectStore):
         return self.mapping.export_commit(rev, tree_sha, parent_lookup,
                                           lossy, verifiers)
 
-    def _revision_to_objects(self, rev, tree, lossy, add_cache_entry=None):
+    def _revision_to_objects(self, rev, tree, lossy, add_cache_entry=None,
+                             hashing_pool=None):
         """Convert a revision to a set of git objects.
 
         :param rev: Bazaar revision object
         :param tree: Bazaar revision tree
         :param lossy: Whether to not roundtrip all Bazaar revision data
+        :param hashing_pool: Optional _BlobHashingPool to hash new blobs in
         """
         unusual_modes = extract_unusual_modes(rev)
         present_parents = self.repository.has_revisions(rev.parent_ids)
@@ -507,7 +626,8 @@ class BazaarObjectStore(BaseObjectStore):
         root_tree = None
         for path, obj, bzr_key_data in _tree_to_objects(
                 tree, parent_trees, self._cache.idmap, unusual_modes,
-                self.mapping.BZR_DUMMY_FILE, add_cache_entry):
+                self.mapping.BZR_DUMMY_FILE, add_cache_entry,
+                hashing_pool):
             if path == "":
                 root_tree = obj
                 root_key_data = bzr_key_data
@@ -547,14 +667,15 @@ class BazaarObjectStore(BaseObjectStore):
     def _get_updater(self, rev):
         return self._cache.get_updater(rev)
 
-    def _update_sha_map_revision(self, revid):
+    def _update_sha_map_revision(self, revid, hashing_pool=None):
         rev = self.repository.get_revision(revid)
         tree = self.tree_cache.revision_tree(rev.revision_id)
         updater = self._get_updater(rev)
         # FIXME JRV 2011-12-15: Shouldn't we try both values for lossy ?
         for path, obj in self._revision_to_objects(
                 rev, tree, lossy=(not self.mapping.roundtripping),
-                add_cache_entry=updater.add_object):
+                add_cache_entry=updater.add_object,
+                hashing_pool=hashing_pool):
             if isinstance(obj, Commit):
                 commit_obj = obj
         commit_obj = updater.finish()
@@ -568,17 +689,24 @@ class BazaarObjectStore(BaseObjectStore):
         """
         stream = self.repository.iter_files_bytes(
             ((key[0], key[1], key) for key in keys))
-        for (file_id, revision, expected_sha), chunks in stream:
-            blob = Blob()
-            blob.chunked = list(chunks)
-            if blob.id != expected_sha and blob.data == b"":
-                # Perhaps it's a symlink ?
-                tree = self.tree_cache.revision_tree(revision)
-                path = tree.id2path(file_id)
-                if tree.kind(path) == 'symlink':
-                    blob = symlink_to_blob(tree.get_symlink_target(path))
-            _check_expected_sha(expected_sha, blob)
-            yield blob
+        if len(keys) > 1:
+            hashing_pool = self._make_hashing_pool()
+        else:
+            hashing_pool = None
+        try:
+            for (file_id, revision, expected_sha), blob in _iter_blobs(
+                    stream, hashing_pool):
+                if blob.id != expected_sha and blob.data == b"":
+                    # Perhaps it's a symlink ?
+                    tree = self.tree_cache.revision_tree(revision)
+                    path = tree.id2path(file_id)
+                    if tree.kind(path) == 'symlink':
+                        blob = symlink_to_blob(tree.get_symlink_target(path))
+                _check_expected_sha(expected_sha, blob)
+                yield blob
+        finally:
+            if hashing_pool is not None:
+                hashing_pool.shutdown()
 
     def _reconstruct_tree(self, fileid, revid, bzr_tree, unusual_modes,
                           expected_sha=None):
@@ -810,18 +938,30 @@ class BazaarObjectStore(BaseObjectStore):
         graph = self.repository.get_graph()
         todo = _find_missing_bzr_revids(graph, pending, processed, shallow)
         ret = PackTupleIterable(self)
-        with ui.ui_factory.nested_progress_bar() as pb:
-            for i, revid in enumerate(graph.iter_topo_order(todo)):
-                pb.update("generating git objects", i, len(todo))
-                try:
-                    rev = self.repository.get_revision(revid)
-                except errors.NoSuchRevision:
-                    continue
-                tree = self.tree_cache.revision_tree(revid)
-                for path, obj in self._revision_to_objects(
-                        rev, tree, lossy=lossy):
-                    ret.add(obj.id, path)
-            return ret
+        hashing_pool = self._make_hashing_pool()
+        try:
+            with ui.ui_factory.nested_progress_bar() as pb:
+                for i, revid in enumerate(graph.iter_topo_order(todo)):
+                    pb.update("generating git objects", i, len(todo))
+                    try:
+                        rev = self.repository.get_revision(revid)
+                    except errors.NoSuchRevision:
+                        continue
+                    tree = self.tree_cache.revision_tree(revid)
+                    blob_keys = {}
+
+                    def add_cache_entry(obj, bzr_key_data, path):
+                        if isinstance(obj, Blob):
+                            blob_keys[obj.id] = bzr_key_data
+                    for path, obj in self._revision_to_objects(
+                            rev, tree, lossy=lossy,
+                            add_cache_entry=add_cache_entry,
+                            hashing_pool=hashing_pool):
+                        ret.add_object(obj, path, blob_keys.get(obj.id))
+                return ret
+        finally:
+            if hashing_pool is not None:
+                hashing_pool.shutdown()
 
     def add_thin_pack(self):
         import tempfile
@@ -63,23 +63,29 @@ class MissingObjectsIterator(object):
         :param revids: Revision ids of revisions to import
         :param lossy: Whether to not roundtrip bzr metadata
         """
-        for i, revid in enumerate(revids):
-            if self.pb:
-                self.pb.update("pushing revisions", i, len(revids))
-            git_commit = self.import_revision(revid, lossy)
-            yield (revid, git_commit)
-
-    def import_revision(self, revid, lossy):
+        hashing_pool = self._object_store._make_hashing_pool()
+        try:
+            for i, revid in enumerate(revids):
+                if self.pb:
+                    self.pb.update("pushing revisions", i, len(revids))
+                git_commit = self.import_revision(revid, lossy, hashing_pool)
+                yield (revid, git_commit)
+        finally:
+            if hashing_pool is not None:
+                hashing_pool.shutdown()
+
+    def import_revision(self, revid, lossy, hashing_pool=None):
         """Import a revision into this Git repository.
 
         :param revid: Revision id of the revision
         :param roundtrip: Whether to roundtrip bzr metadata
+        :param hashing_pool: Optional _BlobHashingPool to hash new blobs in
         """
         tree = self._object_store.tree_cache.revision_tree(revid)
         rev = self.source.get_revision(revid)
         commit = None
         for path, obj in self._object_store._revision_to_objects(
-                rev, tree, lossy):
+                rev, tree, lossy, hashing_pool=hashing_pool):
             if obj.type_name == b"commit":
                 commit = obj
             self._pending.append((obj, path))
@@ -19,6 +19,7 @@
 
 from .. import (
     check,
+    config as _mod_config,
     errors,
     graph as _mod_graph,
     lock,
@@ -33,6 +34,9 @@ from ..foreign import (
     ForeignRepository,
     )
 
+from .file_history import (
+    GitFileHistoryIndex,
+    )
 from .filegraph import (
     GitFileLastChangeScanner,
     GitFileParentProvider,
@@ -231,8 +235,18 @@ class LocalGitRepository(GitRepository):
         GitRepository.__init__(self, gitdir)
         self._git = gitdir._git
         self._file_change_scanner = GitFileLastChangeScanner(self)
+        self._file_history_index = None
         self._transaction = None
 
+    def _get_file_history_index(self):
+        """Return the index of file history, or None if it is disabled."""
+        if not _mod_config.GlobalStack().get('git.file_history_index'):
+            return None
+        if self._file_history_index is None:
+            self._file_history_index = GitFileHistoryIndex.from_repository(
+                self)
+        return self._file_history_index
+
     def get_commit_builder(self, branch, parents, config, timestamp=None,
                            timezone=None, committer=None, revprops=None,
                            revision_id=None, lossy=False):
@@ -262,6 +276,31 @@ class LocalGitRepository(GitRepository):
         return _mod_graph.Graph(GitFileParentProvider(
             self._file_change_scanner))
 
+    def find_file_changing_revisions(self, file_id, revision_ids):
+        file_history = self._get_file_history_index()
+        if file_history is None or file_id is None:
+            return super(LocalGitRepository, self).find_file_changing_revisions(
+                file_id, revision_ids)
+        try:
+            path = encode_git_path(self.get_mapping().parse_file_id(file_id))
+        except ValueError:
+            return set()
+        revids = {}
+        for revid in revision_ids:
+            try:
+                commit_id, mapping = self.lookup_bzr_revision_id(revid)
+            except errors.NoSuchRevision:
+                continue
+            revids[commit_id] = revid
+        file_history.update(list(revids))
+        changing_commits = set(file_history.iter_changing_commits(path))
+        if not changing_commits:
+            # Directories are not in the index.
+            return super(LocalGitRepository, self).find_file_changing_revisions(
+                file_id, revision_ids)
+        return set(revid for (commit_id, revid) in revids.items()
+                   if commit_id in changing_commits)
+
     def iter_files_bytes(self, desired_files):
         """Iterate through file versions.
 
@@ -215,6 +215,7 @@ def load_tests(loader, basic_tests, pattern):
         'test_cache',
         'test_dir',
         'test_fetch',
+        'test_file_history',
         'test_git_remote_helper',
         'test_mapping',
         'test_memorytree',
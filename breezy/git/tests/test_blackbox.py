@@ -17,12 +17,21 @@
 
 """Black-box tests for bzr-git."""
 
+from dulwich.index import (
+    commit_tree,
+    )
+from dulwich.objects import (
+    Blob,
+    )
 from dulwich.repo import (
     Repo as GitRepo,
     )
 
 import os
 
+from ... import (
+    config,
+    )
 from ...controldir import (
     ControlDir,
     )
@@ -31,6 +40,7 @@ from ...tests.blackbox import ExternalBase
 from ...workingtree import WorkingTree
 
 from .. import (
+    cache,
     tests,
     )
 from ...tests.script import TestCaseWithTransportAndScript
@@ -286,6 +296,26 @@ class TestGitBlackBox(ExternalBase):
         self.assertIn('First', output)
         self.assertIn('Third', output)
 
+    def test_log_file_with_history_index(self):
+        config.GlobalStack().set('git.file_history_index', True)
+        repo = GitRepo.init(self.test_dir)
+        contents = {}
+        for message, path in [(b'First', b'a'), (b'Second', b'b'),
+                              (b'Third', b'a')]:
+            blob = Blob.from_string(message)
+            repo.object_store.add_object(blob)
+            contents[path] = blob.id
+            contents.setdefault(b'b', blob.id)
+            tree_id = commit_tree(
+                repo.object_store,
+                [(path, sha, 0o100644) for path, sha in contents.items()])
+            repo.do_commit(message, committer=b'Joe Foo <joe@foo.com>',
+                           tree=tree_id)
+        output, error = self.run_bzr(['log', '--line', 'a'])
+        self.assertEqual(error, '')
+        self.assertContainsRe(output, '^3: .* Third\n1: .* First\n$')
+        self.assertPathExists('.git/bzr-file-history')
+
     def test_tags(self):
         git_repo, commit_sha1 = self.simple_commit()
         git_repo.refs[b"refs/tags/foo"] = commit_sha1
@@ -675,6 +705,44 @@ class GitObjectsTests(ExternalBase):
         self.run_simple(format='2a')
 
 
+class GitCacheCompactTests(ExternalBase):
+
+    def test_compact(self):
+        self.overrideAttr(cache.MmapGitShaMap, 'LOG_MAX_SIZE', 0)
+        config.GlobalStack().set('git.mmap_cache', True)
+        tree = self.make_branch_and_tree('.', format='2a')
+        self.build_tree(['a/', 'a/foo'])
+        tree.add(['a'])
+        tree.commit('add a')
+        self.run_bzr('git-objects')
+        self.build_tree(['b'])
+        tree.add(['b'])
+        tree.commit('add b')
+        shas = sorted(self.run_bzr('git-objects')[0].splitlines())
+        tables_path = tree.branch.repository._transport.local_abspath(
+            'git/idmap.mmap')
+
+        def table_names():
+            return [name for name in os.listdir(tables_path)
+                    if name.endswith('.tab')]
+        self.assertEqual(2, len(table_names()))
+        output, error = self.run_bzr('git-cache-compact')
+        self.assertEqual(('', ''), (output, error))
+        self.assertEqual(1, len(table_names()))
+        self.assertEqual(
+            shas, sorted(self.run_bzr('git-objects')[0].splitlines()))
+
+    def test_other_format(self):
+        config.GlobalStack().set('git.mmap_cache', False)
+        self.make_branch_and_tree('.', format='2a')
+        self.run_bzr_error(['can not be compacted'], 'git-cache-compact')
+
+    def test_git_repository(self):
+        self.make_branch_and_tree('.', format='git')
+        self.run_bzr_error(['Git repositories do not have a SHA map cache'],
+                           'git-cache-compact')
+
+
 class GitApplyTests(ExternalBase):
 
     def test_apply(self):
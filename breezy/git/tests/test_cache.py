@@ -25,6 +25,10 @@ from dulwich.objects import (
 import os
 import stat
 
+from ... import (
+    errors,
+    lock,
+    )
 from ...revision import (
     Revision,
     )
@@ -32,6 +36,7 @@ from ...revision import (
 from ...tests import (
     TestCase,
     TestCaseInTempDir,
+    TestSkipped,
     UnavailableFeature,
     )
 from ...transport import (
@@ -42,6 +47,8 @@ from ..cache import (
     DictBzrGitCache,
     IndexBzrGitCache,
     IndexGitCacheFormat,
+    MmapBzrGitCache,
+    MmapGitShaMap,
     SqliteBzrGitCache,
     TdbBzrGitCache,
     )
@@ -172,3 +179,138 @@ class IndexGitShaMapTests(TestCaseInTempDir, TestGitShaMap):
         IndexGitCacheFormat().initialize(transport)
         self.cache = IndexBzrGitCache(transport)
         self.map = self.cache.idmap
+
+
+class MmapGitShaMapTests(TestCaseInTempDir, TestGitShaMap):
+
+    def setUp(self):
+        TestCaseInTempDir.setUp(self)
+        self.cache = MmapBzrGitCache(os.path.join(self.test_dir, 'idmap'))
+        self.map = self.cache.idmap
+
+    def add_revision(self, revid, message=b"Teh foo bar"):
+        updater = self.cache.get_updater(Revision(revid))
+        c = self._get_test_commit()
+        c.message = message
+        updater.add_object(c, {"testament3-sha1": b"testament"}, None)
+        b = Blob()
+        b.data = b"blob in " + revid
+        updater.add_object(b, (b"fileid", revid), None)
+        updater.finish()
+        return c, b
+
+    def reopen(self):
+        return MmapGitShaMap(os.path.join(self.test_dir, 'idmap'))
+
+    def assertRevision(self, idmap, revid, c, b):
+        self.assertEqual(c.id, idmap.lookup_commit(revid))
+        self.assertEqual(b.id, idmap.lookup_blob_id(b"fileid", revid))
+        self.assertEqual([("blob", (b"fileid", revid))],
+                         list(idmap.lookup_git_sha(b.id)))
+
+    def test_reopen(self):
+        self.map.start_write_group()
+        c, b = self.add_revision(b"rev1")
+        self.map.commit_write_group()
+        self.assertEqual(['lock', 'log'], sorted(os.listdir('idmap')))
+        self.assertRevision(self.reopen(), b"rev1", c, b)
+
+    def test_abort_write_group(self):
+        self.map.start_write_group()
+        c, b = self.add_revision(b"rev1")
+        self.assertRevision(self.map, b"rev1", c, b)
+        self.map.abort_write_group()
+        self.assertRaises(KeyError, self.map.lookup_commit, b"rev1")
+        self.assertRaises(KeyError, self.reopen().lookup_commit, b"rev1")
+
+    def test_log_written_to_table(self):
+        self.overrideAttr(MmapGitShaMap, 'LOG_MAX_SIZE', 500)
+        revs = {}
+        for i in range(5):
+            revid = b"rev%d" % i
+            self.map.start_write_group()
+            revs[revid] = self.add_revision(revid, message=revid)
+            self.map.commit_write_group()
+        tables = [name for name in os.listdir('idmap')
+                  if name.endswith('.tab')]
+        self.assertNotEqual([], tables)
+        idmap = self.reopen()
+        for revid, (c, b) in revs.items():
+            self.assertRevision(idmap, revid, c, b)
+            self.assertRevision(self.map, revid, c, b)
+        self.assertEqual(set(revs), set(idmap.revids()))
+        self.assertEqual(10, len(list(idmap.sha1s())))
+
+    def test_compact(self):
+        self.overrideAttr(MmapGitShaMap, 'LOG_MAX_SIZE', 0)
+        revs = {}
+        for i in range(3):
+            revid = b"rev%d" % i
+            revs[revid] = self.add_revision(revid, message=revid)
+        self.overrideAttr(MmapGitShaMap, 'LOG_MAX_SIZE', 1000000)
+        revs[b"rev3"] = self.add_revision(b"rev3", message=b"rev3")
+        self.assertEqual(['lock', 'log'], sorted(
+            name for name in os.listdir('idmap') if not name.endswith('.tab')))
+        self.assertEqual(3, len(os.listdir('idmap')) - 2)
+        self.map.compact()
+        self.assertEqual(['lock'], [name for name in os.listdir('idmap')
+                                    if not name.endswith('.tab')])
+        self.assertEqual(2, len(os.listdir('idmap')))
+        for idmap in (self.map, self.reopen()):
+            for revid, (c, b) in revs.items():
+                self.assertRevision(idmap, revid, c, b)
+            self.assertEqual(set(revs), set(idmap.revids()))
+
+    def test_concurrent_appends(self):
+        import multiprocessing
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise TestSkipped('needs fork')
+        path = os.path.join(self.test_dir, 'idmap')
+
+        def add_revisions(name):
+            cache = MmapBzrGitCache(path)
+            for i in range(20):
+                updater = cache.get_updater(Revision(b"%s-%d" % (name, i)))
+                c = self._get_test_commit()
+                c.message = b"%s-%d" % (name, i)
+                updater.add_object(
+                    c, {"testament3-sha1": b"testament"}, None)
+                updater.finish()
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=add_revisions, args=(name,))
+                     for name in (b'a', b'b', b'c', b'd')]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            self.assertEqual(0, process.exitcode)
+        self.assertEqual(
+            set(b"%s-%d" % (name, i) for name in (b'a', b'b', b'c', b'd')
+                for i in range(20)),
+            set(self.reopen().revids()))
+
+    def test_locked_by_other_writer(self):
+        self.overrideAttr(MmapGitShaMap, 'LOCK_TIMEOUT', 0)
+        self.add_revision(b"rev1")
+        write_lock = lock.WriteLock(os.path.join('idmap', 'lock'))
+        try:
+            self.assertRaises(errors.LockContention,
+                              self.add_revision, b"rev2")
+            self.assertRaises(errors.LockContention, self.map.compact)
+        finally:
+            write_lock.unlock()
+        self.add_revision(b"rev2")
+        self.assertEqual(set([b"rev1", b"rev2"]), set(self.reopen().revids()))
+
+    def test_torn_log_record(self):
+        self.map.start_write_group()
+        c, b = self.add_revision(b"rev1")
+        self.map.commit_write_group()
+        with open(os.path.join('idmap', 'log'), 'ab') as f:
+            f.write(b'1000 1234\npartial')
+        idmap = self.reopen()
+        self.assertRevision(idmap, b"rev1", c, b)
+        self.add_revision(b"rev2")
+        with open(os.path.join('idmap', 'log'), 'rb') as f:
+            self.assertNotIn(b'partial', f.read())
+        self.assertEqual(set([b"rev1", b"rev2"]), set(self.reopen().revids()))
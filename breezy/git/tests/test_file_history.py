@@ -0,0 +1,202 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Tests for the index of file history in Git repositories."""
+
+import os
+
+from dulwich.index import (
+    commit_tree,
+    )
+from dulwich.objects import (
+    Blob,
+    Commit,
+    )
+from dulwich.repo import (
+    Repo as GitRepo,
+    )
+
+from ... import (
+    config,
+    )
+from ...repository import (
+    Repository,
+    )
+from .. import (
+    file_history,
+    tests,
+    )
+from ..mapping import (
+    default_mapping,
+    )
+
+
+class TestGitFileHistoryIndex(tests.TestCaseInTempDir):
+
+    def setUp(self):
+        super(TestGitFileHistoryIndex, self).setUp()
+        self.git_repo = GitRepo.init(self.test_dir)
+        c1 = self.make_commit(
+            {b'a': b'a 1\n', b'b': b'b 1\n', b'd/c': b'c 1\n'}, [])
+        c2 = self.make_commit({b'a': b'a 2\n', b'b': b'b 1\n'}, [c1])
+        c3 = self.make_commit(
+            {b'a': b'a 1\n', b'b': b'b 3\n', b'd/c': b'c 1\n',
+             b'e': (b'a', 0o120000)}, [c1])
+        c4 = self.make_commit(
+            {b'a': b'a 2\n', b'b': b'b 3\n', b'e': (b'a', 0o120000)},
+            [c2, c3])
+        c5 = self.make_commit(
+            {b'a': b'a 2\n', b'b': b'b 3\n', b'd': b'now a file\n',
+             b'e': (b'a', 0o120000)}, [c4])
+        self.git_repo.refs[b'HEAD'] = c5
+        self.commits = [c1, c2, c3, c4, c5]
+
+    def make_commit(self, contents, parents):
+        store = self.git_repo.object_store
+        entries = []
+        for path, content in contents.items():
+            if isinstance(content, tuple):
+                content, mode = content
+            else:
+                mode = 0o100644
+            blob = Blob.from_string(content)
+            store.add_object(blob)
+            entries.append((path, blob.id, mode))
+        commit = Commit()
+        commit.tree = commit_tree(store, entries)
+        commit.parents = parents
+        commit.author = commit.committer = b'Joe Foo <joe@foo.com>'
+        commit.author_time = commit.commit_time = 1000
+        commit.author_timezone = commit.commit_timezone = 0
+        commit.message = b'message'
+        store.add_object(commit)
+        return commit.id
+
+    def make_index(self):
+        repo = Repository.open('.')
+        return file_history.GitFileHistoryIndex.from_repository(repo)
+
+    def index_files(self):
+        return [name for name in
+                os.listdir(os.path.join('.git', 'bzr-file-history'))
+                if name.endswith('.fhx')]
+
+    def changed_paths(self, commit_index):
+        return file_history.changed_paths(
+            self.git_repo.object_store,
+            self.git_repo[self.commits[commit_index]])
+
+    def test_changed_paths(self):
+        self.assertEqual({b'a', b'b', b'd/c'}, self.changed_paths(0))
+        self.assertEqual({b'a'}, self.changed_paths(1))
+        self.assertEqual({b'b', b'e'}, self.changed_paths(2))
+        # a and b are each different from one of the parents; e is new in
+        # one parent and the same as in the other.
+        self.assertEqual({b'a', b'b'}, self.changed_paths(3))
+        self.assertEqual({b'd'}, self.changed_paths(4))
+
+    def test_iter_changing_commits(self):
+        index = self.make_index()
+        index.update([self.commits[-1]])
+        self.assertEqual(
+            {self.commits[0], self.commits[2], self.commits[3]},
+            set(index.iter_changing_commits(b'b')))
+        self.assertEqual({self.commits[0]},
+                         set(index.iter_changing_commits(b'd/c')))
+        self.assertEqual(set(), set(index.iter_changing_commits(b'f')))
+
+    def test_update_incremental(self):
+        index = self.make_index()
+        index.update([self.commits[1]])
+        self.assertEqual(1, len(self.index_files()))
+        index.update([self.commits[1], self.commits[0]])
+        self.assertEqual(1, len(self.index_files()))
+        index.update([self.commits[-1]])
+        self.assertEqual(2, len(self.index_files()))
+        index = self.make_index()
+        self.assertEqual(
+            {self.commits[0], self.commits[1], self.commits[3]},
+            set(index.iter_changing_commits(b'a')))
+
+    def test_pack(self):
+        self.overrideAttr(file_history, 'MAX_INDEX_FILES', 1)
+        index = self.make_index()
+        index.update([self.commits[0]])
+        index.update([self.commits[1]])
+        self.assertEqual(1, len(self.index_files()))
+        index.update([self.commits[-1]])
+        self.assertEqual(1, len(self.index_files()))
+        self.assertEqual(
+            {self.commits[0], self.commits[1], self.commits[3]},
+            set(self.make_index().iter_changing_commits(b'a')))
+
+    def test_reload_after_other_pack(self):
+        self.overrideAttr(file_history, 'MAX_INDEX_FILES', 10)
+        index = self.make_index()
+        index.update([self.commits[1]])
+        index.update([self.commits[-1]])
+        self.assertEqual(2, len(self.index_files()))
+        reader = self.make_index()
+        index.pack()
+        self.assertEqual(1, len(self.index_files()))
+        self.assertEqual(
+            {self.commits[0], self.commits[1], self.commits[3]},
+            set(reader.iter_changing_commits(b'a')))
+
+    def test_concurrent_pack(self):
+        self.overrideAttr(file_history, 'MAX_INDEX_FILES', 10)
+        index = self.make_index()
+        index.update([self.commits[1]])
+        index.update([self.commits[-1]])
+        other = self.make_index()
+        index.pack()
+        other.pack()
+        self.assertEqual(1, len(self.index_files()))
+        self.assertEqual(
+            {self.commits[0], self.commits[1], self.commits[3]},
+            set(other.iter_changing_commits(b'a')))
+
+    def test_last_change_matches_scanner(self):
+        repo = Repository.open('.')
+        scanner = repo._file_change_scanner
+        store = self.git_repo.object_store
+        expected = {}
+        for commit_id in self.commits:
+            for entry in store.iter_tree_contents(store[commit_id].tree):
+                expected[entry.path, commit_id] = (
+                    scanner.find_last_change_revision(entry.path, commit_id))
+        config.GlobalStack().set('git.file_history_index', True)
+        repo = Repository.open('.')
+        self.assertIsNot(None, repo._get_file_history_index())
+        scanner = repo._file_change_scanner
+        for (path, commit_id), last_change in expected.items():
+            self.assertEqual(
+                last_change,
+                scanner.find_last_change_revision(path, commit_id))
+
+    def test_find_file_changing_revisions(self):
+        config.GlobalStack().set('git.file_history_index', True)
+        repo = Repository.open('.')
+        revids = [default_mapping.revision_id_foreign_to_bzr(c)
+                  for c in self.commits]
+        self.assertEqual(
+            {revids[0], revids[1], revids[3]},
+            repo.find_file_changing_revisions(
+                default_mapping.generate_file_id(u'a'), revids))
+        self.assertEqual(
+            {revids[1]},
+            repo.find_file_changing_revisions(
+                default_mapping.generate_file_id(u'a'), revids[1:3]))
@@ -25,6 +25,9 @@ from dulwich.objects import (
     Tree,
     )
 
+from ... import (
+    config,
+    )
 from ...branchbuilder import (
     BranchBuilder,
     )
@@ -45,6 +48,9 @@ from ...tests import (
     )
 from ...tests.features import SymlinkFeature
 
+from .. import (
+    object_store,
+    )
 from ..cache import (
     DictGitShaMap,
     )
@@ -52,6 +58,7 @@ from ..object_store import (
     BazaarObjectStore,
     LRUTreeCache,
     directory_to_tree,
+    _BlobHashingPool,
     _check_expected_sha,
     _find_missing_bzr_revids,
     _tree_to_objects,
@@ -235,6 +242,77 @@ class BazaarObjectStoreTests(TestCaseWithTransport):
         self.assertTrue(b.id in self.store)
 
 
+    def test_generate_pack_contents(self):
+        tree = self.branch.controldir.create_workingtree()
+        self.build_tree_contents([
+            ('foo/', ),
+            ('foo/bar', b'a\nb\nc\nd\ne\n'),
+            ('baz', b'baz\n')])
+        tree.add(['foo', 'foo/bar', 'baz'])
+        revid1 = tree.commit('commit 1')
+        self.build_tree_contents([('baz', b'new baz\n')])
+        revid2 = tree.commit('commit 2')
+        self.store.lock_read()
+        self.addCleanup(self.store.unlock)
+        contents = self.store.generate_pack_contents(
+            [], [self.store._lookup_revision_sha1(revid2)], lossy=True)
+        # Objects are not looked up in the SHA map again.
+        self.store.lookup_git_shas = None
+        objects = list(contents)
+        del self.store.lookup_git_shas
+        self.assertEqual(len(contents), len(objects))
+        # 2 commits, 3 root trees, 1 tree for foo and 3 blobs
+        self.assertEqual(
+            [b'blob'] * 3 + [b'commit'] * 2 + [b'tree'] * 3,
+            sorted(obj.type_name for (obj, path) in objects))
+        for obj, path in objects:
+            self.assertEqual(obj, self.store[obj.id])
+
+    def test_generate_pack_contents_bounded(self):
+        self.overrideAttr(object_store, 'MAX_GENERATED_CACHE_SIZE', 1)
+        tree = self.branch.controldir.create_workingtree()
+        self.build_tree_contents([('foo/', ), ('foo/bar', b'bar\n')])
+        tree.add(['foo', 'foo/bar'])
+        revid = tree.commit('commit 1')
+        self.store.lock_read()
+        self.addCleanup(self.store.unlock)
+        contents = self.store.generate_pack_contents(
+            [], [self.store._lookup_revision_sha1(revid)], lossy=True)
+        # The trees and commit are too big to keep, so are looked up again.
+        self.assertEqual(0, len(contents._generated))
+        objects = list(contents)
+        self.assertEqual(
+            [b'blob', b'commit', b'tree', b'tree'],
+            sorted(obj.type_name for (obj, path) in objects))
+        for obj, path in objects:
+            self.assertEqual(obj, self.store[obj.id])
+
+    def test_generate_pack_contents_threads(self):
+        config.GlobalStack().set('git.export_threads', 2)
+        tree = self.branch.controldir.create_workingtree()
+        self.build_tree_contents([('foo', b'foo\n'), ('bar', b'bar\n')])
+        tree.add(['foo', 'bar'])
+        revid = tree.commit('commit 1')
+        self.store.lock_read()
+        self.addCleanup(self.store.unlock)
+        commit_sha = self.store._lookup_revision_sha1(revid)
+        shutdowns = []
+        orig_shutdown = object_store._BlobHashingPool.shutdown
+
+        def shutdown(pool):
+            shutdowns.append(pool)
+            orig_shutdown(pool)
+        self.overrideAttr(object_store._BlobHashingPool, 'shutdown', shutdown)
+        contents = self.store.generate_pack_contents(
+            [], [commit_sha], lossy=True)
+        objects = list(contents)
+        self.assertEqual(
+            [b'blob', b'blob', b'commit', b'tree'],
+            sorted(obj.type_name for (obj, path) in objects))
+        # One pool to convert the revision, one to reconstruct the blobs.
+        self.assertEqual(2, len(shutdowns))
+
+
 class TreeToObjectsTests(TestCaseWithTransport):
 
     def setUp(self):
@@ -247,6 +325,20 @@ class TreeToObjectsTests(TestCaseWithTransport):
         entries = list(_tree_to_objects(tree, [tree], self.idmap, {}))
         self.assertEqual([], entries)
 
+    def test_hashing_pool(self):
+        tree = self.make_branch_and_tree('.')
+        self.build_tree(['foo', 'bar/', 'bar/baz'])
+        tree.add(['foo', 'bar', 'bar/baz'])
+        revid = tree.commit('commit')
+        revtree = tree.branch.repository.revision_tree(revid)
+        self.addCleanup(revtree.lock_read().unlock)
+        entries = list(_tree_to_objects(revtree, [], self.idmap, {}))
+        hashing_pool = _BlobHashingPool(2)
+        self.addCleanup(hashing_pool.shutdown)
+        self.assertEqual(
+            entries, list(_tree_to_objects(revtree, [], self.idmap, {},
+                                           hashing_pool=hashing_pool)))
+
     def test_with_gitdir(self):
         tree = self.make_branch_and_tree('.')
         self.build_tree(['.git', 'foo'])
@@ -312,6 +404,19 @@ class TreeToObjectsTests(TestCaseWithTransport):
             (stat.S_IFDIR, subdir_a.id), objects['foo'][b'subdir-a'])
 
 
+class BlobHashingPoolTests(TestCase):
+
+    def test_iter_blobs(self):
+        texts = [(i, iter([b'text %d\n' % i, b'more'])) for i in range(10)]
+        hashing_pool = _BlobHashingPool(3)
+        self.addCleanup(hashing_pool.shutdown)
+        blobs = list(hashing_pool.iter_blobs(iter(texts)))
+        self.assertEqual(list(range(10)), [key for (key, blob) in blobs])
+        for i, blob in blobs:
+            expected = Blob.from_string(b'text %d\nmore' % i)
+            self.assertEqual(expected.id, blob.id)
+
+
 class DirectoryToTreeTests(TestCase):
 
     def test_empty(self):
@@ -961,6 +961,26 @@ class DiskTreeTransform(TreeTransformBase):
             os.unlink(name)
             raise
 
+    def create_reflink(self, path, trans_id, sha1=None):
+        """Schedule creation of a copy-on-write clone of a file.
+
+        The file is copied if it can't be cloned.
+        """
+        name = self._limbo_name(trans_id)
+        try:
+            osutils.reflink_or_copy(path, name)
+            unique_add(self._new_contents, trans_id, 'file')
+        except BaseException:
+            # Clean up the file, it never got registered so
+            # TreeTransform.finalize() won't clean it up.
+            if os.path.exists(name):
+                os.unlink(name)
+            raise
+        self._set_mtime(name)
+        self._set_mode(trans_id, None, S_ISREG)
+        if sha1 is not None:
+            self._observed_sha1s[trans_id] = (sha1, osutils.lstat(name))
+
     def create_directory(self, trans_id):
         """Schedule creation of a new directory.
 
@@ -232,6 +232,91 @@ class CallableToParentsProviderAdapter(object):
         return self.callable(keys)
 
 
+class GenerationIndex(object):
+    """Generation numbers of revisions, used to cut graph searches short.
+
+    The generation number of a revision is one more than the highest
+    generation number of its parents, and revisions without parents are
+    generation 1. A revision can only be an ancestor of revisions with a
+    higher generation number, so a search for ancestors of some revisions
+    can stop at anything with a lower generation than all of them.
+
+    Once all the ancestry of a revision is present its generation number
+    never changes, so it can be kept across processes. Revisions that are
+    not present or have ghosts in their ancestry have no generation number
+    (None); filling in the ghosts could change it.
+    """
+
+    def __init__(self, generations=None, add_generations=None):
+        """Create a GenerationIndex.
+
+        :param generations: A dict of already known generation numbers.
+        :param add_generations: Optional callback that is passed a dict of
+            each batch of newly computed generation numbers, e.g. to save
+            them.
+        """
+        if generations is None:
+            generations = {}
+        self._generations = generations
+        self._add_generations = add_generations
+        self._unknown = set()
+
+    def get_generations(self, parents_provider, keys):
+        """Get the generation numbers of keys.
+
+        Generation numbers that aren't known yet are computed from the
+        ancestry of keys, walking back until revisions with known generation
+        numbers are reached.
+
+        :param parents_provider: The parents provider to read the ancestry
+            from.
+        :return: A dict mapping each of keys to its generation number, or
+            None.
+        """
+        from . import tsort
+        generations = self._generations
+        unknown = self._unknown
+        parent_map = {}
+        pending = set(keys).difference(generations, unknown)
+        pending.discard(revision.NULL_REVISION)
+        while pending:
+            found = parents_provider.get_parent_map(pending)
+            unknown.update(pending.difference(found))
+            parent_map.update(found)
+            pending = set()
+            for parents in found.values():
+                for parent in parents:
+                    if (parent not in generations and parent not in unknown
+                            and parent not in parent_map):
+                        pending.add(parent)
+            pending.discard(revision.NULL_REVISION)
+        new_generations = {}
+        for key in tsort.topo_sort(parent_map):
+            generation = 0
+            for parent in parent_map[key]:
+                if parent == revision.NULL_REVISION:
+                    continue
+                parent_generation = generations.get(parent)
+                if parent_generation is None:
+                    generation = None
+                    break
+                if parent_generation > generation:
+                    generation = parent_generation
+            if generation is None:
+                unknown.add(key)
+            else:
+                generations[key] = new_generations[key] = generation + 1
+        if new_generations and self._add_generations is not None:
+            self._add_generations(new_generations)
+        result = {}
+        for key in keys:
+            if key == revision.NULL_REVISION:
+                result[key] = 0
+            else:
+                result[key] = generations.get(key)
+        return result
+
+
 class Graph(object):
     """Provide incremental access to revision graphs.
 
@@ -239,7 +324,7 @@ class Graph(object):
     specialize it for other repository types.
     """
 
-    def __init__(self, parents_provider):
+    def __init__(self, parents_provider, generation_index=None):
         """Construct a Graph that uses several graphs as its input
 
         This should not normally be invoked directly, because there may be
@@ -249,12 +334,15 @@ class Graph(object):
         :param parents_provider: An object providing a get_parent_map call
             conforming to the behavior of
             StackedParentsProvider.get_parent_map.
+        :param generation_index: Optional GenerationIndex, used to stop
+            searches in heads() and find_unique_ancestors() early.
         """
         if getattr(parents_provider, 'get_parents', None) is not None:
             self.get_parents = parents_provider.get_parents
         if getattr(parents_provider, 'get_parent_map', None) is not None:
             self.get_parent_map = parents_provider.get_parent_map
         self._parents_provider = parents_provider
+        self._generation_index = generation_index
 
     def __repr__(self):
         return 'Graph(%r)' % self._parents_provider
@@ -463,7 +551,8 @@ class Graph(object):
              unique_nodes, unique_searcher, common_searcher)
 
         self._refine_unique_nodes(unique_searcher, all_unique_searcher,
-                                  unique_tip_searchers, common_searcher)
+                                  unique_tip_searchers, common_searcher,
+                                  self._min_generation(unique_nodes))
         true_unique_nodes = unique_nodes.difference(common_searcher.seen)
         if 'graph' in debug.debug_flags:
             trace.mutter('Found %d truly unique nodes out of %d',
@@ -671,11 +760,16 @@ class Graph(object):
         return next_unique_searchers
 
     def _refine_unique_nodes(self, unique_searcher, all_unique_searcher,
-                             unique_tip_searchers, common_searcher):
+                             unique_tip_searchers, common_searcher,
+                             min_unique_generation=None):
         """Steps 5-8 of find_unique_ancestors.
 
         This function returns when common_searcher has stopped searching for
         more nodes.
+
+        :param min_unique_generation: If not None, the lowest generation
+            number of the unique nodes. The common searcher doesn't search
+            past nodes that can't be descendants of any of them.
         """
         # We step the ancestor_all_unique searcher only every
         # STEP_UNIQUE_SEARCHER_EVERY steps.
@@ -697,6 +791,10 @@ class Graph(object):
                 # can stop searching it.
                 common_searcher.stop_searching_any(
                     all_unique_searcher.seen.intersection(newly_seen_common))
+                if min_unique_generation is not None:
+                    self._stop_searching_generations(
+                        [common_searcher], newly_seen_common,
+                        min_unique_generation)
             if common_to_all_unique_nodes:
                 common_to_all_unique_nodes.update(
                     common_searcher.find_seen_ancestors(
@@ -737,6 +835,34 @@ class Graph(object):
     def _make_breadth_first_searcher(self, revisions):
         return _BreadthFirstSearcher(revisions, self)
 
+    def _min_generation(self, keys):
+        """Return the lowest generation number of keys.
+
+        :return: The generation number, or None if there is no generation
+            index or some of keys have no generation number.
+        """
+        if self._generation_index is None or not keys:
+            return None
+        generations = self._generation_index.get_generations(
+            self._parents_provider, keys)
+        if None in generations.values():
+            return None
+        return min(generations.values())
+
+    def _stop_searching_generations(self, searchers, revisions,
+                                    max_generation):
+        """Stop searching revisions with at most max_generation.
+
+        Their ancestors all have lower generation numbers.
+        """
+        generations = self._generation_index.get_generations(
+            self._parents_provider, revisions)
+        stop = [key for key, generation in generations.items()
+                if generation is not None and generation <= max_generation]
+        if stop:
+            for searcher in searchers:
+                searcher.stop_searching_any(stop)
+
     def _find_border_ancestors(self, revisions):
         """Find common ancestors with at least one uncommon descendant.
 
@@ -833,6 +959,13 @@ class Graph(object):
                 return {revision.NULL_REVISION}
         if len(candidate_heads) < 2:
             return candidate_heads
+        min_generation = self._min_generation(candidate_heads)
+        if min_generation is not None:
+            generations = self._generation_index.get_generations(
+                self._parents_provider, candidate_heads)
+            if max(generations.values()) == min_generation:
+                # None of them can be an ancestor of another.
+                return candidate_heads
         searchers = dict((c, self._make_breadth_first_searcher([c]))
                          for c in candidate_heads)
         active_searchers = dict(searchers)
@@ -897,6 +1030,14 @@ class Graph(object):
                                 searcher.find_seen_ancestors([ancestor])
                             searcher.stop_searching_any(seen_ancestors)
             common_walker.start_searching(new_common)
+            if min_generation is not None and ancestors:
+                # Nothing older than all the remaining candidates can lead
+                # to one of them.
+                min_generation = min(
+                    generations[c] for c in candidate_heads)
+                self._stop_searching_generations(
+                    list(searchers.values()) + [common_walker], ancestors,
+                    min_generation)
         return candidate_heads
 
     def find_merge_order(self, tip_revision_id, lca_revision_ids):
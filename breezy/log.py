@@ -48,6 +48,7 @@ all the changes since the previous revision that touched hello.c.
 """
 
 import codecs
+import collections
 from io import BytesIO
 import itertools
 import re
@@ -630,6 +631,10 @@ def _calc_view_revisions(branch, start_rev_id, end_rev_id, direction,
             # Switch to the slower implementation that may be able to find a
             # non-obvious ancestor out of the left-hand history.
             pass
+    if (direction == 'forward' and start_rev_id is None
+            and end_rev_id in (None, br_rev_id)):
+        # The whole history can be shown as it is merge sorted
+        return _graph_view_revisions_forward(branch)
     iter_revs = _generate_all_revisions(branch, start_rev_id, end_rev_id,
                                         direction, delayed_graph_generation,
                                         exclude_common_ancestry)
@@ -869,6 +874,33 @@ def _graph_view_revisions(branch, start_rev_id, end_rev_id,
             yield rev_id, '.'.join(map(str, revno)), merge_depth
 
 
+def _graph_view_revisions_forward(branch):
+    """Calculate all revisions to view including merges, oldest to newest.
+
+    This gives the same revisions in the same order as reversing the whole
+    history with reverse_by_depth, but one mainline revision and the
+    revisions it merged at a time, as the ancestry of the branch tip is merge
+    sorted.
+
+    :param branch: the branch
+    :return: An iterator of (revision_id, dotted_revno, merge_depth) tuples.
+    """
+    merged = []
+    for rev_id, merge_depth, revno in branch._iter_merge_sorted_forward():
+        view = (rev_id, '.'.join(map(str, revno)), merge_depth)
+        if merge_depth:
+            # Merged revisions are sorted before the revision merging them
+            merged.append(view)
+        elif not merged:
+            yield view
+        else:
+            merged.append(view)
+            merged.reverse()
+            for view in reverse_by_depth(merged):
+                yield view
+            merged = []
+
+
 def _rebase_merge_depth(view_revisions):
     """Adjust depths upwards so the top level is 0."""
     # If either the first or last revision have a merge_depth of 0, we're done
@@ -986,10 +1018,98 @@ def _make_delta_filter(branch, generate_delta, search, log_rev_iterator,
     """
     if not generate_delta and not files:
         return log_rev_iterator
+    if generate_delta == 'full' and not files:
+        num_processes = config.GlobalStack().get('log.delta_processes')
+        pool = _start_delta_processes(branch, num_processes)
+        if pool is not None:
+            return _generate_deltas_in_processes(
+                pool, num_processes, log_rev_iterator)
     return _generate_deltas(branch.repository, log_rev_iterator,
                             generate_delta, files, direction)
 
 
+# The repository opened by a delta worker process, see _start_delta_processes
+_delta_worker_repository = None
+
+
+def _init_delta_worker(url):
+    global _delta_worker_repository
+    from .branch import Branch
+    # Open the branch rather than its repository, so that the repositories
+    # it is stacked on are used too.
+    branch = Branch.open(url)
+    branch.lock_read()
+    _delta_worker_repository = branch.repository
+
+
+def _get_deltas_in_worker(revision_ids):
+    repository = _delta_worker_repository
+    return list(repository.get_revision_deltas(
+        repository.get_revisions(revision_ids)))
+
+
+def _start_delta_processes(branch, num_processes):
+    """Start worker processes for computing revision deltas.
+
+    Each worker opens and read locks its own copy of the branch and its
+    repository, so deserialising inventories and comparing them, which is
+    most of the work for 'log -v', can happen on several cores.
+
+    :param branch: The branch being logged. Workers open it, rather than
+        its repository, so that stacking is honoured.
+    :param num_processes: The number of worker processes.
+    :return: A concurrent.futures.ProcessPoolExecutor, or None if
+        num_processes is < 1 or the branch or repository is not local.
+        Workers are forked, so that they have the same formats and plugins
+        available; None is also returned if the platform can't fork.
+    """
+    if num_processes < 1:
+        return None
+    import multiprocessing
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        return None
+    try:
+        branch.user_transport.local_abspath('.')
+        branch.repository.user_transport.local_abspath('.')
+    except errors.NotLocalUrl:
+        return None
+    from concurrent.futures import ProcessPoolExecutor
+    return ProcessPoolExecutor(
+        max_workers=num_processes,
+        mp_context=multiprocessing.get_context('fork'),
+        initializer=_init_delta_worker, initargs=(branch.user_url,))
+
+
+def _generate_deltas_in_processes(pool, num_processes, log_rev_iterator):
+    """Create full deltas for each batch of revisions in worker processes.
+
+    Batches are handed to the workers as they are read, up to twice as many
+    as there are workers ahead of the one being yielded, and yielded in
+    order as soon as their deltas are ready.
+
+    :param pool: An executor from _start_delta_processes, which is shut down
+        once the iterator is done.
+    """
+    pending = collections.deque()
+
+    def with_deltas(revs, future):
+        return [(rev[0], rev[1], delta)
+                for rev, delta in zip(revs, future.result())]
+    try:
+        for revs in log_rev_iterator:
+            pending.append((revs, pool.submit(
+                _get_deltas_in_worker, [rev[0][0] for rev in revs])))
+            while pending and (len(pending) > 2 * num_processes or
+                               pending[0][1].done()):
+                yield with_deltas(*pending.popleft())
+        while pending:
+            yield with_deltas(*pending.popleft())
+    finally:
+        for _, future in pending:
+            future.cancel()
+        pool.shutdown()
+
+
 def _generate_deltas(repository, log_rev_iterator, delta_type, files,
                      direction):
     """Create deltas for each batch of revisions in log_rev_iterator.
@@ -1284,27 +1404,10 @@ def _filter_revisions_touching_path(branch, path, view_revisions,
     """
     # Lookup all possible text keys to determine which ones actually modified
     # the file.
-    graph = branch.repository.get_file_graph()
     start_tree = branch.repository.revision_tree(view_revisions[0][0])
     file_id = start_tree.path2id(path)
-    get_parent_map = graph.get_parent_map
-    text_keys = [(file_id, rev_id) for rev_id, revno, depth in view_revisions]
-    next_keys = None
-    # Looking up keys in batches of 1000 can cut the time in half, as well as
-    # memory consumption. GraphIndex *does* like to look for a few keys in
-    # parallel, it just doesn't like looking for *lots* of keys in parallel.
-    # TODO: This code needs to be re-evaluated periodically as we tune the
-    #       indexing layer. We might consider passing in hints as to the known
-    #       access pattern (sparse/clustered, high success rate/low success
-    #       rate). This particular access is clustered with a low success rate.
-    modified_text_revisions = set()
-    chunk_size = 1000
-    for start in range(0, len(text_keys), chunk_size):
-        next_keys = text_keys[start:start + chunk_size]
-        # Only keep the revision_id portion of the key
-        modified_text_revisions.update(
-            [k[1] for k in get_parent_map(next_keys)])
-    del text_keys, next_keys
+    modified_text_revisions = branch.repository.find_file_changing_revisions(
+        file_id, [rev_id for rev_id, revno, depth in view_revisions])
 
     result = []
     # Track what revisions will merge the current revision, replace entries
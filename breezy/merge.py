@@ -14,6 +14,7 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
 
+import collections
 import contextlib
 
 from .lazy_import import lazy_import
@@ -22,6 +23,7 @@ import patiencediff
 
 from breezy import (
     branch as _mod_branch,
+    config,
     conflicts as _mod_conflicts,
     debug,
     graph as _mod_graph,
@@ -690,6 +692,32 @@ class _InventoryNoneEntry(object):
 _none_entry = _InventoryNoneEntry()
 
 
+def _merge3_lines(m3, base_marker, reprocess):
+    """Merge the texts of a Merge3 the way Merge3Merger.text_merge does.
+
+    This is a function rather than a method, so that it can be run in a
+    worker process.
+
+    :return: A tuple with the merged lines and whether there were any text
+        conflicts.
+    """
+    start_marker = b"!START OF MERGE CONFLICT!" + b"I HOPE THIS IS UNIQUE"
+    merged_lines = []
+    text_conflicts = False
+    for line in m3.merge_lines(name_a=b"TREE",
+                               name_b=b"MERGE-SOURCE",
+                               name_base=b"BASE-REVISION",
+                               start_marker=start_marker,
+                               base_marker=base_marker,
+                               reprocess=reprocess):
+        if line.startswith(start_marker):
+            text_conflicts = True
+            merged_lines.append(line.replace(start_marker, b'<' * 7))
+        else:
+            merged_lines.append(line)
+    return merged_lines, text_conflicts
+
+
 class Merge3Merger(object):
     """Three-way merger that uses the merge3 text merger"""
     requires_base = True
@@ -751,6 +779,9 @@ class Merge3Merger(object):
         #     self._lca_trees = [self.base_tree]
         self.change_reporter = change_reporter
         self.cherrypick = cherrypick
+        self._text_merge_pool = None
+        self._pending_text_merges = collections.deque()
+        self._deferred_executability = {}
         if do_merge:
             self.do_merge()
 
@@ -788,6 +819,14 @@ class Merge3Merger(object):
         # One hook for each registered one plus our default merger
         hooks = [factory(self) for factory in factories] + [self]
         self.active_hooks = [hook for hook in hooks if hook is not None]
+        with contextlib.ExitStack() as stack:
+            self._start_text_merge_processes(stack)
+            self._merge_entries(entries, resolver)
+            self._finish_text_merges()
+        self.tt.fixup_new_roots()
+        self._finish_computing_transform()
+
+    def _merge_entries(self, entries, resolver):
         with ui.ui_factory.nested_progress_bar() as child_pb:
             for num, (file_id, changed, paths3, parents3, names3,
                       executable3, copied) in enumerate(entries):
@@ -809,10 +848,46 @@ class Merge3Merger(object):
                     file_status = self._do_merge_contents(paths3, trans_id, file_id)
                 else:
                     file_status = 'unmodified'
-                self._merge_executable(paths3, trans_id, executable3,
-                                       file_status, resolver=resolver)
-        self.tt.fixup_new_roots()
-        self._finish_computing_transform()
+                if trans_id in self._deferred_executability:
+                    # The file is only created once its text merge is back.
+                    self._deferred_executability[trans_id] = (
+                        paths3, executable3, file_status, resolver)
+                else:
+                    self._merge_executable(paths3, trans_id, executable3,
+                                           file_status, resolver=resolver)
+
+    def _start_text_merge_processes(self, stack):
+        """Start worker processes for the text merges, if configured.
+
+        With merge.text_merge_processes set, text_merge hands the Merge3
+        merges to this many worker processes and _finish_text_merges adds
+        their results to the transform. Everything else, including the
+        merge_file_content hooks, still runs in this process and in the same
+        order. Workers are forked, so nothing is done on platforms that can't
+        fork.
+
+        :param stack: An ExitStack that shuts the workers down.
+        """
+        num_processes = config.GlobalStack().get('merge.text_merge_processes')
+        if num_processes < 1:
+            return
+        import multiprocessing
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            return
+        from concurrent.futures import ProcessPoolExecutor
+        self._text_merge_pool = ProcessPoolExecutor(
+            max_workers=num_processes,
+            mp_context=multiprocessing.get_context('fork'))
+        self._text_merge_processes = num_processes
+
+        def shutdown():
+            for pending in self._pending_text_merges:
+                pending[0].cancel()
+            self._pending_text_merges.clear()
+            self._deferred_executability.clear()
+            self._text_merge_pool.shutdown()
+            self._text_merge_pool = None
+        stack.callback(shutdown)
 
     def _finish_computing_transform(self):
         """Finalize the transform and report the changes.
@@ -1400,6 +1475,11 @@ class Merge3Merger(object):
                 return []
             return tree.get_file_lines(path)
 
+    def _make_merge3(self, base_lines, this_lines, other_lines):
+        """Create the Merge3 for a text merge."""
+        return merge3.Merge3(base_lines, this_lines, other_lines,
+                             is_cherrypick=self.cherrypick)
+
     def text_merge(self, trans_id, paths):
         """Perform a three-way text merge on a file"""
         # it's possible that we got here with base as a different type.
@@ -1408,37 +1488,51 @@ class Merge3Merger(object):
         base_lines = self.get_lines(self.base_tree, base_path)
         other_lines = self.get_lines(self.other_tree, other_path)
         this_lines = self.get_lines(self.this_tree, this_path)
-        m3 = merge3.Merge3(base_lines, this_lines, other_lines,
-                           is_cherrypick=self.cherrypick)
-        start_marker = b"!START OF MERGE CONFLICT!" + b"I HOPE THIS IS UNIQUE"
+        m3 = self._make_merge3(base_lines, this_lines, other_lines)
         if self.show_base is True:
             base_marker = b'|' * 7
         else:
             base_marker = None
-
-        def iter_merge3(retval):
-            retval["text_conflicts"] = False
-            for line in m3.merge_lines(name_a=b"TREE",
-                                       name_b=b"MERGE-SOURCE",
-                                       name_base=b"BASE-REVISION",
-                                       start_marker=start_marker,
-                                       base_marker=base_marker,
-                                       reprocess=self.reprocess):
-                if line.startswith(start_marker):
-                    retval["text_conflicts"] = True
-                    yield line.replace(start_marker, b'<' * 7)
-                else:
-                    yield line
-        retval = {}
-        merge3_iterator = iter_merge3(retval)
-        self.tt.create_file(merge3_iterator, trans_id)
-        if retval["text_conflicts"] is True:
+        lines = (base_lines, other_lines, this_lines)
+        if self._text_merge_pool is None:
+            self._add_text_merge(
+                trans_id, paths, lines,
+                *_merge3_lines(m3, base_marker, self.reprocess))
+            return
+        future = self._text_merge_pool.submit(
+            _merge3_lines, m3, base_marker, self.reprocess)
+        self._pending_text_merges.append((future, trans_id, paths, lines))
+        self._deferred_executability[trans_id] = None
+        # Keep the workers busy without holding on to too many texts.
+        pending = self._pending_text_merges
+        while pending and (len(pending) > 2 * self._text_merge_processes or
+                           pending[0][0].done()):
+            self._finish_text_merge(*pending.popleft())
+
+    def _finish_text_merge(self, future, trans_id, paths, lines):
+        self._add_text_merge(trans_id, paths, lines, *future.result())
+        # The execute bit can only be set now that the file exists.
+        deferred = self._deferred_executability.pop(trans_id)
+        if deferred is not None:
+            paths3, executable3, file_status, resolver = deferred
+            self._merge_executable(paths3, trans_id, executable3,
+                                   file_status, resolver=resolver)
+
+    def _finish_text_merges(self):
+        """Add the results of the text merges still in the workers."""
+        while self._pending_text_merges:
+            self._finish_text_merge(*self._pending_text_merges.popleft())
+
+    def _add_text_merge(self, trans_id, paths, lines, merged_lines,
+                        text_conflicts):
+        """Add the result of a text merge to the transform."""
+        self.tt.create_file(merged_lines, trans_id)
+        if text_conflicts:
             self._raw_conflicts.append(('text conflict', trans_id))
             name = self.tt.final_name(trans_id)
             parent_id = self.tt.final_parent(trans_id)
             file_group = self._dump_conflicts(
-                name, paths, parent_id,
-                lines=(base_lines, other_lines, this_lines))
+                name, paths, parent_id, lines=lines)
             file_group.append(trans_id)
 
     def _get_filter_tree_path(self, path):
@@ -1535,6 +1629,17 @@ class Merge3Merger(object):
             list(fs_conflicts) + self._raw_conflicts))
 
 
+class InternedMerge3Merger(Merge3Merger):
+    """Merge3Merger that matches interned lines, see merge3.InternedMerge3.
+
+    This is faster for large files whose changes are close together.
+    """
+
+    def _make_merge3(self, base_lines, this_lines, other_lines):
+        return merge3.InternedMerge3(base_lines, this_lines, other_lines,
+                                     is_cherrypick=self.cherrypick)
+
+
 class WeaveMerger(Merge3Merger):
     """Three-way tree merger, text weave merger."""
     supports_reprocess = True
@@ -1856,6 +1961,9 @@ merge_type_registry.register('lca', LCAMerger,
                              "LCA-newness merge.")
 merge_type_registry.register('merge3', Merge3Merger,
                              "Native diff3-style merge.")
+merge_type_registry.register('merge3-interned', InternedMerge3Merger,
+                             "Native diff3-style merge of interned lines, "
+                             "faster for large files with local changes.")
 merge_type_registry.register('weave', WeaveMerger,
                              "Weave-based merge.")
 
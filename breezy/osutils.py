@@ -1114,6 +1114,36 @@ def link_or_copy(src, dest):
         shutil.copyfile(src, dest)
 
 
+# The FICLONE ioctl, from linux/fs.h.
+_FICLONE = 0x40049409
+
+
+def reflink_or_copy(src, dest):
+    """Clone a file with copy-on-write, or copy it if it can't be cloned.
+
+    A clone shares the data blocks of the original until either of them is
+    changed, so on filesystems that support it (e.g. btrfs and XFS on Linux)
+    it takes next to no time or disk space.
+
+    :return: True if the file was cloned, False if it was copied.
+    """
+    with open(src, 'rb') as s, open(dest, 'wb') as d:
+        if sys.platform.startswith('linux'):
+            import fcntl
+            try:
+                fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+            except (OSError, IOError) as e:
+                # The filesystem can't clone files, or not between these two
+                # locations.
+                if e.errno not in (errno.EOPNOTSUPP, errno.ENOTTY,
+                                   errno.EXDEV, errno.EINVAL, errno.ENOSYS):
+                    raise
+            else:
+                return True
+        shutil.copyfileobj(s, d)
+    return False
+
+
 def delete_any(path):
     """Delete a file, symlink or directory.
 
@@ -1788,13 +1818,20 @@ class DirReader(object):
 _selected_dir_reader = None
 
 
-def _walkdirs_utf8(top, prefix=""):
+def _walkdirs_utf8(top, prefix="", executor=None, read_ahead=0):
     """Yield data about all the directories in a tree.
 
     This yields the same information as walkdirs() only each entry is yielded
     in utf-8. On platforms which have a filesystem encoding of utf8 the paths
     are returned as exact byte-strings.
 
+    As with walkdirs(), directories removed from a yielded dirblock by the
+    caller are not descended into.
+
+    :param executor: Optional concurrent.futures executor. If given, up to
+        read_ahead of the directories that will be yielded next are read
+        (listed and lstat'ed) by it while the caller processes the current
+        one. The order of the results is the same.
     :return: yields a tuple of (dir_info, [file_info])
         dir_info is (utf8_relpath, path-from-top)
         file_info is (utf8_relpath, utf8_name, kind, lstat, path-from-top)
@@ -1827,6 +1864,11 @@ def _walkdirs_utf8(top, prefix=""):
     pending = [[_selected_dir_reader.top_prefix_to_starting_dir(top, prefix)]]
     read_dir = _selected_dir_reader.read_dir
     _directory = _directory_kind
+    if executor is not None:
+        for dir_info in _walkdirs_utf8_read_ahead(
+                pending, read_dir, executor, read_ahead):
+            yield dir_info
+        return
     while pending:
         relroot, _, _, _, top = pending[-1].pop()
         if not pending[-1]:
@@ -1839,6 +1881,44 @@ def _walkdirs_utf8(top, prefix=""):
             pending.append(next)
 
 
+def _walkdirs_utf8_read_ahead(pending, read_dir, executor, read_ahead):
+    """The body of _walkdirs_utf8, reading directories ahead in executor."""
+    def sorted_read_dir(relroot, top):
+        return sorted(read_dir(relroot, top))
+    _directory = _directory_kind
+    # toppath -> future for the directories being read ahead
+    reading = {}
+    try:
+        while pending:
+            relroot, _, _, _, top = pending[-1].pop()
+            if not pending[-1]:
+                pending.pop()
+            future = reading.pop(top, None)
+            if future is None:
+                dirblock = sorted_read_dir(relroot, top)
+            else:
+                dirblock = future.result()
+            yield (relroot, top), dirblock
+            # push the user specified dirs from dirblock
+            next = [d for d in reversed(dirblock) if d[2] == _directory]
+            if next:
+                pending.append(next)
+            # Directories are visited from the end of the innermost pending
+            # list, so start reading the ones at the end of each list.
+            for dirs in reversed(pending):
+                if len(reading) >= read_ahead:
+                    break
+                for d in reversed(dirs):
+                    if len(reading) >= read_ahead:
+                        break
+                    if d[4] not in reading:
+                        reading[d[4]] = executor.submit(
+                            sorted_read_dir, d[0], d[4])
+    finally:
+        for future in reading.values():
+            future.cancel()
+
+
 class UnicodeDirReader(DirReader):
     """A dir reader for non-utf8 file systems, which transcodes."""
 
@@ -908,15 +908,7 @@ class Repository(controldir.ControlComponent, _RelockDebugMixin):
           children are included.
         """
         from .tree import InterTree
-        # Get the revision-ids of interest
-        required_trees = set()
-        for revision in revisions:
-            required_trees.add(revision.revision_id)
-            required_trees.update(revision.parent_ids[:1])
-
-        trees = {
-            t.get_revision_id(): t
-            for t in self.revision_trees(required_trees)}
+        trees = self._get_revision_delta_trees(revisions)
 
         # Calculate the deltas
         for revision in revisions:
@@ -932,6 +924,21 @@ class Repository(controldir.ControlComponent, _RelockDebugMixin):
                         specific_files).values()
                     if p is not None]
 
+    def _get_revision_delta_trees(self, revisions):
+        """Get the trees needed to compute the deltas for revisions.
+
+        :return: A dict mapping revision ids to revision trees, for each
+            revision and its lefthand predecessor.
+        """
+        # Get the revision-ids of interest
+        required_trees = set()
+        for revision in revisions:
+            required_trees.add(revision.revision_id)
+            required_trees.update(revision.parent_ids[:1])
+        return {
+            t.get_revision_id(): t
+            for t in self.revision_trees(required_trees)}
+
     def store_revision_signature(self, gpg_strategy, plaintext, revision_id):
         raise NotImplementedError(self.store_revision_signature)
 
@@ -1100,6 +1107,38 @@ class Repository(controldir.ControlComponent, _RelockDebugMixin):
         """Return the graph walker for files."""
         raise NotImplementedError(self.get_file_graph)
 
+    def find_file_changing_revisions(self, file_id, revision_ids):
+        """Find the revisions in which a file was changed.
+
+        :param file_id: The file id of the file.
+        :param revision_ids: The revisions to consider.
+        :return: A set with the revision ids from revision_ids that changed
+            the file.
+        """
+        get_parent_map = self.get_file_graph().get_parent_map
+        text_keys = [(file_id, rev_id) for rev_id in revision_ids]
+        # Looking up keys in batches of 1000 can cut the time in half, as well
+        # as memory consumption. GraphIndex *does* like to look for a few keys
+        # in parallel, it just doesn't like looking for *lots* of keys in
+        # parallel.
+        # TODO: This code needs to be re-evaluated periodically as we tune the
+        #       indexing layer. We might consider passing in hints as to the
+        #       known access pattern (sparse/clustered, high success rate/low
+        #       success rate). This particular access is clustered with a low
+        #       success rate.
+        modified_text_revisions = set()
+        chunk_size = 1000
+        for start in range(0, len(text_keys), chunk_size):
+            next_keys = text_keys[start:start + chunk_size]
+            # Only keep the revision_id portion of the key
+            modified_text_revisions.update(
+                [k[1] for k in get_parent_map(next_keys)])
+        return modified_text_revisions
+
+    def _get_generation_index(self):
+        """Return the graph.GenerationIndex for this repository, or None."""
+        return None
+
     def get_graph(self, other_repository=None):
         """Return the graph walker for this repository format"""
         parents_provider = self._make_parents_provider()
@@ -1107,7 +1146,9 @@ class Repository(controldir.ControlComponent, _RelockDebugMixin):
                 not self.has_same_location(other_repository)):
             parents_provider = graph.StackedParentsProvider(
                 [parents_provider, other_repository._make_parents_provider()])
-        return graph.Graph(parents_provider)
+            return graph.Graph(parents_provider)
+        return graph.Graph(parents_provider,
+                           generation_index=self._get_generation_index())
 
     def set_make_working_trees(self, new_value):
         """Set the policy flag for making working trees when creating branches.
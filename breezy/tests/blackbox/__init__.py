@@ -67,6 +67,7 @@ def load_tests(loader, basic_tests, pattern):
         'test_filesystem_cicp',
         'test_filtered_view_ops',
         'test_find_merge_base',
+        'test_fsmonitor',
         'test_help',
         'test_hooks',
         'test_import',
@@ -23,6 +23,7 @@ from breezy import (
     branch,
     controldir,
     errors,
+    osutils,
     revision as _mod_revision,
     tests,
     )
@@ -261,6 +262,22 @@ class TestBranch(tests.TestCaseWithTransport):
         target_stat = os.stat('target/file1')
         self.assertEqual(source_stat, target_stat)
 
+    def test_branch_reflink(self):
+        source = self.make_branch_and_tree('source')
+        self.build_tree(['source/file1'])
+        source.add('file1')
+        source.commit('added file')
+        cloned = []
+        reflink_or_copy = osutils.reflink_or_copy
+
+        def reflink(src, dest):
+            cloned.append(src)
+            return reflink_or_copy(src, dest)
+        self.overrideAttr(osutils, 'reflink_or_copy', reflink)
+        self.run_bzr('branch -Obzr.transform.reflink=true source target')
+        self.assertEqual([osutils.abspath('source/file1')], cloned)
+        self.assertFileEqual(b'contents of source/file1\n', 'target/file1')
+
     def test_branch_files_from(self):
         source = self.make_branch_and_tree('source')
         self.build_tree(['source/file1'])
@@ -0,0 +1,55 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""External tests of 'brz fsmonitor'"""
+
+from breezy import (
+    config,
+    osutils,
+    tests,
+    )
+from breezy.tests.test_fsmonitor import start_fsmonitor
+
+
+class TestFSMonitor(tests.TestCaseWithTransport):
+
+    def setUp(self):
+        super(TestFSMonitor, self).setUp()
+        config.GlobalStack().set('fsmonitor.socket', 'fsmonitor.sock')
+
+    def test_status_not_running(self):
+        out, err = self.run_bzr('fsmonitor status', retcode=1)
+        self.assertEqual('fsmonitor is not running\n', out)
+
+    def test_status(self):
+        start_fsmonitor(self)
+        tree = self.make_branch_and_tree('tree')
+        tree.commit('one')
+        config.GlobalStack().set('bzr.workingtree.fsmonitor', True)
+        self.run_bzr('status tree')
+        out, err = self.run_bzr('fsmonitor status')
+        self.assertEqual('fsmonitor is watching 1 trees\n  %s\n'
+                         % osutils.abspath('tree'), out)
+
+    def test_stop(self):
+        start_fsmonitor(self, 'other.sock')
+        config.GlobalStack().set('fsmonitor.socket', 'other.sock')
+        self.run_bzr('fsmonitor stop')
+        self.run_bzr('fsmonitor status', retcode=1)
+
+    def test_unknown_action(self):
+        self.run_bzr_error(['Unknown action: frobnicate'],
+                           'fsmonitor frobnicate')
@@ -400,6 +400,7 @@ paramiko = ModuleAvailableFeature('paramiko')
 pywintypes = ModuleAvailableFeature('pywintypes')
 subunit = ModuleAvailableFeature('subunit')
 testtools = ModuleAvailableFeature('testtools')
+zstandard = ModuleAvailableFeature('zstandard')
 flake8 = ModuleAvailableFeature('flake8.api.legacy')
 
 lsprof_feature = ModuleAvailableFeature('breezy.lsprof')
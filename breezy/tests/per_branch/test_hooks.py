@@ -114,10 +114,16 @@ class TestOpen(tests.TestCaseWithMemoryTransport):
             self.assertEqual(3, len(self.hook_calls))
             # open_branchV2 RPC
             self.assertRealBranch(self.hook_calls[0])
-            # create RemoteBranch locally
-            self.assertEqual(b, self.hook_calls[1])
-            # get_stacked_on_url RPC
-            self.assertRealBranch(self.hook_calls[2])
+            if b._client._medium.supports_pipelining():
+                # get_stacked_on_url RPC, sent along with find_repositoryV3
+                self.assertRealBranch(self.hook_calls[1])
+                # create RemoteBranch locally
+                self.assertEqual(b, self.hook_calls[2])
+            else:
+                # create RemoteBranch locally
+                self.assertEqual(b, self.hook_calls[1])
+                # get_stacked_on_url RPC
+                self.assertRealBranch(self.hook_calls[2])
         else:
             self.assertEqual([b], self.hook_calls)
 
@@ -20,6 +20,7 @@ import os
 
 from ..bzr.conflicts import TextConflict
 from .. import (
+    config,
     errors,
     merge as _mod_merge,
     )
@@ -206,6 +207,36 @@ class TestMergeImplementation(TestCaseWithTransport):
                           self.do_merge, wt, wt)
         self.assertRaises(errors.LockError, wt.unlock)
 
+    def test_merge_text_and_executable_with_processes(self):
+        config.GlobalStack().set('merge.text_merge_processes', 2)
+        this_tree = self.make_branch_and_tree('this')
+        this_tree.lock_write()
+        self.addCleanup(this_tree.unlock)
+        self.build_tree_contents([
+            ('this/file1', b'a\nb\nc\n'),
+            ('this/file2', b'a\nb\nc\n'),
+        ])
+        this_tree.add(['file1', 'file2'])
+        this_tree.commit('Added files')
+        other_tree = this_tree.controldir.sprout('other').open_workingtree()
+        self.build_tree_contents([
+            ('other/file1', b'a\nb\nc\nd\n'),
+            ('other/file2', b'a\nb\nc\nd\n'),
+        ])
+        os.chmod('other/file1', 0o755)
+        other_tree.commit('Changed both, made file1 executable')
+        self.build_tree_contents([
+            ('this/file1', b'z\na\nb\nc\n'),
+            ('this/file2', b'z\na\nb\nc\n'),
+        ])
+        os.chmod('this/file2', 0o755)
+        this_tree.commit('Changed both, made file2 executable')
+        self.do_merge(this_tree, other_tree)
+        self.assertFileEqual(b'z\na\nb\nc\nd\n', 'this/file1')
+        self.assertFileEqual(b'z\na\nb\nc\nd\n', 'this/file2')
+        self.assertTrue(this_tree.is_executable('file1'))
+        self.assertTrue(this_tree.is_executable('file2'))
+
 
 class TestHookMergeFileContent(TestCaseWithTransport):
     """Tests that the 'merge_file_content' hook is invoked."""
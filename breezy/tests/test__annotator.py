@@ -365,6 +365,54 @@ class TestAnnotator(tests.TestCaseWithMemoryTransport):
                                   ], spec_key,
                                  exp_text=spec_text)
 
+    def make_annotation_cache(self):
+        t = self.get_transport('annotations')
+        t.ensure_base()
+        return annotate.AnnotationCache(t)
+
+    def test_annotate_adds_to_cache(self):
+        self.make_merge_text()
+        cache = self.make_annotation_cache()
+        self.ann.set_annotation_cache(cache)
+        annotations, lines = self.ann.annotate(self.fd_key)
+        self.assertEqual(annotations, cache.get(self.fd_key))
+        # Only the annotated text is cached
+        self.assertIs(None, cache.get(self.fb_key))
+
+    def test_annotate_stops_at_cached_text(self):
+        self.make_many_way_common_merge_text()
+        cache = self.make_annotation_cache()
+        self.ann.set_annotation_cache(cache)
+        self.ann.annotate(self.fd_key)
+        expected = self.module.Annotator(self.vf).annotate_flat(self.ff_key)
+        self.ann = self.module.Annotator(self.vf)
+        self.ann.set_annotation_cache(cache)
+        keys, ann_keys = self.ann._get_needed_keys(self.ff_key)
+        # The ancestry of fd is not needed
+        self.assertEqual([self.fa_key, self.fd_key, self.fe_key, self.ff_key],
+                         sorted(keys))
+        self.ann = self.module.Annotator(self.vf)
+        self.ann.set_annotation_cache(cache)
+        self.assertAnnotateEqual([(self.fa_key,),
+                                  (self.fb_key, self.fc_key, self.fe_key)],
+                                 self.ff_key)
+        # Resolving the tie needs the ancestry of fd after all
+        self.assertEqual(expected, self.ann.annotate_flat(self.ff_key))
+
+    def test_annotate_special_text_caches_parents(self):
+        self.make_many_way_common_merge_text()
+        cache = self.make_annotation_cache()
+        self.ann.set_annotation_cache(cache)
+        spec_key = (b'f-id', revision.CURRENT_REVISION)
+        self.ann.add_special_text(spec_key, [self.fd_key, self.fe_key],
+                                  b'simple\nnew content\nlocally modified\n')
+        self.ann.annotate(spec_key)
+        self.assertIs(None, cache.get(spec_key))
+        self.assertEqual([(self.fa_key,), (self.fb_key, self.fc_key)],
+                         cache.get(self.fd_key))
+        self.assertEqual([(self.fa_key,), (self.fe_key,)],
+                         cache.get(self.fe_key))
+
     def test_no_graph(self):
         self.make_no_graph_texts()
         self.assertAnnotateEqual([(self.fa_key,),
@@ -373,3 +421,4 @@ class TestAnnotator(tests.TestCaseWithMemoryTransport):
         self.assertAnnotateEqual([(self.fb_key,),
                                   (self.fb_key,),
                                   ], self.fb_key)
+
@@ -419,6 +419,9 @@ class TestKnownGraphMergeSort(TestCaseWithKnownGraph):
         if result_list != value:
             self.assertEqualDiff(pprint.pformat(result_list),
                                  pprint.pformat(value))
+        graph = self.make_known_graph(ancestry)
+        self.assertEqual([row[:3] for row in reversed(result_list)],
+                         list(graph.iter_merge_sort_forward(branch_tip)))
 
     def test_merge_sort_empty(self):
         # sorting of an emptygraph does not error
@@ -21,6 +21,7 @@ from io import BytesIO, StringIO
 
 from .. import (
     annotate,
+    config,
     tests,
     )
 from .ui_testing import StringIOWithEncoding
@@ -492,3 +493,41 @@ class TestReannotate(tests.TestCase):
         blocks = [(0, 1, 1), (1, 2, 0)]
         self.annotateEqual([(b'rev2', b'a\n'), (b'rev1', b'a\n')], [parent],
                            new_text, b'rev2', blocks)
+
+
+class TestAnnotationCache(tests.TestCaseWithMemoryTransport):
+
+    def setUp(self):
+        super(TestAnnotationCache, self).setUp()
+        self.transport = self.get_transport()
+        self.cache = annotate.AnnotationCache(self.transport)
+
+    def test_round_trip(self):
+        key = (b'f-id', b'rev-3')
+        annotations = ([((b'f-id', b'rev-1'),)] * 3 +
+                       [((b'f-id', b'rev-2'), (b'f-id', b'rev-3'))] +
+                       [((b'f-id', b'rev-1'),)])
+        self.cache.add(key, annotations)
+        self.assertEqual(annotations, self.cache.get(key))
+        self.assertEqual(annotations, annotate.AnnotationCache(
+            self.get_transport()).get(key))
+
+    def test_empty_text(self):
+        self.cache.add((b'f-id', b'rev-1'), [])
+        self.assertEqual([], self.cache.get((b'f-id', b'rev-1')))
+
+    def test_missing(self):
+        self.assertIs(None, self.cache.get((b'f-id', b'rev-1')))
+
+    def test_bad_entry_ignored(self):
+        key = (b'f-id', b'rev-1')
+        self.cache.add(key, [(key,)])
+        name = self.cache._get_name(key)
+        self.transport.put_bytes(name, b'garbage')
+        self.assertIs(None, self.cache.get(key))
+
+    def test_get_annotation_cache(self):
+        self.assertIs(None, annotate.get_annotation_cache())
+        config.GlobalStack().set('annotate.cache', True)
+        self.assertIsInstance(annotate.get_annotation_cache(),
+                              annotate.AnnotationCache)
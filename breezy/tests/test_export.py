@@ -20,15 +20,18 @@ import gzip
 from io import BytesIO
 import os
 import tarfile
+import threading
 import time
 import zipfile
 
 from .. import (
+    config,
     errors,
     export,
     tests,
     )
 from ..export import get_root_name
+from ..archive import tar
 from ..archive.tar import tarball_generator
 from . import features
 
@@ -181,6 +184,28 @@ class TestDirExport(tests.TestCaseWithTransport):
         self.assertEqual(foo_time, t.stat('foo.txt').st_mtime)
 
 
+class TestExportIterContents(tests.TestCaseWithTransport):
+
+    def test_contents(self):
+        wt = self.make_branch_and_tree('.')
+        self.build_tree_contents([
+            ('a', b'a text\n'), ('d/',), ('d/b', b'b text\n'),
+            ('d/c', b''), ('e', b'e text\n')])
+        wt.add(['a', 'd', 'd/b', 'd/c', 'e'])
+        wt.commit('1')
+        # Read the texts in several batches.
+        self.overrideAttr(export, '_PREFETCH_FILES', 2)
+        tree = wt.basis_tree()
+        with tree.lock_read():
+            self.assertEqual(
+                [('a', 'file', b'a text\n'), ('d', 'directory', None),
+                 ('e', 'file', b'e text\n'), ('d/b', 'file', b'b text\n'),
+                 ('d/c', 'file', b'')],
+                [(final_path, entry.kind, content)
+                 for final_path, tree_path, entry, content
+                 in export._export_iter_contents(tree, None)])
+
+
 class TarExporterTests(tests.TestCaseWithTransport):
 
     def test_xz(self):
@@ -252,6 +277,74 @@ class TarExporterTests(tests.TestCaseWithTransport):
         self.assertFalse(b"target.tar.gz" in content1)
         self.assertTrue(b"target.tar" in content1)
 
+    def test_tgz_compression_threads(self):
+        wt = self.make_branch_and_tree('.')
+        self.build_tree_contents([
+            ('a', b''.join(b'line %d\n' % i for i in range(1000))),
+            ('b', b'b text\n')])
+        wt.add(['a', 'b'])
+        timestamp = 1547400500
+        revid = wt.commit("1", timestamp=timestamp)
+        revtree = wt.branch.repository.revision_tree(revid)
+        os.mkdir('serial')
+        os.mkdir('parallel')
+        export.export(revtree, 'serial/target.tar.gz', format="tgz")
+        config.GlobalStack().set('export.compression_threads', 2)
+        # Compress in many blocks.
+        self.overrideAttr(tar, '_GZIP_BLOCK_SIZE', 1000)
+        export.export(revtree, 'parallel/target.tar.gz', format="tgz")
+        with gzip.GzipFile('serial/target.tar.gz', 'r') as f:
+            expected = f.read()
+        with gzip.GzipFile('parallel/target.tar.gz', 'r') as f:
+            self.assertEqualDiff(expected, f.read())
+            self.assertEqual(int(f.mtime), timestamp)
+        tf = tarfile.open('parallel/target.tar.gz')
+        self.addCleanup(tf.close)
+        self.assertEqual(["target/a", "target/b"], tf.getnames())
+        # The gzip headers are the same.
+        with open('serial/target.tar.gz', 'rb') as f:
+            expected = f.read(20)
+        with open('parallel/target.tar.gz', 'rb') as f:
+            self.assertEqual(expected[:17], f.read(20)[:17])
+
+    def test_parallel_gzip_generator(self):
+        self.overrideAttr(tar, '_GZIP_BLOCK_SIZE', 100)
+        data = b''.join(b'%d\n' % (i * i % 97) for i in range(1000))
+        for chunks in [[], [b''], [data], [data[:7], data[7:500], data[500:]]]:
+            compressed = b''.join(tar.parallel_gzip_generator(
+                chunks, 'foo.tar.gz', 42, 3))
+            with gzip.GzipFile(fileobj=BytesIO(compressed)) as f:
+                self.assertEqual(b''.join(chunks), f.read())
+                self.assertEqual(42, f.mtime)
+        self.assertTrue(compressed.startswith(
+            b'\037\213\010\010*\000\000\000\002\377foo.tar\000'))
+
+    def test_parallel_gzip_generator_stops_threads(self):
+        self.overrideAttr(tar, '_GZIP_BLOCK_SIZE', 100)
+        data = b'x' * 10000
+        num_threads = threading.active_count()
+        b''.join(tar.parallel_gzip_generator([data], 'foo.tar.gz', 42, 3))
+        self.assertEqual(num_threads, threading.active_count())
+        # Also when the consumer stops reading part way through.
+        stream = tar.parallel_gzip_generator([data], 'foo.tar.gz', 42, 3)
+        next(stream)
+        next(stream)
+        stream.close()
+        self.assertEqual(num_threads, threading.active_count())
+
+    def test_tzst(self):
+        self.requireFeature(features.zstandard)
+        import zstandard
+        wt = self.make_branch_and_tree('.')
+        self.build_tree(['a'])
+        wt.add(["a"])
+        wt.commit("1")
+        export.export(wt, 'target.tar.zst', format="tzst")
+        with open('target.tar.zst', 'rb') as f:
+            reader = zstandard.ZstdDecompressor().stream_reader(f)
+            tf = tarfile.open(fileobj=reader, mode='r|')
+            self.assertEqual(["target/a"], tf.getnames())
+
     def test_tbz2(self):
         wt = self.make_branch_and_tree('.')
         self.build_tree(['a'])
@@ -292,6 +385,19 @@ class ZipExporterTests(tests.TestCaseWithTransport):
         self.assertEqual(time.localtime(timestamp)[:6], info.date_time)
 
 
+    def test_contents(self):
+        tree = self.make_branch_and_tree('.')
+        self.build_tree_contents([('a', b'a text\n'), ('d/',), ('d/b', b'')])
+        tree.add(['a', 'd', 'd/b'])
+        tree.commit('setup')
+        export.export(tree.basis_tree(), 'test.zip', format='zip')
+        zfile = zipfile.ZipFile('test.zip')
+        self.addCleanup(zfile.close)
+        self.assertEqual(['test/a', 'test/d/', 'test/d/b'], zfile.namelist())
+        self.assertIs(None, zfile.testzip())
+        self.assertEqual(b'a text\n', zfile.read('test/a'))
+
+
 class RootNameTests(tests.TestCase):
 
     def test_root_name(self):
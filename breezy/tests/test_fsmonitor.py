@@ -0,0 +1,413 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Tests for the fsmonitor daemon and its use by working trees."""
+
+import collections
+import os
+import threading
+
+from .. import (
+    config,
+    fsmonitor,
+    osutils,
+    )
+from ..bzr import workingtree_4
+from . import (
+    TestCase,
+    TestCaseWithTransport,
+    features,
+    )
+
+
+class RecordingWatcher(object):
+    """A watcher that is told about changes by the test, not by inotify."""
+
+    def __init__(self):
+        self.logs = {}
+        self._pending = collections.deque()
+
+    def fileno(self):
+        return None
+
+    def add_tree(self, root, log):
+        self.logs[root] = log
+
+    def changed(self, root, relpath):
+        self._pending.append((root, relpath))
+
+    def process_events(self):
+        while self._pending:
+            root, relpath = self._pending.popleft()
+            self.logs[root].mark_dirty(relpath)
+
+
+def start_fsmonitor(test, socket_path='fsmonitor.sock'):
+    """Run an fsmonitor daemon with a RecordingWatcher in a thread."""
+    watcher = RecordingWatcher()
+    server = fsmonitor.FSMonitorServer(socket_path, watcher)
+    server.start()
+    thread = threading.Thread(target=server.serve)
+    thread.start()
+
+    def stop():
+        try:
+            fsmonitor.FSMonitorClient(socket_path).stop()
+        except fsmonitor.FSMonitorError:
+            # Already stopped by the test.
+            pass
+        thread.join()
+    test.addCleanup(stop)
+    return watcher
+
+
+class TestDirtyPathLog(TestCase):
+
+    def test_changes_since(self):
+        log = fsmonitor.DirtyPathLog()
+        self.assertEqual(set(), log.changes_since(0))
+        log.mark_dirty('a')
+        log.mark_dirty('b')
+        self.assertEqual(2, log.sequence)
+        self.assertEqual({'a', 'b'}, log.changes_since(0))
+        self.assertEqual({'b'}, log.changes_since(1))
+        log.mark_dirty('a')
+        self.assertEqual({'a'}, log.changes_since(2))
+        self.assertEqual(set(), log.changes_since(3))
+
+    def test_unknown_sequence(self):
+        log = fsmonitor.DirtyPathLog()
+        log.mark_dirty('a')
+        self.assertIs(None, log.changes_since(2))
+
+    def test_mark_all_dirty(self):
+        log = fsmonitor.DirtyPathLog()
+        log.mark_dirty('a')
+        log.mark_all_dirty()
+        self.assertIs(None, log.changes_since(1))
+        log.mark_dirty('b')
+        self.assertEqual({'b'}, log.changes_since(2))
+
+    def test_mark_unwatched(self):
+        log = fsmonitor.DirtyPathLog()
+        log.mark_unwatched()
+        self.assertIs(None, log.changes_since(log.sequence))
+        log.mark_dirty('a')
+        self.assertIs(None, log.changes_since(log.sequence))
+
+
+class TestTreeStateFile(TestCaseWithTransport):
+
+    def test_missing(self):
+        state_file = fsmonitor.TreeStateFile(self.get_transport())
+        self.assertEqual((None, None, None), state_file.load())
+
+    def test_round_trip(self):
+        state_file = fsmonitor.TreeStateFile(self.get_transport())
+        state_file.save(b'server:3', {u'a', u'd/\xe9'})
+        self.assertEqual((b'server:3', {u'a', u'd/\xe9'}, False),
+                         state_file.load())
+        state_file.save(b'server:4', set())
+        self.assertEqual((b'server:4', set(), False), state_file.load())
+
+    def test_mark_entries_changed(self):
+        state_file = fsmonitor.TreeStateFile(self.get_transport())
+        state_file.mark_entries_changed()
+        self.assertFalse(self.get_transport().has(state_file.STATE_NAME))
+        state_file.save(b'server:3', {u'a'})
+        state_file.mark_entries_changed()
+        self.assertEqual((b'server:3', {u'a'}, True), state_file.load())
+        state_file.save(b'server:4', {u'a'})
+        self.assertEqual((b'server:4', {u'a'}, False), state_file.load())
+
+    def test_bad_header(self):
+        self.get_transport().put_bytes(
+            fsmonitor.TreeStateFile.STATE_NAME, b'garbage\n')
+        state_file = fsmonitor.TreeStateFile(self.get_transport())
+        self.assertEqual((None, None, None), state_file.load())
+
+
+class TestFSMonitorServer(TestCaseWithTransport):
+
+    def setUp(self):
+        super(TestFSMonitorServer, self).setUp()
+        self.watcher = start_fsmonitor(self)
+        self.client = fsmonitor.FSMonitorClient('fsmonitor.sock')
+        self.root = osutils.abspath('tree')
+
+    def test_query(self):
+        token, paths = self.client.query(self.root, None)
+        self.assertIs(None, paths)
+        self.assertEqual([self.root], list(self.watcher.logs))
+        token, paths = self.client.query(self.root, token)
+        self.assertEqual(set(), paths)
+        self.watcher.changed(self.root, u'a')
+        self.watcher.changed(self.root, u'd/\xe9')
+        new_token, paths = self.client.query(self.root, token)
+        self.assertEqual({u'a', u'd/\xe9'}, paths)
+        self.assertNotEqual(token, new_token)
+        self.assertEqual(set(), self.client.query(self.root, new_token)[1])
+
+    def test_query_unknown_token(self):
+        self.client.query(self.root, None)
+        self.watcher.changed(self.root, u'a')
+        self.assertIs(None, self.client.query(self.root, b'other:0')[1])
+        self.assertIs(None, self.client.query(self.root, b'garbage')[1])
+
+    def test_query_lost_events(self):
+        token, _ = self.client.query(self.root, None)
+        self.watcher.logs[self.root].mark_all_dirty()
+        token, paths = self.client.query(self.root, token)
+        self.assertIs(None, paths)
+        self.assertEqual(set(), self.client.query(self.root, token)[1])
+
+    def test_query_unwatched(self):
+        token, _ = self.client.query(self.root, None)
+        self.watcher.logs[self.root].mark_unwatched()
+        token, paths = self.client.query(self.root, token)
+        self.assertIs(None, paths)
+        self.assertIs(None, self.client.query(self.root, token)[1])
+
+    def test_status(self):
+        self.assertEqual([], self.client.status())
+        self.client.query(self.root, None)
+        self.assertEqual([self.root], self.client.status())
+
+    def test_bad_request(self):
+        e = self.assertRaises(
+            fsmonitor.FSMonitorError, self.client._call, b'frobnicate')
+        self.assertContainsRe(str(e), 'frobnicate')
+
+    def test_already_running(self):
+        server = fsmonitor.FSMonitorServer(
+            'fsmonitor.sock', RecordingWatcher())
+        self.assertRaises(fsmonitor.errors.CommandError, server.start)
+
+    def test_not_running(self):
+        client = fsmonitor.FSMonitorClient('missing.sock')
+        self.assertRaises(fsmonitor.FSMonitorError, client.status)
+
+
+class TestInotifyWatcher(TestCaseWithTransport):
+
+    _test_needs_features = [features.pyinotify]
+
+    def test_changes(self):
+        self.build_tree(['tree/', 'tree/.bzr/', 'tree/.bzr/f/', 'tree/a'])
+        watcher = fsmonitor.InotifyWatcher()
+        log = fsmonitor.DirtyPathLog()
+        root = osutils.abspath('tree')
+        watcher.add_tree(root, log)
+        self.assertEqual([root], [
+            watch.path for watch in watcher._wm.watches.values()])
+        self.build_tree(['tree/b', 'tree/.bzr/c', 'tree/d/', 'tree/d/e'])
+        os.unlink('tree/a')
+        watcher.process_events()
+        self.assertEqual({'a', 'b', 'd', 'd/e'}, log.changes_since(0))
+
+    def fail_add_watch(self, watcher, failing_path):
+        """Make adding a watch for failing_path fail, as with ENOSPC."""
+        add_watch = watcher._wm.add_watch
+
+        def failing_add_watch(path, *args, **kwargs):
+            wds = add_watch(path, *args, **kwargs)
+            if failing_path in wds:
+                watcher._wm.rm_watch(wds[failing_path])
+                wds[failing_path] = -1
+            return wds
+        watcher._wm.add_watch = failing_add_watch
+
+    def test_watch_failure(self):
+        self.build_tree(['tree/', 'tree/a', 'tree/d/'])
+        watcher = fsmonitor.InotifyWatcher()
+        self.fail_add_watch(watcher, osutils.abspath('tree/d'))
+        log = fsmonitor.DirtyPathLog()
+        root = osutils.abspath('tree')
+        watcher.add_tree(root, log)
+        self.assertIs(None, log.changes_since(log.sequence))
+        self.assertEqual({}, watcher._wm.watches)
+        self.build_tree(['tree/b'])
+        watcher.process_events()
+        self.assertIs(None, log.changes_since(log.sequence))
+
+    def test_new_directory_watch_failure(self):
+        self.build_tree(['tree/'])
+        watcher = fsmonitor.InotifyWatcher()
+        log = fsmonitor.DirtyPathLog()
+        root = osutils.abspath('tree')
+        watcher.add_tree(root, log)
+        self.assertEqual(set(), log.changes_since(log.sequence))
+        self.fail_add_watch(watcher, osutils.abspath('tree/d'))
+        self.build_tree(['tree/d/'])
+        watcher.process_events()
+        self.assertIs(None, log.changes_since(log.sequence))
+
+
+class TestIterChangesWithFSMonitor(TestCaseWithTransport):
+
+    def setUp(self):
+        super(TestIterChangesWithFSMonitor, self).setUp()
+        self.tree = self.make_branch_and_tree('tree', format='dirstate')
+        self.build_tree(['tree/a', 'tree/b', 'tree/d/', 'tree/d/c'])
+        self.tree.add(['a', 'b', 'd', 'd/c'])
+        self.tree.commit('one')
+        stack = config.GlobalStack()
+        stack.set('fsmonitor.socket', 'fsmonitor.sock')
+        stack.set('bzr.workingtree.fsmonitor', True)
+        # Spy on the directories that are read.
+        self.walked = []
+
+        def walkdirs_spy(*args, **kwargs):
+            for val in orig(*args, **kwargs):
+                self.walked.append(val[0][0])
+                yield val
+        orig = self.overrideAttr(osutils, '_walkdirs_utf8', walkdirs_spy)
+
+    def ordered_changes(self, want_unversioned=True):
+        del self.walked[:]
+        with self.tree.lock_read():
+            basis = self.tree.basis_tree()
+            with basis.lock_read():
+                return [
+                    (c.path, c.changed_content, c.versioned)
+                    for c in self.tree.iter_changes(
+                        basis, want_unversioned=want_unversioned)]
+
+    def changes(self, want_unversioned=True):
+        return sorted(
+            self.ordered_changes(want_unversioned),
+            key=lambda change: [path or '' for path in change[0]])
+
+    def full_changes(self, want_unversioned=True, ordered=False):
+        stack = config.GlobalStack()
+        stack.set('bzr.workingtree.fsmonitor', False)
+        try:
+            if ordered:
+                return self.ordered_changes(want_unversioned)
+            return self.changes(want_unversioned)
+        finally:
+            stack.set('bzr.workingtree.fsmonitor', True)
+
+    def changed(self, relpath):
+        self.watcher.changed(self.tree.basedir, relpath)
+
+    def test_not_running(self):
+        self.build_tree_contents([('tree/a', b'new a\n')])
+        self.assertEqual([(('a', 'a'), True, (True, True))], self.changes())
+        self.assertEqual([b'', b'd'], self.walked)
+        self.assertFalse(self.tree._transport.has('fsmonitor-state'))
+
+    def test_only_changed_paths_are_looked_at(self):
+        self.watcher = start_fsmonitor(self)
+        self.assertEqual([], self.changes())
+        self.assertEqual([b'', b'd'], self.walked)
+        self.assertEqual([], self.changes())
+        self.assertEqual([], self.walked)
+        self.build_tree_contents([('tree/d/c', b'new c\n')])
+        self.changed('d/c')
+        self.assertEqual([(('d/c', 'd/c'), True, (True, True))],
+                         self.changes())
+        self.assertEqual([], self.walked)
+        # Changed files stay changed without further events.
+        self.assertEqual([(('d/c', 'd/c'), True, (True, True))],
+                         self.changes())
+        self.build_tree_contents([('tree/d/c', b'contents of tree/d/c\n')])
+        self.changed('d/c')
+        self.assertEqual([], self.changes())
+
+    def test_unknowns(self):
+        self.watcher = start_fsmonitor(self)
+        self.build_tree(['tree/u', 'tree/v/', 'tree/v/w'])
+        self.assertEqual(self.full_changes(), self.changes())
+        self.assertEqual([((None, 'u'), True, (False, False)),
+                          ((None, 'v'), True, (False, False))],
+                         self.changes())
+        self.assertEqual([((None, 'u'), True, (False, False)),
+                          ((None, 'v'), True, (False, False))],
+                         self.changes())
+        self.assertEqual([], self.walked)
+        self.assertEqual([], self.changes(want_unversioned=False))
+        # Files in unknown directories are reported as the directory.
+        self.build_tree(['tree/v/x', 'tree/y'])
+        self.changed('v/x')
+        self.changed('y')
+        self.assertEqual([((None, 'u'), True, (False, False)),
+                          ((None, 'v'), True, (False, False)),
+                          ((None, 'y'), True, (False, False))],
+                         self.changes())
+        os.unlink('tree/u')
+        self.changed('u')
+        self.assertEqual([((None, 'v'), True, (False, False)),
+                          ((None, 'y'), True, (False, False))],
+                         self.changes())
+
+    def test_changes_in_dirblock_order(self):
+        self.watcher = start_fsmonitor(self)
+        self.assertEqual([], self.changes())
+        self.build_tree(['tree/0', 'tree/c', 'tree/d/b', 'tree/d/e/',
+                         'tree/z'])
+        self.build_tree_contents([('tree/a', b'new a\n'),
+                                  ('tree/d/c', b'new c\n')])
+        for path in ['0', 'a', 'c', 'd/b', 'd/c', 'd/e', 'z']:
+            self.changed(path)
+        self.assertEqual(self.full_changes(ordered=True),
+                         self.ordered_changes())
+        self.assertEqual([], self.walked)
+
+    def test_records_only_read_after_tree_changes(self):
+        self.watcher = start_fsmonitor(self)
+        self.assertEqual([], self.changes())
+        self.tree.remove(['b'], keep_files=True)
+        calls = []
+
+        def changed_entry_paths(inter, state):
+            calls.append(state)
+            return orig(inter, state)
+        orig = self.overrideAttr(
+            workingtree_4.InterDirStateTree, '_changed_entry_paths',
+            changed_entry_paths)
+        self.assertEqual([((None, 'b'), True, (False, False)),
+                          (('b', None), True, (True, False))],
+                         self.changes())
+        self.assertEqual(1, len(calls))
+        self.assertEqual([((None, 'b'), True, (False, False)),
+                          (('b', None), True, (True, False))],
+                         self.changes())
+        self.assertEqual(1, len(calls))
+
+    def test_tree_changes_without_events(self):
+        self.watcher = start_fsmonitor(self)
+        self.build_tree(['tree/u'])
+        self.assertEqual([((None, 'u'), True, (False, False))],
+                         self.changes())
+        self.tree.add(['u'])
+        self.tree.remove(['b'], keep_files=True)
+        self.tree.rename_one('a', 'e')
+        self.assertEqual(self.full_changes(), self.changes())
+        self.assertEqual([((None, 'b'), True, (False, False)),
+                          ((None, 'u'), True, (False, True)),
+                          (('a', 'e'), False, (True, True)),
+                          (('b', None), True, (True, False))],
+                         self.changes())
+        self.assertEqual([], self.walked)
+
+    def test_daemon_restarted(self):
+        state_file = fsmonitor.TreeStateFile(self.tree._transport)
+        state_file.save(b'other:1', set())
+        self.watcher = start_fsmonitor(self)
+        self.build_tree_contents([('tree/a', b'new a\n')])
+        self.assertEqual([(('a', 'a'), True, (True, True))], self.changes())
+        self.assertEqual([b'', b'd'], self.walked)
@@ -1475,6 +1475,89 @@ class TestGetChildMap(TestGraphBase):
                          child_map)
 
 
+class TestGenerationIndex(tests.TestCase):
+
+    def get_generations(self, ancestry, keys, index=None):
+        if index is None:
+            index = _mod_graph.GenerationIndex()
+        return index.get_generations(
+            _mod_graph.DictParentsProvider(ancestry), keys)
+
+    def test_generations(self):
+        self.assertEqual(
+            {b'rev1': 1, b'rev2a': 2, b'rev2b': 2, b'rev3': 3, b'rev4': 4,
+             NULL_REVISION: 0},
+            self.get_generations(ancestry_1, [b'rev1', b'rev2a', b'rev2b',
+                                              b'rev3', b'rev4', NULL_REVISION]))
+
+    def test_ghosts_and_missing(self):
+        self.assertEqual(
+            {b'a': 4, b'c': None, b'd': None, b'g': None, b'missing': None},
+            self.get_generations(with_ghost, [b'a', b'c', b'd', b'g',
+                                              b'missing']))
+
+    def test_known_generations_not_looked_up(self):
+        calls = []
+        index = _mod_graph.GenerationIndex({b'rev2a': 2, b'rev2b': 2},
+                                           calls.append)
+        provider = InstrumentedParentsProvider(
+            _mod_graph.DictParentsProvider(ancestry_1))
+        self.assertEqual({b'rev4': 4},
+                         index.get_generations(provider, [b'rev4']))
+        self.assertEqual([b'rev4', b'rev3'], provider.calls)
+        self.assertEqual([{b'rev3': 3, b'rev4': 4}], calls)
+
+
+class TestGraphWithGenerationIndex(TestGraphBase):
+
+    def make_graph(self, ancestors):
+        self.provider = InstrumentedParentsProvider(
+            _mod_graph.DictParentsProvider(ancestors))
+        index = _mod_graph.GenerationIndex()
+        # Index the whole graph up front, as a persistent index would be.
+        index.get_generations(self.provider, list(ancestors))
+        del self.provider.calls[:]
+        return _mod_graph.Graph(self.provider, generation_index=index)
+
+    def test_heads(self):
+        graph = self.make_graph(history_shortcut)
+        self.assertEqual({b'rev2a', b'rev2b', b'rev2c'},
+                         graph.heads([b'rev2a', b'rev2b', b'rev2c']))
+        self.assertEqual({b'rev3a', b'rev3b'},
+                         graph.heads([b'rev2a', b'rev3a', b'rev3b']))
+        graph = self.make_graph(criss_cross)
+        self.assertEqual({b'rev3a', b'rev3b'},
+                         graph.heads([b'rev1', b'rev3a', b'rev3b']))
+
+    def test_heads_same_generation_not_searched(self):
+        graph = self.make_graph(history_shortcut)
+        self.assertEqual({b'rev2a', b'rev2b', b'rev2c'},
+                         graph.heads([b'rev2a', b'rev2b', b'rev2c']))
+        self.assertEqual([], self.provider.calls)
+
+    def test_heads_stops_below_candidates(self):
+        graph = self.make_graph(extended_history_shortcut)
+        self.assertEqual({b'f'}, graph.heads([b'd', b'f']))
+        # Once d is found, nothing older than f can matter, so a is not
+        # searched.
+        self.assertEqual([b'd', b'f'], sorted(self.provider.calls))
+
+    def test_heads_with_ghost(self):
+        graph = self.make_graph(with_ghost)
+        self.assertEqual({b'a', b'c'}, graph.heads([b'a', b'c']))
+        self.assertEqual({b'c'}, graph.heads([b'c', b'e']))
+
+    def test_find_unique_ancestors(self):
+        graph = self.make_graph(complex_shortcut)
+        self.assertEqual({b'h', b'n'},
+                         graph.find_unique_ancestors(b'n', [b'm']))
+        self.assertEqual({b'e', b'i', b'm'},
+                         graph.find_unique_ancestors(b'm', [b'n']))
+        graph = self.make_graph(racing_shortcuts)
+        self.assertEqual({b'p', b'q', b'z'},
+                         graph.find_unique_ancestors(b'z', [b'y']))
+
+
 class TestCachingParentsProvider(tests.TestCase):
     """These tests run with:
 
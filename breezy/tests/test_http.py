@@ -801,6 +801,80 @@ class TestRangeRequestServer(TestSpecificRequestHandler):
         # The server should have issued 3 requests
         self.assertEqual(3, server.GET_request_nb)
 
+    def test_readv_concurrent_requests(self):
+        server = self.get_readonly_server()
+        t = self.get_readonly_transport()
+        t._concurrent_requests = 2
+        # force transport to issue multiple requests
+        t._max_readv_combine = 1
+        t._max_get_ranges = 1
+        l = list(t.readv('a', ((0, 1), (1, 1), (3, 2), (9, 1))))
+        self.assertEqual([(0, b'0'), (1, b'1'), (3, b'34'), (9, b'9')], l)
+        self.assertEqual(4, server.GET_request_nb)
+
+    def test_readv_concurrent_requests_out_of_order(self):
+        t = self.get_readonly_transport()
+        t._concurrent_requests = 3
+        t._max_readv_combine = 1
+        t._max_get_ranges = 1
+        l = list(t.readv('a', ((1, 1), (9, 1), (0, 1), (3, 2))))
+        self.assertEqual([(1, b'1'), (9, b'9'), (0, b'0'), (3, b'34')], l)
+
+    def test_concurrent_requests_reuse_connections(self):
+        t = self.get_readonly_transport()
+        t._concurrent_requests = 2
+        t._max_readv_combine = 1
+        t._max_get_ranges = 1
+        list(t.readv('a', ((0, 1), (1, 1), (3, 2), (9, 1))))
+        connections = set(t._connection_pool._connections)
+        self.assertNotEqual(set(), connections)
+        # The connections are shared with clones
+        t2 = t.clone('.')
+        self.assertIs(t._connection_pool, t2._connection_pool)
+        list(t2.readv('a', ((0, 1), (1, 1), (3, 2), (9, 1))))
+        self.assertTrue(
+            connections.issubset(set(t._connection_pool._connections)))
+        t.disconnect()
+        self.assertEqual([], t._connection_pool._connections)
+
+    def test_concurrent_requests_failure_closes_connection(self):
+        t = self.get_readonly_transport()
+        t._concurrent_requests = 2
+        t._max_readv_combine = 1
+        t._max_get_ranges = 1
+        # Authenticate on the transport's own connection first.
+        list(t.readv('a', ((0, 1),)))
+        connections = []
+        orig_get = t._get
+
+        def get(self, relpath, offsets, tail_amount=0):
+            code, rfile = orig_get.__func__(self, relpath, offsets,
+                                            tail_amount)
+            if self is not t:
+                connections.append(self._get_connection())
+                raise errors.ConnectionReset('broken')
+            return code, rfile
+        self.overrideAttr(t.__class__, '_get', get)
+        self.assertListRaises(
+            errors.ConnectionReset,
+            t.readv, 'a', ((0, 1), (1, 1), (3, 2), (9, 1)))
+        self.assertNotEqual([], connections)
+        self.assertEqual([], t._connection_pool._connections)
+        for connection in connections:
+            self.assertIs(None, connection.sock)
+
+    def test_concurrent_requests_max_size(self):
+        server = self.get_readonly_server()
+        t = self.get_readonly_transport()
+        t._concurrent_requests = 2
+        t._concurrent_get_min_size = 1
+        t._concurrent_get_max_size = 2
+        l = list(t.readv('a', ((0, 1), (1, 1), (2, 1), (3, 1), (4, 1))))
+        self.assertEqual(
+            [(0, b'0'), (1, b'1'), (2, b'2'), (3, b'3'), (4, b'4')], l)
+        # Coalesced into ranges of at most 2 bytes, each in its own request.
+        self.assertEqual(3, server.GET_request_nb)
+
     def test_complete_readv_leave_pipe_clean(self):
         server = self.get_readonly_server()
         t = self.get_readonly_transport()
@@ -23,6 +23,7 @@ import re
 
 from .. import (
     branchbuilder,
+    config,
     errors,
     log,
     registry,
@@ -287,6 +288,55 @@ class TestShowLog(tests.TestCaseWithTransport):
         self.assertEqual('add file1 and file2', logentry.rev.message)
         self.checkDelta(logentry.delta, added=['file1', 'file2'])
 
+    def test_deltas_in_processes(self):
+        wt = self.make_branch_and_tree('.')
+        self.build_tree(['file1', 'file2', 'dir/', 'dir/file3'])
+        wt.add(['file1', 'file2'])
+        wt.commit('add file1 and file2')
+        wt.add(['dir', 'dir/file3'])
+        wt.rename_one('file1', 'dir/file1')
+        wt.commit('add dir and move file1')
+        wt.remove(['file2'])
+        wt.commit('remove file2')
+        self.assertDeltasInProcesses(wt.branch)
+
+    def assertDeltasInProcesses(self, branch):
+        started = []
+
+        def start_delta_processes(branch, num_processes):
+            pool = orig(branch, num_processes)
+            started.append(pool is not None)
+            return pool
+        orig = self.overrideAttr(log, '_start_delta_processes',
+                                 start_delta_processes)
+
+        def get_deltas():
+            lf = LogCatcher()
+            log.show_log(branch, lf, verbose=True)
+            return [(r.revno, r.delta) for r in lf.revisions]
+        expected = get_deltas()
+        config.GlobalStack().set('log.delta_processes', 2)
+        self.assertEqual(expected, get_deltas())
+        self.assertEqual([False, True], started)
+
+    def test_deltas_in_processes_stacked(self):
+        trunk = self.make_branch_and_tree('trunk')
+        self.build_tree(['trunk/file1', 'trunk/file2'])
+        trunk.add(['file1', 'file2'])
+        trunk.commit('add file1 and file2')
+        trunk.remove(['file2'])
+        trunk.commit('remove file2')
+        stacked = trunk.controldir.sprout(
+            'stacked', stacked=True).open_workingtree()
+        self.build_tree(['stacked/file3'])
+        stacked.add(['file3'])
+        stacked.commit('add file3')
+        # The trunk revisions are only in the repository stacked on.
+        repository = stacked.branch.controldir.open_repository()
+        with repository.lock_read():
+            self.assertFalse(repository.has_revision(trunk.last_revision()))
+        self.assertDeltasInProcesses(stacked.branch)
+
     def test_bug_842695_log_restricted_to_dir(self):
         # Comments here indicate revision numbers in trunk  # VVVVV
         trunk = self.make_branch_and_tree('this')
@@ -1704,6 +1754,24 @@ class TestLogExcludeAncestry(tests.TestCaseWithTransport):
                              b, b'1', b'3', exclude_common_ancestry=True,
                              generate_merge_revisions=True)
 
+    def test_merge_sorted_forward(self):
+        b = self.make_branch_with_alternate_ancestries()
+        backward = list(log._calc_view_revisions(
+            b, None, None, direction='reverse',
+            generate_merge_revisions=True))
+        iter_revs = log._calc_view_revisions(
+            b, None, None, direction='forward', generate_merge_revisions=True)
+        # The whole history is produced as it is merge sorted.
+        self.assertFalse(isinstance(iter_revs, list))
+        self.assertEqual([(b'1', '1', 0), (b'2', '2', 0), (b'3', '3', 0),
+                          (b'1.1.1', '1.1.1', 1), (b'1.1.2', '1.1.2', 1),
+                          (b'1.2.1', '1.2.1', 2)],
+                         list(iter_revs))
+        self.assertEqual(log.reverse_by_depth(backward),
+                         list(log._calc_view_revisions(
+                             b, None, None, direction='forward',
+                             generate_merge_revisions=True)))
+
 
 class TestLogDefaults(TestCaseForLogFormatter):
     def test_default_log_level(self):
@@ -19,6 +19,7 @@ import os
 
 from .. import (
     branch as _mod_branch,
+    config,
     conflicts,
     errors,
     memorytree,
@@ -3436,3 +3437,79 @@ class TestMergeHooks(TestCaseWithTransport):
 
         self.assertFileEqual(b"content_2", 'tree_a/file')
         self.assertLength(1, calls)
+
+
+class TestTextMergeProcesses(TestCaseWithTransport):
+
+    def setUp(self):
+        super(TestTextMergeProcesses, self).setUp()
+        base = b''.join(b'line %d\n' % i for i in range(10))
+        self.names = ['file%d' % i for i in range(10)]
+        names = self.names + ['conflicted', 'binary', 'hooked']
+        tree = self.make_branch_and_tree('this')
+        self.build_tree_contents(
+            [('this/' + name, base) for name in names[:-2]] +
+            [('this/binary', b'\x00binary\n'), ('this/hooked', base)])
+        tree.add(names)
+        tree.commit('base')
+        other = tree.controldir.sprout('other').open_workingtree()
+        changed = base.replace(b'line 9', b'other 9')
+        self.build_tree_contents(
+            [('other/' + name, changed) for name in self.names] +
+            [('other/conflicted', changed), ('other/binary', b'\x00other\n'),
+             ('other/hooked', changed)])
+        other.commit('other')
+        changed = base.replace(b'line 0', b'this 0')
+        self.build_tree_contents(
+            [('this/' + name, changed) for name in self.names] +
+            [('this/conflicted', base.replace(b'line 9', b'this 9')),
+             ('this/binary', b'\x00this\n'), ('this/hooked', changed)])
+        tree.commit('this')
+        tree.controldir.sprout('this-processes')
+
+        class HookedMerger(_mod_merge.PerFileMerger):
+
+            def file_matches(self, params):
+                return params.this_path == 'hooked'
+
+            def merge_matching(self, params):
+                return 'success', [b'merged by hook\n']
+        _mod_merge.Merger.hooks.install_named_hook(
+            'merge_file_content', HookedMerger, 'test hook')
+
+    def merge(self, path):
+        tree = WorkingTree.open(path)
+        conflicts = tree.merge_from_branch(
+            _mod_branch.Branch.open('other'))
+        files = dict(
+            (name, self.get_contents(name, path))
+            for name in os.listdir(path) if name != '.bzr')
+        return conflicts, tree.conflicts(), files
+
+    def get_contents(self, name, path):
+        with open(os.path.join(path, name), 'rb') as f:
+            return f.read()
+
+    def test_same_as_serial(self):
+        expected = self.merge('this')
+        finished = []
+        finish_text_merge = _mod_merge.Merge3Merger._finish_text_merge
+
+        def record_finish(merger, future, trans_id, paths, lines):
+            finished.append(paths[1])
+            return finish_text_merge(merger, future, trans_id, paths, lines)
+        self.overrideAttr(
+            _mod_merge.Merge3Merger, '_finish_text_merge', record_finish)
+        config.GlobalStack().set('merge.text_merge_processes', 2)
+        self.assertEqual(expected, self.merge('this-processes'))
+        # The text merges happened in the workers, and the hook still took
+        # precedence.
+        self.assertEqual(['conflicted'] + self.names, sorted(finished))
+        files = expected[2]
+        self.assertEqual(b'merged by hook\n', files['hooked'])
+        self.assertEqual(
+            b''.join(b'line %d\n' % i for i in range(10)).replace(
+                b'line 0', b'this 0').replace(b'line 9', b'other 9'),
+            files['file3'])
+        self.assertEqual(
+            ['binary', 'conflicted'], sorted(c.path for c in expected[1]))
@@ -21,6 +21,10 @@ from .. import (
     tests,
     )
 from ..errors import BinaryFile
+from .scenarios import load_tests_apply_scenarios
+
+
+load_tests = load_tests_apply_scenarios
 
 
 def split_lines(t):
@@ -98,11 +102,16 @@ MERGED_RESULT = split_lines(b"""     The Way that can be told of is not the eter
 
 class TestMerge3(tests.TestCase):
 
+    scenarios = [
+        ('Merge3', {'merge3_class': merge3.Merge3}),
+        ('InternedMerge3', {'merge3_class': merge3.InternedMerge3}),
+        ]
+
     def test_no_changes(self):
         """No conflicts because nothing changed"""
-        m3 = merge3.Merge3([b'aaa', b'bbb'],
-                           [b'aaa', b'bbb'],
-                           [b'aaa', b'bbb'])
+        m3 = self.merge3_class([b'aaa', b'bbb'],
+                               [b'aaa', b'bbb'],
+                               [b'aaa', b'bbb'])
 
         self.assertEqual(m3.find_unconflicted(),
                          [(0, 2)])
@@ -120,9 +129,9 @@ class TestMerge3(tests.TestCase):
                          [('unchanged', [b'aaa', b'bbb'])])
 
     def test_front_insert(self):
-        m3 = merge3.Merge3([b'zz'],
-                           [b'aaa', b'bbb', b'zz'],
-                           [b'zz'])
+        m3 = self.merge3_class([b'zz'],
+                               [b'aaa', b'bbb', b'zz'],
+                               [b'zz'])
 
         # todo: should use a sentinal at end as from get_matching_blocks
         # to match without zz
@@ -139,9 +148,9 @@ class TestMerge3(tests.TestCase):
                           ('unchanged', [b'zz'])])
 
     def test_null_insert(self):
-        m3 = merge3.Merge3([],
-                           [b'aaa', b'bbb'],
-                           [])
+        m3 = self.merge3_class([],
+                               [b'aaa', b'bbb'],
+                               [])
         # todo: should use a sentinal at end as from get_matching_blocks
         # to match without zz
         self.assertEqual(list(m3.find_sync_regions()),
@@ -155,9 +164,9 @@ class TestMerge3(tests.TestCase):
 
     def test_no_conflicts(self):
         """No conflicts because only one side changed"""
-        m3 = merge3.Merge3([b'aaa', b'bbb'],
-                           [b'aaa', b'111', b'bbb'],
-                           [b'aaa', b'bbb'])
+        m3 = self.merge3_class([b'aaa', b'bbb'],
+                               [b'aaa', b'111', b'bbb'],
+                               [b'aaa', b'bbb'])
 
         self.assertEqual(m3.find_unconflicted(),
                          [(0, 1), (1, 2)])
@@ -173,33 +182,33 @@ class TestMerge3(tests.TestCase):
                           ('unchanged', 1, 2), ])
 
     def test_append_a(self):
-        m3 = merge3.Merge3([b'aaa\n', b'bbb\n'],
-                           [b'aaa\n', b'bbb\n', b'222\n'],
-                           [b'aaa\n', b'bbb\n'])
+        m3 = self.merge3_class([b'aaa\n', b'bbb\n'],
+                               [b'aaa\n', b'bbb\n', b'222\n'],
+                               [b'aaa\n', b'bbb\n'])
 
         self.assertEqual(b''.join(m3.merge_lines()),
                          b'aaa\nbbb\n222\n')
 
     def test_append_b(self):
-        m3 = merge3.Merge3([b'aaa\n', b'bbb\n'],
-                           [b'aaa\n', b'bbb\n'],
-                           [b'aaa\n', b'bbb\n', b'222\n'])
+        m3 = self.merge3_class([b'aaa\n', b'bbb\n'],
+                               [b'aaa\n', b'bbb\n'],
+                               [b'aaa\n', b'bbb\n', b'222\n'])
 
         self.assertEqual(b''.join(m3.merge_lines()),
                          b'aaa\nbbb\n222\n')
 
     def test_append_agreement(self):
-        m3 = merge3.Merge3([b'aaa\n', b'bbb\n'],
-                           [b'aaa\n', b'bbb\n', b'222\n'],
-                           [b'aaa\n', b'bbb\n', b'222\n'])
+        m3 = self.merge3_class([b'aaa\n', b'bbb\n'],
+                               [b'aaa\n', b'bbb\n', b'222\n'],
+                               [b'aaa\n', b'bbb\n', b'222\n'])
 
         self.assertEqual(b''.join(m3.merge_lines()),
                          b'aaa\nbbb\n222\n')
 
     def test_append_clash(self):
-        m3 = merge3.Merge3([b'aaa\n', b'bbb\n'],
-                           [b'aaa\n', b'bbb\n', b'222\n'],
-                           [b'aaa\n', b'bbb\n', b'333\n'])
+        m3 = self.merge3_class([b'aaa\n', b'bbb\n'],
+                               [b'aaa\n', b'bbb\n', b'222\n'],
+                               [b'aaa\n', b'bbb\n', b'333\n'])
 
         ml = m3.merge_lines(name_a=b'a',
                             name_b=b'b',
@@ -218,9 +227,9 @@ bbb
 ''')
 
     def test_insert_agreement(self):
-        m3 = merge3.Merge3([b'aaa\n', b'bbb\n'],
-                           [b'aaa\n', b'222\n', b'bbb\n'],
-                           [b'aaa\n', b'222\n', b'bbb\n'])
+        m3 = self.merge3_class([b'aaa\n', b'bbb\n'],
+                               [b'aaa\n', b'222\n', b'bbb\n'],
+                               [b'aaa\n', b'222\n', b'bbb\n'])
 
         ml = m3.merge_lines(name_a=b'a',
                             name_b=b'b',
@@ -231,9 +240,9 @@ bbb
 
     def test_insert_clash(self):
         """Both try to insert lines in the same place."""
-        m3 = merge3.Merge3([b'aaa\n', b'bbb\n'],
-                           [b'aaa\n', b'111\n', b'bbb\n'],
-                           [b'aaa\n', b'222\n', b'bbb\n'])
+        m3 = self.merge3_class([b'aaa\n', b'bbb\n'],
+                               [b'aaa\n', b'111\n', b'bbb\n'],
+                               [b'aaa\n', b'222\n', b'bbb\n'])
 
         self.assertEqual(m3.find_unconflicted(),
                          [(0, 1), (1, 2)])
@@ -271,9 +280,9 @@ bbb
 
     def test_replace_clash(self):
         """Both try to insert lines in the same place."""
-        m3 = merge3.Merge3([b'aaa', b'000', b'bbb'],
-                           [b'aaa', b'111', b'bbb'],
-                           [b'aaa', b'222', b'bbb'])
+        m3 = self.merge3_class([b'aaa', b'000', b'bbb'],
+                               [b'aaa', b'111', b'bbb'],
+                               [b'aaa', b'222', b'bbb'])
 
         self.assertEqual(m3.find_unconflicted(),
                          [(0, 1), (2, 3)])
@@ -285,9 +294,10 @@ bbb
 
     def test_replace_multi(self):
         """Replacement with regions of different size."""
-        m3 = merge3.Merge3([b'aaa', b'000', b'000', b'bbb'],
-                           [b'aaa', b'111', b'111', b'111', b'bbb'],
-                           [b'aaa', b'222', b'222', b'222', b'222', b'bbb'])
+        m3 = self.merge3_class(
+            [b'aaa', b'000', b'000', b'bbb'],
+            [b'aaa', b'111', b'111', b'111', b'bbb'],
+            [b'aaa', b'222', b'222', b'222', b'222', b'bbb'])
 
         self.assertEqual(m3.find_unconflicted(),
                          [(0, 1), (3, 4)])
@@ -299,7 +309,7 @@ bbb
 
     def test_merge_poem(self):
         """Test case from diff3 manual"""
-        m3 = merge3.Merge3(TZU, LAO, TAO)
+        m3 = self.merge3_class(TZU, LAO, TAO)
         ml = list(m3.merge_lines(b'LAO', b'TAO'))
         self.log('merge result:')
         self.log(b''.join(ml))
@@ -311,7 +321,7 @@ bbb
         this_text = (b"a\n" * 10 + b"b\n" * 10).splitlines(True)
         other_text = (b"a\n" * 10 + b"c\n" + b"b\n" *
                       8 + b"c\n").splitlines(True)
-        m3 = merge3.Merge3(base_text, other_text, this_text)
+        m3 = self.merge3_class(base_text, other_text, this_text)
         m_lines = m3.merge_lines(b'OTHER', b'THIS', reprocess=True)
         merged_text = b"".join(list(m_lines))
         optimal_text = (b"a\n" * 10 + b"<<<<<<< OTHER\nc\n"
@@ -327,7 +337,7 @@ bbb
         base_text = add_newline(b"abcdefghijklm")
         this_text = add_newline(b"abcdefghijklmNOPQRSTUVWXYZ")
         other_text = add_newline(b"abcdefghijklm1OPQRSTUVWXY2")
-        m3 = merge3.Merge3(base_text, other_text, this_text)
+        m3 = self.merge3_class(base_text, other_text, this_text)
         m_lines = m3.merge_lines(b'OTHER', b'THIS', reprocess=True)
         merged_text = b"".join(list(m_lines))
         optimal_text = b''.join(add_newline(b"abcdefghijklm")
@@ -345,7 +355,7 @@ bbb
         base_text = add_newline(b"abacddefgghij")
         this_text = add_newline(b"abacddefgghijkalmontfprz")
         other_text = add_newline(b"abacddefgghijknlmontfprd")
-        m3 = merge3.Merge3(base_text, other_text, this_text)
+        m3 = self.merge3_class(base_text, other_text, this_text)
         m_lines = m3.merge_lines(b'OTHER', b'THIS', reprocess=True)
         merged_text = b"".join(list(m_lines))
         optimal_text = b''.join(add_newline(b"abacddefgghijk")
@@ -361,7 +371,7 @@ bbb
         this_text = (b"a\n" * 10 + b"b\n" * 10).splitlines(True)
         other_text = (b"a\n" * 10 + b"c\n" + b"b\n" *
                       8 + b"c\n").splitlines(True)
-        m3 = merge3.Merge3(base_text, other_text, this_text)
+        m3 = self.merge3_class(base_text, other_text, this_text)
         m_lines = m3.merge_lines(b'OTHER', b'THIS', reprocess=True,
                                  base_marker=b'|||||||')
         self.assertRaises(merge3.CantReprocessAndShowBase, list, m_lines)
@@ -373,9 +383,9 @@ bbb
         base_text = b'a\r\n'
         this_text = b'b\r\n'
         other_text = b'c\r\n'
-        m3 = merge3.Merge3(base_text.splitlines(True),
-                           other_text.splitlines(True),
-                           this_text.splitlines(True))
+        m3 = self.merge3_class(base_text.splitlines(True),
+                               other_text.splitlines(True),
+                               this_text.splitlines(True))
         m_lines = m3.merge_lines(b'OTHER', b'THIS')
         self.assertEqual(b'<<<<<<< OTHER\r\nc\r\n=======\r\nb\r\n'
                          b'>>>>>>> THIS\r\n'.splitlines(True), list(m_lines))
@@ -384,9 +394,9 @@ bbb
         base_text = b'a\r'
         this_text = b'b\r'
         other_text = b'c\r'
-        m3 = merge3.Merge3(base_text.splitlines(True),
-                           other_text.splitlines(True),
-                           this_text.splitlines(True))
+        m3 = self.merge3_class(base_text.splitlines(True),
+                               other_text.splitlines(True),
+                               this_text.splitlines(True))
         m_lines = m3.merge_lines(b'OTHER', b'THIS')
         self.assertEqual(b'<<<<<<< OTHER\rc\r=======\rb\r'
                          b'>>>>>>> THIS\r'.splitlines(True), list(m_lines))
@@ -396,17 +406,17 @@ bbb
         this_text = b"a\n"
         other_text = b"a\nb\nc\n"
         # When cherrypicking, lines in base are not part of the conflict
-        m3 = merge3.Merge3(base_text.splitlines(True),
-                           this_text.splitlines(True),
-                           other_text.splitlines(True), is_cherrypick=True)
+        m3 = self.merge3_class(base_text.splitlines(True),
+                               this_text.splitlines(True),
+                               other_text.splitlines(True), is_cherrypick=True)
         m_lines = m3.merge_lines()
         self.assertEqualDiff(b'a\n<<<<<<<\n=======\nc\n>>>>>>>\n',
                              b''.join(m_lines))
 
         # This is not symmetric
-        m3 = merge3.Merge3(base_text.splitlines(True),
-                           other_text.splitlines(True),
-                           this_text.splitlines(True), is_cherrypick=True)
+        m3 = self.merge3_class(base_text.splitlines(True),
+                               other_text.splitlines(True),
+                               this_text.splitlines(True), is_cherrypick=True)
         m_lines = m3.merge_lines()
         self.assertEqualDiff(b'a\n<<<<<<<\nb\nc\n=======\n>>>>>>>\n',
                              b''.join(m_lines))
@@ -416,9 +426,9 @@ bbb
         this_text = b'a\nb\nq\n'
         other_text = b'a\nb\nc\nd\nf\ne\ng\n'
         # When cherrypicking, lines in base are not part of the conflict
-        m3 = merge3.Merge3(base_text.splitlines(True),
-                           this_text.splitlines(True),
-                           other_text.splitlines(True), is_cherrypick=True)
+        m3 = self.merge3_class(base_text.splitlines(True),
+                               this_text.splitlines(True),
+                               other_text.splitlines(True), is_cherrypick=True)
         m_lines = m3.merge_lines()
         self.assertEqualDiff(b'a\n'
                              b'b\n'
@@ -443,7 +453,7 @@ bbb
         base = [(x, x) for x in 'abcde']
         a = [(x, x) for x in 'abcdef']
         b = [(x, x) for x in 'Zabcde']
-        m3 = merge3.Merge3(base, a, b, allow_objects=True)
+        m3 = self.merge3_class(base, a, b, allow_objects=True)
         self.assertEqual(
             [('b', 0, 1),
              ('unchanged', 0, 5),
@@ -454,3 +464,65 @@ bbb
              ('unchanged', [(x, x) for x in 'abcde']),
              ('a', [('f', 'f')])],
             list(m3.merge_groups()))
+
+
+class TestTrimmedMatchingBlocks(tests.TestCase):
+
+    def test_common_prefix_length(self):
+        self.assertEqual(0, merge3._common_prefix_length([], [1]))
+        self.assertEqual(0, merge3._common_prefix_length([1], [2]))
+        self.assertEqual(3, merge3._common_prefix_length([1, 2, 3], [1, 2, 3]))
+        self.assertEqual(2, merge3._common_prefix_length([1, 2], [1, 2, 3]))
+        for i in range(40):
+            x = list(range(40))
+            y = list(x)
+            y[i] = -1
+            self.assertEqual(i, merge3._common_prefix_length(x, y))
+
+    def test_common_suffix_length(self):
+        self.assertEqual(0, merge3._common_suffix_length([], [1], 0))
+        self.assertEqual(0, merge3._common_suffix_length([1], [2], 1))
+        self.assertEqual(
+            3, merge3._common_suffix_length([1, 2, 3], [1, 2, 3], 3))
+        self.assertEqual(2, merge3._common_suffix_length([2, 3], [1, 2, 3], 2))
+        self.assertEqual(1, merge3._common_suffix_length([1, 2], [1, 2], 1))
+        for i in range(40):
+            x = list(range(40))
+            y = list(x)
+            y[39 - i] = -1
+            self.assertEqual(i, merge3._common_suffix_length(x, y, 40))
+
+    def assertMatchingBlocks(self, expected, x, y):
+        self.assertEqual(
+            expected, merge3._get_trimmed_matching_blocks(x, y))
+
+    def test_identical(self):
+        self.assertMatchingBlocks([(0, 0, 3), (3, 3, 0)], b'abc', b'abc')
+        self.assertMatchingBlocks([(0, 0, 0)], b'', b'')
+
+    def test_insertions(self):
+        self.assertMatchingBlocks([(0, 0, 2), (2, 3, 0)], b'ab', b'abc')
+        self.assertMatchingBlocks([(0, 1, 2), (2, 3, 0)], b'ab', b'cab')
+        self.assertMatchingBlocks(
+            [(0, 0, 1), (1, 2, 1), (2, 3, 0)], b'ab', b'acb')
+
+    def test_middle(self):
+        # The blocks found in the middle are joined up with the common start
+        # and end.
+        self.assertMatchingBlocks(
+            [(0, 0, 2), (3, 3, 1), (5, 5, 2), (7, 7, 0)],
+            b'abXcYde', b'abZcWde')
+        self.assertMatchingBlocks(
+            [(0, 0, 1), (1, 2, 3), (4, 5, 0)], b'abcd', b'aXbcd')
+
+    def test_same_as_merge3(self):
+        base = [b'line %d\n' % i for i in range(1000)]
+        this = list(base)
+        this[10:12] = [b'this\n']
+        this[700] = b'this 700\n'
+        other = list(base)
+        other[500:500] = [b'other\n', b'other\n']
+        other[700] = b'other 700\n'
+        self.assertEqual(
+            list(merge3.Merge3(base, this, other).merge_regions()),
+            list(merge3.InternedMerge3(base, this, other).merge_regions()))
@@ -288,6 +288,29 @@ class TestDeleteAny(tests.TestCaseInTempDir):
         osutils.delete_any('d')
 
 
+class TestReflinkOrCopy(tests.TestCaseInTempDir):
+
+    def test_reflink_or_copy(self):
+        self.build_tree_contents([('source', b'some content\n' * 1000)])
+        osutils.reflink_or_copy('source', 'target')
+        self.assertFileEqual(b'some content\n' * 1000, 'target')
+        # The files are independent.
+        self.build_tree_contents([('target', b'other content\n')])
+        self.assertFileEqual(b'some content\n' * 1000, 'source')
+
+    def test_reflink_unsupported(self):
+        if not sys.platform.startswith('linux'):
+            raise tests.TestNotApplicable('only linux can clone files')
+        import fcntl
+
+        def ioctl(fd, request, arg):
+            raise OSError(errno.EOPNOTSUPP, 'Operation not supported')
+        self.overrideAttr(fcntl, 'ioctl', ioctl)
+        self.build_tree_contents([('source', b'some content\n')])
+        self.assertFalse(osutils.reflink_or_copy('source', 'target'))
+        self.assertFileEqual(b'some content\n', 'target')
+
+
 class TestKind(tests.TestCaseInTempDir):
 
     def test_file_kind(self):
@@ -1225,6 +1248,28 @@ class TestWalkDirs(tests.TestCaseInTempDir):
             result.append(dirblock)
         self.assertExpectedBlocks(expected_dirblocks[1:], result)
 
+    def test__walkdirs_utf8_read_ahead(self):
+        from concurrent.futures import ThreadPoolExecutor
+        self.build_tree(['.bzr/', '.bzr/branch/', 'a/', 'a/b/', 'a/b/c',
+                         'a/d/', 'a/d/e/', 'f', 'g/', 'g/h/', 'g/h/i'])
+        executor = ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(executor.shutdown)
+
+        def walk(**kwargs):
+            result = []
+            for dirdetail, dirblock in osutils._walkdirs_utf8(b'.', **kwargs):
+                if dirdetail[0] == b'':
+                    # Directories removed by the caller are not walked.
+                    del dirblock[0]
+                result.append(
+                    (dirdetail, [(entry[0], entry[2]) for entry in dirblock]))
+            return result
+        expected = walk()
+        self.assertEqual([b'', b'a', b'a/b', b'a/d', b'a/d/e', b'g', b'g/h'],
+                         [dirdetail[0] for dirdetail, _ in expected])
+        self.assertEqual(expected, walk(executor=executor, read_ahead=1))
+        self.assertEqual(expected, walk(executor=executor, read_ahead=10))
+
     def _filter_out_stat(self, result):
         """Filter out the stat value from the walkdirs result"""
         for dirdetail, dirblock in result:
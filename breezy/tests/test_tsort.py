@@ -137,6 +137,16 @@ class MergeSortTests(TestCase):
                              mainline_revisions=mainline_revisions,
                              generate_revno=generate_revno,
                              ).iter_topo_order()))
+        if mainline_revisions is None:
+            # The same nodes are yielded oldest first by iter_forward_order.
+            forward = [(node, depth, revno) for node, depth, revno
+                       in MergeSorter(graph, branch_tip).iter_forward_order()]
+            if generate_revno:
+                expected = [row[1:4] for row in reversed(result_list)]
+            else:
+                expected = [row[1:3] for row in reversed(result_list)]
+                forward = [row[:2] for row in forward]
+            self.assertEqual(expected, forward)
 
     def test_merge_sort_empty(self):
         # sorting of an emptygraph does not error
@@ -693,3 +703,77 @@ class MergeSortTests(TestCase):
              ],
             True
             )
+
+    def assertIncrementalSort(self, graph, old_tip, branch_tip):
+        """Check sorting on from the revnos for old_tip matches a full sort.
+
+        The end_of_merge of the oldest new node can't be known without the
+        old nodes, so it is not compared.
+        """
+        known_revnos = dict(
+            (node, revno) for _, node, _, revno, _
+            in merge_sort(graph.items(), old_tip, generate_revno=True))
+        new_graph = dict((node, parents) for node, parents in graph.items()
+                         if node not in known_revnos)
+        value = [(node, depth, revno, end_of_merge)
+                 for _, node, depth, revno, end_of_merge in MergeSorter(
+                     new_graph, branch_tip, generate_revno=True,
+                     known_revnos=known_revnos).iter_topo_order()]
+        expected = [(node, depth, revno, end_of_merge)
+                    for _, node, depth, revno, end_of_merge in merge_sort(
+                        graph.items(), branch_tip, generate_revno=True)]
+        expected = expected[:len(new_graph)]
+        self.assertEqual(expected[:-1], value[:-1])
+        self.assertEqual(expected[-1][:3], value[-1][:3])
+
+    def test_known_revnos(self):
+        graph = {'J': ['G', 'I'],
+                 'I': ['H', ],
+                 'H': ['A'],
+                 'G': ['D', 'F'],
+                 'F': ['E'],
+                 'E': ['A'],
+                 'D': ['A', 'C'],
+                 'C': ['B'],
+                 'B': ['A'],
+                 'A': [],
+                 }
+        self.assertIncrementalSort(graph, 'G', 'J')
+        self.assertIncrementalSort(graph, 'D', 'J')
+        self.assertIncrementalSort(graph, 'A', 'J')
+
+    def test_known_revnos_continue_branches(self):
+        # The branch that C is on was merged into D, and carries on in E;
+        # F starts a new branch from B.
+        graph = {'G': ['D', 'E', 'F'],
+                 'F': ['B'],
+                 'E': ['C'],
+                 'D': ['B', 'C'],
+                 'C': ['A'],
+                 'B': ['A'],
+                 'A': [],
+                 }
+        self.assertIncrementalSort(graph, 'D', 'G')
+
+    def test_known_revnos_extra_roots(self):
+        graph = {'A': [],
+                 'B': ['A'],
+                 'C': ['B'],
+                 'D': [],
+                 'E': ['D'],
+                 'F': ['D'],
+                 'G': ['E', 'F'],
+                 'H': ['C', 'G'],
+                 'I': [],
+                 'J': ['H', 'I'],
+                 'K': [],
+                 'L': ['K'],
+                 'M': ['K'],
+                 'N': ['L', 'M'],
+                 'O': ['N'],
+                 'P': ['N'],
+                 'Q': ['O', 'P'],
+                 'R': ['J', 'Q'],
+                 }
+        self.assertIncrementalSort(graph, 'J', 'R')
+        self.assertIncrementalSort(graph, 'H', 'R')
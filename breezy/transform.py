@@ -518,6 +518,15 @@ class TreeTransform(object):
         """Schedule creation of a hard link"""
         raise NotImplementedError(self.create_hardlink)
 
+    def create_reflink(self, path, trans_id, sha1=None):
+        """Schedule creation of a copy-on-write clone of a file.
+
+        The file is copied if it can't be cloned.
+
+        :param sha1: If the sha1 of the file is already known, pass it in.
+        """
+        raise NotImplementedError(self.create_reflink)
+
     def cancel_creation(self, trans_id):
         """Cancel the creation of new file contents."""
         raise NotImplementedError(self.cancel_creation)
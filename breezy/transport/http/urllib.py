@@ -25,12 +25,15 @@ DEBUG = 0
 
 import base64
 import cgi
+import collections
 import errno
+import itertools
 import os
 import re
 import socket
 import ssl
 import sys
+import threading
 import time
 import urllib
 import weakref
@@ -1772,6 +1775,66 @@ class Opener(object):
             pprint.pprint(self._opener.__dict__)
 
 
+class _ConnectionPool(object):
+    """Idle connections for requests issued concurrently.
+
+    This is shared by the transports cloned from the same base, so that the
+    connections opened for one readv can be reused by the next, whichever
+    transport it is issued on.
+    """
+
+    def __init__(self):
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take an idle connection from the pool.
+
+        :return: A connection, or None if there is no idle connection, in
+            which case a new one will be created by the request.
+        """
+        with self._lock:
+            if self._connections:
+                return self._connections.pop()
+        return None
+
+    def release(self, connection):
+        """Give a connection back to the pool once its request is done."""
+        with self._lock:
+            self._connections.append(connection)
+
+    def close(self):
+        """Close all the idle connections."""
+        with self._lock:
+            connections = self._connections
+            self._connections = []
+        for connection in connections:
+            connection.close()
+
+
+class _RangeData(object):
+    """The data fetched for a coalesced offset.
+
+    This is seekable with the file offsets, like the response file it was
+    read from.
+    """
+
+    def __init__(self, start, data):
+        self._start = start
+        self._data = data
+        self._pos = 0
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence != os.SEEK_SET:
+            raise AssertionError('Only absolute seeks are supported')
+        self._pos = offset - self._start
+
+    def read(self, size):
+        data = self._data[self._pos:self._pos + size]
+        self._pos += len(data)
+        return data
+
+
 class HttpTransport(ConnectedTransport):
     """HTTP Client implementations.
 
@@ -1805,10 +1868,15 @@ class HttpTransport(ConnectedTransport):
         if _from_transport is not None:
             self._range_hint = _from_transport._range_hint
             self._opener = _from_transport._opener
+            self._connection_pool = _from_transport._connection_pool
+            self._concurrent_requests = _from_transport._concurrent_requests
         else:
             self._range_hint = 'multi'
             self._opener = Opener(
                 report_activity=self._report_activity, ca_certs=ca_certs)
+            self._connection_pool = _ConnectionPool()
+            # Read from the configuration on first use
+            self._concurrent_requests = None
 
     def request(self, method, url, fields=None, headers=None, **urlopen_kw):
         body = urlopen_kw.pop('body', None)
@@ -1924,6 +1992,7 @@ class HttpTransport(ConnectedTransport):
         connection = self._get_connection()
         if connection is not None:
             connection.close()
+        self._connection_pool.close()
 
     def has(self, relpath):
         """Does the target location exist?
@@ -2050,6 +2119,12 @@ class HttpTransport(ConnectedTransport):
     # We impose no limit on the range size. But see _pycurl.py for a different
     # use.
     _get_max_size = 0
+    # When issuing concurrent requests, don't split the ranges into requests
+    # smaller than this, the latency would dominate.
+    _concurrent_get_min_size = 256 * 1024
+    # Nor into requests bigger than this, as the data for each is held in
+    # memory until it is yielded.
+    _concurrent_get_max_size = 1024 * 1024
 
     def _readv(self, relpath, offsets):
         """Get parts of the file at the given relative path.
@@ -2071,7 +2146,7 @@ class HttpTransport(ConnectedTransport):
             coalesced = self._coalesce_offsets(
                 sorted_offsets, limit=self._max_readv_combine,
                 fudge_factor=self._bytes_to_read_before_seek,
-                max_size=self._get_max_size)
+                max_size=self._get_readv_max_size())
 
             # Turn it into a list, we will iterate it several times
             coalesced = list(coalesced)
@@ -2160,37 +2235,154 @@ class HttpTransport(ConnectedTransport):
             # Download whole file
             for c, rfile in get_and_yield(relpath, coalesced):
                 yield c, rfile
+            return
+        concurrent_requests = self._get_concurrent_requests()
+        requests = list(self._split_ranges(coalesced, concurrent_requests))
+        if concurrent_requests > 1 and len(requests) > 1:
+            if self._get_connection() is None:
+                # Authenticate once, on our own connection, rather than
+                # once per concurrent request.
+                for c, rfile in get_and_yield(relpath, requests.pop(0)):
+                    yield c, rfile
+            for c, rfile in self._get_concurrently(
+                    relpath, requests, concurrent_requests):
+                yield c, rfile
+        else:
+            for ranges in requests:
+                for c, rfile in get_and_yield(relpath, ranges):
+                    yield c, rfile
+
+    def _get_readv_max_size(self):
+        """The largest coalesced offset to request, 0 for no limit."""
+        if self._get_concurrent_requests() > 1:
+            if self._get_max_size > 0:
+                return min(self._get_max_size, self._concurrent_get_max_size)
+            return self._concurrent_get_max_size
+        return self._get_max_size
+
+    def _split_ranges(self, coalesced, concurrent_requests=1):
+        """Split coalesced offsets into the ranges for each GET request.
+
+        :param concurrent_requests: The number of requests that can be
+            issued at once. If more than one, the ranges are also split into
+            at least that many requests when they are big enough, and into
+            requests of at most _concurrent_get_max_size.
+        :return: An iterator of lists of coalesced offsets.
+        """
+        total = len(coalesced)
+        if self._range_hint == 'multi':
+            max_ranges = self._max_get_ranges
+        elif self._range_hint == 'single':
+            max_ranges = total
+        else:
+            raise AssertionError("Unknown _range_hint %r"
+                                 % (self._range_hint,))
+        if concurrent_requests > 1:
+            split_size = min(max(
+                sum(coal.length for coal in coalesced) // concurrent_requests,
+                self._concurrent_get_min_size), self._concurrent_get_max_size)
         else:
-            total = len(coalesced)
-            if self._range_hint == 'multi':
-                max_ranges = self._max_get_ranges
-            elif self._range_hint == 'single':
-                max_ranges = total
+            split_size = None
+        # TODO: Some web servers may ignore the range requests and return
+        # the whole file, we may want to detect that and avoid further
+        # requests.
+        # Hint: test_readv_multiple_get_requests will fail once we do that
+        cumul = 0
+        ranges = []
+        for coal in coalesced:
+            if ((self._get_max_size > 0
+                 and cumul + coal.length > self._get_max_size) or
+                    len(ranges) >= max_ranges or
+                    (split_size is not None and ranges and
+                     cumul + coal.length > split_size)):
+                # Get that much
+                yield ranges
+                # Restart with the current offset
+                ranges = [coal]
+                cumul = coal.length
             else:
-                raise AssertionError("Unknown _range_hint %r"
-                                     % (self._range_hint,))
-            # TODO: Some web servers may ignore the range requests and return
-            # the whole file, we may want to detect that and avoid further
-            # requests.
-            # Hint: test_readv_multiple_get_requests will fail once we do that
-            cumul = 0
-            ranges = []
-            for coal in coalesced:
-                if ((self._get_max_size > 0
-                     and cumul + coal.length > self._get_max_size) or
-                        len(ranges) >= max_ranges):
-                    # Get that much and yield
-                    for c, rfile in get_and_yield(relpath, ranges):
-                        yield c, rfile
-                    # Restart with the current offset
-                    ranges = [coal]
-                    cumul = coal.length
-                else:
-                    ranges.append(coal)
-                    cumul += coal.length
-            # Get the rest and yield
-            for c, rfile in get_and_yield(relpath, ranges):
-                yield c, rfile
+                ranges.append(coal)
+                cumul += coal.length
+        # Get the rest
+        if ranges:
+            yield ranges
+
+    def _get_concurrent_requests(self):
+        if self._concurrent_requests is None:
+            self._concurrent_requests = config.GlobalStack().get(
+                'http.concurrent_requests')
+        return self._concurrent_requests
+
+    def _get_concurrently(self, relpath, requests, concurrent_requests):
+        """Issue the GET requests for the ranges in requests concurrently.
+
+        Each request uses its own connection from the connection pool. Up to
+        concurrent_requests are in flight at once, the data for each being
+        read in full before it is yielded, in order. _split_ranges keeps
+        each request small enough for that.
+
+        :return: An iterator of (coalesced offset, file) like
+            _coalesce_readv.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        executor = ThreadPoolExecutor(max_workers=concurrent_requests)
+
+        def submit(ranges):
+            return executor.submit(
+                self._get_on_pooled_connection, relpath, ranges)
+        requests = iter(requests)
+        pending = collections.deque(
+            submit(ranges)
+            for ranges in itertools.islice(requests, concurrent_requests))
+        try:
+            while pending:
+                result = pending.popleft().result()
+                ranges = next(requests, None)
+                if ranges is not None:
+                    pending.append(submit(ranges))
+                for c, rfile in result:
+                    yield c, rfile
+        finally:
+            # If we're abandoned part way through, don't issue the remaining
+            # requests, but let the running ones give their connection back.
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def _get_on_pooled_connection(self, relpath, ranges):
+        """Get the data for ranges, on a connection from the pool.
+
+        This is run in a worker thread, so it uses its own transport sharing
+        everything but the connection with this one.
+
+        :return: A list of (coalesced offset, _RangeData).
+        """
+        worker = self.clone()
+        worker._shared_connection = transport._SharedConnection(
+            self._connection_pool.acquire(), self._get_credentials(),
+            self._shared_connection.base)
+        try:
+            code, rfile = worker._get(relpath, ranges)
+            result = []
+            for coal in ranges:
+                rfile.seek(coal.start, os.SEEK_SET)
+                result.append(
+                    (coal, _RangeData(coal.start, rfile.read(coal.length))))
+            connection = worker._get_connection()
+            if connection is not None:
+                # Read what is left of the response, so that the next
+                # request on the connection starts cleanly.
+                connection.cleanup_pipe()
+        except BaseException:
+            # The connection may be in the middle of a response, don't let
+            # another request use it.
+            connection = worker._get_connection()
+            if connection is not None:
+                connection.close()
+            raise
+        if connection is not None:
+            self._connection_pool.release(connection)
+        return result
 
     def recommended_page_size(self):
         """See Transport.recommended_page_size().
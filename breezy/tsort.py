@@ -202,7 +202,7 @@ class MergeSorter(object):
                  ]
 
     def __init__(self, graph, branch_tip, mainline_revisions=None,
-                 generate_revno=False):
+                 generate_revno=False, known_revnos=None):
         """Merge-aware topological sorting of a graph.
 
         :param graph: sequence of pairs of node_name->parent_names_list.
@@ -224,6 +224,13 @@ class MergeSorter(object):
         :param generate_revno: Optional parameter controlling the generation of
             revision number sequences in the output. See the output description
             for more details.
+        :param known_revnos: Optional dict of node_name -> revno_sequence for
+            the whole ancestry of a revision on the mainline of branch_tip, as
+            generated by an earlier merge sort with that revision as the
+            branch tip. If given, graph should only contain the nodes that are
+            not in that ancestry, and the revnos generated carry on from the
+            known ones as if the whole ancestry of branch_tip was sorted. The
+            output only contains the nodes in graph.
 
         The result is a list sorted so that all parents come before
         their children. Each element of the list is a tuple containing:
@@ -373,6 +380,8 @@ class MergeSorter(object):
                             for revision in self._graph)
         # Each mainline revision counts how many child branches have spawned from it.
         self._revno_to_branch_count = {}
+        if known_revnos:
+            self._seed_known_revnos(known_revnos)
 
         # this is a stack storing the depth first search into the graph.
         self._node_name_stack = []
@@ -414,6 +423,28 @@ class MergeSorter(object):
             parents = self._graph.pop(branch_tip)
             self._push_node(branch_tip, 0, parents)
 
+    def _seed_known_revnos(self, known_revnos):
+        """Carry on numbering from an earlier sort of an ancestor's ancestry.
+
+        Sorting the whole ancestry of branch_tip would first complete the
+        ancestry of the earlier tip exactly as the earlier sort did. So the
+        branch counts are the highest ones in its revnos, and a node already
+        had its first left-hand child if the revno that child would have been
+        given is taken.
+        """
+        revnos = self._revnos
+        revno_to_branch_count = self._revno_to_branch_count
+        taken = set(known_revnos.values())
+        for node_name, revno in known_revnos.items():
+            first_child_revno = revno[:-1] + (revno[-1] + 1,)
+            revnos[node_name] = [revno, first_child_revno not in taken]
+            if len(revno) == 1:
+                branch_base, branch_count = 0, 0
+            else:
+                branch_base, branch_count = revno[0], revno[1]
+            if revno_to_branch_count.get(branch_base, -1) < branch_count:
+                revno_to_branch_count[branch_base] = branch_count
+
     def sorted(self):
         """Sort the graph and return as a list.
 
@@ -427,6 +458,52 @@ class MergeSorter(object):
         After finishing iteration the sorter is empty and you cannot continue
         iteration.
         """
+        scheduled_nodes = self._scheduled_nodes
+        scheduled_nodes.extend(self.iter_forward_order())
+
+        # We have scheduled the graph. Now deliver the ordered output:
+        sequence_number = 0
+        stop_revision = self._stop_revision
+        generate_revno = self._generate_revno
+        original_graph = self._original_graph
+
+        while scheduled_nodes:
+            node_name, merge_depth, revno = scheduled_nodes.pop()
+            if node_name == stop_revision:
+                return
+            if not len(scheduled_nodes):
+                # last revision is the end of a merge
+                end_of_merge = True
+            elif scheduled_nodes[-1][1] < merge_depth:
+                # the next node is to our left
+                end_of_merge = True
+            elif (scheduled_nodes[-1][1] == merge_depth
+                  and (scheduled_nodes[-1][0] not in
+                       original_graph[node_name])):
+                # the next node was part of a multiple-merge.
+                end_of_merge = True
+            else:
+                end_of_merge = False
+            if generate_revno:
+                yield (sequence_number, node_name, merge_depth, revno, end_of_merge)
+            else:
+                yield (sequence_number, node_name, merge_depth, end_of_merge)
+            sequence_number += 1
+
+    def iter_forward_order(self):
+        """Yield the nodes of the graph oldest first, as they are sorted.
+
+        This is the reverse of the order of iter_topo_order, but nodes are
+        yielded as soon as all of their ancestors have been, rather than once
+        the whole graph has been sorted, and without keeping a list of them.
+        Revnos are generated whether or not generate_revno was given, and
+        mainline_revisions does not stop the iteration.
+
+        After finishing iteration the sorter is empty and you cannot continue
+        iteration.
+
+        :return: An iterator over (node_name, merge_depth, revno) tuples.
+        """
         # These are safe to offload to local variables, because they are used
         # as a stack and modified in place, never assigned to.
         node_name_stack = self._node_name_stack
@@ -434,7 +511,6 @@ class MergeSorter(object):
         pending_parents_stack = self._pending_parents_stack
         left_subtree_pushed_stack = self._left_subtree_pushed_stack
         completed_node_names = self._completed_node_names
-        scheduled_nodes = self._scheduled_nodes
 
         graph_pop = self._graph.pop
 
@@ -484,12 +560,12 @@ class MergeSorter(object):
                      original_graph=self._original_graph,
                      revnos=self._revnos,
                      completed_node_names_add=self._completed_node_names.add,
-                     scheduled_nodes_append=scheduled_nodes.append,
                      revno_to_branch_count=self._revno_to_branch_count,
                      ):
             """Pop the top node off the stack
 
-            The node is appended to the sorted output.
+            :return: The node_name, merge_depth and revno of the node, which
+                is next in the sorted output.
             """
             # we are returning from the flattened call frame:
             # pop off the local variables
@@ -535,8 +611,7 @@ class MergeSorter(object):
             # store the revno for this node for future reference
             revnos[node_name][0] = revno
             completed_node_names_add(node_name)
-            scheduled_nodes_append((node_name, merge_depth, revno))
-            return node_name
+            return node_name, merge_depth, revno
 
         while node_name_stack:
             # loop until this call completes.
@@ -546,7 +621,7 @@ class MergeSorter(object):
                 # append the revision to the topo sorted scheduled list:
                 # all the nodes parents have been scheduled added, now
                 # we can add it to the output.
-                pop_node()
+                yield pop_node()
             else:
                 while pending_parents_stack[-1]:
                     if not left_subtree_pushed_stack[-1]:
@@ -599,35 +674,6 @@ class MergeSorter(object):
                     # has recursed.
                     break
 
-        # We have scheduled the graph. Now deliver the ordered output:
-        sequence_number = 0
-        stop_revision = self._stop_revision
-        generate_revno = self._generate_revno
-        original_graph = self._original_graph
-
-        while scheduled_nodes:
-            node_name, merge_depth, revno = scheduled_nodes.pop()
-            if node_name == stop_revision:
-                return
-            if not len(scheduled_nodes):
-                # last revision is the end of a merge
-                end_of_merge = True
-            elif scheduled_nodes[-1][1] < merge_depth:
-                # the next node is to our left
-                end_of_merge = True
-            elif (scheduled_nodes[-1][1] == merge_depth
-                  and (scheduled_nodes[-1][0] not in
-                       original_graph[node_name])):
-                # the next node was part of a multiple-merge.
-                end_of_merge = True
-            else:
-                end_of_merge = False
-            if generate_revno:
-                yield (sequence_number, node_name, merge_depth, revno, end_of_merge)
-            else:
-                yield (sequence_number, node_name, merge_depth, end_of_merge)
-            sequence_number += 1
-
     def _push_node(self, node_name, merge_depth, parents):
         """Add node_name to the pending node stack.
 
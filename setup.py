@@ -76,6 +76,7 @@ META_INFO = {
         'git': [],
         'launchpad': ['launchpadlib>=1.6.3'],
         'workspace': ['pyinotify'],
+        'zstd': ['zstandard'],
         'doc': ['setuptools<45;python_version<"3.0"', 'sphinx==1.8.5;python_version<"3.0"', 'sphinx_epytext'],
         },
     'tests_require': [
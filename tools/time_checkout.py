@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Time building a working tree, as done by 'brz checkout' and 'brz branch'.
+
+Usage: time_checkout.py [--threads=N,...] [--repeat=N] [BRANCH]
+
+The tree of the last revision of BRANCH is built with each of the given
+values of bzr.transform.write_threads.
+"""
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+
+import breezy
+from breezy import (
+    branch,
+    controldir,
+    osutils,
+    )
+# Registers the bzr formats
+import breezy.bzr
+from breezy.bzr import transform
+
+p = optparse.OptionParser()
+p.add_option('--threads', default='0,2,4,8',
+             help='Comma separated values of bzr.transform.write_threads.')
+p.add_option('--repeat', default=3, type=int)
+opts, args = p.parse_args(sys.argv[1:])
+
+breezy.initialize()
+
+if len(args) >= 1:
+    b = branch.Branch.open(args[0])
+else:
+    b = branch.Branch.open('.')
+
+
+def time_build(basis, num_threads):
+    breezy.get_global_state().cmdline_overrides._from_cmdline(
+        ['bzr.transform.write_threads=%d' % (num_threads,)])
+    tmpdir = tempfile.mkdtemp(prefix='time_checkout-')
+    try:
+        target = os.path.join(tmpdir, 'tree')
+        begin = osutils.perf_counter()
+        wt = controldir.ControlDir.create_standalone_workingtree(
+            target, format=b.controldir.cloning_metadir())
+        with wt.lock_tree_write():
+            transform.build_tree(basis, wt)
+        return osutils.perf_counter() - begin
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+with b.lock_read():
+    basis = b.basis_tree()
+    with basis.lock_read():
+        print('Building a tree of %d entries'
+              % (len(list(basis.all_versioned_paths())),))
+        for num_threads in [int(t) for t in opts.threads.split(',')]:
+            times = [time_build(basis, num_threads)
+                     for i in range(opts.repeat)]
+            print('%2d threads best %.3fs of %d'
+                  % (num_threads, min(times), opts.repeat))
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""Time exporting a tree to an archive, as done by 'brz export'.
+
+Usage: time_export.py [--format=FORMAT] [--threads=N,...] [--repeat=N] [BRANCH]
+
+The tree of the last revision of BRANCH is exported with each of the given
+values of export.compression_threads.
+"""
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+
+import breezy
+from breezy import (
+    branch,
+    export,
+    osutils,
+    )
+# Registers the bzr formats
+import breezy.bzr
+
+p = optparse.OptionParser()
+p.add_option('--format', default='tgz',
+             help='Archive format to export to.')
+p.add_option('--threads', default='0,2,4,8',
+             help='Comma separated values of export.compression_threads.')
+p.add_option('--repeat', default=3, type=int)
+opts, args = p.parse_args(sys.argv[1:])
+
+breezy.initialize()
+
+if len(args) >= 1:
+    b = branch.Branch.open(args[0])
+else:
+    b = branch.Branch.open('.')
+
+
+def time_export(basis, num_threads):
+    breezy.get_global_state().cmdline_overrides._from_cmdline(
+        ['export.compression_threads=%d' % (num_threads,)])
+    tmpdir = tempfile.mkdtemp(prefix='time_export-')
+    try:
+        target = os.path.join(tmpdir, 'export')
+        begin = osutils.perf_counter()
+        export.export(basis, target, format=opts.format)
+        return osutils.perf_counter() - begin, os.path.getsize(target)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+with b.lock_read():
+    basis = b.basis_tree()
+    with basis.lock_read():
+        print('Exporting a tree of %d entries to %s'
+              % (len(list(basis.all_versioned_paths())), opts.format))
+        for num_threads in [int(t) for t in opts.threads.split(',')]:
+            results = [time_export(basis, num_threads)
+                       for i in range(opts.repeat)]
+            print('%2d threads best %.3fs of %d, %d bytes'
+                  % (num_threads, min(results)[0], opts.repeat,
+                     results[0][1]))
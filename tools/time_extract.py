@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Time extracting every text of a tree, with and without inflate threads.
+
+Usage: time_extract.py [--threads=N] [--repeat=N] [BRANCH]
+"""
+import optparse
+import sys
+
+import breezy
+from breezy import (
+    branch,
+    osutils,
+    )
+# Registers the bzr formats
+import breezy.bzr
+
+p = optparse.OptionParser()
+p.add_option('--threads', default=4, type=int,
+             help='Number of decompression threads to compare against.')
+p.add_option('--repeat', default=3, type=int)
+p.add_option('--revision', default=None, type=str,
+             help='Revision id of the tree to extract (default: tip).')
+opts, args = p.parse_args(sys.argv[1:])
+
+breezy.initialize()
+
+if len(args) >= 1:
+    b = branch.Branch.open(args[0])
+else:
+    b = branch.Branch.open('.')
+
+
+def extract_all(repo, text_keys, num_threads):
+    texts = repo.texts
+    texts._decompression_threads = num_threads
+    # Make sure every run starts from a cold group cache
+    texts._group_cache.clear()
+    begin = osutils.perf_counter()
+    total = 0
+    for record in texts.get_record_stream(text_keys, 'unordered', True):
+        total += sum(map(len, record.iter_bytes_as('chunked')))
+    return osutils.perf_counter() - begin, total
+
+
+with b.lock_read():
+    repo = b.repository
+    revision_id = opts.revision
+    if revision_id is None:
+        revision_id = b.last_revision()
+    else:
+        revision_id = revision_id.encode('utf-8')
+    tree = repo.revision_tree(revision_id)
+    with tree.lock_read():
+        text_keys = [(tree.path2id(path), tree.get_file_revision(path))
+                     for path, ie in tree.iter_entries_by_dir()
+                     if ie.kind == 'file']
+    print('Extracting %d texts' % (len(text_keys),))
+    for num_threads in (0, opts.threads):
+        times = []
+        for i in range(opts.repeat):
+            elapsed, total = extract_all(repo, text_keys, num_threads)
+            times.append(elapsed)
+        print('%2d threads: best %.3fs of %d (%d bytes)'
+              % (num_threads, min(times), opts.repeat, total))
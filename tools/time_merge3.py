@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""Time merging large synthetic texts with Merge3 and InternedMerge3.
+
+Usage: time_merge3.py [--lines=N] [--changes=N] [--repeat=N]
+"""
+import optparse
+import random
+import sys
+
+from breezy import (
+    merge3,
+    osutils,
+    )
+
+p = optparse.OptionParser()
+p.add_option('--lines', default=200000, type=int,
+             help='Number of lines in the base text.')
+p.add_option('--changes', default=20, type=int,
+             help='Number of changes made on each side.')
+p.add_option('--repeat', default=3, type=int)
+opts, args = p.parse_args(sys.argv[1:])
+
+
+def lockfile(num_lines):
+    # Lots of repeated lines, like in a lock file.
+    lines = []
+    for i in range(num_lines // 4):
+        lines.append(b'[[package]]\n')
+        lines.append(b'name = "package-%d"\n' % i)
+        lines.append(b'version = "1.%d.0"\n' % (i % 7))
+        lines.append(b'\n')
+    return lines
+
+
+def catalogue(num_lines):
+    # Mostly unique lines, like in a translation catalogue.
+    return [b'msgid "message %d"\n' % i for i in range(num_lines)]
+
+
+def change(lines, rand, num_changes, label, window):
+    # Change lines in a random window of the text.
+    lines = list(lines)
+    window = min(window, len(lines))
+    start = rand.randrange(len(lines) - window + 1)
+    for i in range(num_changes):
+        pos = start + rand.randrange(window)
+        lines[pos] = b'version = "%s %d"\n' % (label, i)
+    return lines
+
+
+def time_merge(cls, base, this, other):
+    times = []
+    for i in range(opts.repeat):
+        begin = osutils.perf_counter()
+        result = list(cls(base, this, other).merge_lines())
+        times.append(osutils.perf_counter() - begin)
+    return min(times), result
+
+
+for name, make_text in [('lockfile', lockfile), ('catalogue', catalogue)]:
+    for where, window in [('scattered', opts.lines), ('clustered', 1000)]:
+        rand = random.Random(42)
+        base = make_text(opts.lines)
+        this = change(base, rand, opts.changes, b'this', window)
+        other = change(base, rand, opts.changes, b'other', window)
+        print('%s: %d lines, %d %s changes on each side'
+              % (name, len(base), opts.changes, where))
+        results = []
+        for cls in (merge3.Merge3, merge3.InternedMerge3):
+            elapsed, result = time_merge(cls, base, this, other)
+            results.append(result)
+            print('  %-14s best %.3fs of %d'
+                  % (cls.__name__, elapsed, opts.repeat))
+        if results[0] != results[1]:
+            print('  (the merged texts differ)')
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""Time computing revision deltas, as done by 'brz log -v'.
+
+Usage: time_revision_deltas.py [--limit=N] [--repeat=N] [BRANCH]
+"""
+import optparse
+import sys
+
+import breezy
+from breezy import (
+    branch,
+    osutils,
+    revision as _mod_revision,
+    )
+from breezy.repository import Repository
+# Registers the bzr formats
+import breezy.bzr
+from breezy.bzr import chk_map
+
+p = optparse.OptionParser()
+p.add_option('--limit', default=200, type=int,
+             help='Number of mainline revisions to compute deltas for.')
+p.add_option('--repeat', default=3, type=int)
+opts, args = p.parse_args(sys.argv[1:])
+
+breezy.initialize()
+
+if len(args) >= 1:
+    b = branch.Branch.open(args[0])
+else:
+    b = branch.Branch.open('.')
+
+
+def time_deltas(repo, revisions, batched):
+    if batched:
+        get_trees = repo._get_revision_delta_trees
+    else:
+        # The generic implementation compares each pair separately
+        def get_trees(revisions):
+            return Repository._get_revision_delta_trees(repo, revisions)
+    chk_map.clear_cache()
+    begin = osutils.perf_counter()
+    trees = get_trees(revisions)
+    count = 0
+    for revision in revisions:
+        if not revision.parent_ids:
+            continue
+        old_tree = trees[revision.parent_ids[0]]
+        new_tree = trees[revision.revision_id]
+        count += len(list(new_tree.iter_changes(old_tree)))
+    return osutils.perf_counter() - begin, count
+
+
+with b.lock_read():
+    repo = b.repository
+    graph = repo.get_graph()
+    revision_ids = []
+    for revision_id in graph.iter_lefthand_ancestry(
+            b.last_revision(), [_mod_revision.NULL_REVISION]):
+        revision_ids.append(revision_id)
+        if len(revision_ids) >= opts.limit:
+            break
+    revisions = repo.get_revisions(revision_ids)
+    print('Computing deltas for %d revisions' % (len(revisions),))
+    for batched in (False, True):
+        times = []
+        for i in range(opts.repeat):
+            elapsed, count = time_deltas(repo, revisions, batched)
+            times.append(elapsed)
+        print('%-9s best %.3fs of %d (%d changes)'
+              % ('batched' if batched else 'per-pair', min(times),
+                 opts.repeat, count))